@@ -3,13 +3,141 @@ Supabase JWT Authentication for Django REST Framework.
 """
 import jwt
 import logging
+import threading
+import time
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from django.conf import settings
+from apps.core.exceptions import UpstreamUnavailable
 from apps.core.services.supabase_service import SupabaseService
+from apps.auth.token_cache import get_token_cache
 
 logger = logging.getLogger(__name__)
 
+# Algorithms verified locally against the project's published JWKS
+ASYMMETRIC_ALGORITHMS = ('RS256', 'ES256', 'EdDSA')
+# Roles allowed to see every user's resources
+ADMIN_ROLES = ('service_role', 'admin')
+
+_jwks_client = None
+_jwks_lock = threading.Lock()
+
+
+def get_jwks_client() -> jwt.PyJWKClient:
+    """Get the shared JWKS client; it caches the key set and refreshes it periodically."""
+    global _jwks_client
+    if _jwks_client is None:
+        with _jwks_lock:
+            if _jwks_client is None:
+                _jwks_client = jwt.PyJWKClient(
+                    f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json",
+                    cache_jwk_set=True,
+                    lifespan=settings.AUTH_JWKS_REFRESH_SECONDS,
+                    timeout=10
+                )
+    return _jwks_client
+
+
+def _user_info_from_payload(payload):
+    return {
+        'id': payload.get('sub'),
+        'email': payload.get('email'),
+        'role': payload.get('role', 'authenticated'),
+        'token_payload': payload
+    }
+
+
+def _verify_token(token):
+    """
+    Verify a token locally when possible, falling back to GoTrue.
+
+    Raises ``AuthenticationFailed`` for invalid tokens and
+    ``UpstreamUnavailable`` when the key set or GoTrue cannot be reached.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.InvalidTokenError as e:
+        raise AuthenticationFailed(f'Invalid token: {str(e)}')
+
+    algorithm = header.get('alg')
+    jwt_secret = settings.SUPABASE_JWT_SECRET
+
+    if algorithm == settings.JWT_ALGORITHM and jwt_secret:
+        key = jwt_secret
+    elif algorithm in ASYMMETRIC_ALGORITHMS and settings.SUPABASE_URL:
+        try:
+            key = get_jwks_client().get_signing_key_from_jwt(token).key
+        except jwt.PyJWKClientConnectionError as e:
+            raise UpstreamUnavailable(f'Could not fetch signing keys: {e}', upstream='supabase.jwks', retry_after=1.0)
+        except jwt.PyJWKClientError as e:
+            raise AuthenticationFailed(f'Invalid token: {str(e)}')
+    else:
+        # Fallback to Supabase client validation
+        user_info = SupabaseService.get_user_by_token(token)
+        if not user_info:
+            raise AuthenticationFailed('Invalid token')
+        return user_info
+
+    try:
+        payload = jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=settings.SUPABASE_JWT_AUDIENCE,
+            options={"verify_sub": False}
+        )
+    except jwt.ExpiredSignatureError:
+        raise AuthenticationFailed('Token has expired')
+    except jwt.InvalidTokenError as e:
+        raise AuthenticationFailed(f'Invalid token: {str(e)}')
+    return _user_info_from_payload(payload)
+
+
+def is_admin(user) -> bool:
+    """Whether an authenticated user may act on other users' resources (service role or app_metadata admin)."""
+    if not isinstance(user, dict):
+        return False
+    app_metadata = (user.get('token_payload') or {}).get('app_metadata') or {}
+    return user.get('role') in ADMIN_ROLES or app_metadata.get('role') in ADMIN_ROLES
+
+
+def _token_expiry(token, user_info):
+    """Epoch seconds until which a validation result may be reused."""
+    payload = user_info.get('token_payload')
+    if payload is None:
+        try:
+            payload = jwt.decode(token, options={"verify_signature": False})
+        except jwt.InvalidTokenError:
+            payload = {}
+    exp = payload.get('exp')
+    return float(exp) if exp else time.time() + settings.AUTH_CACHE_DEFAULT_TTL
+
+
+def validate_supabase_token(token):
+    """
+    Validate a Supabase access token and return the user info.
+
+    Results are cached by token hash until the token expires; rejected
+    tokens are cached briefly. Raises AuthenticationFailed for invalid tokens
+    and UpstreamUnavailable, never cached, when validation could not be done.
+    """
+    cache = get_token_cache()
+    cached = cache.get(token)
+    if cached is not None:
+        is_valid, value = cached
+        if is_valid:
+            return value
+        raise AuthenticationFailed(value)
+
+    try:
+        user_info = _verify_token(token)
+    except AuthenticationFailed as e:
+        cache.set_invalid(token, str(e.detail))
+        raise
+
+    cache.set_valid(token, user_info, _token_expiry(token, user_info))
+    return user_info
+
 
 class SupabaseAuthentication(BaseAuthentication):
     """
@@ -19,7 +147,7 @@ class SupabaseAuthentication(BaseAuthentication):
     def authenticate(self, request):
         """
         Authenticate the request based on the Authorization header.
-        
+
         Expected header:
             Authorization: Bearer <supabase_jwt_token>
         """
@@ -37,42 +165,19 @@ class SupabaseAuthentication(BaseAuthentication):
 
         try:
             user_info = self._validate_token(token)
-            return (user_info, token)
+        except UpstreamUnavailable:
+            # Answered with 503 and Retry-After: the client should retry, not sign in again
+            raise
         except Exception as e:
             logger.error(f"Authentication failed: {e}")
             raise AuthenticationFailed(str(e))
+        return (user_info, token)
 
     def _validate_token(self, token):
         """
-        Validate the JWT token using Supabase JWT secret.
+        Validate the JWT token (HS256 secret, JWKS or GoTrue), using the token cache.
         """
-        jwt_secret = settings.SUPABASE_JWT_SECRET
-
-        if jwt_secret:
-            # Decode JWT using the secret
-            try:
-                payload = jwt.decode(
-                    token,
-                    jwt_secret,
-                    algorithms=[settings.JWT_ALGORITHM],
-                    options={"verify_sub": False}
-                )
-                return {
-                    'id': payload.get('sub'),
-                    'email': payload.get('email'),
-                    'role': payload.get('role', 'authenticated'),
-                    'token_payload': payload
-                }
-            except jwt.ExpiredSignatureError:
-                raise AuthenticationFailed('Token has expired')
-            except jwt.InvalidTokenError as e:
-                raise AuthenticationFailed(f'Invalid token: {str(e)}')
-        else:
-            # Fallback to Supabase client validation
-            user_info = SupabaseService.get_user_by_token(token)
-            if not user_info:
-                raise AuthenticationFailed('Invalid token')
-            return user_info
+        return validate_supabase_token(token)
 
     def authenticate_header(self, request):
         """
@@ -0,0 +1,88 @@
+import time
+
+import jwt
+import pytest
+from rest_framework.exceptions import AuthenticationFailed
+
+from apps.auth import token_cache
+from apps.auth.authentication import validate_supabase_token
+from apps.auth.token_cache import TokenCache
+from apps.core.exceptions import UpstreamUnavailable
+
+SECRET = 's' * 32
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    monkeypatch.setattr(token_cache, '_token_cache', None)
+    return token_cache.get_token_cache
+
+
+def _token(secret=SECRET, **claims):
+    payload = {'sub': 'user-1', 'aud': 'authenticated', 'exp': int(time.time()) + 600, **claims}
+    return jwt.encode(payload, secret, algorithm='HS256')
+
+
+def test_cache_evicts_least_recently_used_and_expired_entries(monkeypatch):
+    cache = TokenCache(max_entries=2, negative_ttl=30)
+    cache.set_valid('a', {'id': 'a'}, time.time() + 60)
+    cache.set_valid('b', {'id': 'b'}, time.time() + 60)
+    cache.get('a')
+    cache.set_valid('c', {'id': 'c'}, time.time() + 60)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == (True, {'id': 'a'})
+
+    cache.set_invalid('bad', 'Invalid token')
+    assert cache.get('bad') == (False, 'Invalid token')
+    monkeypatch.setattr(token_cache.time, 'time', lambda: time.monotonic() + 10 ** 10)
+    assert cache.get('bad') is None and cache.get('a') is None
+
+
+def test_local_tokens_are_verified_once_and_cached(settings, monkeypatch):
+    settings.SUPABASE_JWT_SECRET = SECRET
+    token = _token()
+
+    assert validate_supabase_token(token)['id'] == 'user-1'
+    monkeypatch.setattr(jwt, 'decode', lambda *args, **kwargs: pytest.fail('verified twice'))
+    assert validate_supabase_token(token)['id'] == 'user-1'
+
+
+def test_forged_and_expired_tokens_are_rejected(settings):
+    settings.SUPABASE_JWT_SECRET = SECRET
+
+    with pytest.raises(AuthenticationFailed):
+        validate_supabase_token(_token(secret='f' * 32))
+    with pytest.raises(AuthenticationFailed, match='expired'):
+        validate_supabase_token(_token(exp=int(time.time()) - 10))
+
+
+def test_gotrue_rejections_are_cached_briefly(offline, settings):
+    settings.SUPABASE_JWT_SECRET = ''
+    valid, rejected = _token(), _token(sub='user-2')
+    offline.supabase.add_user(valid, user_id='user-1')
+
+    assert validate_supabase_token(valid)['id'] == 'user-1'
+    assert validate_supabase_token(valid)['id'] == 'user-1'
+    for _ in range(3):
+        with pytest.raises(AuthenticationFailed):
+            validate_supabase_token(rejected)
+
+    assert offline.supabase.calls['supabase.auth'] == 2
+
+
+def test_gotrue_outages_are_not_cached(offline, settings, monkeypatch):
+    settings.SUPABASE_JWT_SECRET = ''
+    token = _token()
+    offline.supabase.add_user(token, user_id='user-1')
+    get_user = offline.supabase.auth.get_user
+
+    def unreachable(token):
+        raise ConnectionError('connection refused')
+
+    monkeypatch.setattr(offline.supabase.auth, 'get_user', unreachable)
+    with pytest.raises(UpstreamUnavailable):
+        validate_supabase_token(token)
+
+    monkeypatch.setattr(offline.supabase.auth, 'get_user', get_user)
+    assert validate_supabase_token(token)['id'] == 'user-1'
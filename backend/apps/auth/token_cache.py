@@ -0,0 +1,83 @@
+"""
+In-process cache of validated Supabase tokens.
+
+Entries are keyed by a SHA-256 of the token so raw bearer tokens are never
+kept in memory longer than the request. Valid tokens are cached until their
+``exp``; invalid tokens are cached briefly so a client retrying a bad token
+does not turn into a stream of GoTrue round-trips.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from django.conf import settings
+
+
+class TokenCache:
+    """Size-bounded LRU of token validation results with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 10000, negative_ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self._entries: 'OrderedDict[str, Tuple[float, bool, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token: str) -> Optional[Tuple[bool, Any]]:
+        """
+        Look up a token.
+
+        Returns:
+            None on a miss, otherwise (is_valid, user_info_or_error_message)
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, is_valid, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return is_valid, value
+
+    def set_valid(self, token: str, user_info: dict, expires_at: float):
+        """Cache a successful validation until ``expires_at`` (epoch seconds)."""
+        if expires_at > time.time():
+            self._set(token, expires_at, True, user_info)
+
+    def set_invalid(self, token: str, error: str):
+        """Cache a failed validation for the negative TTL."""
+        self._set(token, time.time() + self.negative_ttl, False, error)
+
+    def _set(self, token, expires_at, is_valid, value):
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, is_valid, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_token_cache: Optional[TokenCache] = None
+
+
+def get_token_cache() -> TokenCache:
+    """Get the process-wide token cache configured from settings."""
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenCache(
+            max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+            negative_ttl=settings.AUTH_NEGATIVE_CACHE_SECONDS
+        )
+    return _token_cache
@@ -1,10 +1,10 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from apps.core.services.supabase_service import SupabaseService
-import jwt
+from rest_framework.exceptions import AuthenticationFailed
+from apps.auth.authentication import validate_supabase_token
+from apps.core.exceptions import UpstreamUnavailable
 import logging
-from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
@@ -34,60 +34,30 @@ class SupabaseAuthView(APIView):
             )
         
         try:
-            # Decode and verify the JWT token
-            # Supabase uses JWT with the secret from SUPABASE_JWT_SECRET
-            jwt_secret = settings.SUPABASE_JWT_SECRET
-            
-            if not jwt_secret:
-                # If no JWT secret configured, try to validate via Supabase client
-                user_info = SupabaseService.get_user_by_token(token)
-                if user_info:
-                    return Response({
-                        'user_id': user_info.get('id'),
-                        'email': user_info.get('email'),
-                        'role': user_info.get('role', 'authenticated'),
-                        'is_valid': True
-                    })
-                else:
-                    return Response(
-                        {'error': 'Invalid token'},
-                        status=status.HTTP_401_UNAUTHORIZED
-                    )
-            
-            # Decode the JWT
-            payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-            
-            # Extract user info from the payload
-            user_id = payload.get('sub')
-            email = payload.get('email')
-            role = payload.get('role', 'authenticated')
-            
-            return Response({
-                'user_id': user_id,
-                'email': email,
-                'role': role,
-                'is_valid': True,
-                'exp': payload.get('exp'),
-                'iat': payload.get('iat')
-            })
-            
-        except jwt.ExpiredSignatureError:
+            user_info = validate_supabase_token(token)
+        except AuthenticationFailed as e:
             return Response(
-                {'error': 'Token has expired'},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-        except jwt.InvalidTokenError as e:
-            logger.error(f"Invalid JWT token: {e}")
-            return Response(
-                {'error': 'Invalid token'},
+                {'error': str(e.detail)},
                 status=status.HTTP_401_UNAUTHORIZED
             )
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Auth verification error: {e}")
             return Response(
                 {'error': 'Authentication failed'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        
+        payload = user_info.get('token_payload') or {}
+        return Response({
+            'user_id': user_info.get('id'),
+            'email': user_info.get('email'),
+            'role': user_info.get('role', 'authenticated'),
+            'is_valid': True,
+            'exp': payload.get('exp'),
+            'iat': payload.get('iat')
+        })
     
     def get(self, request):
         """
@@ -127,34 +97,20 @@ class SupabaseAuthView(APIView):
             })
     
     def _validate_token(self, token):
-        """Validate a Supabase JWT token."""
+        """Validate a Supabase JWT token (cached; see validate_supabase_token)."""
         try:
-            jwt_secret = settings.SUPABASE_JWT_SECRET
-            
-            if not jwt_secret:
-                user_info = SupabaseService.get_user_by_token(token)
-                if user_info:
-                    return {
-                        'is_valid': True,
-                        'user_id': user_info.get('id'),
-                        'email': user_info.get('email'),
-                        'role': user_info.get('role', 'authenticated')
-                    }
-                return {'is_valid': False, 'error': 'Invalid token'}
-            
-            payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-            
+            user_info = validate_supabase_token(token)
             return {
                 'is_valid': True,
-                'user_id': payload.get('sub'),
-                'email': payload.get('email'),
-                'role': payload.get('role', 'authenticated')
+                'user_id': user_info.get('id'),
+                'email': user_info.get('email'),
+                'role': user_info.get('role', 'authenticated')
             }
-            
-        except jwt.ExpiredSignatureError:
-            return {'is_valid': False, 'error': 'Token has expired'}
-        except jwt.InvalidTokenError:
-            return {'is_valid': False, 'error': 'Invalid token'}
+        except AuthenticationFailed as e:
+            return {'is_valid': False, 'error': str(e.detail)}
+        except UpstreamUnavailable:
+            # Unknown, not invalid: answered with 503 and Retry-After
+            raise
         except Exception as e:
             logger.error(f"Token validation error: {e}")
             return {'is_valid': False, 'error': 'Validation failed'}
@@ -1,7 +1,22 @@
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.books'
     label = 'books'
+
+    def ready(self):
+        # Warm in-memory indexes for servers, not for one-off management commands or test runs
+        command = sys.argv[1] if len(sys.argv) > 1 and sys.argv[0].endswith('manage.py') else None
+        if not settings.SUPABASE_URL or command not in (None, 'runserver') or 'pytest' in sys.modules:
+            return
+        if settings.CATALOG_INDEX_WARM_ON_STARTUP:
+            from apps.books.services.catalog_index import warm_catalog_index
+            warm_catalog_index()
+        if settings.BOOK_ROUTER_ENABLED:
+            from apps.books.services.book_router import warm_book_router
+            warm_book_router()
@@ -0,0 +1,219 @@
+import logging
+import os
+from typing import Callable, Dict, Tuple
+from urllib.parse import unquote, urlparse
+
+import requests
+from rest_framework import status
+
+from apps.core.exceptions import BookImportError
+from apps.core.services.blob_store import BLOB_BUCKET, BlobStore
+from apps.core.services.downloads import DownloadedFile, download_to_file
+from apps.core.services.extractors import FileSource
+from apps.core.services.file_processor import FileProcessor
+from apps.core.services.supabase_service import SupabaseService
+from apps.core.services.text_artifacts import preview_text
+from .catalog_index import index_book
+
+logger = logging.getLogger(__name__)
+
+PDF_CONTENT_TYPE = 'application/pdf'
+
+# HTTP statuses worth retrying when downloading a source PDF
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+BOOK_SPEC_FIELDS = (
+    'source_url', 'title', 'grade_id', 'subject_id',
+    'grade_level', 'subject_name', 'author', 'description',
+)
+
+
+def parse_pdf(file_content: FileSource) -> Tuple[int, str]:
+    """
+    Page count and inline text preview of a PDF (bytes or a path on disk).
+
+    Module-level so it can run in a worker process.
+
+    Returns:
+        Tuple of (page_count, preview_text)
+    """
+    processor = FileProcessor()
+    return processor.page_count(file_content, 'pdf'), preview_text(processor.iter_pages(file_content, 'pdf'))
+
+
+def title_from_url(url: str) -> str:
+    """Extract a readable title from a URL."""
+    # Remove protocol and common path parts
+    clean_url = url.replace('https://', '').replace('http://', '')
+    clean_url = clean_url.replace('www.', '')
+
+    # Get the last part of the path
+    parts = clean_url.split('/')
+    filename = parts[-1] if parts else 'downloaded-book'
+
+    # Remove file extension
+    if filename.endswith('.pdf'):
+        filename = filename[:-4]
+
+    # Replace hyphens and underscores with spaces
+    title = filename.replace('-', ' ').replace('_', ' ')
+
+    # Capitalize words
+    title = ' '.join(word.capitalize() for word in title.split())
+
+    return title if title else 'Untitled Book'
+
+
+class BookImporter:
+    """
+    Download → upload → register pipeline for one official PDF.
+
+    Shared by the single-book endpoint and the bulk import engine. ``parse``
+    turns a PDF path into ``(page_count, preview_text)`` and defaults to
+    ``parse_pdf`` in-process; the bulk engine passes one that uses a
+    process pool.
+    """
+
+    def __init__(self, parse: Callable[[str], Tuple[int, str]] = None, download_timeout: int = 60):
+        self.parse = parse or parse_pdf
+        self.download_timeout = download_timeout
+
+    @staticmethod
+    def validate(spec: Dict):
+        """Raise BookImportError unless ``spec`` names a source and a grade."""
+        if not spec.get('source_url'):
+            raise BookImportError('source_url is required')
+        if not (spec.get('grade_id') or (spec.get('grade_level') and spec.get('subject_name'))):
+            raise BookImportError('Either grade_id or both grade_level and subject_name are required')
+
+    def import_book(self, spec: Dict) -> Tuple[Dict, bool]:
+        """
+        Import one book described by ``spec`` (see ``BOOK_SPEC_FIELDS``).
+
+        Returns:
+            Tuple of (book, created); created is False when the URL or the
+            downloaded content was already registered.
+        """
+        self.validate(spec)
+        source_url = spec['source_url']
+
+        # A textbook already registered from this URL is returned as-is
+        existing = SupabaseService.fetch_table('books', {'source_url': source_url}, limit=1)
+        if existing:
+            logger.info(f"Book already registered from {source_url}: {existing[0]['id']}")
+            return existing[0], False
+
+        # Step 1: Stream the official PDF to disk, hashing as it arrives
+        download = self.download(source_url)
+        try:
+            return self._register(spec, download)
+        finally:
+            download.remove()
+
+    def _register(self, spec: Dict, download: DownloadedFile) -> Tuple[Dict, bool]:
+        source_url = spec['source_url']
+        content_hash = download.content_hash
+
+        # The same PDF published under another URL is the same book
+        existing = SupabaseService.fetch_table('books', {'content_hash': content_hash}, limit=1)
+        if existing:
+            logger.info(f"Book with identical content already registered: {existing[0]['id']}")
+            return existing[0], False
+
+        title = spec.get('title') or title_from_url(source_url)
+        page_count, extracted_text = self.parse(download.path)
+
+        # Step 2: Upload to Supabase Storage, unless the content is already stored
+        blob = BlobStore.get(content_hash)
+        if blob:
+            storage_path = blob['storage_path']
+            public_url = SupabaseService.get_storage_public_url(BLOB_BUCKET, storage_path)
+            logger.info(f"Reusing stored content at {storage_path}")
+        else:
+            storage_path = BlobStore.storage_path(content_hash, 'pdf')
+            logger.info(f"Uploading PDF to Supabase Storage at {storage_path}...")
+            public_url = SupabaseService.upload_path(
+                BLOB_BUCKET, storage_path, download.path, PDF_CONTENT_TYPE, upsert=True
+            )
+            BlobStore.register(content_hash, storage_path, download.size, PDF_CONTENT_TYPE, page_count)
+            logger.info(f"Uploaded successfully. Public URL: {public_url}")
+
+        # Step 3: Register in database; the full text artifact is written at ingestion
+        book_data = {
+            'title': title,
+            'author': spec.get('author') or '',
+            'description': spec.get('description') or '',
+            'file_name': self._file_name(source_url, title),
+            'file_type': PDF_CONTENT_TYPE,
+            'storage_path': storage_path,
+            'download_url': public_url,
+            'source_url': source_url,
+            'content_hash': content_hash,
+            'file_size': download.size,
+            'page_count': page_count,
+            'extracted_text': extracted_text,
+            'text_artifact_key': (blob or {}).get('text_artifact_key'),
+            'page_artifact_prefix': (blob or {}).get('page_artifact_prefix'),
+            'is_official': True,
+        }
+        book_data.update(self._associations(spec))
+
+        logger.info("Registering book in database...")
+        book = SupabaseService.insert_record('books', book_data)
+        if not book:
+            raise BookImportError(
+                'Failed to register book in database',
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                retryable=True
+            )
+        logger.info(f"Book registered successfully: {book['id']}")
+        index_book(book)
+        return book, True
+
+    def download(self, source_url: str) -> DownloadedFile:
+        """Stream a source PDF to disk, classifying failures as retryable or not."""
+        logger.info(f"Downloading PDF from: {source_url}")
+        try:
+            download = download_to_file(source_url, timeout=self.download_timeout)
+        except requests.exceptions.HTTPError as e:
+            retryable = e.response is not None and e.response.status_code in RETRYABLE_STATUSES
+            raise BookImportError(f'Failed to download PDF: {e}', retryable=retryable) from e
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            raise BookImportError(f'Failed to download PDF: {e}', retryable=True) from e
+        except requests.exceptions.RequestException as e:
+            raise BookImportError(f'Failed to download PDF: {e}') from e
+
+        # Verify it's a PDF
+        if 'pdf' not in download.content_type.lower() and not source_url.lower().endswith('.pdf'):
+            # Check first bytes for PDF magic number
+            if download.head(4) != b'%PDF':
+                download.remove()
+                raise BookImportError('The downloaded file is not a valid PDF')
+        return download
+
+    @staticmethod
+    def _associations(spec: Dict) -> Dict:
+        """Grade/subject ids from the spec, looked up by name when only names are given."""
+        associations = {}
+        if spec.get('grade_id'):
+            associations['grade_id'] = spec['grade_id']
+        if spec.get('subject_id'):
+            associations['subject_id'] = spec['subject_id']
+
+        if not spec.get('grade_id') and spec.get('grade_level'):
+            grade = SupabaseService.fetch_table('grades', {'name': spec['grade_level']}, columns='id')
+            if grade:
+                associations['grade_id'] = grade[0]['id']
+
+        if not spec.get('subject_id') and spec.get('subject_name'):
+            subject = SupabaseService.fetch_table('subjects', {'name': spec['subject_name']}, columns='id')
+            if subject:
+                associations['subject_id'] = subject[0]['id']
+        return associations
+
+    @staticmethod
+    def _file_name(source_url: str, title: str) -> str:
+        name = os.path.basename(unquote(urlparse(source_url).path))
+        return name if name.lower().endswith('.pdf') else f"{title}.pdf"
@@ -0,0 +1,233 @@
+"""
+Single-flight RAG ingestion of a book across all workers.
+
+A row in ``ingestion_leases`` names the worker ingesting a book. It is
+taken atomically by ``acquire_ingestion_lease``, so when a class opens an
+unindexed book together exactly one worker ingests it while the others
+report ``indexing`` and, if asked, wait for the outcome. The holder renews
+the lease every ``INGESTION_LEASE_HEARTBEAT_SECONDS``; if its worker dies
+the lease expires after ``INGESTION_LEASE_TTL_SECONDS`` and the next
+caller (or a waiter) takes over. A failed ingestion is retried once
+``INGESTION_RETRY_SECONDS`` have passed.
+
+Without the lease functions in the database (migration not applied) this
+falls back to deduplicating within the process.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from apps.core.background import run_in_background
+from apps.core.services.supabase_service import SupabaseService
+from .rag_service import RAGService
+
+logger = logging.getLogger(__name__)
+
+LEASE_TABLE = 'ingestion_leases'
+
+INDEXED = 'indexed'
+INDEXING = 'indexing'
+FAILED = 'failed'
+
+# Book columns needed to tell whether it is indexed
+INDEX_STATE_COLUMNS = 'id,is_processed,metadata'
+
+
+def is_indexed(book: Dict) -> bool:
+    return bool(book.get('is_processed')) and bool((book.get('metadata') or {}).get('rag_indexed'))
+
+
+class BookIngestion:
+    """Starts ingestion under a lease and reports or waits for its outcome."""
+
+    _instance: Optional['BookIngestion'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        # Ingestions running in this process, set when they finish
+        self._running: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> 'BookIngestion':
+        """The process-wide coordinator."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def ensure_indexed(self, book: Dict, wait: float = 0) -> str:
+        """
+        Make sure ``book`` is indexed or being indexed by exactly one worker.
+
+        Returns:
+            'indexed', 'indexing' (still running after ``wait`` seconds) or
+            'failed' (the last attempt failed and its retry delay has not passed)
+        """
+        if is_indexed(book):
+            return INDEXED
+        status = self.start(book['id'])
+        if status == INDEXING and wait > 0:
+            status = self.wait(book['id'], wait)
+        return status
+
+    def start(self, book_id: str) -> str:
+        """Take the lease and ingest in the background, unless another worker holds it."""
+        with self._lock:
+            if book_id in self._running:
+                return INDEXING
+            # Claimed locally before the lease call so threads of this process never race
+            done = self._running[book_id] = threading.Event()
+
+        holder = f"{self.worker}:{uuid.uuid4().hex[:8]}"
+        try:
+            lease = self._acquire(book_id, holder)
+        except Exception as e:
+            logger.warning(f"Ingestion lease unavailable for book {book_id}, deduplicating in-process only: {e}")
+            lease = {'holder': holder, 'status': 'running'}
+
+        if lease is None or lease.get('holder') != holder:
+            self._finish(book_id, done)
+            return FAILED if lease and lease.get('status') == 'failed' else INDEXING
+
+        # Renewed from now on, not once a background worker picks the ingestion up
+        stop = self._start_heartbeat(book_id, holder)
+        try:
+            # Another worker may have finished between our read of the book and taking the lease
+            book = SupabaseService.fetch_by_id('books', book_id, columns=INDEX_STATE_COLUMNS)
+            if book is None or is_indexed(book):
+                stop.set()
+                self._release(book_id, holder, 'succeeded')
+                self._finish(book_id, done)
+                return INDEXED if book else FAILED
+            run_in_background(self._ingest, book_id, holder, done, stop)
+        except Exception:
+            stop.set()
+            self._release(book_id, holder, 'failed', 'Could not schedule ingestion')
+            self._finish(book_id, done)
+            raise
+        return INDEXING
+
+    def wait(self, book_id: str, timeout: float) -> str:
+        """
+        Wait up to ``timeout`` seconds for the book's ingestion to finish.
+
+        Waiters in the ingesting process are woken when it finishes; others
+        poll the lease, taking it over if its holder stopped renewing it.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return INDEXING
+            with self._lock:
+                local = self._running.get(book_id)
+            pause = min(remaining, settings.INGESTION_POLL_SECONDS)
+            if local is not None:
+                local.wait(pause)
+            else:
+                time.sleep(pause)
+
+            lease = self.status(book_id)
+            if lease is None:
+                # No lease table: only an ingestion in this process can be followed
+                book = SupabaseService.fetch_by_id('books', book_id, columns=INDEX_STATE_COLUMNS)
+                if book is not None and is_indexed(book):
+                    return INDEXED
+                if local is None:
+                    return INDEXING
+                if not local.is_set():
+                    continue
+                return FAILED
+            if lease['status'] == 'succeeded':
+                return INDEXED
+            if lease['status'] == 'failed':
+                return FAILED
+            # Still running: a no-op unless the holder's lease has expired
+            status = self.start(book_id)
+            if status != INDEXING:
+                return status
+
+    def status(self, book_id: str) -> Optional[Dict]:
+        """The book's lease row, if it was ever ingested under a lease."""
+        try:
+            rows = SupabaseService.fetch_table(LEASE_TABLE, {'book_id': book_id}, limit=1)
+        except Exception as e:
+            logger.warning(f"Could not read ingestion lease for book {book_id}: {e}")
+            return None
+        return rows[0] if rows else None
+
+    # --- Lease ------------------------------------------------------------
+
+    @staticmethod
+    def _acquire(book_id: str, holder: str) -> Optional[Dict]:
+        rows = SupabaseService.call_rpc('acquire_ingestion_lease', {
+            'p_book_id': book_id,
+            'p_holder': holder,
+            'p_ttl_seconds': settings.INGESTION_LEASE_TTL_SECONDS,
+        })
+        return rows[0] if rows else None
+
+    @staticmethod
+    def _release(book_id: str, holder: str, status: str, error: str = None):
+        try:
+            SupabaseService.call_rpc('release_ingestion_lease', {
+                'p_book_id': book_id,
+                'p_holder': holder,
+                'p_status': status,
+                'p_error': error,
+                'p_retry_seconds': settings.INGESTION_RETRY_SECONDS if status == 'failed' else 0,
+            })
+        except Exception as e:
+            # The lease expires on its own; the next caller retries
+            logger.warning(f"Could not release ingestion lease for book {book_id}: {e}")
+
+    def _heartbeat(self, book_id: str, holder: str, stop: threading.Event):
+        while not stop.wait(settings.INGESTION_LEASE_HEARTBEAT_SECONDS):
+            try:
+                renewed = SupabaseService.call_rpc('renew_ingestion_lease', {
+                    'p_book_id': book_id,
+                    'p_holder': holder,
+                    'p_ttl_seconds': settings.INGESTION_LEASE_TTL_SECONDS,
+                })
+            except Exception as e:
+                logger.warning(f"Ingestion lease heartbeat for book {book_id} failed: {e}")
+                continue
+            if renewed is False:
+                logger.warning(f"Lost ingestion lease for book {book_id}; another worker took it over")
+                return
+
+    def _start_heartbeat(self, book_id: str, holder: str) -> threading.Event:
+        """Renew the lease until the returned event is set."""
+        stop = threading.Event()
+        threading.Thread(
+            target=self._heartbeat, args=(book_id, holder, stop), name=f'ingestion-lease-{book_id}', daemon=True
+        ).start()
+        return stop
+
+    def _ingest(self, book_id: str, holder: str, done: threading.Event, stop: threading.Event):
+        succeeded = False
+        try:
+            succeeded = RAGService().ingest_book(book_id)
+        finally:
+            stop.set()
+            self._release(
+                book_id, holder,
+                'succeeded' if succeeded else 'failed',
+                None if succeeded else 'Ingestion failed; see worker logs'
+            )
+            self._finish(book_id, done)
+
+    def _finish(self, book_id: str, done: threading.Event):
+        with self._lock:
+            if self._running.get(book_id) is done:
+                del self._running[book_id]
+        done.set()
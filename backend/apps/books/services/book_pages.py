@@ -0,0 +1,129 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from apps.core.background import run_in_background
+from apps.core.services.blob_store import BlobStore
+from apps.core.services.downloads import download_to_file
+from apps.core.services.extractors import FileSource
+from apps.core.services.page_artifacts import get_page_artifacts, page_artifact_prefix
+from apps.core.services.supabase_service import SupabaseService
+from apps.core.services.text_artifacts import get_text_artifacts
+
+logger = logging.getLogger(__name__)
+
+
+class BookPages:
+    """Page-level access to a textbook: per-page text and single-page PDFs."""
+
+    # Books whose page PDFs are being generated in this process
+    _generating = set()
+    _generating_lock = threading.Lock()
+
+    @staticmethod
+    def generate(book: Dict, source: FileSource = None) -> Optional[str]:
+        """
+        Split a book's PDF into page artifacts and record their prefix.
+
+        ``source`` is the already-downloaded PDF, if the caller has one;
+        otherwise it is downloaded from the book's ``download_url``. A failure
+        is recorded on the book with the time after which it may be retried
+        (see ``retry_at``).
+
+        Returns:
+            The page artifact prefix, or None if generation failed
+        """
+        book_id = book['id']
+        prefix = page_artifact_prefix(book.get('content_hash') or f"books/{book_id}")
+        download = None
+        try:
+            if source is None:
+                if not book.get('download_url'):
+                    raise ValueError('no download URL')
+                download = download_to_file(book['download_url'])
+                source = download.path
+            get_page_artifacts().save(prefix, source)
+            SupabaseService.update_record('books', book_id, {
+                'page_artifact_prefix': prefix,
+                'page_generation_attempts': 0,
+                'page_generation_retry_at': None,
+                'page_generation_error': None,
+            })
+            if book.get('content_hash'):
+                BlobStore.set_page_artifacts(book['content_hash'], prefix)
+            return prefix
+        except Exception as e:
+            logger.error(f"Error generating page artifacts for book {book_id}: {e}")
+            BookPages._record_failure(book, e)
+            return None
+        finally:
+            if download:
+                download.remove()
+
+    @staticmethod
+    def _record_failure(book: Dict, error: Exception):
+        """Back off exponentially (up to PAGE_GENERATION_RETRY_MAX_SECONDS) before the next attempt."""
+        attempts = (book.get('page_generation_attempts') or 0) + 1
+        delay = min(
+            settings.PAGE_GENERATION_RETRY_BASE_SECONDS * (2 ** (attempts - 1)),
+            settings.PAGE_GENERATION_RETRY_MAX_SECONDS
+        )
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        try:
+            SupabaseService.update_record('books', book['id'], {
+                'page_generation_attempts': attempts,
+                'page_generation_retry_at': retry_at.isoformat(),
+                'page_generation_error': str(error)[:500],
+            })
+        except Exception as e:
+            logger.warning(f"Could not record page generation failure of book {book['id']}: {e}")
+
+    @staticmethod
+    def retry_at(book: Dict) -> Optional[datetime]:
+        """When page generation may be tried again after a failure; None if it may run now."""
+        value = book.get('page_generation_retry_at')
+        if not value:
+            return None
+        retry_at = datetime.fromisoformat(value)
+        return retry_at if retry_at > datetime.now(timezone.utc) else None
+
+    @classmethod
+    def generate_in_background(cls, book: Dict) -> bool:
+        """Schedule page generation unless it is running or backing off; returns True if scheduled."""
+        if cls.retry_at(book):
+            return False
+        with cls._generating_lock:
+            if book['id'] in cls._generating:
+                return False
+            cls._generating.add(book['id'])
+
+        def _run():
+            try:
+                cls.generate(book)
+            finally:
+                with cls._generating_lock:
+                    cls._generating.discard(book['id'])
+
+        run_in_background(_run)
+        return True
+
+    @staticmethod
+    def text(book: Dict, start: int, end: int) -> List[Dict]:
+        """
+        Extracted text of pages ``start`` through ``end`` (inclusive).
+
+        Returns:
+            List of {'page': n, 'text': ...}; empty if the book has no text artifact
+        """
+        key = book.get('text_artifact_key')
+        if not key:
+            return []
+        return [{'page': number, 'text': text} for number, text in get_text_artifacts().page_range(key, start, end)]
+
+    @staticmethod
+    def pdf(book: Dict, start: int, end: int) -> bytes:
+        """Pages ``start`` through ``end`` as one PDF. The book must have page artifacts."""
+        return get_page_artifacts().pages(book['page_artifact_prefix'], start, end)
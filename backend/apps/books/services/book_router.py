@@ -0,0 +1,323 @@
+"""
+First stage of two-stage retrieval for chats that are not pinned to a book.
+
+Each indexed book has a centroid embedding for the whole book and one per
+section of ``BOOK_ROUTER_SECTION_PAGES`` pages, computed from its chunk
+embeddings at ingestion and stored in ``book_embeddings``. The router keeps
+them in memory: book centroids in one float32 matrix and section centroids
+per book in float16. A query is scored against the books matching the
+grade/subject filter, then against the sections of the best books, with
+NumPy matrix products; chunk retrieval is then filtered to the winning
+sections. Both stages stay small as the catalog grows, so latency stays
+flat while the chunk search no longer competes with unrelated books.
+"""
+import base64
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from django.conf import settings
+
+from apps.core.background import run_in_background
+from apps.core.services.supabase_service import SupabaseService
+
+logger = logging.getLogger(__name__)
+
+ROUTER_TABLE = 'book_embeddings'
+# page_start of the row holding the whole-book centroid
+BOOK_LEVEL = 0
+
+
+def encode_vector(vector: Sequence[float]) -> str:
+    """Unit-normalize and pack a vector as base64 float16 (3 KB for 1536 dimensions)."""
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    if norm:
+        array = array / norm
+    return base64.b64encode(array.astype(np.float16).tobytes()).decode('ascii')
+
+
+def decode_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float16)
+
+
+class CentroidAccumulator:
+    """Running sums of chunk embeddings per book and per page section."""
+
+    def __init__(self, section_pages: int = None):
+        self.section_pages = section_pages or settings.BOOK_ROUTER_SECTION_PAGES
+        self._sums: Dict[int, np.ndarray] = {}
+        self._counts: Dict[int, int] = {}
+
+    def add(self, page_number: int, embedding: Sequence[float]):
+        section = (max(page_number, 1) - 1) // self.section_pages
+        vector = np.asarray(embedding, dtype=np.float64)
+        for key in (-1, section):
+            if key in self._sums:
+                self._sums[key] += vector
+            else:
+                self._sums[key] = vector.copy()
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def rows(self, book_id: str) -> List[Dict]:
+        """``book_embeddings`` records: the whole-book centroid first, then sections."""
+        records = []
+        for key in sorted(self._sums):
+            if key == -1:
+                page_start = page_end = BOOK_LEVEL
+            else:
+                page_start = key * self.section_pages + 1
+                page_end = page_start + self.section_pages - 1
+            records.append({
+                'book_id': book_id,
+                'page_start': page_start,
+                'page_end': page_end,
+                'chunk_count': self._counts[key],
+                'embedding': encode_vector(self._sums[key] / self._counts[key]),
+            })
+        return records
+
+
+class _Snapshot:
+    """Immutable routing state; replaced wholesale on updates so queries never lock."""
+
+    def __init__(self, books: Dict[str, Dict], unrouted: Dict[str, Dict] = None):
+        self.books = books
+        # Books without centroids (not ingested since routing began): id -> grade/subject
+        self.unrouted = unrouted or {}
+        self.book_ids = list(books)
+        if books:
+            self.matrix = np.stack([entry['vector'] for entry in books.values()]).astype(np.float32)
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.grades = np.array([str(entry.get('grade_id')) for entry in books.values()], dtype=object)
+        self.subjects = np.array([str(entry.get('subject_id')) for entry in books.values()], dtype=object)
+
+
+class BookRouter:
+    """Picks the books and page sections to search for a query."""
+
+    _instance: Optional['BookRouter'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._snapshot = _Snapshot({})
+        self._write_lock = threading.Lock()
+        self._loading = threading.Lock()
+        self._last_refresh = 0.0
+        self.ready = threading.Event()
+
+    @classmethod
+    def get(cls) -> 'BookRouter':
+        """The process-wide router."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    # --- Routing ----------------------------------------------------------
+
+    def route(
+        self,
+        query_vector: Sequence[float],
+        grade_id=None,
+        subject_id=None,
+        top_books: int = None,
+        top_sections: int = None
+    ) -> List[Dict]:
+        """
+        Best page sections for a query among books matching the filters.
+
+        Returns:
+            List of {'book_id', 'page_start', 'page_end', 'score'}, best
+            first; empty when no routed book matches the filters.
+        """
+        top_books = top_books or settings.BOOK_ROUTER_TOP_BOOKS
+        top_sections = top_sections or settings.BOOK_ROUTER_TOP_SECTIONS
+        snapshot = self._snapshot
+        if not snapshot.book_ids:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        mask = np.ones(len(snapshot.book_ids), dtype=bool)
+        if grade_id is not None:
+            mask &= snapshot.grades == str(grade_id)
+        if subject_id is not None:
+            mask &= snapshot.subjects == str(subject_id)
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+
+        # Stage 1: whole-book centroids
+        book_scores = snapshot.matrix[candidates] @ query
+        best_books = candidates[self._top(book_scores, top_books)]
+
+        # Stage 2: sections of the best books
+        section_book_ids, ranges, vectors = [], [], []
+        for index in best_books:
+            book_id = snapshot.book_ids[index]
+            entry = snapshot.books[book_id]
+            if not len(entry['ranges']):
+                # No section centroids: route to the whole book
+                entry_ranges = np.array([[BOOK_LEVEL, BOOK_LEVEL]], dtype=np.int32)
+                entry_vectors = entry['vector'][np.newaxis, :]
+            else:
+                entry_ranges, entry_vectors = entry['ranges'], entry['sections']
+            section_book_ids.extend([book_id] * len(entry_ranges))
+            ranges.append(entry_ranges)
+            vectors.append(entry_vectors)
+
+        ranges = np.concatenate(ranges)
+        section_scores = np.concatenate(vectors).astype(np.float32) @ query
+        routes = []
+        for index in self._top(section_scores, top_sections):
+            page_start, page_end = ranges[index]
+            routes.append({
+                'book_id': section_book_ids[index],
+                'page_start': int(page_start),
+                'page_end': int(page_end),
+                'score': float(section_scores[index]),
+            })
+        return routes
+
+    def unrouted_books(self, grade_id=None, subject_id=None) -> List[str]:
+        """Books matching the filters that have no centroids, so routing cannot pick them."""
+        return [
+            book_id for book_id, book in self._snapshot.unrouted.items()
+            if (grade_id is None or str(book.get('grade_id')) == str(grade_id))
+            and (subject_id is None or str(book.get('subject_id')) == str(subject_id))
+        ]
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the ``k`` highest scores, best first."""
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        return top[np.argsort(-scores[top])]
+
+    # --- Writes -----------------------------------------------------------
+
+    def save_book(self, book: Dict, accumulator: CentroidAccumulator):
+        """Store a freshly ingested book's centroids and route to it immediately."""
+        rows = accumulator.rows(book['id'])
+        if not rows:
+            return
+        SupabaseService.upsert_records(ROUTER_TABLE, rows, on_conflict='book_id,page_start', ignore_duplicates=False)
+        self.add_book(book, rows)
+
+    def add_book(self, book: Dict, rows: Iterable[Dict]):
+        """Route to ``book`` using its ``book_embeddings`` rows."""
+        entry = self._entry(book, rows)
+        if entry is None:
+            return
+        with self._write_lock:
+            books = dict(self._snapshot.books)
+            books[str(book['id'])] = entry
+            unrouted = {
+                book_id: info for book_id, info in self._snapshot.unrouted.items() if book_id != str(book['id'])
+            }
+            self._snapshot = _Snapshot(books, unrouted)
+
+    def remove_book(self, book_id: str):
+        with self._write_lock:
+            snapshot = self._snapshot
+            if str(book_id) not in snapshot.books and str(book_id) not in snapshot.unrouted:
+                return
+            books = {key: entry for key, entry in snapshot.books.items() if key != str(book_id)}
+            unrouted = {key: info for key, info in snapshot.unrouted.items() if key != str(book_id)}
+            self._snapshot = _Snapshot(books, unrouted)
+
+    @staticmethod
+    def _entry(book: Dict, rows: Iterable[Dict]) -> Optional[Dict]:
+        vector = None
+        sections = []
+        for row in rows:
+            decoded = decode_vector(row['embedding'])
+            if row['page_start'] == BOOK_LEVEL:
+                vector = decoded.astype(np.float32)
+            else:
+                sections.append((row['page_start'], row['page_end'], decoded))
+        if vector is None:
+            return None
+        sections.sort(key=lambda section: section[0])
+        return {
+            'grade_id': book.get('grade_id'),
+            'subject_id': book.get('subject_id'),
+            'vector': vector,
+            'ranges': np.array([[start, end] for start, end, _ in sections], dtype=np.int32).reshape(-1, 2),
+            'sections': (
+                np.stack([section for _, _, section in sections])
+                if sections else np.zeros((0, len(vector)), dtype=np.float16)
+            ),
+        }
+
+    # --- Loading ----------------------------------------------------------
+
+    def load(self):
+        """Replace the routing state with every stored centroid."""
+        if not self._loading.acquire(blocking=False):
+            return
+        try:
+            started = time.monotonic()
+            books = {
+                str(book['id']): book
+                for book in SupabaseService.scan_table('books', columns='id,grade_id,subject_id')
+            }
+            rows_by_book: Dict[str, List[Dict]] = {}
+            for row in self._fetch_rows():
+                rows_by_book.setdefault(str(row['book_id']), []).append(row)
+
+            entries = {}
+            for book_id, rows in rows_by_book.items():
+                if book_id in books:
+                    entry = self._entry(books[book_id], rows)
+                    if entry is not None:
+                        entries[book_id] = entry
+            unrouted = {book_id: book for book_id, book in books.items() if book_id not in entries}
+            with self._write_lock:
+                self._snapshot = _Snapshot(entries, unrouted)
+            self._last_refresh = time.time()
+            self.ready.set()
+            logger.info(
+                f"Book router loaded: {len(entries)} books ({len(unrouted)} without centroids) "
+                f"in {time.monotonic() - started:.2f}s"
+            )
+        except Exception as e:
+            logger.warning(f"Book router load failed: {e}")
+        finally:
+            self._loading.release()
+
+    def maybe_refresh(self):
+        """Reload in the background when older than ``BOOK_ROUTER_REFRESH_SECONDS``."""
+        if time.time() - self._last_refresh >= settings.BOOK_ROUTER_REFRESH_SECONDS:
+            self._last_refresh = time.time()
+            run_in_background(self.load)
+
+    @staticmethod
+    def _fetch_rows(page_size: int = 500) -> Iterable[Dict]:
+        cursor = None
+        while True:
+            rows, has_more = SupabaseService.fetch_keyset_page(
+                ROUTER_TABLE,
+                columns='id,book_id,page_start,page_end,embedding,created_at',
+                cursor=cursor,
+                limit=page_size
+            )
+            yield from rows
+            if not has_more or not rows:
+                return
+            cursor = (rows[-1]['created_at'], rows[-1]['id'])
+
+
+def warm_book_router():
+    """Load centroids in the background so the first chat does not pay for it."""
+    run_in_background(BookRouter.get().load)
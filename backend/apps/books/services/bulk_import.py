@@ -0,0 +1,382 @@
+"""
+Bulk import engine for official PDFs.
+
+A batch is recorded in ``import_batches`` and processed in the background,
+at most ``BULK_IMPORT_CONCURRENT_BATCHES`` at a time per process on a pool
+of their own (later ones stay queued): books are imported concurrently on a
+thread pool, downloads are limited per source host, PDF parsing runs in a
+process pool so it does not contend for the GIL with request threads, and
+transient failures are retried with jittered exponential backoff. Progress
+is kept in memory for live event streams and persisted to the batch row for
+polling from any process.
+
+While a process holds unfinished batches it touches their rows every
+``BULK_IMPORT_HEARTBEAT_SECONDS``. A queued or running batch whose row has
+not been touched for ``BULK_IMPORT_STALE_SECONDS`` lost its process (e.g. a
+restart) and is marked failed when its progress is next read.
+
+A finished batch is ``completed`` when every book was imported or already
+registered, ``partial`` when only some were and ``failed`` when none were.
+"""
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+from apps.core.exceptions import BookImportError
+from apps.core.services.downloads import DownloadedFile
+from apps.core.services.supabase_service import SupabaseService
+from .book_importer import BOOK_SPEC_FIELDS, BookImporter, parse_pdf
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('completed', 'partial', 'failed')
+UNFINISHED_ITEM_STATUSES = ('pending', 'running', 'retrying')
+# Finished batches kept in memory for late progress readers
+FINISHED_BATCHES_KEPT = 50
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+_batch_pool: Optional[ThreadPoolExecutor] = None
+_batch_pool_lock = threading.Lock()
+
+
+def get_batch_pool() -> ThreadPoolExecutor:
+    """Pool running batches, so imports never occupy the shared background pool."""
+    global _batch_pool
+    if _batch_pool is None:
+        with _batch_pool_lock:
+            if _batch_pool is None:
+                _batch_pool = ThreadPoolExecutor(
+                    max_workers=settings.BULK_IMPORT_CONCURRENT_BATCHES,
+                    thread_name_prefix='import-batch'
+                )
+    return _batch_pool
+
+
+def _init_parse_worker():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """Shared process pool for PDF parsing. Spawned, since forking a threaded server is unsafe."""
+    global _parse_pool
+    if _parse_pool is None:
+        with _parse_pool_lock:
+            if _parse_pool is None:
+                _parse_pool = ProcessPoolExecutor(
+                    max_workers=settings.BULK_IMPORT_PARSE_PROCESSES,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_parse_worker
+                )
+    return _parse_pool
+
+
+def parse_in_pool(path: str) -> Tuple[int, str]:
+    """Parse a downloaded PDF in the process pool; only the path crosses the process boundary."""
+    return get_parse_pool().submit(parse_pdf, path).result()
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _is_stale(record: Dict) -> bool:
+    if record.get('status') in TERMINAL_STATUSES or not record.get('updated_at'):
+        return False
+    updated_at = datetime.fromisoformat(record['updated_at'])
+    return (datetime.now(timezone.utc) - updated_at).total_seconds() > settings.BULK_IMPORT_STALE_SECONDS
+
+
+class ImportBatch:
+    """In-memory progress of one batch; readers wait on ``condition`` for changes."""
+
+    def __init__(self, batch_id: str, specs: List[Dict], created_by: str = None):
+        self.id = batch_id
+        self.specs = specs
+        self.created_by = created_by
+        self.status = 'queued'
+        self.version = 0
+        self.items = [
+            {
+                'index': index,
+                'source_url': spec.get('source_url'),
+                'title': spec.get('title'),
+                'status': 'pending',
+                'attempts': 0,
+                'book_id': None,
+                'error': None,
+            }
+            for index, spec in enumerate(specs)
+        ]
+        self.condition = threading.Condition()
+        self._persist_lock = threading.Lock()
+
+    def set_status(self, status: str):
+        with self.condition:
+            self.status = status
+            self.version += 1
+            self.condition.notify_all()
+
+    def update_item(self, index: int, **changes):
+        with self.condition:
+            self.items[index].update(changes)
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """Block until the batch changes past ``version`` or ``timeout`` passes; returns the current version."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def outcome(self) -> str:
+        """Terminal status once every item has finished."""
+        summary = self.summary()
+        if summary['failed'] == 0:
+            return 'completed'
+        return 'failed' if summary['failed'] == summary['total'] else 'partial'
+
+    def summary(self) -> Dict:
+        with self.condition:
+            items = [dict(item) for item in self.items]
+            status = self.status
+        counts = defaultdict(int)
+        for item in items:
+            counts[item['status']] += 1
+        return {
+            'id': self.id,
+            'status': status,
+            'created_by': self.created_by,
+            'total': len(items),
+            'imported': counts['imported'],
+            'existing': counts['existing'],
+            'failed': counts['failed'],
+            'pending': counts['pending'] + counts['running'] + counts['retrying'],
+            'items': items,
+        }
+
+    def persist(self):
+        """Write the current progress to the batch row. Writes are serialized so the last one wins."""
+        with self._persist_lock:
+            summary = self.summary()
+            record = {
+                'status': summary['status'],
+                'total': summary['total'],
+                'succeeded': summary['imported'] + summary['existing'],
+                'failed': summary['failed'],
+                'items': summary['items'],
+                'updated_at': _utc_now(),
+            }
+            if summary['status'] in TERMINAL_STATUSES:
+                record['finished_at'] = record['updated_at']
+            try:
+                SupabaseService.update_record('import_batches', self.id, record)
+            except Exception as e:
+                logger.warning(f"Could not persist progress of import batch {self.id}: {e}")
+
+
+class _HostLimitedImporter(BookImporter):
+    """BookImporter whose downloads take a per-host slot first."""
+
+    def __init__(self, engine: 'BulkImporter', **kwargs):
+        super().__init__(**kwargs)
+        self.engine = engine
+
+    def download(self, source_url: str) -> DownloadedFile:
+        with self.engine.host_slot(source_url):
+            return super().download(source_url)
+
+
+class BulkImporter:
+    """Runs import batches; one instance per batch."""
+
+    _batches: Dict[str, ImportBatch] = {}
+    _registry_lock = threading.Lock()
+    _heartbeat: Optional[threading.Thread] = None
+    # Download slots are shared by all batches in the process
+    _host_slots: Dict[str, threading.BoundedSemaphore] = {}
+    _host_lock = threading.Lock()
+
+    def __init__(self):
+        self.workers = settings.BULK_IMPORT_WORKERS
+        self.max_attempts = settings.BULK_IMPORT_MAX_ATTEMPTS
+        self.retry_base = settings.BULK_IMPORT_RETRY_BASE_SECONDS
+        self.importer = _HostLimitedImporter(self, parse=parse_in_pool)
+
+    @staticmethod
+    def build_specs(books: List[Dict], default_grade_id=None, default_subject_id=None) -> List[Dict]:
+        """Normalize request entries into importer specs, applying batch defaults."""
+        specs = []
+        for book in books:
+            spec = {field: book.get(field) for field in BOOK_SPEC_FIELDS}
+            spec['grade_id'] = spec['grade_id'] or default_grade_id
+            spec['subject_id'] = spec['subject_id'] or default_subject_id
+            specs.append(spec)
+        return specs
+
+    @classmethod
+    def start(cls, specs: List[Dict], created_by: str = None) -> Dict:
+        """Record a new batch, schedule it, and return its initial summary."""
+        batch = ImportBatch(str(uuid.uuid4()), specs, created_by=created_by)
+        SupabaseService.insert_record('import_batches', {
+            'id': batch.id,
+            'status': batch.status,
+            'total': len(specs),
+            'succeeded': 0,
+            'failed': 0,
+            'items': batch.summary()['items'],
+            'created_by': created_by,
+        })
+        with cls._registry_lock:
+            cls._prune()
+            cls._batches[batch.id] = batch
+            if cls._heartbeat is None:
+                cls._heartbeat = threading.Thread(target=cls._beat, name='import-heartbeat', daemon=True)
+                cls._heartbeat.start()
+        get_batch_pool().submit(cls().run, batch)
+        return batch.summary()
+
+    @classmethod
+    def _beat(cls):
+        """Touch the rows of this process's unfinished batches so readers can tell them from lost ones."""
+        while True:
+            time.sleep(settings.BULK_IMPORT_HEARTBEAT_SECONDS)
+            with cls._registry_lock:
+                live = [batch.id for batch in cls._batches.values() if batch.status not in TERMINAL_STATUSES]
+            for batch_id in live:
+                try:
+                    SupabaseService.update_record('import_batches', batch_id, {'updated_at': _utc_now()})
+                except Exception as e:
+                    logger.warning(f"Could not record heartbeat of import batch {batch_id}: {e}")
+
+    @classmethod
+    def get_batch(cls, batch_id: str) -> Optional[ImportBatch]:
+        """The live batch if it is running (or recently finished) in this process."""
+        with cls._registry_lock:
+            return cls._batches.get(batch_id)
+
+    @classmethod
+    def load_summary(cls, batch_id: str) -> Optional[Dict]:
+        """Progress from memory when available, otherwise from the batch row."""
+        batch = cls.get_batch(batch_id)
+        if batch:
+            return batch.summary()
+        record = SupabaseService.fetch_by_id('import_batches', batch_id)
+        if not record:
+            return None
+        if _is_stale(record):
+            record = cls._fail_lost(record)
+        items = record.get('items') or []
+        counts = defaultdict(int)
+        for item in items:
+            counts[item.get('status')] += 1
+        return {
+            'id': record['id'],
+            'status': record['status'],
+            'created_by': record.get('created_by'),
+            'total': record.get('total', len(items)),
+            'imported': counts['imported'],
+            'existing': counts['existing'],
+            'failed': counts['failed'],
+            'pending': record.get('total', len(items)) - counts['imported'] - counts['existing'] - counts['failed'],
+            'items': items,
+        }
+
+    @staticmethod
+    def _fail_lost(record: Dict) -> Dict:
+        """Mark a batch whose process stopped heartbeating as failed, unless it was touched meanwhile."""
+        items = [
+            {**item, 'status': 'failed', 'error': 'Import interrupted'}
+            if item.get('status') in UNFINISHED_ITEM_STATUSES else item
+            for item in record.get('items') or []
+        ]
+        now = _utc_now()
+        updated = SupabaseService.update_where(
+            'import_batches',
+            {'id': record['id'], 'updated_at': record['updated_at']},
+            {
+                'status': 'failed',
+                'failed': sum(1 for item in items if item.get('status') == 'failed'),
+                'items': items,
+                'updated_at': now,
+                'finished_at': now,
+            }
+        )
+        if updated:
+            logger.warning(f"Import batch {record['id']} stopped heartbeating; marked failed")
+            return updated[0]
+        return SupabaseService.fetch_by_id('import_batches', record['id']) or record
+
+    @classmethod
+    def _prune(cls):
+        finished = [key for key, batch in cls._batches.items() if batch.status in TERMINAL_STATUSES]
+        for key in finished[:max(len(finished) - FINISHED_BATCHES_KEPT, 0)]:
+            del cls._batches[key]
+
+    @classmethod
+    def host_slot(cls, url: str) -> threading.BoundedSemaphore:
+        """Semaphore bounding concurrent downloads from the URL's host."""
+        host = urlparse(url).netloc.lower()
+        with cls._host_lock:
+            if host not in cls._host_slots:
+                cls._host_slots[host] = threading.BoundedSemaphore(settings.BULK_IMPORT_PER_HOST_LIMIT)
+            return cls._host_slots[host]
+
+    def run(self, batch: ImportBatch):
+        """Import every book in the batch and record how it went (see ``ImportBatch.outcome``)."""
+        logger.info(f"Starting import batch {batch.id} with {len(batch.specs)} books")
+        batch.set_status('running')
+        batch.persist()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'import-{batch.id[:8]}') as pool:
+                for index, spec in enumerate(batch.specs):
+                    pool.submit(self._import_item, batch, index, spec)
+            batch.set_status(batch.outcome())
+        except Exception as e:
+            logger.error(f"Import batch {batch.id} failed: {e}")
+            batch.set_status('failed')
+        finally:
+            batch.persist()
+        summary = batch.summary()
+        logger.info(
+            f"Import batch {batch.id} finished: {summary['imported']} imported, "
+            f"{summary['existing']} already registered, {summary['failed']} failed"
+        )
+
+    def _import_item(self, batch: ImportBatch, index: int, spec: Dict):
+        for attempt in range(1, self.max_attempts + 1):
+            batch.update_item(index, status='running', attempts=attempt)
+            try:
+                book, created = self.importer.import_book(spec)
+                batch.update_item(
+                    index,
+                    status='imported' if created else 'existing',
+                    book_id=book.get('id'),
+                    title=book.get('title'),
+                    error=None
+                )
+                break
+            except Exception as e:
+                # Storage and database errors are treated as transient too
+                retryable = e.retryable if isinstance(e, BookImportError) else True
+                if not retryable or attempt == self.max_attempts:
+                    logger.warning(f"Import of {spec.get('source_url')} failed after {attempt} attempts: {e}")
+                    batch.update_item(index, status='failed', error=str(e))
+                    break
+                delay = self.retry_base * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                batch.update_item(index, status='retrying', error=str(e))
+                time.sleep(delay)
+        batch.persist()
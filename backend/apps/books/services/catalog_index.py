@@ -0,0 +1,326 @@
+"""
+In-memory full-text index over the book catalog.
+
+An inverted index over title, author, description and page text, ranked
+with BM25 (fields weighted by ``FIELD_WEIGHTS``). The last query term, and
+any term with no exact match, also matches as a prefix through a sorted
+term list, so partial words work while typing. Results carry grade and
+subject facet counts.
+
+Each process holds its own index. It is built from Supabase at startup,
+updated in place when books are written through this process, and
+reconciled against the table every ``CATALOG_INDEX_SYNC_SECONDS`` to pick
+up writes from other processes.
+"""
+import logging
+import math
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+from apps.core.background import run_in_background
+from apps.core.services.supabase_service import SupabaseService
+from apps.core.services.text_artifacts import get_text_artifacts
+
+logger = logging.getLogger(__name__)
+
+FIELD_WEIGHTS = {'title': 3.0, 'author': 2.0, 'description': 1.5, 'text': 1.0}
+# Fields kept per book to render results without another query
+SUMMARY_FIELDS = ('id', 'title', 'author', 'description', 'grade_id', 'subject_id', 'download_url', 'page_count')
+INDEX_COLUMNS = ','.join(SUMMARY_FIELDS + ('text_artifact_key', 'created_at', 'updated_at', 'extracted_text'))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Prefix expansions considered per query term, and their score discount
+MAX_PREFIX_EXPANSIONS = 50
+PREFIX_WEIGHT = 0.6
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+STOPWORDS = frozenset(
+    'a an and are as at be by for from in into is it of on or that the this to with'.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords; Unicode-aware so Ge'ez script works."""
+    return [token for token in TOKEN_PATTERN.findall((text or '').lower()) if token not in STOPWORDS]
+
+
+class CatalogIndex:
+    """Thread-safe inverted index of books."""
+
+    _instance: Optional['CatalogIndex'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._terms: List[str] = []
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._docs: Dict[str, Dict] = {}
+        self._versions: Dict[str, str] = {}
+        self._total_length = 0.0
+        self.ready = threading.Event()
+        self._building = threading.Lock()
+        self._last_sync = 0.0
+
+    @classmethod
+    def get(cls) -> 'CatalogIndex':
+        """The process-wide index."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    # --- Writes -----------------------------------------------------------
+
+    def upsert(self, book: Dict, text: str = None):
+        """Index or re-index a book. ``text`` overrides the row's inline text preview."""
+        book_id = str(book['id'])
+        body = text if text is not None else book.get('extracted_text') or ''
+        weights: Dict[str, float] = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(body if field == 'text' else book.get(field)):
+                weights[token] += weight
+
+        with self._lock:
+            previous = self._docs.get(book_id)
+            self._remove_locked(book_id)
+            summary = {field: book.get(field) for field in SUMMARY_FIELDS}
+            # Partial rows (e.g. from an update) keep the fields they do not carry
+            if previous:
+                summary = {field: book.get(field, previous.get(field)) for field in SUMMARY_FIELDS}
+            summary['id'] = book_id
+            self._docs[book_id] = summary
+            self._versions[book_id] = book.get('updated_at') or ''
+            for token, weight in weights.items():
+                if token not in self._postings:
+                    insort(self._terms, token)
+                self._postings[token][book_id] = weight
+            self._doc_terms[book_id] = list(weights)
+            self._doc_lengths[book_id] = sum(weights.values())
+            self._total_length += self._doc_lengths[book_id]
+
+    def remove(self, book_id: str):
+        with self._lock:
+            self._remove_locked(str(book_id))
+
+    def _remove_locked(self, book_id: str):
+        for token in self._doc_terms.pop(book_id, []):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(book_id, None)
+            if not postings:
+                del self._postings[token]
+                position = bisect_left(self._terms, token)
+                if position < len(self._terms) and self._terms[position] == token:
+                    del self._terms[position]
+        self._total_length -= self._doc_lengths.pop(book_id, 0.0)
+        self._docs.pop(book_id, None)
+        self._versions.pop(book_id, None)
+
+    # --- Queries ----------------------------------------------------------
+
+    def search(
+        self,
+        query: str,
+        grade_id: int = None,
+        subject_id: int = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> Dict:
+        """
+        Rank books for ``query``, optionally filtered by grade and subject.
+
+        An empty query lists the filtered catalog by title.
+
+        Returns:
+            Dict with total, results (book summaries with score) and facets
+            ({'grade_id': {id: count}, 'subject_id': {id: count}}) over the
+            matching books before grade/subject filtering.
+        """
+        terms = tokenize(query)
+        with self._lock:
+            if terms:
+                scores = self._score(terms)
+            else:
+                scores = {book_id: 0.0 for book_id in self._docs}
+
+            facets = {'grade_id': defaultdict(int), 'subject_id': defaultdict(int)}
+            matches = []
+            for book_id, score in scores.items():
+                doc = self._docs[book_id]
+                facets['grade_id'][doc.get('grade_id')] += 1
+                facets['subject_id'][doc.get('subject_id')] += 1
+                if grade_id is not None and str(doc.get('grade_id')) != str(grade_id):
+                    continue
+                if subject_id is not None and str(doc.get('subject_id')) != str(subject_id):
+                    continue
+                matches.append((score, doc))
+
+        if terms:
+            matches.sort(key=lambda item: (-item[0], (item[1].get('title') or '').lower()))
+        else:
+            matches.sort(key=lambda item: (item[1].get('title') or '').lower())
+
+        return {
+            'total': len(matches),
+            'results': [
+                {**doc, 'score': round(score, 4)}
+                for score, doc in matches[offset:offset + limit]
+            ],
+            'facets': {
+                name: {str(key): count for key, count in counts.items() if key is not None}
+                for name, counts in facets.items()
+            },
+        }
+
+    def _score(self, terms: List[str]) -> Dict[str, float]:
+        """BM25 over weighted term frequencies; every query term must match (AND)."""
+        doc_count = len(self._docs) or 1
+        average_length = (self._total_length / doc_count) or 1.0
+        scores: Optional[Dict[str, float]] = None
+
+        for position, term in enumerate(terms):
+            expansions = self._expand(term, is_last=position == len(terms) - 1)
+            term_scores: Dict[str, float] = defaultdict(float)
+            for token, boost in expansions:
+                postings = self._postings[token]
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for book_id, frequency in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[book_id] / average_length)
+                    score = boost * idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    term_scores[book_id] = max(term_scores[book_id], score)
+
+            if scores is None:
+                scores = dict(term_scores)
+            else:
+                scores = {book_id: scores[book_id] + term_scores[book_id]
+                          for book_id in scores if book_id in term_scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+    def _expand(self, term: str, is_last: bool) -> List[tuple]:
+        """Exact match, plus prefix matches for the last term or for terms with no exact match."""
+        expansions = []
+        if term in self._postings:
+            expansions.append((term, 1.0))
+            if not is_last:
+                return expansions
+        start = bisect_left(self._terms, term)
+        for token in self._terms[start:start + MAX_PREFIX_EXPANSIONS + 1]:
+            if not token.startswith(term):
+                break
+            if token != term:
+                expansions.append((token, PREFIX_WEIGHT))
+        return expansions
+
+    # --- Loading ----------------------------------------------------------
+
+    def rebuild(self):
+        """Replace the index with the current catalog, then add full page text from artifacts."""
+        if not self._building.acquire(blocking=False):
+            return
+        try:
+            started = time.monotonic()
+            fresh = CatalogIndex()
+            rows = list(self._fetch_rows())
+            for row in rows:
+                fresh.upsert(row)
+            with self._lock:
+                self._swap_from(fresh)
+                self._last_sync = time.time()
+            self.ready.set()
+            logger.info(f"Catalog index built: {len(rows)} books in {time.monotonic() - started:.2f}s")
+
+            if settings.CATALOG_INDEX_PAGE_TEXT:
+                for row in rows:
+                    if row.get('text_artifact_key'):
+                        self._index_artifact_text(row)
+        finally:
+            self._building.release()
+
+    def sync(self):
+        """Reconcile with Supabase: drop deleted books, (re)index new and changed ones."""
+        if not self.ready.is_set():
+            return self.rebuild()
+        if not self._building.acquire(blocking=False):
+            return
+        try:
+            self._last_sync = time.time()
+            current = {
+                str(row['id']): row.get('updated_at') or ''
+                for row in SupabaseService.scan_table('books', columns='id,updated_at')
+            }
+            with self._lock:
+                known = dict(self._versions)
+            for book_id in set(known) - set(current):
+                self.remove(book_id)
+            for book_id, version in current.items():
+                if known.get(book_id) != version:
+                    row = SupabaseService.fetch_table('books', {'id': book_id}, limit=1, columns=INDEX_COLUMNS)
+                    if row:
+                        self.upsert(row[0])
+                        if settings.CATALOG_INDEX_PAGE_TEXT and row[0].get('text_artifact_key'):
+                            self._index_artifact_text(row[0])
+        except Exception as e:
+            logger.warning(f"Catalog index sync failed: {e}")
+        finally:
+            self._building.release()
+
+    def maybe_sync(self):
+        """Schedule a background sync when the index is older than the sync interval."""
+        if time.time() - self._last_sync >= settings.CATALOG_INDEX_SYNC_SECONDS:
+            self._last_sync = time.time()
+            run_in_background(self.sync)
+
+    def _swap_from(self, other: 'CatalogIndex'):
+        self._postings = other._postings
+        self._terms = other._terms
+        self._doc_terms = other._doc_terms
+        self._doc_lengths = other._doc_lengths
+        self._docs = other._docs
+        self._versions = other._versions
+        self._total_length = other._total_length
+
+    def _index_artifact_text(self, row: Dict):
+        try:
+            text = get_text_artifacts().text(row['text_artifact_key'])
+        except Exception as e:
+            logger.warning(f"Could not load text for book {row['id']}: {e}")
+            return
+        self.upsert(row, text=text)
+
+    @staticmethod
+    def _fetch_rows(page_size: int = 500) -> Iterable[Dict]:
+        cursor = None
+        while True:
+            rows, has_more = SupabaseService.fetch_keyset_page(
+                'books', columns=INDEX_COLUMNS, cursor=cursor, limit=page_size
+            )
+            yield from rows
+            if not has_more or not rows:
+                return
+            cursor = (rows[-1]['created_at'], rows[-1]['id'])
+
+
+def index_book(book: Dict):
+    """Index a book written through this process; its full page text follows in the background."""
+    index = CatalogIndex.get()
+    index.upsert(book)
+    if settings.CATALOG_INDEX_PAGE_TEXT and book.get('text_artifact_key'):
+        run_in_background(index._index_artifact_text, book)
+
+
+def warm_catalog_index():
+    """Build the index in the background so the first search does not pay for it."""
+    run_in_background(CatalogIndex.get().rebuild)
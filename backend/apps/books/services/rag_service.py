@@ -1,94 +1,166 @@
 import logging
+import time
 import uuid
-import requests
-from io import BytesIO
-import PyPDF2
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Iterable, Tuple, Optional
+from django.conf import settings
 from apps.core.services.ai_service import AIService
+from apps.core.services.blob_store import BlobStore
+from apps.core.services.downloads import download_to_file
+from apps.core.services.file_processor import FileProcessor
 from apps.core.services.pinecone_service import PineconeService
 from apps.core.services.supabase_service import SupabaseService
+from apps.core.services.text_artifacts import artifact_key, get_text_artifacts
+from apps.core.services.token_counter import count_tokens
+from apps.core.exceptions import UpstreamUnavailable
+from apps.core.metrics import record_cache, record_ingestion
+from apps.core.singleflight import SingleFlight
+from apps.core.tracing import set_attributes, traced
+from .book_pages import BookPages
+from .book_router import BOOK_LEVEL, BookRouter, CentroidAccumulator
+from .catalog_index import index_book
 
 logger = logging.getLogger(__name__)
 
+BOOKS_NAMESPACE = "books"
+DOCUMENTS_NAMESPACE = "documents"
+# Chunks embedded per OpenAI request and vectors per Pinecone upsert
+INDEX_BATCH_SIZE = 100
+# Books without centroids added to a routed search before it falls back to plain filtering
+MAX_UNROUTED_BOOKS = 50
+# Book columns ingestion reads; never the legacy inline extracted_text
+BOOK_INGEST_COLUMNS = (
+    'id,title,download_url,content_hash,text_artifact_key,page_artifact_prefix,'
+    'page_generation_attempts,metadata'
+)
+
+
+def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Split text into ``chunk_size``-character windows overlapping by ``chunk_overlap``."""
+    if not text:
+        return []
+    if chunk_overlap >= chunk_size:
+        raise ValueError("chunk_overlap must be smaller than chunk_size")
+        
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        chunks.append(text[start:end])
+        start = end - chunk_overlap
+        
+    return chunks
+
+
+def format_context(matches: List[Dict[str, Any]], source_label, token_budget: int) -> Tuple[str, int, int]:
+    """
+    Format matches best-first until the token budget is spent.
+    
+    Returns:
+        Tuple of (context, matches included, tokens used)
+    """
+    context_parts = []
+    remaining = token_budget
+    for match in matches:
+        metadata = match.get('metadata', {})
+        part = f"--- FROM {source_label(metadata)} ---\n{metadata.get('text', '')}"
+        cost = count_tokens(part)
+        if cost > remaining:
+            break
+        remaining -= cost
+        context_parts.append(part)
+    return "\n\n".join(context_parts), len(context_parts), token_budget - remaining
+
+
 class RAGService:
     """Service for RAG operations: indexing and querying."""
     
     def __init__(self):
         self.ai = AIService()
         self.pinecone = PineconeService()
-        self.chunk_size = 1000  # Local characters
-        self.chunk_overlap = 200
+        self.chunk_size = settings.RAG_CHUNK_SIZE  # Local characters
+        self.chunk_overlap = settings.RAG_CHUNK_OVERLAP
+        self.top_k = settings.RAG_TOP_K
+        self.context_token_budget = settings.RAG_CONTEXT_TOKEN_BUDGET
+        self.document_token_budget = settings.RAG_DOCUMENT_TOKEN_BUDGET
+        self._query_embeddings: Dict[str, List[float]] = {}
 
+    @traced('rag.ingest_book', capture=('book_id',))
     def ingest_book(self, book_id: str) -> bool:
         """Fetch book PDF, chunk it, embed it, and store in Pinecone."""
         try:
             logger.info(f"Starting RAG ingestion for book: {book_id}")
             
             # Fetch book from Supabase
-            book = SupabaseService.fetch_by_id('books', book_id)
+            book = SupabaseService.fetch_by_id('books', book_id, columns=BOOK_INGEST_COLUMNS)
             if not book:
                 logger.error(f"Book {book_id} not found in database.")
                 return False
                 
-            pdf_url = book.get('download_url')
-            if not pdf_url:
-                logger.error(f"No download URL for book {book_id}")
-                return False
-                
-            # Download PDF
-            response = requests.get(pdf_url)
-            response.raise_for_status()
-            pdf_content = response.content
-            
-            # Extract text by page
-            pages = self._extract_text_by_page(pdf_content)
-            
-            # Chunk and Embed
-            vectors = []
-            chunk_count = 0
-            
-            for page in pages:
-                page_text = page['text']
-                page_num = page['page_number']
-                
-                # Simple sliding window chunking
-                # In production, use a more sophisticated chunker (e.g. LangChain)
-                chunks = self._chunk_text(page_text)
-                
-                for i, chunk in enumerate(chunks):
-                    if not chunk.strip():
-                        continue
-                        
-                    embedding = self.ai.generate_embedding(chunk)
-                    
-                    vector_id = f"{book_id}_p{page_num}_c{i}"
-                    vectors.append({
-                        "id": vector_id,
-                        "values": embedding,
-                        "metadata": {
-                            "book_id": book_id,
-                            "page_number": page_num,
-                            "chunk_index": i,
-                            "text": chunk,
-                            "book_title": book.get('title', 'Unknown')
-                        }
-                    })
-                    chunk_count += 1
+            # Chunk and Embed, page by page, collecting routing centroids on the way
+            centroids = CentroidAccumulator() if settings.BOOK_ROUTER_ENABLED else None
+
+            def index(pages):
+                return self._index_pages(
+                    pages,
+                    id_prefix=book_id,
+                    base_metadata={
+                        "book_id": book_id,
+                        "book_title": book.get('title', 'Unknown')
+                    },
+                    namespace=BOOKS_NAMESPACE,
+                    centroids=centroids
+                )
+
+            # Re-indexing reads the stored text artifact instead of re-parsing the PDF
+            text_artifact_key = book.get('text_artifact_key')
+            save_text = not text_artifact_key
+            if text_artifact_key:
+                chunk_count = index(get_text_artifacts().pages(text_artifact_key))
+            else:
+                pdf_url = book.get('download_url')
+                if not pdf_url:
+                    logger.error(f"No download URL for book {book_id}")
+                    return False
                     
-                    # Batch upsert to avoid large requests
-                    if len(vectors) >= 100:
-                        self.pinecone.upsert_vectors(vectors)
-                        vectors = []
+                # Stream the PDF to disk; pages go from the extractor to the embedder and
+                # the text artifact one at a time, so the book is never held in memory
+                text_artifact_key = artifact_key(book.get('content_hash') or f"books/{book_id}")
+                writer = get_text_artifacts().writer(text_artifact_key)
+                download = download_to_file(pdf_url)
+                try:
+                    def pages():
+                        for number, text in FileProcessor().iter_pages(download.path, 'pdf'):
+                            writer.add(number, text)
+                            yield number, text
+
+                    chunk_count = index(pages())
+                    writer.close()
+                    # Split into single-page PDFs while the file is on disk
+                    if not book.get('page_artifact_prefix'):
+                        BookPages.generate(book, download.path)
+                finally:
+                    download.remove()
             
-            # Final upsert
-            if vectors:
-                self.pinecone.upsert_vectors(vectors)
-                
-            # Update book status in DB
-            SupabaseService.update_record('books', book_id, {
+            if centroids:
+                try:
+                    BookRouter.get().save_book(book, centroids)
+                except Exception as e:
+                    logger.warning(f"Could not store routing centroids for book {book_id}: {e}")
+            
+            updates = {
                 'is_processed': True,
                 'metadata': {**book.get('metadata', {}), 'rag_indexed': True}
-            })
+            }
+            if save_text:
+                updates['text_artifact_key'] = text_artifact_key
+                if book.get('content_hash'):
+                    BlobStore.set_text_artifact(book['content_hash'], text_artifact_key)
+                
+            # Update book status in DB
+            updated = SupabaseService.update_record('books', book_id, updates)
+            if save_text and updated:
+                # Full page text is searchable now that it has been extracted; read back from the artifact
+                index_book(updated)
             
             logger.info(f"Successfully ingested book {book_id}. Total chunks: {chunk_count}")
             return True
@@ -97,41 +169,220 @@ class RAGService:
             logger.error(f"Error ingesting book {book_id} into RAG: {e}")
             return False
 
-    def query_book_context(self, query: str, book_id: Optional[str] = None, top_k: int = 5) -> str:
-        """Search for relevant chunks and return formatted context."""
+    def ingest_document(self, content_hash: str, pages: Iterable[Tuple[int, str]], metadata: Dict[str, Any]) -> bool:
+        """
+        Chunk and embed an uploaded file into the documents namespace.
+        
+        Vectors are keyed by the file's content hash, so identical uploads in
+        different conversations share one set of embeddings.
+        """
+        try:
+            logger.info(f"Starting RAG ingestion for blob: {content_hash}")
+            chunk_count = self._index_pages(
+                pages,
+                id_prefix=content_hash,
+                base_metadata={**metadata, "content_hash": content_hash},
+                namespace=DOCUMENTS_NAMESPACE
+            )
+            BlobStore.mark_indexed(content_hash)
+            logger.info(f"Successfully ingested blob {content_hash}. Total chunks: {chunk_count}")
+            return True
+        except Exception as e:
+            logger.error(f"Error ingesting blob {content_hash} into RAG: {e}")
+            return False
+
+    @traced('rag.book_context', capture=('book_id', 'grade_id', 'subject_id'))
+    def query_book_context(
+        self,
+        query: str,
+        book_id: Optional[str] = None,
+        top_k: Optional[int] = None,
+        grade_id=None,
+        subject_id=None
+    ) -> str:
+        """
+        Search for relevant chunks and return formatted context.
+        
+        Without a ``book_id`` the search is first routed to the best books
+        and sections for the grade/subject (see ``BookRouter``). Concurrent
+        identical lookups share one search (see ``SingleFlight``). Raises
+        when the search fails.
+        """
+        top_k = top_k or self.top_k
+        return SingleFlight.get().do(
+            'book_context',
+            [query, book_id, top_k, grade_id, subject_id, self.context_token_budget],
+            lambda: self._book_context(query, book_id, top_k, grade_id, subject_id)
+        )
+
+    def _book_context(self, query: str, book_id, top_k: int, grade_id, subject_id) -> str:
         try:
-            query_embedding = self.ai.generate_embedding(query)
-            
             filter = None
             if book_id:
                 filter = {"book_id": book_id}
+            elif settings.BOOK_ROUTER_ENABLED:
+                filter = self._routed_filter(query, grade_id, subject_id)
                 
-            matches = self.pinecone.query_vectors(query_embedding, top_k=top_k, filter=filter)
-            
-            context_parts = []
-            for match in matches:
-                metadata = match.get('metadata', {})
-                text = metadata.get('text', '')
-                page = metadata.get('page_number', '?')
-                title = metadata.get('book_title', 'Book')
-                
-                context_parts.append(f"--- FROM {title}, PAGE {page} ---\n{text}")
-                
-            return "\n\n".join(context_parts)
+            matches = self.pinecone.query_vectors(
+                self._embed_query(query), top_k=top_k, filter=filter, namespace=BOOKS_NAMESPACE
+            )
+            return self._format_context(
+                matches,
+                lambda metadata: f"{metadata.get('book_title', 'Book')}, PAGE {metadata.get('page_number', '?')}",
+                self.context_token_budget
+            )
             
         except Exception as e:
+            # Raised rather than returned as no context, so a failed search is not mistaken for an empty one
             logger.error(f"Error querying book context: {e}")
-            return ""
+            raise
+
+    def _routed_filter(self, query: str, grade_id=None, subject_id=None) -> Optional[Dict[str, Any]]:
+        """
+        Pinecone filter restricting a search to the routed sections, plus any
+        matching books routing cannot see yet, or else to the filtered books.
+        """
+        router = BookRouter.get()
+        router.maybe_refresh()
+        routes = router.route(self._embed_query(query), grade_id=grade_id, subject_id=subject_id)
+        # Books not backfilled with centroids are searched whole; with too many, routing is skipped
+        unrouted = router.unrouted_books(grade_id=grade_id, subject_id=subject_id) if routes else []
+        if routes and len(unrouted) <= MAX_UNROUTED_BOOKS:
+            logger.info(
+                "Routed query to " + ", ".join(
+                    f"{route['book_id']} p{route['page_start']}-{route['page_end']}" for route in routes
+                )
+            )
+            clauses = [
+                {"book_id": route['book_id']} if route['page_start'] == BOOK_LEVEL else {
+                    "book_id": route['book_id'],
+                    "page_number": {"$gte": route['page_start'], "$lte": route['page_end']},
+                }
+                for route in routes
+            ]
+            if unrouted:
+                clauses.append({"book_id": {"$in": unrouted}})
+            return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+        
+        # Routing unavailable or covering too few books: restrict to the grade/subject's books
+        if grade_id is None and subject_id is None:
+            return None
+        filters = {}
+        if grade_id is not None:
+            filters['grade_id'] = grade_id
+        if subject_id is not None:
+            filters['subject_id'] = subject_id
+        book_ids = [book['id'] for book in SupabaseService.fetch_table('books', filters, columns='id')]
+        return {"book_id": {"$in": book_ids}} if book_ids else None
+
+    @traced('rag.document_context')
+    def query_document_context(self, query: str, content_hashes: List[str], top_k: Optional[int] = None) -> str:
+        """Search the given uploaded files (by content hash) and return formatted context."""
+        top_k = top_k or self.top_k
+        return SingleFlight.get().do(
+            'document_context',
+            [query, sorted(content_hashes), top_k, self.document_token_budget],
+            lambda: self._document_context(query, content_hashes, top_k)
+        )
+
+    def _document_context(self, query: str, content_hashes: List[str], top_k: int) -> str:
+        try:
+            matches = self.pinecone.query_vectors(
+                self._embed_query(query),
+                top_k=top_k,
+                filter={"content_hash": {"$in": content_hashes}},
+                namespace=DOCUMENTS_NAMESPACE
+            )
+            return self._format_context(
+                matches,
+                lambda metadata: (
+                    f"UPLOADED DOCUMENT {metadata.get('file_name', 'Document')}, "
+                    f"PAGE {metadata.get('page_number', '?')}"
+                ),
+                self.document_token_budget
+            )
+        except Exception as e:
+            # Raised rather than returned as no context, so a failed search is not mistaken for an empty one
+            logger.error(f"Error querying document context: {e}")
+            raise
+
+    def _embed_query(self, query: str) -> List[float]:
+        """Embed a query once per service instance, so book and document lookups share it."""
+        record_cache('query_embeddings', query in self._query_embeddings)
+        if query not in self._query_embeddings:
+            self._query_embeddings[query] = self.ai.generate_embedding(query)
+        return self._query_embeddings[query]
+
+    def _format_context(self, matches: List[Dict[str, Any]], source_label, token_budget: int) -> str:
+        """Format matches best-first until the token budget is spent."""
+        context, included, tokens = format_context(matches, source_label, token_budget)
+        set_attributes(matches=len(matches), chunks=included, context_tokens=tokens)
+        return context
+
+    def _index_pages(
+        self,
+        pages: Iterable[Tuple[int, str]],
+        id_prefix: str,
+        base_metadata: Dict[str, Any],
+        namespace: str,
+        centroids: Optional[CentroidAccumulator] = None
+    ) -> int:
+        """
+        Chunk, embed and upsert pages as they are produced.
+        
+        Vector ids are ``{id_prefix}_p{page}_c{chunk}``. Embeddings are also
+        added to ``centroids`` when given. Returns the chunk count; raises if
+        an upsert fails.
+        """
+        pending = []
+        chunk_count = 0
+        started = time.perf_counter()
+        
+        def flush():
+            embeddings = self.ai.generate_embeddings([item["metadata"]["text"] for item in pending])
+            vectors = [{**item, "values": embedding} for item, embedding in zip(pending, embeddings)]
+            if centroids is not None:
+                for vector in vectors:
+                    centroids.add(vector["metadata"]["page_number"], vector["values"])
+            if not self.pinecone.upsert_vectors(vectors, namespace=namespace):
+                # Fail the ingest so the book or blob stays unindexed and is retried
+                raise UpstreamUnavailable(f"Upserting {len(vectors)} vectors failed", upstream='pinecone.upsert')
+            pending.clear()
+        
+        for page_num, page_text in pages:
+            # Simple sliding window chunking
+            # In production, use a more sophisticated chunker (e.g. LangChain)
+            for i, chunk in enumerate(self._chunk_text(page_text)):
+                if not chunk.strip():
+                    continue
+                pending.append({
+                    "id": f"{id_prefix}_p{page_num}_c{i}",
+                    "metadata": {
+                        **base_metadata,
+                        "page_number": page_num,
+                        "chunk_index": i,
+                        "text": chunk,
+                    }
+                })
+                chunk_count += 1
+                
+                # Batch embedding and upsert to avoid large requests
+                if len(pending) >= INDEX_BATCH_SIZE:
+                    flush()
+        
+        if pending:
+            flush()
+        record_ingestion(namespace, chunk_count, time.perf_counter() - started)
+        return chunk_count
 
     def _extract_text_by_page(self, pdf_content: bytes) -> List[Dict[str, Any]]:
         """Extract text from each page of the PDF."""
         pages = []
         try:
-            pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_content))
-            for i, page in enumerate(pdf_reader.pages):
+            for page_num, text in FileProcessor().iter_pages(pdf_content, 'pdf'):
                 pages.append({
-                    'page_number': i + 1,
-                    'text': page.extract_text() or ''
+                    'page_number': page_num,
+                    'text': text
                 })
         except Exception as e:
             logger.error(f"Error extracting PDF text: {e}")
@@ -139,14 +390,4 @@ class RAGService:
 
     def _chunk_text(self, text: str) -> List[str]:
         """Simple text chunking with overlap."""
-        if not text:
-            return []
-            
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + self.chunk_size
-            chunks.append(text[start:end])
-            start = end - self.chunk_overlap
-            
-        return chunks
+        return chunk_text(text, self.chunk_size, self.chunk_overlap)
@@ -0,0 +1,182 @@
+"""
+Garbage collection of Pinecone vectors whose owners are gone.
+
+Book vectors are ids ``{book_id}_p{page}_c{chunk}`` in the books namespace;
+uploaded-file vectors are ``{content_hash}_p{page}_c{chunk}`` in the
+documents namespace and are shared by every document with that content.
+Deletes cascade to vectors by id prefix, and a periodic sweep reconciles
+both namespaces against the ``books`` and ``documents`` tables to catch
+anything a cascade missed (failed deletes, rows removed in the database).
+The sweep lists the whole index, so it runs in one place only: schedule
+``manage.py sweep_vectors`` (e.g. from cron), not in every server process.
+"""
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+from apps.core.background import run_in_background
+from apps.core.services.blob_store import BlobStore
+from apps.core.services.pinecone_service import PineconeService
+from apps.core.services.supabase_service import SupabaseService
+from apps.core.services.text_artifacts import get_text_artifacts
+from .book_router import BookRouter
+from .rag_service import BOOKS_NAMESPACE, DOCUMENTS_NAMESPACE, RAGService
+
+logger = logging.getLogger(__name__)
+
+VECTOR_ID_PATTERN = re.compile(r'^(?P<owner>.+)_p\d+_c\d+$')
+
+
+def vector_owner(vector_id: str) -> Optional[str]:
+    """Book id or content hash a vector id belongs to, or None for ids in another format."""
+    match = VECTOR_ID_PATTERN.match(vector_id)
+    return match.group('owner') if match else None
+
+
+class VectorCollector:
+    """Deletes vectors of removed books and unreferenced uploads."""
+
+    def __init__(self, pinecone: PineconeService = None):
+        self.pinecone = pinecone or PineconeService()
+
+    # --- Cascades ---------------------------------------------------------
+
+    def delete_book(self, book_id: str) -> int:
+        """Delete a book's vectors and stop routing to it. Returns the number deleted."""
+        BookRouter.get().remove_book(book_id)
+        deleted = self.pinecone.delete_by_prefix(f"{book_id}_p", namespace=BOOKS_NAMESPACE)
+        logger.info(f"Deleted {deleted} vectors of book {book_id}")
+        return deleted
+
+    def release_documents(self, content_hashes: Iterable[str]) -> int:
+        """
+        Delete vectors of uploaded content no document references any more.
+
+        Call after the document rows are gone. Returns the number deleted.
+        """
+        deleted = 0
+        for content_hash in set(filter(None, content_hashes)):
+            if self._referenced(content_hash):
+                continue
+            deleted += self._delete_blob_vectors(content_hash)
+        return deleted
+
+    def _delete_blob_vectors(self, content_hash: str) -> int:
+        blob = BlobStore.get(content_hash)
+        # Uploads from now on index the content again instead of relying on these vectors
+        BlobStore.mark_unindexed(content_hash)
+        if self._referenced(content_hash):
+            if blob and blob.get('rag_indexed'):
+                BlobStore.mark_indexed(content_hash)
+            return 0
+
+        deleted = self.pinecone.delete_by_prefix(f"{content_hash}_p", namespace=DOCUMENTS_NAMESPACE)
+        logger.info(f"Deleted {deleted} vectors of unreferenced upload {content_hash}")
+        # An upload that saw the content indexed just before the flag was cleared
+        # may have attached since the last check; give it its vectors back
+        document = self._referenced(content_hash)
+        if document:
+            self._reindex(content_hash, blob, document)
+        return deleted
+
+    @staticmethod
+    def _referenced(content_hash: str) -> Optional[Dict]:
+        """A document referencing the content, if any."""
+        rows = SupabaseService.fetch_table('documents', {'content_hash': content_hash}, limit=1, columns='id,file_name')
+        return rows[0] if rows else None
+
+    @staticmethod
+    def _reindex(content_hash: str, blob: Optional[Dict], document: Dict):
+        if not blob or not blob.get('text_artifact_key'):
+            logger.warning(f"Upload {content_hash} was referenced again while its vectors were deleted; "
+                           f"it is indexed on its next upload")
+            return
+        logger.info(f"Upload {content_hash} was referenced again while its vectors were deleted; re-indexing")
+        RAGService().ingest_document(
+            content_hash,
+            get_text_artifacts().pages(blob['text_artifact_key']),
+            {'file_name': document.get('file_name') or 'Document'}
+        )
+
+    # --- Sweeping ---------------------------------------------------------
+
+    def sweep(self, dry_run: bool = False) -> Dict[str, Dict]:
+        """
+        Delete vectors whose book or document no longer exists.
+
+        Returns:
+            Per-namespace report: vectors and owners scanned, orphaned owners
+            with their vector counts, and vectors deleted (0 on a dry run).
+        """
+        return {
+            BOOKS_NAMESPACE: self._sweep_namespace(
+                BOOKS_NAMESPACE, 'books', 'id', self.delete_book, dry_run
+            ),
+            DOCUMENTS_NAMESPACE: self._sweep_namespace(
+                DOCUMENTS_NAMESPACE, 'documents', 'content_hash', self._delete_blob_vectors, dry_run
+            ),
+        }
+
+    def _sweep_namespace(self, namespace: str, table: str, column: str, delete, dry_run: bool) -> Dict:
+        counts: Dict[str, int] = defaultdict(int)
+        vectors = unrecognized = 0
+        for ids in self.pinecone.list_ids('', namespace=namespace):
+            for vector_id in ids:
+                vectors += 1
+                owner = vector_owner(vector_id)
+                if owner is None:
+                    unrecognized += 1
+                else:
+                    counts[owner] += 1
+
+        # Live owners are read after listing, so anything ingested meanwhile counts as live
+        live = set(self._column_values(table, column))
+        orphans = {}
+        for owner, count in counts.items():
+            # Re-check each candidate directly before deleting anything
+            if owner not in live and not SupabaseService.fetch_table(table, {column: owner}, limit=1, columns='id'):
+                orphans[owner] = count
+
+        deleted = 0
+        if not dry_run:
+            for owner in orphans:
+                try:
+                    deleted += delete(owner)
+                except Exception as e:
+                    logger.error(f"Could not delete orphaned vectors of {owner} in {namespace}: {e}")
+
+        return {
+            'vectors': vectors,
+            'owners': len(counts),
+            'unrecognized': unrecognized,
+            'orphans': orphans,
+            'orphan_vectors': sum(orphans.values()),
+            'deleted': deleted,
+        }
+
+    @staticmethod
+    def _column_values(table: str, column: str, page_size: int = 1000) -> Iterable[str]:
+        """Every value of ``column``, paged so large tables are not truncated by the API row limit."""
+        cursor = None
+        while True:
+            rows, has_more = SupabaseService.fetch_keyset_page(
+                table, columns=f'id,created_at,{column}', cursor=cursor, limit=page_size
+            )
+            for row in rows:
+                if row.get(column):
+                    yield str(row[column])
+            if not has_more or not rows:
+                return
+            cursor = (rows[-1]['created_at'], rows[-1]['id'])
+
+
+def delete_book_vectors_in_background(book_id: str):
+    run_in_background(VectorCollector().delete_book, book_id)
+
+
+def release_documents_in_background(content_hashes: List[str]):
+    if any(content_hashes):
+        run_in_background(VectorCollector().release_documents, content_hashes)
@@ -0,0 +1,91 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from apps.books.services import book_ingestion
+from apps.books.services.book_ingestion import FAILED, INDEXED, INDEXING, BookIngestion
+
+
+@pytest.fixture
+def ingest(monkeypatch):
+    """Replace the RAG ingestion with one that blocks until ``release`` is set."""
+    class Ingest:
+        calls = []
+        release = threading.Event()
+        succeed = True
+
+    def ingest_book(self, book_id):
+        Ingest.calls.append(book_id)
+        Ingest.release.wait(5)
+        return Ingest.succeed
+
+    monkeypatch.setattr(book_ingestion.RAGService, '__init__', lambda self: None)
+    monkeypatch.setattr(book_ingestion.RAGService, 'ingest_book', ingest_book)
+    return Ingest
+
+
+@pytest.fixture
+def book(offline):
+    return offline.supabase.seed('books', [{'title': 'Algebra', 'is_processed': False, 'metadata': {}}])[0]
+
+
+def _lease(offline, book_id):
+    return next(row for row in offline.supabase.tables['ingestion_leases'] if row['book_id'] == book_id)
+
+
+def test_only_one_worker_ingests_a_book(offline, book, ingest):
+    workers = [BookIngestion() for _ in range(3)]
+
+    statuses = [worker.start(book['id']) for worker in workers]
+
+    assert statuses == [INDEXING] * 3
+    ingest.release.set()
+    assert workers[1].wait(book['id'], timeout=5) == INDEXED
+    assert ingest.calls == [book['id']]
+    assert _lease(offline, book['id'])['status'] == 'succeeded'
+
+
+def test_expired_lease_is_taken_over(offline, book, ingest):
+    expired = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+    offline.supabase.seed('ingestion_leases', [{
+        'book_id': book['id'], 'holder': 'dead-worker', 'status': 'running', 'attempts': 1, 'expires_at': expired,
+    }])
+    ingest.release.set()
+
+    worker = BookIngestion()
+    assert worker.start(book['id']) == INDEXING
+    assert worker.wait(book['id'], timeout=5) == INDEXED
+    assert ingest.calls == [book['id']]
+    assert _lease(offline, book['id'])['attempts'] == 2
+
+
+def test_failed_ingestion_is_not_retried_before_its_delay(offline, book, ingest, settings):
+    settings.INGESTION_RETRY_SECONDS = 300
+    ingest.succeed = False
+    ingest.release.set()
+
+    worker = BookIngestion()
+    worker.start(book['id'])
+    assert worker.wait(book['id'], timeout=5) == FAILED
+
+    assert BookIngestion().start(book['id']) == FAILED
+    assert ingest.calls == [book['id']]
+
+
+def test_lease_is_renewed_while_ingestion_waits_for_a_worker(offline, book, ingest, settings, monkeypatch):
+    settings.INGESTION_LEASE_HEARTBEAT_SECONDS = 0.01
+    queued = []
+    monkeypatch.setattr(book_ingestion, 'run_in_background', lambda fn, *args: queued.append((fn, args)))
+
+    worker = BookIngestion()
+    assert worker.start(book['id']) == INDEXING
+    renewals = offline.supabase.calls['supabase.rpc']
+    time.sleep(0.1)
+    assert offline.supabase.calls['supabase.rpc'] > renewals
+
+    ingest.release.set()
+    fn, args = queued[0]
+    fn(*args)
+    assert _lease(offline, book['id'])['status'] == 'succeeded'
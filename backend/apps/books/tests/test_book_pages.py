@@ -0,0 +1,83 @@
+from io import BytesIO
+
+import PyPDF2
+import pytest
+from rest_framework.test import APIClient
+
+from apps.core.fakes import synthetic_pdf
+from apps.core.services.text_artifacts import get_text_artifacts
+
+PAGES = ['Cells are the unit of life.', 'Photosynthesis makes sugar.', 'Respiration releases energy.']
+
+
+@pytest.fixture
+def book(offline, inline_background, settings):
+    """An indexed three-page book whose page PDFs have not been generated yet."""
+    settings.PAGE_RANGE_MAX_PAGES = 2
+    offline.supabase.storage.put('educational-content', 'books/biology.pdf', synthetic_pdf(PAGES))
+    key = get_text_artifacts().save('artifacts/text/biology.jsonl.gz', list(enumerate(PAGES, start=1)))
+    return offline.supabase.seed('books', [{
+        'title': 'Biology Grade 9',
+        'page_count': len(PAGES),
+        'content_hash': 'biology',
+        'text_artifact_key': key,
+        'download_url': offline.supabase.storage.public_url('educational-content', 'books/biology.pdf'),
+    }])[0]
+
+
+def _stored(offline, book_id):
+    return next(row for row in offline.supabase.tables['books'] if row['id'] == book_id)
+
+
+def test_page_text_is_served_with_validators(book):
+    client = APIClient()
+
+    response = client.get(f"/api/v1/books/{book['id']}/pages/2-3/")
+    assert response.status_code == 200
+    assert response.json()['pages'] == [{'page': 2, 'text': PAGES[1]}, {'page': 3, 'text': PAGES[2]}]
+    assert 'immutable' in response['Cache-Control']
+
+    again = client.get(f"/api/v1/books/{book['id']}/pages/2-3/", HTTP_IF_NONE_MATCH=response['ETag'])
+    assert again.status_code == 304
+
+
+@pytest.mark.parametrize('path, status', [
+    ('pages/3-2/', 400),
+    ('pages/1-3/', 400),
+    ('pages/4/', 404),
+])
+def test_invalid_page_ranges_are_rejected(book, path, status):
+    assert APIClient().get(f"/api/v1/books/{book['id']}/{path}").status_code == status
+
+
+def test_page_pdf_is_generated_on_first_request_then_served(book, offline):
+    client = APIClient()
+
+    pending = client.get(f"/api/v1/books/{book['id']}/pages/2/pdf/")
+    assert pending.status_code == 202
+    assert pending['Retry-After']
+    assert _stored(offline, book['id'])['page_artifact_prefix']
+
+    response = client.get(f"/api/v1/books/{book['id']}/pages/2/pdf/")
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/pdf'
+    reader = PyPDF2.PdfReader(BytesIO(response.content))
+    assert len(reader.pages) == 1
+    assert 'Photosynthesis' in reader.pages[0].extract_text()
+
+    partial = client.get(f"/api/v1/books/{book['id']}/pages/2/pdf/", HTTP_RANGE='bytes=0-9')
+    assert partial.status_code == 206
+    assert partial.content == response.content[:10]
+
+
+def test_failed_generation_falls_back_to_the_whole_book(book, offline):
+    offline.supabase.storage.objects.pop(('educational-content', 'books/biology.pdf'))
+    client = APIClient()
+
+    client.get(f"/api/v1/books/{book['id']}/pages/2/pdf/")
+    assert _stored(offline, book['id'])['page_generation_attempts'] == 1
+
+    response = client.get(f"/api/v1/books/{book['id']}/pages/2/pdf/")
+    assert response.status_code == 303
+    assert response['Location'] == f"{book['download_url']}#page=2"
+    assert int(response['Retry-After']) >= 1
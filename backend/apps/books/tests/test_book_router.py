@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+import pytest
+
+from apps.books.services import rag_service
+from apps.books.services.book_router import ROUTER_TABLE, BookRouter, CentroidAccumulator
+from apps.books.services.rag_service import RAGService
+from apps.core.fakes import EMBEDDING_DIMENSION
+
+
+def _vector(seed):
+    return np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSION).tolist()
+
+
+@pytest.fixture
+def router(offline, monkeypatch):
+    router = BookRouter()
+    monkeypatch.setattr(BookRouter, '_instance', router)
+    # Loaded explicitly by the tests, never in the background
+    router._last_refresh = time.time()
+    return router
+
+
+@pytest.fixture
+def library(offline):
+    """Two routed books in grade 1, one book without centroids, and one book in grade 2."""
+    books = offline.supabase.seed('books', [
+        {'title': 'Routed A', 'grade_id': 'g1', 'subject_id': 's1'},
+        {'title': 'Routed B', 'grade_id': 'g1', 'subject_id': 's1'},
+        {'title': 'Not backfilled', 'grade_id': 'g1', 'subject_id': 's1'},
+        {'title': 'Other grade', 'grade_id': 'g2', 'subject_id': 's1'},
+    ])
+    for index, book in enumerate(books[:2]):
+        centroids = CentroidAccumulator(section_pages=10)
+        for page in (1, 15):
+            centroids.add(page, _vector(index * 10 + page))
+        offline.supabase.seed(ROUTER_TABLE, centroids.rows(book['id']))
+    return books
+
+
+def test_routes_to_sections_of_matching_books(router, library):
+    router.load()
+
+    routes = router.route(_vector(1), grade_id='g1')
+
+    assert {route['book_id'] for route in routes} <= {library[0]['id'], library[1]['id']}
+    assert routes[0]['book_id'] == library[0]['id']
+    assert (routes[0]['page_start'], routes[0]['page_end']) == (1, 10)
+    assert router.unrouted_books(grade_id='g1') == [library[2]['id']]
+    assert router.route(_vector(1), grade_id='missing') == []
+
+
+def test_search_filter_keeps_books_without_centroids(router, library):
+    router.load()
+
+    search_filter = RAGService()._routed_filter('photosynthesis', grade_id='g1')
+
+    clauses = search_filter['$or']
+    assert {'book_id': {'$in': [library[2]['id']]}} in clauses
+    routed = {clause['book_id'] for clause in clauses if isinstance(clause['book_id'], str)}
+    assert routed <= {library[0]['id'], library[1]['id']}
+
+
+def test_search_filter_falls_back_to_grade_books_without_routes(router, library):
+    search_filter = RAGService()._routed_filter('photosynthesis', grade_id='g1')
+
+    assert search_filter == {'book_id': {'$in': [book['id'] for book in library[:3]]}}
+
+
+def test_search_filter_falls_back_when_too_many_books_are_unrouted(router, library, monkeypatch):
+    monkeypatch.setattr(rag_service, 'MAX_UNROUTED_BOOKS', 0)
+    router.load()
+
+    search_filter = RAGService()._routed_filter('photosynthesis', grade_id='g1')
+
+    assert search_filter == {'book_id': {'$in': [book['id'] for book in library[:3]]}}
+
+
+def test_removed_book_is_no_longer_routed(router, library):
+    router.load()
+
+    router.remove_book(library[0]['id'])
+    router.remove_book(library[2]['id'])
+
+    assert {route['book_id'] for route in router.route(_vector(1), grade_id='g1')} == {library[1]['id']}
+    assert router.unrouted_books(grade_id='g1') == []
@@ -0,0 +1,75 @@
+import time
+
+import jwt
+import pytest
+from rest_framework.test import APIClient
+
+from apps.auth import token_cache
+from apps.books.services.bulk_import import BulkImporter, ImportBatch
+from apps.core.exceptions import BookImportError
+
+
+@pytest.fixture
+def users(offline, settings, monkeypatch):
+    """Bearer tokens checked by the fake GoTrue, keyed by user name."""
+    settings.SUPABASE_JWT_SECRET = ''
+    monkeypatch.setattr(token_cache, '_token_cache', None)
+    tokens = {}
+    for name, role in (('owner', 'authenticated'), ('other', 'authenticated'), ('admin', 'service_role')):
+        token = jwt.encode({'sub': name, 'exp': int(time.time()) + 600}, f'{name}-secret' * 4, algorithm='HS256')
+        offline.supabase.add_user(token, user_id=name, role=role)
+        tokens[name] = token
+    return tokens
+
+
+def _client(token=None):
+    client = APIClient()
+    if token:
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+def _run(offline, settings, outcomes):
+    """Run a batch whose items succeed (True) or fail (False), and return its stored row."""
+    settings.BULK_IMPORT_MAX_ATTEMPTS = 1
+    specs = [{'source_url': f'https://example.org/{index}.pdf'} for index in range(len(outcomes))]
+    batch = ImportBatch('batch-1', specs, created_by='owner')
+    offline.supabase.seed('import_batches', [{'id': batch.id, 'status': 'queued', 'created_by': 'owner'}])
+    importer = BulkImporter()
+
+    def import_book(spec):
+        index = int(spec['source_url'].rsplit('/', 1)[1].split('.')[0])
+        if not outcomes[index]:
+            raise BookImportError('not a PDF')
+        return {'id': f'book-{index}', 'title': f'Book {index}'}, True
+
+    importer.importer.import_book = import_book
+    importer.run(batch)
+    return offline.supabase.tables['import_batches'][0]
+
+
+@pytest.mark.parametrize('outcomes, status', [
+    ([True, True], 'completed'),
+    ([True, False], 'partial'),
+    ([False, False], 'failed'),
+])
+def test_finished_batches_report_how_many_books_made_it(offline, settings, outcomes, status):
+    row = _run(offline, settings, outcomes)
+
+    assert row['status'] == status
+    assert row['failed'] == outcomes.count(False)
+    assert row['finished_at']
+
+
+def test_only_the_owner_and_admins_can_read_a_batch(offline, users):
+    offline.supabase.seed('import_batches', [{
+        'id': 'batch-1', 'status': 'completed', 'total': 0, 'items': [], 'created_by': 'owner',
+        'updated_at': '2026-10-19T00:00:00+00:00',
+    }])
+    url = '/api/v1/books/imports/batch-1/'
+
+    assert _client(users['owner']).get(url).status_code == 200
+    assert _client(users['admin']).get(url).status_code == 200
+    assert _client(users['other']).get(url).status_code == 404
+    assert _client().get(url).status_code == 404
+    assert _client(users['other']).get(f'{url}events/').status_code == 404
@@ -0,0 +1,68 @@
+import pytest
+from rest_framework.test import APIClient
+
+from apps.books.services.catalog_index import CatalogIndex
+
+BOOKS = [
+    {'title': 'Biology Grade 9', 'author': 'Ministry of Education', 'grade_id': 9, 'subject_id': 1,
+     'description': 'Cells, photosynthesis and ecosystems', 'extracted_text': 'The cell is the unit of life.'},
+    {'title': 'Photosynthesis Explained', 'author': 'Abebe Kebede', 'grade_id': 10, 'subject_id': 1,
+     'description': 'A short guide', 'extracted_text': 'Light reactions and the Calvin cycle.'},
+    {'title': 'Chemistry Grade 9', 'author': 'Ministry of Education', 'grade_id': 9, 'subject_id': 2,
+     'description': 'Atoms and molecules', 'extracted_text': 'Chlorophyll absorbs light.'},
+]
+
+
+@pytest.fixture
+def catalog(offline, settings, monkeypatch):
+    """The process-wide index, built from the seeded books."""
+    settings.CATALOG_INDEX_PAGE_TEXT = False
+    offline.supabase.seed('books', [dict(book) for book in BOOKS])
+    index = CatalogIndex()
+    monkeypatch.setattr(CatalogIndex, '_instance', index)
+    index.rebuild()
+    return index
+
+
+def _titles(result):
+    return [book['title'] for book in result['results']]
+
+
+def test_title_matches_rank_above_description_matches(catalog):
+    assert _titles(catalog.search('photosynthesis')) == ['Photosynthesis Explained', 'Biology Grade 9']
+
+
+def test_every_term_must_match_and_the_last_one_as_a_prefix(catalog):
+    assert _titles(catalog.search('ministry chem')) == ['Chemistry Grade 9']
+    assert _titles(catalog.search('ministry calvin')) == []
+
+
+def test_facets_count_matches_before_filtering(catalog):
+    result = catalog.search('ministry', subject_id=2)
+
+    assert _titles(result) == ['Chemistry Grade 9']
+    assert result['facets'] == {'grade_id': {'9': 2}, 'subject_id': {'1': 1, '2': 1}}
+
+
+def test_sync_picks_up_changes_made_elsewhere(catalog, offline):
+    rows = offline.supabase.tables['books']
+    rows[:] = [row for row in rows if row['title'] != 'Chemistry Grade 9']
+    rows[0].update({'title': 'Biology and Ecology', 'updated_at': '2026-10-19T12:00:00+00:00'})
+    offline.supabase.seed('books', [{'title': 'Ecology Field Guide', 'grade_id': 11, 'subject_id': 1}])
+
+    catalog.sync()
+
+    assert set(_titles(catalog.search('ecology'))) == {'Biology and Ecology', 'Ecology Field Guide'}
+    assert _titles(catalog.search('chemistry')) == []
+
+
+def test_search_endpoint_pages_and_validates(catalog):
+    client = APIClient()
+
+    # Without terms the filtered catalog is listed by title
+    response = client.get('/api/v1/books/search/', {'grade_id': 9, 'limit': 1, 'offset': 1})
+    assert response.status_code == 200
+    assert response.json()['total'] == 2
+    assert [book['title'] for book in response.json()['results']] == ['Chemistry Grade 9']
+
+    assert client.get('/api/v1/books/search/', {'limit': 'many'}).status_code == 400
@@ -0,0 +1,61 @@
+import pytest
+
+from apps.books.services import rag_service
+from apps.books.services.rag_service import BOOKS_NAMESPACE, RAGService
+from apps.core.fakes import synthetic_pdf
+from apps.core.services.file_processor import FileProcessor
+from apps.core.services.pinecone_service import PineconeService
+from apps.core.services.text_artifacts import get_text_artifacts
+
+PAGES = [f'Chapter {number}: the water cycle moves water between oceans, air and land. ' * 8 for number in range(1, 6)]
+
+
+@pytest.fixture
+def book(offline, inline_background, settings):
+    settings.BOOK_ROUTER_ENABLED = False
+    offline.supabase.storage.put('educational-content', 'books/water.pdf', synthetic_pdf(PAGES))
+    return offline.supabase.seed('books', [{
+        'title': 'Water',
+        'download_url': offline.supabase.storage.public_url('educational-content', 'books/water.pdf'),
+        'page_artifact_prefix': 'artifacts/pages/water',
+        'metadata': {},
+    }])[0]
+
+
+def test_pages_are_embedded_as_they_are_extracted(offline, book, monkeypatch):
+    events = []
+    iter_pages = FileProcessor.iter_pages
+    generate_embeddings = RAGService().ai.generate_embeddings.__func__
+
+    def extract(self, *args, **kwargs):
+        for number, text in iter_pages(self, *args, **kwargs):
+            events.append(('extract', number))
+            yield number, text
+
+    def embed(self, texts):
+        events.append(('embed', len(texts)))
+        return generate_embeddings(self, texts)
+
+    monkeypatch.setattr(FileProcessor, 'iter_pages', extract)
+    monkeypatch.setattr(type(RAGService().ai), 'generate_embeddings', embed)
+    monkeypatch.setattr(rag_service, 'INDEX_BATCH_SIZE', 1)
+
+    assert RAGService().ingest_book(book['id'])
+
+    # Each page is embedded before the next one is extracted
+    extracted = [index for index, event in enumerate(events) if event[0] == 'extract']
+    assert len(extracted) == len(PAGES)
+    assert all(events[index + 1][0] == 'embed' for index in extracted)
+
+
+def test_ingestion_stores_vectors_text_and_searchable_pages(offline, book):
+    assert RAGService().ingest_book(book['id'])
+
+    stored = next(row for row in offline.supabase.tables['books'] if row['id'] == book['id'])
+    assert stored['is_processed'] and stored['metadata']['rag_indexed']
+    pages = get_text_artifacts().pages(stored['text_artifact_key'])
+    assert [number for number, _ in pages] == [1, 2, 3, 4, 5]
+    assert 'Chapter 5' in pages[-1][1]
+    ids = [vector_id for batch in PineconeService().list_ids(f"{book['id']}_p", namespace=BOOKS_NAMESPACE)
+           for vector_id in batch]
+    assert {vector_id.split('_p')[1].split('_')[0] for vector_id in ids} == {'1', '2', '3', '4', '5'}
@@ -0,0 +1,84 @@
+import pytest
+
+from apps.books.services.rag_service import BOOKS_NAMESPACE, DOCUMENTS_NAMESPACE, RAGService
+from apps.books.services.vector_gc import VectorCollector, vector_owner
+from apps.core.services.blob_store import BlobStore
+from apps.core.services.pinecone_service import PineconeService
+from apps.core.services.text_artifacts import artifact_key, get_text_artifacts
+
+PAGES = [(1, 'Cells are the basic unit of life. ' * 20), (2, 'Mitochondria make energy for the cell. ' * 20)]
+
+
+def _vector_ids(prefix, namespace):
+    return [vector_id for ids in PineconeService().list_ids(prefix, namespace=namespace) for vector_id in ids]
+
+
+@pytest.fixture
+def upload(offline):
+    """Indexed uploaded content referenced by one document."""
+    def create(content_hash, referenced=True):
+        key = artifact_key(f"blobs/{content_hash}")
+        get_text_artifacts().save(key, PAGES)
+        BlobStore.register(content_hash, f"blobs/{content_hash}.pdf", 100, 'application/pdf', text_artifact_key=key)
+        assert RAGService().ingest_document(content_hash, PAGES, {'file_name': 'cells.pdf'})
+        if referenced:
+            offline.supabase.seed('documents', [{'content_hash': content_hash, 'file_name': 'cells.pdf'}])
+        return content_hash
+    return create
+
+
+def test_vector_owner():
+    assert vector_owner('abc_p3_c12') == 'abc'
+    assert vector_owner('book-1_p10_c0') == 'book-1'
+    assert vector_owner('no-suffix') is None
+
+
+def test_released_content_loses_its_vectors_unless_still_referenced(upload):
+    orphan, shared = upload('orphan', referenced=False), upload('shared')
+
+    deleted = VectorCollector().release_documents([orphan, shared])
+
+    assert deleted > 0
+    assert _vector_ids(f'{orphan}_p', DOCUMENTS_NAMESPACE) == []
+    assert _vector_ids(f'{shared}_p', DOCUMENTS_NAMESPACE)
+    assert not BlobStore.get(orphan)['rag_indexed']
+    assert BlobStore.get(shared)['rag_indexed']
+
+
+def test_document_attaching_during_the_delete_gets_its_vectors_back(offline, upload, monkeypatch):
+    content_hash = upload('racing', referenced=False)
+    delete_by_prefix = PineconeService.delete_by_prefix
+
+    def delete_then_attach(self, prefix, namespace='books'):
+        deleted = delete_by_prefix(self, prefix, namespace=namespace)
+        offline.supabase.seed('documents', [{'content_hash': content_hash, 'file_name': 'late.pdf'}])
+        return deleted
+
+    monkeypatch.setattr(PineconeService, 'delete_by_prefix', delete_then_attach)
+    VectorCollector().release_documents([content_hash])
+
+    assert _vector_ids(f'{content_hash}_p', DOCUMENTS_NAMESPACE)
+    assert BlobStore.get(content_hash)['rag_indexed']
+
+
+def test_sweep_deletes_only_orphaned_owners(offline, upload):
+    live_book = offline.supabase.seed('books', [{'title': 'Live'}])[0]
+    vector = [0.1] * 1536
+    PineconeService().upsert_vectors([
+        {'id': f"{live_book['id']}_p1_c0", 'values': vector, 'metadata': {}},
+        {'id': 'deleted-book_p1_c0', 'values': vector, 'metadata': {}},
+        {'id': 'deleted-book_p2_c0', 'values': vector, 'metadata': {}},
+    ], namespace=BOOKS_NAMESPACE)
+    live, orphan = upload('live'), upload('gone', referenced=False)
+
+    dry_run = VectorCollector().sweep(dry_run=True)
+    assert dry_run[BOOKS_NAMESPACE]['orphans'] == {'deleted-book': 2}
+    assert set(dry_run[DOCUMENTS_NAMESPACE]['orphans']) == {orphan}
+    assert dry_run[BOOKS_NAMESPACE]['deleted'] == 0
+
+    report = VectorCollector().sweep()
+
+    assert report[BOOKS_NAMESPACE]['deleted'] == 2
+    assert _vector_ids('', BOOKS_NAMESPACE) == [f"{live_book['id']}_p1_c0"]
+    assert _vector_ids(f'{orphan}_p', DOCUMENTS_NAMESPACE) == []
+    assert _vector_ids(f'{live}_p', DOCUMENTS_NAMESPACE)
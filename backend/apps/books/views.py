@@ -2,16 +2,84 @@ from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
 from apps.core.services.supabase_service import SupabaseService
-from apps.core.services.file_processor import FileProcessor
-from apps.books.services.rag_service import RAGService
-import requests
+from apps.core.exceptions import BookImportError
+from apps.books.services.book_importer import BOOK_SPEC_FIELDS, BookImporter
+from apps.books.services.book_pages import BookPages
+from apps.books.services.bulk_import import TERMINAL_STATUSES, BulkImporter
+from apps.books.services.catalog_index import CatalogIndex, index_book
+from apps.books.services.book_ingestion import FAILED, INDEXED, INDEXING, BookIngestion, is_indexed
+from apps.books.services.vector_gc import delete_book_vectors_in_background
+from apps.auth.authentication import is_admin
+from apps.core.responses import artifact_response, cache_control, not_modified
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.text import slugify
+from django.urls import reverse
+import json
 import logging
-import uuid
-import re
+import time
+from datetime import datetime, timezone
+from django.conf import settings
 from rest_framework.decorators import action
 
 logger = logging.getLogger(__name__)
 
+# Seconds between import progress checks when the batch runs in another process
+IMPORT_EVENTS_POLL_SECONDS = 2
+# Longest wait for a change before re-sending progress (keeps proxies from closing the stream)
+IMPORT_EVENTS_HEARTBEAT = 15
+
+# Columns returned by list views; extracted text stays out of list payloads
+BOOK_LIST_COLUMNS = (
+    'id,title,author,publisher,isbn,description,grade_id,subject_id,chapter,version,'
+    'language,file_name,file_size,file_type,storage_path,download_url,source_url,'
+    'official_source,metadata,is_processed,is_official,page_count,published_year,'
+    'content_hash,text_artifact_key,page_artifact_prefix,created_at,updated_at'
+)
+
+# Columns needed to serve page artifacts
+BOOK_PAGE_COLUMNS = (
+    'id,title,page_count,download_url,content_hash,text_artifact_key,page_artifact_prefix,updated_at,'
+    'page_generation_attempts,page_generation_retry_at'
+)
+# Seconds clients should wait before retrying while page PDFs are generated
+PAGE_GENERATION_RETRY_AFTER = 10
+
+# Largest page of search results
+SEARCH_MAX_LIMIT = 100
+
+
+def resolve_catalog_filters(params):
+    """
+    Grade/subject filters from query params, resolving grade_level and
+    subject_name to ids.
+
+    Returns:
+        Dict of filters, or None when a named grade or subject does not exist
+    """
+    filters = {}
+    grade_id = params.get('grade_id')
+    subject_id = params.get('subject_id')
+    grade_level = params.get('grade_level')
+    subject_name = params.get('subject_name')
+
+    if grade_id:
+        filters['grade_id'] = grade_id
+    elif grade_level:
+        grade = SupabaseService.fetch_table('grades', {'name': grade_level}, limit=1, columns='id')
+        if not grade:
+            return None
+        filters['grade_id'] = grade[0]['id']
+
+    if subject_id:
+        filters['subject_id'] = subject_id
+    elif subject_name:
+        subject = SupabaseService.fetch_table('subjects', {'name': subject_name}, limit=1, columns='id')
+        if not subject:
+            return None
+        filters['subject_id'] = subject[0]['id']
+    return filters
+
+
 class BookViewSet(ViewSet):
     """ViewSet for Book operations with complete download → upload → register pipeline."""
     
@@ -19,7 +87,12 @@ class BookViewSet(ViewSet):
     def initialize_session(self, request):
         """
         Initialize a learning session for a specific grade and subject.
-        Finds the book and triggers RAG ingestion if needed.
+        Finds the book and starts RAG ingestion if needed; one worker ingests
+        while concurrent sessions for the same book share its outcome.
+        
+        Optional ``wait``: seconds to wait for a running ingestion to finish
+        (at most INGESTION_WAIT_MAX_SECONDS). ``indexing_status`` is
+        'indexed', 'indexing' (poll ``books/<id>/ingestion/``) or 'failed'.
         """
         grade_id = request.data.get('grade_id')
         subject_id = request.data.get('subject_id')
@@ -29,6 +102,14 @@ class BookViewSet(ViewSet):
                 {'error': 'grade_id and subject_id are required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        
+        try:
+            wait = min(max(float(request.data.get('wait') or 0), 0.0), settings.INGESTION_WAIT_MAX_SECONDS)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'wait must be a number of seconds'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
             
         try:
             # Find the book
@@ -44,23 +125,16 @@ class BookViewSet(ViewSet):
             book = books[0]
             book_id = book['id']
             
-            # Check if indexed in RAG
-            is_indexed = book.get('is_processed', False) and \
-                        book.get('metadata', {}).get('rag_indexed', False)
-            
-            if not is_indexed:
-                logger.info(f"Book {book_id} not indexed. Triggering RAG ingestion...")
-                rag_service = RAGService()
-                # Run ingestion (this should ideally be async/background task)
-                success = rag_service.ingest_book(book_id)
-                if not success:
-                    logger.warning(f"RAG ingestion failed for book {book_id}")
+            indexing_status = BookIngestion.get().ensure_indexed(book, wait=wait)
+            if indexing_status != INDEXED:
+                logger.info(f"Book {book_id} not indexed yet: {indexing_status}")
             
             return Response({
                 'book_id': book_id,
                 'title': book['title'],
                 'download_url': book.get('download_url'),
-                'is_indexed': True # Assuming it worked or was already indexed
+                'is_indexed': indexing_status == INDEXED,
+                'indexing_status': indexing_status
             })
             
         except Exception as e:
@@ -69,27 +143,98 @@ class BookViewSet(ViewSet):
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+    
+    @action(detail=True, methods=['get'], url_path='ingestion')
+    def ingestion_status(self, request, pk=None):
+        """RAG ingestion state of a book, for clients waiting on initialize-session."""
+        try:
+            book = SupabaseService.fetch_table('books', {'id': pk}, limit=1, columns='id,is_processed,metadata')
+            if not book:
+                return Response({'error': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+            lease = BookIngestion.get().status(pk)
+            indexed = is_indexed(book[0])
+            if indexed:
+                indexing_status = INDEXED
+            elif lease and lease['status'] == 'failed':
+                indexing_status = FAILED
+            elif lease and lease['status'] == 'running':
+                indexing_status = INDEXING
+            else:
+                indexing_status = 'not_indexed'
+            return Response({
+                'book_id': pk,
+                'is_indexed': indexed,
+                'indexing_status': indexing_status,
+                'attempts': lease['attempts'] if lease else 0,
+                'error': lease.get('error') if lease else None,
+                'heartbeat_at': lease.get('heartbeat_at') if lease else None,
+            })
+        except Exception as e:
+            logger.error(f"Error reading ingestion status for book {pk}: {e}")
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
     
     def list(self, request):
-        """List all books with optional filtering by grade_id and subject_id."""
-        filters = {}
-        grade_id = request.query_params.get('grade_id')
-        subject_id = request.query_params.get('subject_id')
-        grade_level = request.query_params.get('grade_level')
-        subject_name = request.query_params.get('subject_name')
+        """List all books with optional filtering by grade (id or level) and subject (id or name)."""
+        filters = resolve_catalog_filters(request.query_params)
+        if filters is None:
+            return Response([])
         
-        if grade_id:
-            filters['grade_id'] = grade_id
-        if subject_id:
-            filters['subject_id'] = subject_id
-        
-        books = SupabaseService.fetch_table('books', filters, order_by='title')
+        books = SupabaseService.fetch_table('books', filters, order_by='title', columns=BOOK_LIST_COLUMNS)
         return Response(books)
     
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Full-text search over the catalog.
+        
+        Query params:
+            - q: Search terms; the last word also matches as a prefix
+            - grade_id / grade_level, subject_id / subject_name: Filters
+            - limit (default 20, max 100), offset
+        
+        Returns:
+            - total, results (ranked book summaries with score) and
+              grade/subject facet counts
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), SEARCH_MAX_LIMIT)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response(
+                {'error': 'limit and offset must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        filters = resolve_catalog_filters(request.query_params)
+        if filters is None:
+            return Response({'total': 0, 'results': [], 'facets': {'grade_id': {}, 'subject_id': {}}})
+        
+        index = CatalogIndex.get()
+        if not index.ready.is_set():
+            index.maybe_sync()
+            if not index.ready.wait(settings.CATALOG_INDEX_READY_TIMEOUT):
+                return Response(
+                    {'error': 'Search index is warming up, try again shortly'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+        index.maybe_sync()
+        
+        return Response(index.search(
+            query,
+            grade_id=filters.get('grade_id'),
+            subject_id=filters.get('subject_id'),
+            limit=limit,
+            offset=offset
+        ))
+    
     def retrieve(self, request, pk=None):
         """Get a specific book by ID."""
-        book = SupabaseService.fetch_by_id('books', pk)
+        book = SupabaseService.fetch_by_id('books', pk, columns=BOOK_LIST_COLUMNS)
         if book:
             return Response(book)
         return Response(
@@ -113,6 +258,7 @@ class BookViewSet(ViewSet):
         data = request.data.copy()
         book = SupabaseService.insert_record('books', data)
         if book:
+            index_book(book)
             return Response(book, status=status.HTTP_201_CREATED)
         return Response(
             {'error': 'Failed to create book'},
@@ -123,6 +269,7 @@ class BookViewSet(ViewSet):
         """Update a book record."""
         book = SupabaseService.update_record('books', pk, request.data)
         if book:
+            index_book(book)
             return Response(book)
         return Response(
             {'error': 'Failed to update book'},
@@ -130,8 +277,10 @@ class BookViewSet(ViewSet):
         )
     
     def destroy(self, request, pk=None):
-        """Delete a book record."""
+        """Delete a book record, its search entry and its vectors."""
         if SupabaseService.delete_record('books', pk):
+            CatalogIndex.get().remove(pk)
+            delete_book_vectors_in_background(pk)
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'error': 'Failed to delete book'},
@@ -140,7 +289,7 @@ class BookViewSet(ViewSet):
     
     def download(self, request, pk=None):
         """Get download URL for a book."""
-        book = SupabaseService.fetch_by_id('books', pk)
+        book = SupabaseService.fetch_by_id('books', pk, columns='id,title,download_url,storage_path')
         if book:
             return Response({
                 'id': book['id'],
@@ -152,6 +301,131 @@ class BookViewSet(ViewSet):
             status=status.HTTP_404_NOT_FOUND
         )
     
+    def page_text(self, request, book_id=None, start=None, end=None):
+        """
+        Extracted text of one page, or of pages start-end.
+        
+        Returns:
+            - book_id, title, page_count and pages ([{page, text}]), with
+              ETag and Cache-Control headers
+        """
+        book, error = self._page_request(book_id, start, end)
+        if error:
+            return error
+        end = end or start
+        
+        etag = self._page_etag(book, start, end, 'text')
+        if not_modified(request, etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            pages = BookPages.text(book, start, end)
+            if not pages:
+                return Response(
+                    {'error': 'Page text is not available until the book has been indexed'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            response = Response({
+                'book_id': book['id'],
+                'title': book.get('title'),
+                'page_count': book.get('page_count'),
+                'pages': pages,
+            })
+        response['ETag'] = f'"{etag}"'
+        response['Cache-Control'] = self._page_cache_control(book)
+        return response
+    
+    def page_pdf(self, request, book_id=None, start=None, end=None):
+        """
+        One page, or pages start-end, as a standalone PDF.
+        
+        Supports If-None-Match and Range. Returns 202 with Retry-After
+        while the book's page PDFs are still being generated. After a failed
+        generation, until it may be retried, redirects (303) to the whole
+        book opened at ``start``, or returns 503 if the book has no URL.
+        """
+        book, error = self._page_request(book_id, start, end)
+        if error:
+            return error
+        end = end or start
+        
+        retry_at = None if book.get('page_artifact_prefix') else BookPages.retry_at(book)
+        if retry_at:
+            retry_after = str(max(int((retry_at - datetime.now(timezone.utc)).total_seconds()), 1))
+            if book.get('download_url'):
+                response = HttpResponseRedirect(f"{book['download_url']}#page={start}", status=303)
+            else:
+                response = Response(
+                    {'error': 'Page PDFs are not available', 'book_id': book['id']},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+            response['Retry-After'] = retry_after
+            return response
+        
+        if not book.get('page_artifact_prefix'):
+            BookPages.generate_in_background(book)
+            response = Response(
+                {'status': 'generating', 'book_id': book['id']},
+                status=status.HTTP_202_ACCEPTED
+            )
+            response['Retry-After'] = str(PAGE_GENERATION_RETRY_AFTER)
+            return response
+        
+        etag = self._page_etag(book, start, end, 'pdf')
+        cache_header = self._page_cache_control(book)
+        if not_modified(request, etag):
+            return artifact_response(request, b'', 'application/pdf', etag, cache_header)
+        
+        try:
+            data = BookPages.pdf(book, start, end)
+        except Exception as e:
+            logger.error(f"Error serving pages {start}-{end} of book {book_id}: {e}")
+            return Response(
+                {'error': 'Failed to load page'},
+                status=status.HTTP_502_BAD_GATEWAY
+            )
+        
+        pages_label = f"p{start}" if start == end else f"p{start}-{end}"
+        filename = f"{slugify(book.get('title') or 'book')}-{pages_label}.pdf"
+        return artifact_response(request, data, 'application/pdf', etag, cache_header, filename)
+    
+    def _page_request(self, book_id, start, end):
+        """Load the book and validate the page range; returns (book, error_response)."""
+        end = end or start
+        if start < 1 or end < start:
+            return None, Response(
+                {'error': 'Invalid page range'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end - start + 1 > settings.PAGE_RANGE_MAX_PAGES:
+            return None, Response(
+                {'error': f'At most {settings.PAGE_RANGE_MAX_PAGES} pages can be requested at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        books = SupabaseService.fetch_table('books', {'id': book_id}, limit=1, columns=BOOK_PAGE_COLUMNS)
+        if not books:
+            return None, Response(
+                {'error': 'Book not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        book = books[0]
+        if book.get('page_count') and end > book['page_count']:
+            return None, Response(
+                {'error': f"Book has {book['page_count']} pages"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return book, None
+    
+    @staticmethod
+    def _page_etag(book, start, end, kind):
+        # Content-addressed books never change; others are versioned by updated_at
+        version = book.get('content_hash') or f"{book['id']}-{book.get('updated_at') or ''}"
+        return f"{version}-{kind}-{start}-{end}"
+    
+    @staticmethod
+    def _page_cache_control(book):
+        return cache_control(settings.PAGE_ARTIFACT_MAX_AGE, immutable=bool(book.get('content_hash')))
+    
     def download_and_register(self, request):
         """
         Complete pipeline: Download official PDF → upload to storage → register in DB.
@@ -169,123 +443,17 @@ class BookViewSet(ViewSet):
             - description: Book description (optional)
         
         Returns:
-            - The registered book record with download URL
+            - The registered book record with download URL (201), or the existing
+              record (200) when the URL or identical content is already registered
         """
-        source_url = request.data.get('source_url')
-        title = request.data.get('title')
-        grade_id = request.data.get('grade_id')
-        subject_id = request.data.get('subject_id')
-        grade_level = request.data.get('grade_level')
-        subject_name = request.data.get('subject_name')
-        author = request.data.get('author', '')
-        description = request.data.get('description', '')
-        
-        # Validate required fields
-        if not source_url:
-            return Response(
-                {'error': 'source_url is required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        if not (grade_id or (grade_level and subject_name)):
-            return Response(
-                {'error': 'Either grade_id or both grade_level and subject_name are required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        spec = {field: request.data.get(field) for field in BOOK_SPEC_FIELDS}
         
         try:
-            # Step 1: Download the official PDF
-            logger.info(f"Downloading PDF from: {source_url}")
-            
-            response = requests.get(source_url, timeout=60)
-            response.raise_for_status()
-            
-            # Verify it's a PDF
-            content_type = response.headers.get('content-type', '')
-            if 'pdf' not in content_type.lower() and not source_url.lower().endswith('.pdf'):
-                # Check first bytes for PDF magic number
-                if response.content[:4] != b'%PDF':
-                    return Response(
-                        {'error': 'The downloaded file is not a valid PDF'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            file_content = response.content
-            file_size = len(file_content)
-            
-            # Extract title from URL if not provided
-            if not title:
-                title = self._extract_title_from_url(source_url)
-            
-            # Generate storage path
-            file_extension = 'pdf'
-            safe_title = re.sub(r'[^\w\s-]', '', title).strip()[:50]
-            storage_filename = f"{safe_title}_{uuid.uuid4().hex[:8]}.{file_extension}"
-            storage_path = f"books/{storage_filename}"
-            
-            logger.info(f"Generated storage path: {storage_path}")
-            
-            # Step 2: Upload to Supabase Storage
-            logger.info("Uploading PDF to Supabase Storage...")
-            
-            bucket_name = 'educational-content'
-            public_url = SupabaseService.upload_file(bucket_name, storage_path, file_content)
-            
-            logger.info(f"Uploaded successfully. Public URL: {public_url}")
-            
-            # Step 3: Extract text content for search/indexing
-            logger.info("Extracting text content from PDF...")
-            processor = FileProcessor()
-            extracted_text, page_count = processor.process_file(file_content, 'pdf')
-            
-            # Step 4: Register in database
-            book_data = {
-                'title': title,
-                'author': author,
-                'description': description,
-                'storage_path': storage_path,
-                'download_url': public_url,
-                'file_size': file_size,
-                'page_count': page_count,
-                'extracted_text': extracted_text[:10000],  # Limit text size
-                'is_official': True,
-            }
-            
-            # Add grade/subject associations
-            if grade_id:
-                book_data['grade_id'] = grade_id
-            if subject_id:
-                book_data['subject_id'] = subject_id
-            
-            # Get or create grade/subject if names provided
-            if not grade_id and grade_level:
-                grade = SupabaseService.fetch_table('grades', {'name': grade_level})
-                if grade:
-                    book_data['grade_id'] = grade[0]['id']
-            
-            if not subject_id and subject_name:
-                subject = SupabaseService.fetch_table('subjects', {'name': subject_name})
-                if subject:
-                    book_data['subject_id'] = subject[0]['id']
-            
-            logger.info("Registering book in database...")
-            book = SupabaseService.insert_record('books', book_data)
-            
-            if book:
-                logger.info(f"Book registered successfully: {book['id']}")
-                return Response(book, status=status.HTTP_201_CREATED)
-            else:
-                return Response(
-                    {'error': 'Failed to register book in database'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to download PDF: {e}")
-            return Response(
-                {'error': f'Failed to download PDF: {str(e)}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            book, created = BookImporter().import_book(spec)
+            return Response(book, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+        except BookImportError as e:
+            logger.error(f"Book import failed: {e}")
+            return Response({'error': str(e)}, status=e.status_code)
         except Exception as e:
             logger.error(f"Error in download_and_register pipeline: {e}")
             return Response(
@@ -302,8 +470,11 @@ class BookViewSet(ViewSet):
             - default_grade_id: Default grade ID for books without specific grade
             - default_subject_id: Default subject ID for books without specific subject
         
+        Books are imported in the background; poll ``progress_url`` or
+        subscribe to ``events_url`` (Server-Sent Events) for progress.
+        
         Returns:
-            - List of registered book records
+            - 202 with the batch id and its initial progress
         """
         books_to_import = request.data.get('books', [])
         default_grade_id = request.data.get('default_grade_id')
@@ -315,66 +486,81 @@ class BookViewSet(ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        results = []
-        errors = []
-        
-        for i, book_data in enumerate(books_to_import):
-            # Prepare request data for single book
-            single_request_data = {
-                'source_url': book_data.get('source_url'),
-                'title': book_data.get('title'),
-                'grade_id': book_data.get('grade_id') or default_grade_id,
-                'subject_id': book_data.get('subject_id') or default_subject_id,
-                'grade_level': book_data.get('grade_level'),
-                'subject_name': book_data.get('subject_name'),
-                'author': book_data.get('author', ''),
-                'description': book_data.get('description', ''),
-            }
-            
-            # Create a mock request object
-            class MockRequest:
-                def __init__(self, data):
-                    self.data = data
-            
-            mock_request = MockRequest(single_request_data)
-            
-            # Process single book
-            result = self.download_and_register(mock_request)
-            
-            if result.status_code == 201:
-                results.append(result.data)
-            else:
-                errors.append({
-                    'index': i,
-                    'title': book_data.get('title', 'Unknown'),
-                    'error': result.data.get('error', 'Unknown error')
-                })
+        specs = BulkImporter.build_specs(books_to_import, default_grade_id, default_subject_id)
+        try:
+            # request.user is the Supabase user dict when the request carried a valid token
+            created_by = request.user.get('id') if request.auth else None
+            batch = BulkImporter.start(specs, created_by=created_by)
+        except Exception as e:
+            logger.error(f"Error starting bulk import: {e}")
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
         
         return Response({
-            'imported': results,
-            'errors': errors,
-            'total_imported': len(results),
-            'total_errors': len(errors)
-        }, status=status.HTTP_201_CREATED if results else status.HTTP_400_BAD_REQUEST)
+            **batch,
+            'progress_url': reverse('book-import-status', args=[batch['id']]),
+            'events_url': reverse('book-import-events', args=[batch['id']]),
+        }, status=status.HTTP_202_ACCEPTED)
     
-    def _extract_title_from_url(self, url):
-        """Extract a readable title from a URL."""
-        # Remove protocol and common path parts
-        clean_url = url.replace('https://', '').replace('http://', '')
-        clean_url = clean_url.replace('www.', '')
-        
-        # Get the last part of the path
-        parts = clean_url.split('/')
-        filename = parts[-1] if parts else 'downloaded-book'
-        
-        # Remove file extension
-        if filename.endswith('.pdf'):
-            filename = filename[:-4]
-        
-        # Replace hyphens and underscores with spaces
-        title = filename.replace('-', ' ').replace('_', ' ')
+    @staticmethod
+    def _load_own_batch(request, batch_id):
+        """Progress of a batch the caller started (any batch for admins); None otherwise."""
+        summary = BulkImporter.load_summary(batch_id)
+        if not summary or not request.auth:
+            return None
+        if summary.get('created_by') == request.user.get('id') or is_admin(request.user):
+            return summary
+        return None
+    
+    def import_status(self, request, batch_id=None):
+        """Progress of a bulk import batch started by the caller."""
+        summary = self._load_own_batch(request, batch_id)
+        if summary:
+            return Response(summary)
+        return Response(
+            {'error': 'Import batch not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    def import_events(self, request, batch_id=None):
+        """
+        Stream progress of a bulk import batch as Server-Sent Events.
         
-        # Capitalize words
-        title = ' '.join(word.capitalize() for word in title.split())
+        A ``progress`` event is sent whenever the batch changes, and the stream
+        ends with a ``done`` event once the batch finishes. Only the caller's
+        own batches can be followed.
+        """
+        summary = self._load_own_batch(request, batch_id)
+        if not summary:
+            return Response(
+                {'error': 'Import batch not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
         
-        return title if title else 'Untitled Book'
+        response = StreamingHttpResponse(
+            self._import_event_stream(batch_id, summary),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    def _import_event_stream(self, batch_id, summary):
+        """Yield SSE frames until the batch is finished."""
+        version = -1
+        while True:
+            yield f"event: progress\ndata: {json.dumps(summary)}\n\n"
+            if summary['status'] in TERMINAL_STATUSES:
+                yield f"event: done\ndata: {json.dumps({'id': batch_id, 'status': summary['status']})}\n\n"
+                return
+            
+            batch = BulkImporter.get_batch(batch_id)
+            if batch:
+                # Running in this process: wake up on the next change
+                version = batch.wait_for_change(version, timeout=IMPORT_EVENTS_HEARTBEAT)
+            else:
+                # Running elsewhere: poll the batch row
+                time.sleep(IMPORT_EVENTS_POLL_SECONDS)
+            summary = BulkImporter.load_summary(batch_id) or summary
@@ -0,0 +1,115 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from apps.core.background import run_in_background
+from apps.core.services.ai_service import AIService
+from apps.core.services.supabase_service import SupabaseService
+from apps.core.services.token_counter import count_tokens, message_tokens, total_tokens
+
+logger = logging.getLogger(__name__)
+
+HISTORY_COLUMNS = 'id,role,content,created_at,token_count'
+
+
+class HistoryCompactor:
+    """Folds older conversation turns into a rolling summary stored on the conversation."""
+
+    _in_flight = set()
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.token_budget = settings.CHAT_HISTORY_TOKEN_BUDGET
+        self.keep_recent_tokens = settings.CHAT_SUMMARY_KEEP_RECENT_TOKENS
+        self.max_input_tokens = settings.CHAT_SUMMARY_MAX_INPUT_TOKENS
+
+    @staticmethod
+    def summary_cursor(conversation: Optional[Dict]) -> Optional[Tuple[str, str]]:
+        """The ``(created_at, id)`` of the last message covered by the summary."""
+        if conversation and conversation.get('summary_until_at') and conversation.get('summary_until_id'):
+            return str(conversation['summary_until_at']), str(conversation['summary_until_id'])
+        return None
+
+    @staticmethod
+    def unsummarized(messages: List[Dict], cursor: Optional[Tuple[str, str]]) -> List[Dict]:
+        """Drop messages already folded into the summary."""
+        if not cursor:
+            return messages
+        return [msg for msg in messages if (str(msg['created_at']), msg['id']) > cursor]
+
+    def maybe_schedule(self, conversation_id: str, messages: List[Dict], window_full: bool = False) -> bool:
+        """
+        Schedule background compaction when the unsummarized turns no longer
+        fit the history budget. Returns True if a compaction was scheduled.
+        """
+        if not window_full and total_tokens(messages) <= self.token_budget:
+            return False
+
+        with self._lock:
+            if conversation_id in self._in_flight:
+                return False
+            self._in_flight.add(conversation_id)
+
+        run_in_background(self._compact_and_release, conversation_id)
+        return True
+
+    def _compact_and_release(self, conversation_id: str):
+        try:
+            self.compact(conversation_id)
+        finally:
+            with self._lock:
+                self._in_flight.discard(conversation_id)
+
+    def compact(self, conversation_id: str) -> Optional[str]:
+        """Summarize the oldest unsummarized turns, keeping recent ones verbatim."""
+        conversation = SupabaseService.fetch_by_id('conversations', conversation_id)
+        if not conversation:
+            return None
+
+        messages, _ = SupabaseService.fetch_keyset_page(
+            'messages',
+            {'conversation_id': conversation_id},
+            columns=HISTORY_COLUMNS,
+            cursor=self.summary_cursor(conversation),
+            direction='after',
+            limit=200
+        )
+
+        # Keep the newest turns verbatim; they are what the prompt budget is for
+        split = len(messages)
+        recent_tokens = 0
+        while split > 0:
+            recent_tokens += message_tokens(messages[split - 1])
+            if recent_tokens > self.keep_recent_tokens:
+                break
+            split -= 1
+
+        # Summarize oldest-first, bounded so the summarization prompt stays small
+        older = []
+        input_tokens = 0
+        for msg in messages[:split]:
+            input_tokens += message_tokens(msg)
+            if older and input_tokens > self.max_input_tokens:
+                break
+            older.append(msg)
+
+        if not older:
+            return None
+
+        summary = AIService().summarize_conversation(older, conversation.get('summary'))
+        last = older[-1]
+        # Compare-and-set on the cursor read above: another worker may have compacted meanwhile
+        updated = SupabaseService.update_where('conversations', {
+            'id': conversation_id,
+            'summary_until_id': conversation.get('summary_until_id'),
+        }, {
+            'summary': summary,
+            'summary_token_count': count_tokens(summary),
+            'summary_until_at': last['created_at'],
+            'summary_until_id': last['id'],
+        })
+        if not updated:
+            logger.info(f"Dropped summary of conversation {conversation_id}: it was compacted concurrently")
+            return None
+        logger.info(f"Compacted {len(older)} messages of conversation {conversation_id} into summary")
+        return summary
@@ -0,0 +1,17 @@
+from rest_framework.test import APIRequestFactory
+
+from apps.chat.views import ChatView
+
+
+def test_both_turns_are_stored_before_the_reply_is_returned(offline):
+    request = APIRequestFactory().post('/api/chat/', {'message': 'What do mitochondria do?'}, format='json')
+
+    response = ChatView.as_view()(request)
+
+    assert response.status_code == 200
+    messages = offline.supabase.tables['messages']
+    assert [(message['role'], message['conversation_id']) for message in messages] == [
+        ('user', response.data['conversation_id']),
+        ('assistant', response.data['conversation_id']),
+    ]
+    assert messages[1]['id'] == response.data['message_id']
@@ -0,0 +1,72 @@
+import uuid
+
+import pytest
+
+from apps.chat.services import history_compactor
+from apps.chat.services.history_compactor import HistoryCompactor
+
+
+@pytest.fixture
+def conversation(offline, settings):
+    settings.CHAT_HISTORY_TOKEN_BUDGET = 100
+    settings.CHAT_SUMMARY_KEEP_RECENT_TOKENS = 60
+    settings.CHAT_SUMMARY_MAX_INPUT_TOKENS = 1000
+    conversation = offline.supabase.seed('conversations', [{'title': 'Cells'}])[0]
+    offline.supabase.seed('messages', [{
+        'id': str(uuid.UUID(int=index + 1)),
+        'conversation_id': conversation['id'],
+        'role': 'user' if index % 2 == 0 else 'assistant',
+        'content': f'turn {index} ' + 'about cell membranes ' * 5,
+        'created_at': f'2026-10-19T10:00:{index:02d}+00:00',
+        'token_count': 30,
+    } for index in range(10)])
+    return conversation
+
+
+def _conversation(offline, conversation):
+    return next(row for row in offline.supabase.tables['conversations'] if row['id'] == conversation['id'])
+
+
+def test_older_turns_are_folded_into_the_summary(offline, conversation):
+    summary = HistoryCompactor().compact(conversation['id'])
+
+    stored = _conversation(offline, conversation)
+    assert summary and stored['summary'] == summary
+    assert stored['summary_token_count'] > 0
+    # The newest turns stay verbatim
+    assert stored['summary_until_id'] == str(uuid.UUID(int=9))
+
+    messages = offline.supabase.tables['messages']
+    recent = HistoryCompactor.unsummarized(messages, HistoryCompactor.summary_cursor(stored))
+    assert [message['id'] for message in recent] == [str(uuid.UUID(int=10))]
+
+
+def test_a_concurrent_compaction_wins_and_the_stale_summary_is_dropped(offline, conversation, monkeypatch):
+    summarize = history_compactor.AIService.summarize_conversation
+
+    def summarize_while_another_worker_compacts(self, messages, previous_summary=None, **kwargs):
+        _conversation(offline, conversation).update(
+            summary='from the other worker', summary_until_at=messages[-1]['created_at'],
+            summary_until_id=messages[-1]['id'],
+        )
+        return summarize(self, messages, previous_summary, **kwargs)
+
+    monkeypatch.setattr(history_compactor.AIService, 'summarize_conversation', summarize_while_another_worker_compacts)
+
+    assert HistoryCompactor().compact(conversation['id']) is None
+    assert _conversation(offline, conversation)['summary'] == 'from the other worker'
+
+
+def test_compaction_is_scheduled_only_over_budget(offline, conversation, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(history_compactor, 'run_in_background', lambda fn, *args: scheduled.append(args))
+    compactor = HistoryCompactor()
+    short = [{'role': 'user', 'content': 'hi', 'token_count': 5}]
+    long = [{'role': 'user', 'content': 'hi', 'token_count': 80}] * 2
+
+    assert not compactor.maybe_schedule(conversation['id'], short)
+    assert compactor.maybe_schedule(conversation['id'], short, window_full=True)
+    # Already compacting in this process
+    assert not compactor.maybe_schedule(conversation['id'], long)
+    assert scheduled == [(conversation['id'],)]
+    HistoryCompactor._in_flight.discard(conversation['id'])
@@ -0,0 +1,80 @@
+import uuid
+
+import pytest
+from rest_framework.test import APIClient
+
+from apps.core.pagination import encode_cursor
+
+
+@pytest.fixture
+def conversation(offline):
+    conversation = offline.supabase.seed('conversations', [{'title': 'Cells'}])[0]
+    # Pairs share a timestamp, so pages must break ties on id
+    offline.supabase.seed('messages', [{
+        'id': str(uuid.UUID(int=index + 1)),
+        'conversation_id': conversation['id'],
+        'role': 'user',
+        'content': f'message {index}',
+        'created_at': f'2026-10-19T10:00:0{index // 2}.500000+00:00',
+    } for index in range(7)])
+    return conversation
+
+
+def _page(conversation, **params):
+    response = APIClient().get(f"/api/v1/conversations/{conversation['id']}/messages/", params)
+    assert response.status_code == 200
+    return response.data
+
+
+def _contents(page):
+    return [message['content'] for message in page['messages']]
+
+
+def test_retrieve_returns_the_whole_conversation(conversation):
+    response = APIClient().get(f"/api/v1/conversations/{conversation['id']}/")
+
+    assert [message['content'] for message in response.data['messages']] == [f'message {i}' for i in range(7)]
+
+
+def test_pages_walk_back_from_the_newest(conversation):
+    newest = _page(conversation, limit=3)
+    assert _contents(newest) == ['message 4', 'message 5', 'message 6']
+    assert (newest['has_more_before'], newest['has_more_after']) == (True, False)
+
+    older = _page(conversation, limit=3, before=newest['cursors']['before'])
+    assert _contents(older) == ['message 1', 'message 2', 'message 3']
+    assert (older['has_more_before'], older['has_more_after']) == (True, True)
+
+    oldest = _page(conversation, limit=3, before=older['cursors']['before'])
+    assert _contents(oldest) == ['message 0']
+    assert (oldest['has_more_before'], oldest['has_more_after']) == (False, True)
+
+
+def test_has_more_after_reflects_messages_beyond_the_page(conversation):
+    first = _page(conversation, limit=7, latest='false')
+    last = first['messages'][-1]
+
+    page = _page(conversation, before=encode_cursor(last['created_at'], last['id']), limit=10)
+
+    assert len(page['messages']) == 6
+    assert page['has_more_after'] is True
+    forward = _page(conversation, after=page['cursors']['after'], limit=10)
+    assert _contents(forward) == ['message 6']
+    assert (forward['has_more_before'], forward['has_more_after']) == (True, False)
+
+
+def test_cursor_past_the_end_has_nothing_after(conversation):
+    cursor = encode_cursor('2026-10-19T11:00:00+00:00', str(uuid.UUID(int=99)))
+
+    page = _page(conversation, before=cursor, limit=10)
+
+    assert len(page['messages']) == 7
+    assert page['has_more_after'] is False
+
+
+def test_malformed_cursors_are_rejected(conversation):
+    injected = encode_cursor('2026-10-19T10:00:00+00:00,id.neq.0', str(uuid.UUID(int=1)))
+
+    for cursor in ('not-a-cursor', injected, encode_cursor('2026-10-19T10:00:00+00:00', 'x),or(id')):
+        response = APIClient().get(f"/api/v1/conversations/{conversation['id']}/messages/", {'before': cursor})
+        assert response.status_code == 400
@@ -2,13 +2,28 @@ from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
+from rest_framework.decorators import action
 from apps.core.services.supabase_service import SupabaseService
 from apps.core.services.ai_service import AIService
+from apps.core.exceptions import RateLimitExceeded, UpstreamUnavailable
+from apps.core.services.message_journal import MessageJournal, utc_now_iso
 from apps.books.services.rag_service import RAGService
+from apps.books.services.vector_gc import release_documents_in_background
+from apps.chat.services.history_compactor import HistoryCompactor, HISTORY_COLUMNS
+from apps.core.services.token_counter import count_tokens
+from apps.core.pagination import cursor_for, decode_cursor, parse_page_size
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
+# Per-message fields returned by paginated endpoints; conversation_id is implied
+MESSAGE_COLUMNS = 'id,role,content,created_at'
+MESSAGE_FIELDS = MESSAGE_COLUMNS.split(',')
+
+# Most recent unsummarized messages read per turn; the prompt takes what fits its token budget
+HISTORY_FETCH_LIMIT = 50
+
 
 class ConversationViewSet(ViewSet):
     """ViewSet for Conversation operations."""
@@ -43,6 +58,76 @@ class ConversationViewSet(ViewSet):
             status=status.HTTP_404_NOT_FOUND
         )
     
+    @action(detail=True, methods=['get'], url_path='messages')
+    def messages(self, request, pk=None):
+        """
+        Page through a conversation's messages using ``(created_at, id)`` cursors.
+        
+        Query params:
+            - before: Cursor; return the page of messages older than it
+            - after: Cursor; return the page of messages newer than it
+            - latest: When no cursor is given, start from the newest page
+              (default ``true``) or from the oldest (``false``)
+            - limit: Page size (default 50, max 200)
+        
+        Returns:
+            - messages: Page of messages in chronological order
+            - cursors: ``before``/``after`` cursors for the page edges
+            - has_more_before / has_more_after: Whether more pages exist
+        """
+        before = request.query_params.get('before')
+        after = request.query_params.get('after')
+        latest = request.query_params.get('latest', 'true').lower() != 'false'
+        
+        if before and after:
+            return Response(
+                {'error': 'Use either before or after, not both'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            limit = parse_page_size(request.query_params.get('limit'))
+            cursor = decode_cursor(before or after) if (before or after) else None
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        direction = 'before' if before or (not after and latest) else 'after'
+        messages, has_more = SupabaseService.fetch_keyset_page(
+            'messages',
+            {'conversation_id': pk},
+            columns=MESSAGE_COLUMNS,
+            cursor=cursor,
+            direction=direction,
+            limit=limit
+        )
+        
+        # The other side is only non-empty when paging from a cursor; probe it with a one-row over-fetch
+        other = 'after' if direction == 'before' else 'before'
+        edge = (messages[-1] if direction == 'before' else messages[0]) if messages else None
+        has_more_other = cursor is not None and SupabaseService.fetch_keyset_page(
+            'messages',
+            {'conversation_id': pk},
+            columns='id',
+            cursor=(str(edge['created_at']), edge['id']) if edge else None,
+            direction=other,
+            limit=0
+        )[1]
+        if direction == 'before':
+            has_more_before, has_more_after = has_more, has_more_other
+        else:
+            has_more_before, has_more_after = has_more_other, has_more
+        
+        return Response({
+            'conversation_id': pk,
+            'messages': messages,
+            'cursors': {
+                'before': cursor_for(messages[0]) if messages else before,
+                'after': cursor_for(messages[-1]) if messages else after,
+            },
+            'has_more_before': has_more_before,
+            'has_more_after': has_more_after,
+        })
+    
     def create(self, request):
         """Create a new conversation."""
         user_id = request.META.get('HTTP_X_USER_ID')
@@ -60,13 +145,20 @@ class ConversationViewSet(ViewSet):
         )
     
     def destroy(self, request, pk=None):
-        """Delete a conversation and its messages."""
+        """Delete a conversation, its messages, and its documents' vectors."""
+        # Uploaded documents are removed with the conversation (ON DELETE CASCADE)
+        documents = SupabaseService.fetch_table('documents', {'conversation_id': pk}, columns='content_hash')
+        
+        # Queued writes for a deleted conversation could only fail
+        MessageJournal.get().discard(pk)
+        
         # Delete messages first
         messages = SupabaseService.fetch_table('messages', {'conversation_id': pk})
         for msg in messages:
             SupabaseService.delete_record('messages', msg['id'])
         
         if SupabaseService.delete_record('conversations', pk):
+            release_documents_in_background([document.get('content_hash') for document in documents])
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'error': 'Failed to delete conversation'},
@@ -92,6 +184,8 @@ class ChatView(APIView):
             - response: AI response
             - conversation_id: Conversation ID
             - message_id: Message ID
+            - context_unavailable: Book or document search failed, so the
+              answer was given without (some of) its context
         """
         user_message = request.data.get('message')
         conversation_id = request.data.get('conversation_id')
@@ -110,7 +204,8 @@ class ChatView(APIView):
         
         try:
             # Get or create conversation
-            if not conversation_id:
+            is_new_conversation = not conversation_id
+            if is_new_conversation:
                 conversation_data = {
                     'user_id': user_id,
                     'title': user_message[:50] + '...' if len(user_message) > 50 else user_message,
@@ -122,33 +217,49 @@ class ChatView(APIView):
             else:
                 conversation = SupabaseService.fetch_by_id('conversations', conversation_id)
             
-            # Save user message
-            user_msg_data = {
-                'conversation_id': conversation_id,
-                'role': 'user',
-                'content': user_message,
-            }
-            user_message_record = SupabaseService.insert_record('messages', user_msg_data)
-            
-            # Get conversation history
-            messages = SupabaseService.fetch_table(
+            # Get recent conversation history not yet folded into the summary
+            summary_cursor = HistoryCompactor.summary_cursor(conversation)
+            messages, has_older = SupabaseService.fetch_keyset_page(
                 'messages',
                 {'conversation_id': conversation_id},
-                order_by='created_at'
+                columns=HISTORY_COLUMNS,
+                direction='before',
+                limit=HISTORY_FETCH_LIMIT
             )
+            fetched_count = len(messages)
+            messages = HistoryCompactor.unsummarized(messages, summary_cursor)
+            window_full = has_older and len(messages) == fetched_count
+            
+            # Save user message; clients read messages straight from Supabase (and its
+            # realtime feed), so the turn is written before the reply is generated
+            user_message_record = SupabaseService.insert_record('messages', {
+                'conversation_id': conversation_id,
+                'role': 'user',
+                'content': user_message,
+                'token_count': count_tokens(user_message),
+            })
             
             # --- CONTEXT RETRIEVAL (RAG) ---
             rag_service = RAGService()
             context_text = ""
             
-            # Use RAG to fetch relevant chunks
-            if book_id:
-                logger.info(f"Fetching RAG context for book {book_id}")
-                context_text = rag_service.query_book_context(user_message, book_id=book_id)
-            elif grade_id or subject_id:
-                logger.info(f"Fetching general RAG context for grade {grade_id}, subject {subject_id}")
-                # We could filter by metadata here if we wanted to be more specific
-                context_text = rag_service.query_book_context(user_message)
+            # Use RAG to fetch relevant chunks; a failed search is reported, not mistaken for no matches
+            context_unavailable = False
+            try:
+                if book_id:
+                    logger.info(f"Fetching RAG context for book {book_id}")
+                    context_text = rag_service.query_book_context(user_message, book_id=book_id)
+                elif grade_id or subject_id:
+                    logger.info(f"Fetching general RAG context for grade {grade_id}, subject {subject_id}")
+                    # Routed to the best books and sections for this grade/subject
+                    context_text = rag_service.query_book_context(
+                        user_message, grade_id=grade_id or None, subject_id=subject_id or None
+                    )
+            except RateLimitExceeded:
+                raise
+            except Exception as e:
+                logger.warning(f"Book search unavailable, answering without it: {e}")
+                context_unavailable = True
             
             # Fallback to basic keyword search if RAG is empty or failed
             if not context_text:
@@ -159,60 +270,81 @@ class ChatView(APIView):
                     if subject_id:
                         book_filters['subject_id'] = subject_id
                     
-                    books = SupabaseService.fetch_table('books', book_filters, limit=3)
+                    books = SupabaseService.fetch_table(
+                        'books', book_filters, limit=3, columns='title,extracted_text'
+                    )
                     if books:
                         context_text = "Relevant educational content (backup):\n"
                         for book in books:
                             if book.get('extracted_text'):
                                 context_text += f"- {book['title']}: {book['extracted_text'][:500]}...\n"
             
-            # Get relevant documents
-            documents = SupabaseService.fetch_table(
-                'documents',
-                {'conversation_id': conversation_id},
-                limit=3
-            )
-            if documents:
-                context_text += "\nUploaded documents:\n"
-                for doc in documents:
-                    if doc.get('extracted_text'):
-                        context_text += f"- {doc['file_name']}: {doc['extracted_text'][:300]}...\n"
-            
-            # Build message history for AI
-            message_history = []
-            for msg in messages[-10:]:  # Last 10 messages
-                message_history.append({
-                    'role': msg['role'],
-                    'content': msg['content']
-                })
+            # Retrieve relevant passages from documents uploaded to this conversation
+            if not is_new_conversation:
+                documents = SupabaseService.fetch_table(
+                    'documents', {'conversation_id': conversation_id}, columns='content_hash'
+                )
+                content_hashes = sorted({doc['content_hash'] for doc in documents if doc.get('content_hash')})
+                if content_hashes:
+                    try:
+                        document_context = rag_service.query_document_context(user_message, content_hashes)
+                    except RateLimitExceeded:
+                        raise
+                    except Exception as e:
+                        logger.warning(f"Document search unavailable, answering without it: {e}")
+                        document_context = ""
+                        context_unavailable = True
+                    if document_context:
+                        context_text += f"\n\nUploaded documents:\n{document_context}"
             
-            # Get AI response
+            # Get AI response; the service fits summary + recent turns to its token budget
             ai_service = AIService()
             ai_response = ai_service.chat(
                 message=user_message,
                 context=context_text,
-                conversation_history=message_history,
-                system_prompt=context_data.get('system_prompt')
+                conversation_history=messages,
+                system_prompt=context_data.get('system_prompt'),
+                summary=(conversation or {}).get('summary')
             )
             
-            # Save AI response
-            ai_msg_data = {
+            # Save AI response; only bumping the conversation is write-behind
+            ai_message_record = SupabaseService.insert_record('messages', {
                 'conversation_id': conversation_id,
                 'role': 'assistant',
                 'content': ai_response,
-            }
-            ai_message_record = SupabaseService.insert_record('messages', ai_msg_data)
+                'token_count': count_tokens(ai_response),
+            })
+            MessageJournal.get().update(
+                'conversations', conversation_id, {'updated_at': utc_now_iso()}, scope=conversation_id
+            )
             
-            # Update conversation timestamp
-            SupabaseService.update_record('conversations', conversation_id, {'updated_at': 'now()'})
+            # Fold older turns into the rolling summary once they outgrow the budget
+            HistoryCompactor().maybe_schedule(
+                conversation_id,
+                messages + [user_message_record, ai_message_record],
+                window_full=window_full
+            )
             
             return Response({
                 'response': ai_response,
                 'conversation_id': conversation_id,
                 'message_id': ai_message_record['id'],
-                'context_used': bool(context_text)
+                'context_used': bool(context_text),
+                'context_unavailable': context_unavailable
             })
             
+        except (RateLimitExceeded, UpstreamUnavailable) as e:
+            logger.warning(f"Chat unavailable: {e}")
+            response = Response(
+                {'error': str(e)},
+                status=(
+                    status.HTTP_429_TOO_MANY_REQUESTS if isinstance(e, RateLimitExceeded)
+                    else status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+            )
+            if e.retry_after:
+                response['Retry-After'] = str(max(math.ceil(e.retry_after), 1))
+            return response
         except Exception as e:
             logger.error(f"Chat error: {e}")
             return Response(
@@ -5,3 +5,9 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core'
     label = 'core'
+
+    def ready(self):
+        from apps.core import metrics
+        from apps.core.tracing import configure_opentelemetry
+        configure_opentelemetry()
+        metrics.install()
@@ -0,0 +1,44 @@
+"""
+Process-local background execution for work that must not block a request.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from django.conf import settings
+
+from apps.core.metrics import BACKGROUND_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get or create the shared background thread pool."""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.BACKGROUND_WORKERS,
+                    thread_name_prefix='background'
+                )
+    return _executor
+
+
+def run_in_background(fn: Callable, *args, **kwargs) -> Future:
+    """Schedule ``fn`` on the background pool; failures are logged, not raised."""
+    BACKGROUND_QUEUE_DEPTH.inc()
+    future = get_executor().submit(fn, *args, **kwargs)
+
+    def _log_failure(done: Future):
+        BACKGROUND_QUEUE_DEPTH.dec()
+        exc = done.exception()
+        if exc:
+            logger.error(f"Background task {getattr(fn, '__qualname__', fn)} failed: {exc}")
+
+    future.add_done_callback(_log_failure)
+    return future
@@ -1,15 +1,31 @@
-from rest_framework.views import exception_handler
 from rest_framework.response import Response
 from rest_framework import status
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
 
 def custom_exception_handler(exc, context):
     """Custom exception handler for consistent error responses."""
+    # Imported here: rest_framework.views loads the authentication classes,
+    # which import services that import this module
+    from rest_framework.views import exception_handler
+    
     response = exception_handler(exc, context)
     
+    if isinstance(exc, (RateLimitExceeded, UpstreamUnavailable)):
+        response = Response(
+            {'error': True, 'message': str(exc), 'details': None},
+            status=(
+                status.HTTP_429_TOO_MANY_REQUESTS if isinstance(exc, RateLimitExceeded)
+                else status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        )
+        if exc.retry_after:
+            response['Retry-After'] = str(max(math.ceil(exc.retry_after), 1))
+        return response
+    
     if response is not None:
         response.data = {
             'error': True,
@@ -41,6 +57,53 @@ class AIError(Exception):
     pass
 
 
+class RateLimitExceeded(AIError):
+    """
+    Exception raised when an AI call is shed because the OpenAI budgets are
+    exhausted or too many calls are waiting; ``retry_after`` is in seconds.
+    """
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Exception raised when an upstream call fails fast or runs out of time;
+    ``retry_after`` is in seconds when known.
+    """
+
+    def __init__(self, message: str, upstream: str, retry_after: float = None):
+        super().__init__(message)
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """Exception raised without calling an upstream whose circuit breaker is open."""
+    pass
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """Exception raised when an upstream call does not finish within its deadline."""
+    pass
+
+
 class FileProcessingError(Exception):
     """Exception raised for file processing errors."""
     pass
+
+
+class BookImportError(Exception):
+    """
+    Exception raised when a book cannot be downloaded or registered.
+
+    ``status_code`` is the HTTP status to report for single imports;
+    ``retryable`` marks transient failures (timeouts, 5xx, 429).
+    """
+
+    def __init__(self, message: str, status_code: int = status.HTTP_400_BAD_REQUEST, retryable: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
@@ -0,0 +1,881 @@
+"""
+Offline stand-ins for OpenAI, Pinecone and Supabase.
+
+``offline_services()`` swaps the clients the services build — the OpenAI
+and Pinecone SDK objects, the Supabase client and the HTTP calls made for
+Storage — for deterministic in-memory fakes. Everything above them
+(``AIService``, ``PineconeService``, ``SupabaseService``, RAG, views) runs
+unchanged without network access or credentials. Each fake call sleeps
+for a configurable simulated latency, so end-to-end timings can model
+upstream round trips as well as local CPU cost.
+
+Embeddings are hashed bags of words: texts sharing words score higher, so
+retrieval behaves plausibly and the same text always gets the same vector.
+
+    with offline_services(Latency(chat=0.8, embedding=0.1)) as services:
+        services.supabase.seed('books', [{'title': 'Biology'}])
+        RAGService().query_book_context('photosynthesis')
+"""
+import base64
+import hashlib
+import random
+import re
+import tempfile
+import textwrap
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+from unittest import mock
+from urllib.parse import unquote, urlparse
+
+import numpy as np
+import requests
+from django.test import override_settings
+
+from apps.core.services.supabase_service import SupabaseService
+from apps.core.services.token_counter import count_tokens
+
+OFFLINE_URL = 'http://supabase.offline'
+EMBEDDING_DIMENSION = 1536
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+class Latency:
+    """Simulated seconds per upstream call, with seeded jitter so runs repeat."""
+
+    UPSTREAMS = ('chat', 'embedding', 'pinecone', 'postgrest', 'storage', 'auth')
+
+    def __init__(self, jitter: float = 0.0, seed: int = 0, **seconds: float):
+        unknown = set(seconds) - set(self.UPSTREAMS)
+        if unknown:
+            raise ValueError(f"Unknown upstream(s): {', '.join(sorted(unknown))}")
+        self.seconds = {name: float(seconds.get(name, 0.0)) for name in self.UPSTREAMS}
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._paused = 0
+
+    @classmethod
+    def parse(cls, spec: str, jitter: float = 0.0, seed: int = 0) -> 'Latency':
+        """Parse ``chat=0.8,embedding=0.1,pinecone=0.03`` (seconds per call)."""
+        seconds = {}
+        for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+            name, _, value = item.partition('=')
+            try:
+                seconds[name.strip()] = float(value)
+            except ValueError:
+                raise ValueError(f"Invalid latency {item!r}; expected <upstream>=<seconds>")
+        return cls(jitter=jitter, seed=seed, **seconds)
+
+    def describe(self) -> str:
+        return ','.join(f"{name}={value:g}" for name, value in self.seconds.items() if value)
+
+    def wait(self, upstream: str):
+        seconds = self.seconds[upstream]
+        if seconds <= 0 or self._paused:
+            return
+        if self.jitter:
+            with self._lock:
+                seconds *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        time.sleep(seconds)
+
+    @contextmanager
+    def paused(self):
+        """No simulated latency inside the block (seeding fixtures)."""
+        with self._lock:
+            self._paused += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._paused -= 1
+
+
+def embed_text(text: str, dimension: int = EMBEDDING_DIMENSION) -> List[float]:
+    """Deterministic unit vector from the hashed words of ``text``."""
+    vector = np.zeros(dimension, dtype=np.float32)
+    words = _WORD.findall(text.lower()) or [text]
+    for word in words:
+        digest = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'big')
+        vector[digest % dimension] += 1.0 if digest >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector.tolist()
+
+
+# --- OpenAI -------------------------------------------------------------------
+
+
+class FakeOpenAI:
+    """``openai.OpenAI`` replacement: chat completions and embeddings."""
+
+    def __init__(self, latency: Latency, calls: Counter, dimension: int = EMBEDDING_DIMENSION):
+        self.latency = latency
+        self.calls = calls
+        self.dimension = dimension
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.embeddings = SimpleNamespace(create=self._embed)
+
+    def with_options(self, **kwargs) -> 'FakeOpenAI':
+        return self
+
+    def _chat(self, model: str, messages: List[Dict], max_tokens: int = 1000, **kwargs):
+        self.calls['openai.chat'] += 1
+        self.latency.wait('chat')
+        prompt_tokens = sum(count_tokens(message.get('content') or '') + 4 for message in messages)
+        question = next((m['content'] for m in reversed(messages) if m.get('role') == 'user'), '')
+        content = f"Offline answer ({len(messages)} messages, {prompt_tokens} prompt tokens) to: {question[:200]}"
+        completion_tokens = min(count_tokens(content), max_tokens)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, finish_reason='stop', message=SimpleNamespace(role='assistant', content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+    def _embed(self, model: str, input, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        self.calls['openai.embedding'] += 1
+        self.latency.wait('embedding')
+        tokens = sum(count_tokens(text) for text in texts)
+        return SimpleNamespace(
+            model=model,
+            data=[SimpleNamespace(index=i, embedding=embed_text(text, self.dimension)) for i, text in enumerate(texts)],
+            usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens),
+        )
+
+
+# --- Pinecone -----------------------------------------------------------------
+
+
+def matches_filter(metadata: Dict[str, Any], condition: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a Pinecone metadata filter against one vector's metadata."""
+    if not condition:
+        return True
+    for key, expected in condition.items():
+        if key == '$and':
+            if not all(matches_filter(metadata, clause) for clause in expected):
+                return False
+        elif key == '$or':
+            if not any(matches_filter(metadata, clause) for clause in expected):
+                return False
+        elif isinstance(expected, dict):
+            value = metadata.get(key)
+            for op, operand in expected.items():
+                if not _compare(op, value, operand):
+                    return False
+        elif metadata.get(key) != expected:
+            return False
+    return True
+
+
+def _compare(op: str, value, operand) -> bool:
+    if op == '$eq':
+        return value == operand
+    if op == '$ne':
+        return value != operand
+    if op == '$in':
+        return value in operand
+    if op == '$nin':
+        return value not in operand
+    if op == '$exists':
+        return (value is not None) == bool(operand)
+    if value is None:
+        return False
+    if op == '$gt':
+        return value > operand
+    if op == '$gte':
+        return value >= operand
+    if op == '$lt':
+        return value < operand
+    if op == '$lte':
+        return value <= operand
+    raise ValueError(f"Unsupported filter operator {op}")
+
+
+class _Namespace:
+    def __init__(self):
+        self.vectors: Dict[str, np.ndarray] = {}
+        self.metadata: Dict[str, Dict] = {}
+        self._matrix = None
+
+    def matrix(self):
+        """(ids, unit-normalized matrix), rebuilt after writes."""
+        if self._matrix is None:
+            ids = list(self.vectors)
+            if ids:
+                matrix = np.stack([self.vectors[vector_id] for vector_id in ids])
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix = matrix / np.where(norms == 0, 1, norms)
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            self._matrix = (ids, matrix)
+        return self._matrix
+
+
+class FakeIndex:
+    """Pinecone ``Index`` replacement with exact cosine search and metadata filters."""
+
+    def __init__(self, latency: Latency, calls: Counter, dimension: int = EMBEDDING_DIMENSION):
+        self.latency = latency
+        self.calls = calls
+        self.dimension = dimension
+        self._namespaces: Dict[str, _Namespace] = defaultdict(_Namespace)
+        self._lock = threading.Lock()
+
+    def _call(self, operation: str):
+        self.calls[f'pinecone.{operation}'] += 1
+        self.latency.wait('pinecone')
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = ''):
+        self._call('upsert')
+        with self._lock:
+            space = self._namespaces[namespace]
+            for vector in vectors:
+                space.vectors[vector['id']] = np.asarray(vector['values'], dtype=np.float32)
+                space.metadata[vector['id']] = dict(vector.get('metadata') or {})
+            space._matrix = None
+        return {'upserted_count': len(vectors)}
+
+    def query(
+        self,
+        vector: Sequence[float],
+        top_k: int = 10,
+        filter: Optional[Dict] = None,
+        namespace: str = '',
+        include_metadata: bool = False,
+        **kwargs
+    ) -> Dict[str, Any]:
+        self._call('query')
+        with self._lock:
+            space = self._namespaces[namespace]
+            ids, matrix = space.matrix()
+            metadata = space.metadata
+        if not ids:
+            return {'matches': [], 'namespace': namespace}
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = matrix @ (query / norm if norm else query)
+        if filter:
+            allowed = np.array([matches_filter(metadata[vector_id], filter) for vector_id in ids], dtype=bool)
+            scores = np.where(allowed, scores, -np.inf)
+        order = np.argsort(-scores)[:top_k]
+        matches = []
+        for index in order:
+            if scores[index] == -np.inf:
+                break
+            match = {'id': ids[index], 'score': float(scores[index])}
+            if include_metadata:
+                match['metadata'] = dict(metadata[ids[index]])
+            matches.append(match)
+        return {'matches': matches, 'namespace': namespace}
+
+    def delete(self, ids: List[str] = None, namespace: str = '', delete_all: bool = False, filter: Dict = None):
+        self._call('delete')
+        with self._lock:
+            space = self._namespaces[namespace]
+            if delete_all:
+                doomed = list(space.vectors)
+            elif filter:
+                doomed = [vector_id for vector_id, meta in space.metadata.items() if matches_filter(meta, filter)]
+            else:
+                doomed = ids or []
+            for vector_id in doomed:
+                space.vectors.pop(vector_id, None)
+                space.metadata.pop(vector_id, None)
+            space._matrix = None
+        return {}
+
+    def list(self, prefix: str = '', namespace: str = '', limit: int = 100) -> Iterator[SimpleNamespace]:
+        self._call('list')
+        with self._lock:
+            ids = sorted(vector_id for vector_id in self._namespaces[namespace].vectors if vector_id.startswith(prefix))
+        for start in range(0, len(ids), limit):
+            yield SimpleNamespace(vectors=[SimpleNamespace(id=vector_id) for vector_id in ids[start:start + limit]])
+
+    def fetch(self, ids: List[str], namespace: str = '') -> SimpleNamespace:
+        self._call('fetch')
+        with self._lock:
+            space = self._namespaces[namespace]
+            return SimpleNamespace(vectors={
+                vector_id: SimpleNamespace(
+                    id=vector_id,
+                    values=space.vectors[vector_id].tolist(),
+                    metadata=dict(space.metadata[vector_id]),
+                )
+                for vector_id in ids if vector_id in space.vectors
+            })
+
+    def describe_index_stats(self, **kwargs) -> SimpleNamespace:
+        with self._lock:
+            namespaces = {name: {'vector_count': len(space.vectors)} for name, space in self._namespaces.items()}
+        return SimpleNamespace(
+            dimension=self.dimension,
+            namespaces=namespaces,
+            total_vector_count=sum(entry['vector_count'] for entry in namespaces.values()),
+        )
+
+
+class FakePinecone:
+    """``pinecone.Pinecone`` replacement; indexes live as long as the fake."""
+
+    def __init__(self, latency: Latency, calls: Counter, dimension: int = EMBEDDING_DIMENSION):
+        self.latency = latency
+        self.calls = calls
+        self.dimension = dimension
+        self.indexes: Dict[str, FakeIndex] = {}
+
+    def list_indexes(self):
+        return [SimpleNamespace(name=name) for name in self.indexes]
+
+    def create_index(self, name: str, dimension: int = None, **kwargs):
+        self.indexes[name] = FakeIndex(self.latency, self.calls, dimension or self.dimension)
+
+    def Index(self, name: str) -> FakeIndex:
+        if name not in self.indexes:
+            self.create_index(name)
+        return self.indexes[name]
+
+
+# --- Supabase -----------------------------------------------------------------
+
+
+def _split_terms(expression: str) -> List[str]:
+    """Split a PostgREST logic expression on top-level commas."""
+    terms, depth, quoted, escaped, current = [], 0, False, False, []
+    for char in expression:
+        if escaped:
+            escaped = False
+        elif quoted and char == '\\':
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and char == ',' and depth == 0:
+            terms.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    if current:
+        terms.append(''.join(current))
+    return terms
+
+
+def _sortable(value):
+    """Compare numbers numerically and everything else as text, as PostgREST would per column."""
+    if isinstance(value, bool) or value is None:
+        return (0, str(value))
+    if isinstance(value, (int, float)):
+        return (1, value)
+    try:
+        return (1, float(value))
+    except (TypeError, ValueError):
+        return (2, str(value))
+
+
+def _predicate(column: str, op: str, value) -> Callable[[Dict], bool]:
+    if op == 'in':
+        if isinstance(value, str):
+            value = [item.strip().strip('"') for item in value.strip('()').split(',')]
+        wanted = {str(item) for item in value}
+        return lambda row: str(row.get(column)) in wanted
+    if op == 'is':
+        wanted = {'null': None, 'true': True, 'false': False}.get(str(value).lower(), value)
+        return lambda row: row.get(column) is wanted
+    if op in ('eq', 'neq'):
+        equal = lambda row: row.get(column) is not None and str(row.get(column)) == str(value)  # noqa: E731
+        return equal if op == 'eq' else (lambda row: not equal(row))
+    compare = {
+        'gt': lambda a, b: a > b,
+        'gte': lambda a, b: a >= b,
+        'lt': lambda a, b: a < b,
+        'lte': lambda a, b: a <= b,
+    }[op]
+    return lambda row: row.get(column) is not None and compare(_sortable(row.get(column)), _sortable(value))
+
+
+def _parse_logic(expression: str, combine=any) -> Callable[[Dict], bool]:
+    """Predicate for an ``or_()`` expression such as ``a.lt."x",and(a.eq."x",id.lt.y)``."""
+    predicates = []
+    for term in _split_terms(expression):
+        term = term.strip()
+        if term.startswith(('and(', 'or(')):
+            name, _, inner = term.partition('(')
+            predicates.append(_parse_logic(inner[:-1], all if name == 'and' else any))
+            continue
+        column, op, value = term.split('.', 2)
+        if value.startswith('"') and value.endswith('"'):
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        predicates.append(_predicate(column, op, value))
+    return lambda row: combine(predicate(row) for predicate in predicates)
+
+
+class _Query:
+    """The subset of the postgrest query builder ``SupabaseService`` uses."""
+
+    def __init__(self, client: 'FakeSupabase', table: str):
+        self.client = client
+        self.table = table
+        self.action = 'select'
+        self.columns = '*'
+        self.payload = None
+        self.on_conflict = 'id'
+        self.ignore_duplicates = False
+        self.predicates: List[Callable[[Dict], bool]] = []
+        self.ordering: List[tuple] = []
+        self.row_limit: Optional[int] = None
+        self.row_offset = 0
+
+    def select(self, columns: str = '*', **kwargs):
+        self.columns = columns
+        return self
+
+    def insert(self, data, **kwargs):
+        self.action, self.payload = 'insert', data
+        return self
+
+    def upsert(self, data, on_conflict: str = 'id', ignore_duplicates: bool = False, **kwargs):
+        self.action, self.payload = 'upsert', data
+        self.on_conflict, self.ignore_duplicates = on_conflict, ignore_duplicates
+        return self
+
+    def update(self, data, **kwargs):
+        self.action, self.payload = 'update', data
+        return self
+
+    def delete(self, **kwargs):
+        self.action = 'delete'
+        return self
+
+    def _filter(self, column, op, value):
+        self.predicates.append(_predicate(column, op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self._filter(column, 'neq', value)
+
+    def gt(self, column, value):
+        return self._filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self._filter(column, 'gte', value)
+
+    def lt(self, column, value):
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self._filter(column, 'lte', value)
+
+    def in_(self, column, values):
+        return self._filter(column, 'in', values)
+
+    def is_(self, column, value):
+        return self._filter(column, 'is', value)
+
+    def or_(self, expression: str, **kwargs):
+        self.predicates.append(_parse_logic(expression))
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count: int, **kwargs):
+        self.row_limit = count
+        return self
+
+    def range(self, start: int, end: int, **kwargs):
+        self.row_offset, self.row_limit = start, end - start + 1
+        return self
+
+    def execute(self) -> SimpleNamespace:
+        self.client.calls[f'supabase.{self.action}'] += 1
+        self.client.latency.wait('postgrest')
+        with self.client.lock:
+            data = getattr(self, f'_{self.action}')()
+        return SimpleNamespace(data=data, count=len(data))
+
+    def _matching(self) -> List[Dict]:
+        return [row for row in self.client.tables[self.table] if all(p(row) for p in self.predicates)]
+
+    def _select(self) -> List[Dict]:
+        rows = self._matching()
+        for column, desc in reversed(self.ordering):
+            rows.sort(key=lambda row: _sortable(row.get(column)), reverse=desc)
+        rows = rows[self.row_offset:]
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        if self.columns.strip() == '*':
+            return [dict(row) for row in rows]
+        names = [name.strip() for name in self.columns.split(',') if name.strip()]
+        return [{name: row.get(name) for name in names} for row in rows]
+
+    def _insert(self) -> List[Dict]:
+        records = self.payload if isinstance(self.payload, list) else [self.payload]
+        return [dict(self.client._store(self.table, record)) for record in records]
+
+    def _upsert(self) -> List[Dict]:
+        records = self.payload if isinstance(self.payload, list) else [self.payload]
+        keys = [key.strip() for key in self.on_conflict.split(',')]
+        written = []
+        for record in records:
+            existing = next((
+                row for row in self.client.tables[self.table]
+                if all(str(row.get(key)) == str(record.get(key)) for key in keys)
+            ), None)
+            if existing is None:
+                written.append(dict(self.client._store(self.table, record)))
+            elif not self.ignore_duplicates:
+                existing.update(record)
+                written.append(dict(existing))
+        return written
+
+    def _update(self) -> List[Dict]:
+        rows = self._matching()
+        for row in rows:
+            row.update(self.payload)
+        return [dict(row) for row in rows]
+
+    def _delete(self) -> List[Dict]:
+        rows = self._matching()
+        doomed = {id(row) for row in rows}
+        self.client.tables[self.table] = [row for row in self.client.tables[self.table] if id(row) not in doomed]
+        return [dict(row) for row in rows]
+
+
+class FakeStorage:
+    """Supabase Storage: SDK bucket calls and the REST/TUS endpoints used for uploads."""
+
+    def __init__(self, latency: Latency, calls: Counter):
+        self.latency = latency
+        self.calls = calls
+        self.objects: Dict[tuple, bytes] = {}
+        self._uploads: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def from_(self, bucket: str) -> SimpleNamespace:
+        return SimpleNamespace(
+            upload=lambda path, content, options=None: self.put(bucket, path, content),
+            download=lambda path: self.get(bucket, path),
+            get_public_url=lambda path: self.public_url(bucket, path),
+            remove=lambda paths: [self.objects.pop((bucket, path), None) for path in paths],
+        )
+
+    def put(self, bucket: str, path: str, content, upsert: bool = True) -> Dict:
+        self.calls['supabase.storage_upload'] += 1
+        self.latency.wait('storage')
+        data = content.read() if hasattr(content, 'read') else bytes(content)
+        with self._lock:
+            if not upsert and (bucket, path) in self.objects:
+                raise requests.HTTPError(f"409 Duplicate: {bucket}/{path}")
+            self.objects[(bucket, path)] = data
+        return {'Key': f"{bucket}/{path}"}
+
+    def get(self, bucket: str, path: str) -> bytes:
+        self.calls['supabase.storage_download'] += 1
+        self.latency.wait('storage')
+        try:
+            return self.objects[(bucket, path)]
+        except KeyError:
+            raise requests.HTTPError(f"404 Object not found: {bucket}/{path}")
+
+    @staticmethod
+    def public_url(bucket: str, path: str) -> str:
+        return f"{OFFLINE_URL}/storage/v1/object/public/{bucket}/{path}"
+
+    # Minimal HTTP: object uploads, TUS resumable uploads and public downloads
+
+    def http(self, method: str, url: str, data=None, headers: Dict = None, **kwargs) -> '_HTTPResponse':
+        if not url.startswith(OFFLINE_URL):
+            raise requests.exceptions.ConnectionError(f"Offline mode: no route to {url}")
+        headers = headers or {}
+        path = unquote(urlparse(url).path)
+        if method == 'POST' and path.startswith('/storage/v1/object/'):
+            bucket, _, name = path[len('/storage/v1/object/'):].partition('/')
+            self.put(bucket, name, data, upsert=headers.get('x-upsert') == 'true')
+            return _HTTPResponse(200)
+        if path.startswith('/storage/v1/upload/resumable'):
+            return self._tus(method, path, data, headers)
+        if method == 'GET' and path.startswith('/storage/v1/object/public/'):
+            bucket, _, name = path[len('/storage/v1/object/public/'):].partition('/')
+            body = self.get(bucket, name)
+            start = 0
+            match = re.match(r'bytes=(\d+)-', headers.get('Range', ''))
+            if match:
+                start = int(match.group(1))
+            return _HTTPResponse(206 if start else 200, body[start:], {'content-type': 'application/pdf'})
+        return _HTTPResponse(404)
+
+    def _tus(self, method: str, path: str, data, headers: Dict) -> '_HTTPResponse':
+        if method == 'POST':
+            metadata = {}
+            for item in headers.get('Upload-Metadata', '').split(','):
+                key, _, value = item.partition(' ')
+                metadata[key] = base64.b64decode(value).decode('utf-8')
+            upload_id = uuid.uuid4().hex
+            with self._lock:
+                self._uploads[upload_id] = {
+                    'bucket': metadata.get('bucketName'),
+                    'name': metadata.get('objectName'),
+                    'length': int(headers.get('Upload-Length', 0)),
+                    'data': bytearray(),
+                }
+            return _HTTPResponse(201, headers={'Location': f"/storage/v1/upload/resumable/{upload_id}"})
+        upload = self._uploads.get(path.rsplit('/', 1)[-1])
+        if upload is None:
+            return _HTTPResponse(404)
+        if method == 'PATCH':
+            self.latency.wait('storage')
+            upload['data'][int(headers['Upload-Offset']):] = data
+            if len(upload['data']) >= upload['length']:
+                with self._lock:
+                    self.objects[(upload['bucket'], upload['name'])] = bytes(upload['data'])
+                self.calls['supabase.storage_upload'] += 1
+        return _HTTPResponse(204, headers={'Upload-Offset': str(len(upload['data']))})
+
+
+class _HTTPResponse:
+    """Just enough of ``requests.Response`` for the storage and download helpers."""
+
+    def __init__(self, status_code: int, content: bytes = b'', headers: Dict = None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} from offline storage", response=self)
+
+    def iter_content(self, chunk_size: int = 65536):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeSupabase:
+    """Supabase client replacement: in-memory tables, storage and GoTrue tokens."""
+
+    def __init__(self, latency: Latency, calls: Counter):
+        self.latency = latency
+        self.calls = calls
+        self.tables: Dict[str, List[Dict]] = defaultdict(list)
+        self.lock = threading.RLock()
+        self.storage = FakeStorage(latency, calls)
+        self.auth = SimpleNamespace(get_user=self._get_user)
+        self.users: Dict[str, Dict] = {}
+        self._sequence = 0
+        self._epoch = datetime.now(timezone.utc)
+        # Postgres functions called through rpc(), emulated in Python
+        self.functions: Dict[str, Callable[..., Any]] = {
+            'acquire_ingestion_lease': self._acquire_ingestion_lease,
+            'renew_ingestion_lease': self._renew_ingestion_lease,
+            'release_ingestion_lease': self._release_ingestion_lease,
+        }
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, function: str, params: Dict = None) -> SimpleNamespace:
+        def execute():
+            self.calls['supabase.rpc'] += 1
+            self.latency.wait('postgrest')
+            if function not in self.functions:
+                raise requests.HTTPError(f"404 Could not find the function public.{function}")
+            with self.lock:
+                return SimpleNamespace(data=self.functions[function](**(params or {})))
+
+        return SimpleNamespace(execute=execute)
+
+    # Ingestion leases (supabase/migrations/20261019000900_ingestion_leases.sql)
+
+    def _lease(self, book_id: str) -> Optional[Dict]:
+        return next((row for row in self.tables['ingestion_leases'] if row['book_id'] == book_id), None)
+
+    def _acquire_ingestion_lease(self, p_book_id, p_holder, p_ttl_seconds):
+        now = datetime.now(timezone.utc)
+        lease = self._lease(p_book_id)
+        fields = {
+            'holder': p_holder, 'status': 'running', 'error': None, 'acquired_at': now.isoformat(),
+            'heartbeat_at': now.isoformat(), 'expires_at': (now + timedelta(seconds=p_ttl_seconds)).isoformat(),
+            'finished_at': None,
+        }
+        if lease is None:
+            lease = {'book_id': p_book_id, 'attempts': 1, **fields}
+            self.tables['ingestion_leases'].append(lease)
+        elif lease['status'] == 'succeeded' or datetime.fromisoformat(lease['expires_at']) < now:
+            lease.update(fields, attempts=lease['attempts'] + 1)
+        return [dict(lease)]
+
+    def _renew_ingestion_lease(self, p_book_id, p_holder, p_ttl_seconds):
+        lease = self._lease(p_book_id)
+        if lease is None or lease['holder'] != p_holder or lease['status'] != 'running':
+            return False
+        now = datetime.now(timezone.utc)
+        lease.update(heartbeat_at=now.isoformat(), expires_at=(now + timedelta(seconds=p_ttl_seconds)).isoformat())
+        return True
+
+    def _release_ingestion_lease(self, p_book_id, p_holder, p_status, p_error=None, p_retry_seconds=0):
+        lease = self._lease(p_book_id)
+        if lease is None or lease['holder'] != p_holder or lease['status'] != 'running':
+            return False
+        now = datetime.now(timezone.utc)
+        lease.update(
+            status=p_status, error=p_error, finished_at=now.isoformat(),
+            expires_at=(now + timedelta(seconds=p_retry_seconds)).isoformat(),
+        )
+        return True
+
+    def _store(self, table: str, record: Dict) -> Dict:
+        # Sequential ids and timestamps keep keyset ordering deterministic
+        self._sequence += 1
+        row = {
+            'id': str(uuid.UUID(int=self._sequence)),
+            'created_at': (self._epoch + timedelta(microseconds=self._sequence)).isoformat(),
+            **record,
+        }
+        self.tables[table].append(row)
+        return row
+
+    def seed(self, table: str, records: List[Dict]) -> List[Dict]:
+        """Insert fixture rows directly, without latency or call counts."""
+        with self.lock:
+            return [dict(self._store(table, record)) for record in records]
+
+    def add_user(self, token: str, user_id: str = None, email: str = None, role: str = 'authenticated') -> Dict:
+        user = {'id': user_id or str(uuid.uuid4()), 'email': email or 'student@offline.test', 'role': role}
+        self.users[token] = user
+        return user
+
+    def _get_user(self, token: str):
+        self.calls['supabase.auth'] += 1
+        self.latency.wait('auth')
+        user = self.users.get(token)
+        if user is None:
+            # Like GoTrue's AuthApiError: a 4xx means the token was rejected
+            error = ValueError("Invalid JWT")
+            error.status = 401
+            raise error
+        return SimpleNamespace(user=SimpleNamespace(**user))
+
+
+# --- Wiring -------------------------------------------------------------------
+
+
+class OfflineServices:
+    """The fakes behind one ``offline_services()`` block, and their call counts."""
+
+    def __init__(self, latency: Latency = None, dimension: int = EMBEDDING_DIMENSION):
+        self.latency = latency or Latency()
+        self.calls: Counter = Counter()
+        self.openai = FakeOpenAI(self.latency, self.calls, dimension)
+        self.pinecone = FakePinecone(self.latency, self.calls, dimension)
+        self.supabase = FakeSupabase(self.latency, self.calls)
+
+    def reset_calls(self):
+        self.calls.clear()
+
+
+@contextmanager
+def offline_services(latency: Latency = None, dimension: int = EMBEDDING_DIMENSION) -> Iterator[OfflineServices]:
+    """
+    Run the services against in-memory fakes inside the block.
+
+    Settings get placeholder credentials, no OpenAI budgets and throwaway
+    local stores (message journal, single-flight, OpenAI budgets); the
+    process-wide instances, if started, are set aside and restored.
+    """
+    from apps.core.services.embedding_batcher import EmbeddingBatcher
+    from apps.core.openai_scheduler import OpenAIScheduler
+    from apps.core.services.message_journal import MessageJournal
+    from apps.core.singleflight import SingleFlight
+
+    services = OfflineServices(latency, dimension)
+    storage = services.supabase.storage
+    with ExitStack() as stack:
+        journal_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='offline-'))
+        stack.enter_context(override_settings(
+            OPENAI_API_KEY='offline',
+            PINECONE_API_KEY='offline',
+            SUPABASE_URL=OFFLINE_URL,
+            SUPABASE_SERVICE_KEY='offline',
+            MESSAGE_JOURNAL_PATH=f"{journal_dir}/journal.sqlite3",
+            SINGLEFLIGHT_PATH=f"{journal_dir}/singleflight.sqlite3",
+            OPENAI_SCHEDULER_PATH=f"{journal_dir}/openai_scheduler.sqlite3",
+            OPENAI_REQUESTS_PER_MINUTE=0,
+            OPENAI_TOKENS_PER_MINUTE=0,
+        ))
+        stack.enter_context(mock.patch('openai.OpenAI', lambda *args, **kwargs: services.openai))
+        stack.enter_context(mock.patch(
+            'apps.core.services.pinecone_service.Pinecone', lambda *args, **kwargs: services.pinecone
+        ))
+        stack.enter_context(mock.patch.object(
+            SupabaseService, 'get_client', classmethod(lambda cls: services.supabase)
+        ))
+        for method in ('get', 'post', 'patch', 'head'):
+            stack.enter_context(mock.patch(
+                f'requests.{method}',
+                lambda url, _method=method.upper(), **kwargs: storage.http(_method, url, **kwargs)
+            ))
+        stack.enter_context(mock.patch.object(MessageJournal, '_instance', None))
+        stack.enter_context(mock.patch.object(SingleFlight, '_instance', None))
+        stack.enter_context(mock.patch.object(EmbeddingBatcher, '_instance', None))
+        stack.enter_context(mock.patch.object(OpenAIScheduler, '_instance', None))
+        try:
+            yield services
+        finally:
+            journal = MessageJournal._instance
+            if journal is not None:
+                journal.stop()
+
+
+def synthetic_pdf(pages: Sequence[str], line_width: int = 90, lines_per_page: int = 52) -> bytes:
+    """A plain PDF with one page of Helvetica text per item of ``pages``."""
+    def escape(line: str) -> str:
+        return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', b'', b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for text in pages:
+        lines = textwrap.wrap(text.encode('latin-1', 'replace').decode('latin-1'), line_width)[:lines_per_page]
+        stream = ('BT /F1 10 Tf 14 TL 50 780 Td ' + ' '.join(f'({escape(line)}) Tj T*' for line in lines) + ' ET')
+        stream = stream.encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        objects.append((
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R '
+            f'/Resources << /Font << /F1 3 0 R >> >> >>'
+        ).encode('latin-1'))
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>".encode('latin-1')
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
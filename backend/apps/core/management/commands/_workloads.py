@@ -0,0 +1,133 @@
+"""
+Synthetic fixtures shared by the offline ``benchmark`` and ``replay_traffic``
+commands (the leading underscore keeps Django from listing this module as a
+command).
+"""
+import random
+from typing import Dict, List
+
+from apps.core.fakes import FakeStorage, OfflineServices, synthetic_pdf
+
+_SYLLABLES = (
+    'ka', 'lo', 'mi', 'ne', 'ra', 'to', 'shi', 'ba', 'de', 'fu', 'ge', 'hi', 'ju', 'ke', 'ma',
+    'no', 'pe', 'qu', 'ri', 'sa', 'ti', 'vo', 'we', 'ya', 'zo', 'che', 'dru', 'fla', 'gri', 'ple',
+)
+
+
+def vocabulary(size: int = 4000, seed: int = 7) -> List[str]:
+    """Deterministic pseudo-words, so texts have realistic word statistics without a corpus."""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def synthetic_pages(count: int, words_per_page: int = 400, seed: int = 0, words: List[str] = None) -> List[str]:
+    """Pages of text drawn with a Zipf-like skew, each with its own topical words."""
+    rng = random.Random(seed)
+    words = words or vocabulary()
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    pages = []
+    for _ in range(count):
+        topic = rng.sample(words, 12)
+        body = rng.choices(words, weights=weights, k=words_per_page)
+        for position in rng.sample(range(words_per_page), words_per_page // 8):
+            body[position] = rng.choice(topic)
+        sentences = [' '.join(body[start:start + 12]).capitalize() + '.' for start in range(0, len(body), 12)]
+        pages.append(' '.join(sentences))
+    return pages
+
+
+def seed_library(
+    services: OfflineServices,
+    books: int = 12,
+    pages: int = 30,
+    grades: int = 3,
+    subjects: int = 4,
+    seed: int = 0
+) -> Dict[str, List[Dict]]:
+    """
+    Grades, subjects and indexed books in the fakes, with their vectors and
+    router centroids, built through ``RAGService`` without simulated latency.
+
+    Returns:
+        {'grades', 'subjects', 'books'}; each book also carries its ``pages``.
+    """
+    from apps.books.services.book_router import BookRouter, CentroidAccumulator
+    from apps.books.services.rag_service import BOOKS_NAMESPACE, RAGService
+
+    supabase = services.supabase
+    with services.latency.paused():
+        grade_rows = supabase.seed('grades', [{'name': f'Grade {n}', 'level': n} for n in range(9, 9 + grades)])
+        subject_rows = supabase.seed('subjects', [{'name': f'Subject {n}'} for n in range(1, subjects + 1)])
+        rag = RAGService()
+        library = []
+        for n in range(books):
+            grade = grade_rows[n % grades]
+            subject = subject_rows[(n // grades) % subjects]
+            texts = synthetic_pages(pages, seed=seed * 1000 + n)
+            book = supabase.seed('books', [{
+                'title': f"{subject['name']} for {grade['name']} ({n + 1})",
+                'grade_id': grade['id'],
+                'subject_id': subject['id'],
+                'is_processed': True,
+                'page_count': pages,
+                'extracted_text': '\n'.join(texts)[:2000],
+                'metadata': {'rag_indexed': True},
+            }])[0]
+            centroids = CentroidAccumulator()
+            rag._index_pages(
+                enumerate(texts, start=1),
+                book['id'],
+                {'book_id': book['id'], 'book_title': book['title']},
+                BOOKS_NAMESPACE,
+                centroids
+            )
+            BookRouter.get().save_book(book, centroids)
+            library.append({**book, 'pages': texts})
+    services.reset_calls()
+    return {'grades': grade_rows, 'subjects': subject_rows, 'books': library}
+
+
+def sample_questions(library: Dict[str, List[Dict]], count: int, seed: int = 0, length: int = 10) -> List[Dict]:
+    """Questions quoting a stretch of one page: {'question', 'book_id', 'grade_id', 'subject_id', 'page'}."""
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        book = rng.choice(library['books'])
+        page = rng.randrange(len(book['pages']))
+        words = book['pages'][page].split()
+        start = rng.randrange(max(len(words) - length, 1))
+        questions.append({
+            'question': ' '.join(words[start:start + length]).rstrip('.') + '?',
+            'book_id': book['id'],
+            'grade_id': book['grade_id'],
+            'subject_id': book['subject_id'],
+            'page': page + 1,
+        })
+    return questions
+
+
+def seed_unindexed_book(services: OfflineServices, pages: int = 30, seed: int = 99) -> Dict:
+    """
+    A book that still needs RAG ingestion, alone in its own grade and subject,
+    with its PDF in fake Storage so ``initialize_session`` ingests it for real.
+    """
+    supabase = services.supabase
+    with services.latency.paused():
+        grade = supabase.seed('grades', [{'name': 'Grade 12 (unindexed)', 'level': 12}])[0]
+        subject = supabase.seed('subjects', [{'name': 'Subject (unindexed)'}])[0]
+        path = f"books/unindexed-{seed}.pdf"
+        supabase.storage.put('educational-content', path, synthetic_pdf(synthetic_pages(pages, seed=seed)))
+        book = supabase.seed('books', [{
+            'title': 'Unindexed textbook',
+            'grade_id': grade['id'],
+            'subject_id': subject['id'],
+            'is_processed': False,
+            'page_count': pages,
+            'download_url': FakeStorage.public_url('educational-content', path),
+            'metadata': {'rag_indexed': False},
+        }])[0]
+    services.reset_calls()
+    return book
@@ -0,0 +1,208 @@
+"""
+Offline microbenchmarks of the request hot paths, run against the in-memory
+OpenAI, Pinecone and Supabase fakes in ``apps.core.fakes``.
+
+    python manage.py benchmark
+    python manage.py benchmark chat_view --latency chat=0.8,embedding=0.1,pinecone=0.03,postgrest=0.02
+    python manage.py benchmark --save benchmarks.json
+    python manage.py benchmark --compare benchmarks.json --threshold 0.15
+
+Without ``--latency`` the fakes answer instantly, so timings are the local
+CPU cost. With ``--compare`` each median is checked against a saved
+baseline: a slowdown beyond ``--threshold`` or more upstream calls per run
+is reported as a regression and the command exits non-zero.
+"""
+import json
+import logging
+import math
+import statistics
+import time
+from itertools import cycle
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from apps.core.fakes import Latency, offline_services, synthetic_pdf
+from ._workloads import sample_questions, seed_library
+
+
+def _chunk_text(services, library):
+    from apps.books.services.rag_service import RAGService
+    rag = RAGService()
+    text = '\n'.join(library['books'][0]['pages'])
+    return lambda: rag._chunk_text(text)
+
+
+def _extract_text_by_page(services, library):
+    from apps.books.services.rag_service import RAGService
+    rag = RAGService()
+    pages = library['books'][0]['pages']
+    pdf = synthetic_pdf(pages)
+    if len(rag._extract_text_by_page(pdf)) != len(pages):
+        raise RuntimeError("Synthetic PDF did not extract page by page")
+    return lambda: rag._extract_text_by_page(pdf)
+
+
+def _format_context(services, library):
+    from apps.books.services.rag_service import BOOKS_NAMESPACE, RAGService
+    rag = RAGService()
+    question = sample_questions(library, 1)[0]['question']
+    matches = rag.pinecone.query_vectors(rag._embed_query(question), top_k=20, namespace=BOOKS_NAMESPACE)
+    label = lambda metadata: f"{metadata.get('book_title', 'Book')}, PAGE {metadata.get('page_number', '?')}"  # noqa: E731
+    return lambda: rag._format_context(matches, label, rag.context_token_budget)
+
+
+def _chat_view(services, library):
+    client = Client(HTTP_HOST='localhost')
+    book = library['books'][0]
+    conversation = services.supabase.seed('conversations', [{
+        'title': 'Benchmark', 'grade_id': book['grade_id'], 'subject_id': book['subject_id'],
+    }])[0]
+    services.supabase.seed('messages', [
+        {'conversation_id': conversation['id'], 'role': role, 'content': f"Earlier {role} turn {n}", 'token_count': 5}
+        for n in range(10) for role in ('user', 'assistant')
+    ])
+    questions = cycle(sample_questions(library, 64, seed=1))
+
+    def run():
+        question = next(questions)
+        response = client.post('/api/v1/chat/', {
+            'message': question['question'],
+            'conversation_id': conversation['id'],
+            'grade_id': question['grade_id'],
+            'subject_id': question['subject_id'],
+        }, content_type='application/json')
+        if response.status_code != 200:
+            raise RuntimeError(f"Chat returned {response.status_code}: {response.content[:200]!r}")
+
+    return run
+
+
+BENCHMARKS = {
+    'chunk_text': _chunk_text,
+    'extract_text_by_page': _extract_text_by_page,
+    'format_context': _format_context,
+    'chat_view': _chat_view,
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark RAG and chat hot paths offline, optionally against a saved baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmarks', nargs='*', help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+        parser.add_argument('--repeat', type=int, default=15, help='Timed runs per benchmark')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed runs before timing')
+        parser.add_argument('--min-run-ms', type=float, default=20.0, help='Loop fast calls until a run takes this long')
+        parser.add_argument('--latency', default='', help='Simulated upstream seconds, e.g. chat=0.8,embedding=0.1')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Latency jitter as a fraction (seeded)')
+        parser.add_argument('--books', type=int, default=12, help='Books in the synthetic library')
+        parser.add_argument('--pages', type=int, default=30, help='Pages per synthetic book')
+        parser.add_argument('--save', metavar='PATH', help='Write results as a baseline JSON file')
+        parser.add_argument('--compare', metavar='PATH', help='Compare against a baseline JSON file')
+        parser.add_argument('--threshold', type=float, default=0.10, help='Allowed median slowdown (0.10 = 10%%)')
+
+    def handle(self, *args, **options):
+        names = options['benchmarks'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}")
+        try:
+            latency = Latency.parse(options['latency'], jitter=options['jitter'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as fh:
+                    baseline = json.load(fh)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read baseline {options['compare']}: {e}")
+            if baseline.get('latency', '') != latency.describe():
+                self.stderr.write(
+                    f"Baseline was recorded with latency {baseline.get('latency') or 'none'!r}, "
+                    f"this run uses {latency.describe() or 'none'!r}"
+                )
+
+        if options['verbosity'] < 2:
+            # Per-request trace lines would drown the table
+            logging.disable(logging.INFO)
+        results = {}
+        with offline_services(latency) as services:
+            library = seed_library(services, books=options['books'], pages=options['pages'])
+            for name in names:
+                fn = BENCHMARKS[name](services, library)
+                results[name] = self._measure(services, fn, options)
+        logging.disable(logging.NOTSET)
+
+        regressions = self._report(results, baseline, options['threshold'])
+        if options['save']:
+            with open(options['save'], 'w') as fh:
+                json.dump({'latency': latency.describe(), 'repeat': options['repeat'], 'results': results}, fh, indent=2)
+            self.stdout.write(f"Baseline written to {options['save']}")
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) against {options['compare']}")
+
+    def _measure(self, services, fn, options):
+        for _ in range(options['warmup']):
+            fn()
+
+        # Loop sub-millisecond calls so each timed run is long enough to measure
+        loops = 1
+        while loops < 1_000_000:
+            started = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            if (time.perf_counter() - started) * 1000 >= options['min_run_ms']:
+                break
+            loops *= 2
+
+        services.reset_calls()
+        timings = []
+        for _ in range(max(options['repeat'], 1)):
+            started = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            timings.append((time.perf_counter() - started) * 1000 / loops)
+        calls = len(timings) * loops
+        timings.sort()
+        return {
+            'loops': loops,
+            'mean_ms': statistics.fmean(timings),
+            'p50_ms': statistics.median(timings),
+            'p95_ms': timings[max(math.ceil(len(timings) * 0.95) - 1, 0)],
+            'min_ms': timings[0],
+            'calls': {key: round(count / calls, 3) for key, count in sorted(services.calls.items()) if count},
+        }
+
+    def _report(self, results, baseline, threshold):
+        base_results = (baseline or {}).get('results', {})
+        header = (
+            f"{'benchmark':<22} {'loops':>7} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'min ms':>10} "
+            f"{'calls/run':>10} {'base p50':>10} {'change':>8}"
+        )
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        regressions = []
+        for name, row in results.items():
+            base = base_results.get(name)
+            calls = sum(row['calls'].values())
+            base_column = change_column = ''
+            if base:
+                change = row['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+                base_column, change_column = f"{base['p50_ms']:.3f}", f"{change:+.1%}"
+                if change > threshold:
+                    regressions.append(f"{name}: median {base['p50_ms']:.3f} -> {row['p50_ms']:.3f} ms ({change:+.1%})")
+                for key, per_run in row['calls'].items():
+                    if per_run > base.get('calls', {}).get(key, 0):
+                        regressions.append(
+                            f"{name}: {key} calls per run {base.get('calls', {}).get(key, 0)} -> {per_run}"
+                        )
+            self.stdout.write(
+                f"{name:<22} {row['loops']:>7} {row['mean_ms']:>10.3f} {row['p50_ms']:>10.3f} "
+                f"{row['p95_ms']:>10.3f} {row['min_ms']:>10.3f} {calls:>10.2f} {base_column:>10} {change_column:>8}"
+            )
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(f"REGRESSION {regression}"))
+        return regressions
@@ -0,0 +1,68 @@
+"""
+Compare text extraction backends on a local corpus.
+
+    python manage.py benchmark_extractors books/*.pdf --backends pypdf2 pymupdf
+"""
+import os
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand, CommandError
+from apps.core.services.extractors import available_backends, get_backend
+
+EXTENSION_TYPES = {'.pdf': 'pdf', '.docx': 'docx', '.txt': 'txt'}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark registered text extraction backends against files on disk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Files to extract')
+        parser.add_argument('--backends', nargs='*', help='Backend names (default: all registered)')
+        parser.add_argument('--repeat', type=int, default=1, help='Runs per file and backend')
+
+    def handle(self, *args, **options):
+        rows = []
+        for path in options['paths']:
+            file_type = EXTENSION_TYPES.get(os.path.splitext(path)[1].lower())
+            if not file_type:
+                raise CommandError(f"Unsupported file extension: {path}")
+
+            for name in options['backends'] or available_backends(file_type):
+                if name not in available_backends(file_type):
+                    self.stderr.write(f"Skipping {name}: not available for {file_type}")
+                    continue
+                rows.append(self._measure(path, file_type, name, options['repeat']))
+
+        header = f"{'file':<40} {'backend':<10} {'pages':>6} {'chars':>10} {'sec':>8} {'pages/s':>8} {'peak MB':>8}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in rows:
+            self.stdout.write(
+                f"{os.path.basename(row['path'])[:40]:<40} {row['backend']:<10} {row['pages']:>6} "
+                f"{row['chars']:>10} {row['seconds']:>8.2f} {row['pages_per_second']:>8.1f} {row['peak_mb']:>8.1f}"
+            )
+
+    def _measure(self, path, file_type, name, repeat):
+        backend = get_backend(file_type, name)
+        best = None
+        pages = chars = peak = 0
+        for _ in range(max(repeat, 1)):
+            tracemalloc.start()
+            started = time.perf_counter()
+            pages = chars = 0
+            for _, text in backend.iter_pages(path):
+                pages += 1
+                chars += len(text)
+            elapsed = time.perf_counter() - started
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            best = elapsed if best is None else min(best, elapsed)
+        return {
+            'path': path,
+            'backend': name,
+            'pages': pages,
+            'chars': chars,
+            'seconds': best,
+            'pages_per_second': pages / best if best else 0.0,
+            'peak_mb': peak / (1024 * 1024),
+        }
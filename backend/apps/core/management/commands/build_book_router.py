@@ -0,0 +1,53 @@
+"""
+Compute routing centroids for books indexed before routing existed.
+
+    python manage.py build_book_router --missing-only
+
+Centroids are averaged from the chunk vectors already stored in Pinecone,
+so nothing is re-embedded.
+"""
+from django.core.management.base import BaseCommand
+from apps.books.services.book_router import BOOK_LEVEL, ROUTER_TABLE, BookRouter, CentroidAccumulator
+from apps.books.services.rag_service import BOOKS_NAMESPACE
+from apps.core.services.pinecone_service import PineconeService
+from apps.core.services.supabase_service import SupabaseService
+
+
+class Command(BaseCommand):
+    help = 'Build per-book and per-section routing centroids from vectors already in Pinecone.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book-id', action='append', dest='book_ids', help='Only this book (repeatable)')
+        parser.add_argument('--missing-only', action='store_true', help='Skip books that already have centroids')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be built without writing')
+
+    def handle(self, *args, **options):
+        pinecone = PineconeService()
+        books = SupabaseService.scan_table('books', columns='id,title,grade_id,subject_id')
+        if options['book_ids']:
+            books = [book for book in books if str(book['id']) in options['book_ids']]
+        if options['missing_only']:
+            routed = {
+                str(row['book_id'])
+                for row in SupabaseService.scan_table(ROUTER_TABLE, {'page_start': BOOK_LEVEL}, columns='book_id')
+            }
+            books = [book for book in books if str(book['id']) not in routed]
+
+        built = 0
+        for book in books:
+            centroids = CentroidAccumulator()
+            vector_count = 0
+            for ids in pinecone.list_ids(f"{book['id']}_p", namespace=BOOKS_NAMESPACE):
+                for vector in pinecone.fetch_vectors(ids, namespace=BOOKS_NAMESPACE).values():
+                    centroids.add(int(vector['metadata'].get('page_number', 1)), vector['values'])
+                    vector_count += 1
+            if not vector_count:
+                self.stdout.write(f"{book['id']} ({book.get('title')}): no vectors, skipped")
+                continue
+            if not options['dry_run']:
+                BookRouter.get().save_book(book, centroids)
+            built += 1
+            self.stdout.write(f"{book['id']} ({book.get('title')}): {vector_count} vectors")
+
+        verb = 'Would build' if options['dry_run'] else 'Built'
+        self.stdout.write(f"{verb} centroids for {built} of {len(books)} books")
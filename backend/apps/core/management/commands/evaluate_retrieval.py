@@ -0,0 +1,222 @@
+"""
+Compare chunking and top-k settings on a labeled question set for one book.
+
+    python manage.py evaluate_retrieval book.pdf --questions questions.jsonl
+    python manage.py evaluate_retrieval --book-id <id> --questions questions.jsonl --chunk-sizes 600 1000 --top-k 3 5 8
+    python manage.py evaluate_retrieval --synthetic
+    python manage.py evaluate_retrieval book.pdf --questions questions.jsonl --embeddings openai
+
+Questions are JSON lines (or a JSON list) of ``{"question": ..., "pages":
+[12, 13]}``; ``"page": 12`` works for a single page. For each chunk size and
+overlap the book is re-chunked, embedded and indexed into a local NumPy
+index (nothing is written to Pinecone). Each question is then answered
+with every top-k. A question counts as recalled when a retrieved chunk
+comes from one of its pages.
+
+Columns: recall@k and MRR@k; index size (vectors and MB including chunk
+text); ingestion seconds (chunk, embed and index); mean context tokens as
+assembled for the prompt under ``RAG_CONTEXT_TOKEN_BUDGET``; and the median
+search-and-assembly latency. The query embedding is made once per
+question and is not part of the latency.
+
+Embeddings are offline hashed bag-of-words vectors unless ``--embeddings
+openai`` is given, so a sweep never calls (or pays for) the API by accident.
+"""
+import json
+import os
+import statistics
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.books.services.rag_service import INDEX_BATCH_SIZE, chunk_text, format_context
+from apps.core.fakes import EMBEDDING_DIMENSION, FakeIndex, Latency, embed_text
+from apps.core.services.token_counter import count_tokens
+
+EXTENSION_TYPES = {'.pdf': 'pdf', '.docx': 'docx', '.txt': 'txt'}
+
+
+def load_questions(path: str):
+    with open(path) as fh:
+        content = fh.read()
+    stripped = content.lstrip()
+    records = json.loads(content) if stripped.startswith('[') else [
+        json.loads(line) for line in content.splitlines() if line.strip()
+    ]
+    questions = []
+    for record in records:
+        pages = record.get('pages') or ([record['page']] if record.get('page') is not None else [])
+        if not record.get('question') or not pages:
+            raise ValueError(f"Each question needs 'question' and 'pages' (or 'page'): {record}")
+        questions.append({'question': record['question'], 'pages': {int(page) for page in pages}})
+    return questions
+
+
+class Command(BaseCommand):
+    help = 'Sweep chunk size, overlap and top-k against labeled questions and report recall, cost and latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', help='Book file (PDF, DOCX or TXT)')
+        parser.add_argument('--book-id', help='Use the stored text of an ingested book instead of a file')
+        parser.add_argument('--synthetic', action='store_true', help='Use a generated book and questions')
+        parser.add_argument('--questions', help='Labeled questions (JSON lines or JSON list)')
+        parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[500, 1000, 1500])
+        parser.add_argument('--overlaps', type=int, nargs='+', default=[0, 100, 200])
+        parser.add_argument('--top-k', type=int, nargs='+', default=[3, 5, 10])
+        parser.add_argument(
+            '--embeddings', choices=('openai', 'offline'), default='offline',
+            help='offline hashed bag-of-words vectors (default) or openai'
+        )
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        pages, questions = self._load(options)
+        if not pages:
+            raise CommandError('The book has no extractable text')
+        if not questions:
+            raise CommandError('No questions to evaluate')
+        embed = self._embedder(options['embeddings'])
+
+        # Query vectors do not depend on the chunking
+        query_vectors = embed([question['question'] for question in questions])
+        top_ks = sorted(set(options['top_k']))
+        rows = []
+        for chunk_size in sorted(set(options['chunk_sizes'])):
+            for overlap in sorted(set(options['overlaps'])):
+                if overlap >= chunk_size:
+                    continue
+                rows.extend(self._evaluate(pages, questions, query_vectors, embed, chunk_size, overlap, top_ks))
+                if options['verbosity'] > 1:
+                    self.stderr.write(f"Evaluated chunk_size={chunk_size} overlap={overlap}")
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+        else:
+            self._print(rows, len(pages), len(questions))
+
+    def _load(self, options):
+        if options['synthetic']:
+            from ._workloads import sample_questions, synthetic_pages
+            texts = synthetic_pages(60, seed=11)
+            sampled = sample_questions(
+                {'books': [{'id': 'synthetic', 'grade_id': None, 'subject_id': None, 'pages': texts}]}, 100, seed=11
+            )
+            questions = [{'question': item['question'], 'pages': {item['page']}} for item in sampled]
+            return list(enumerate(texts, start=1)), questions
+
+        if not options['questions']:
+            raise CommandError('--questions is required unless --synthetic is given')
+        try:
+            questions = load_questions(options['questions'])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Could not read questions: {e}")
+
+        if options['book_id']:
+            from apps.core.services.supabase_service import SupabaseService
+            from apps.core.services.text_artifacts import get_text_artifacts
+            book = SupabaseService.fetch_by_id('books', options['book_id'], columns='id,text_artifact_key')
+            if not book or not book.get('text_artifact_key'):
+                raise CommandError(f"Book {options['book_id']} has no stored text; ingest it first")
+            return list(get_text_artifacts().pages(book['text_artifact_key'])), questions
+
+        source = options['source']
+        file_type = EXTENSION_TYPES.get(os.path.splitext(source or '')[1].lower())
+        if not file_type:
+            raise CommandError('Give a PDF, DOCX or TXT file, --book-id or --synthetic')
+        from apps.core.services.file_processor import FileProcessor
+        return list(FileProcessor().iter_pages(source, file_type)), questions
+
+    def _embedder(self, choice):
+        if choice == 'offline':
+            self.stderr.write('Using offline bag-of-words embeddings; recall reflects word overlap only')
+            return lambda texts: [embed_text(text) for text in texts]
+        if not settings.OPENAI_API_KEY:
+            raise CommandError('--embeddings openai needs OPENAI_API_KEY')
+        import openai
+        from apps.core.services.ai_service import AIService
+        ai = AIService()
+
+        def embed(texts):
+            vectors = []
+            try:
+                for start in range(0, len(texts), INDEX_BATCH_SIZE):
+                    vectors.extend(ai.generate_embeddings(texts[start:start + INDEX_BATCH_SIZE]))
+            except openai.APIConnectionError as e:
+                raise CommandError(
+                    f"Could not reach OpenAI for embeddings ({e}); use --embeddings offline to run without it"
+                )
+            except openai.AuthenticationError as e:
+                raise CommandError(f"OpenAI rejected OPENAI_API_KEY ({e})")
+            return vectors
+
+        return embed
+
+    def _evaluate(self, pages, questions, query_vectors, embed, chunk_size, overlap, top_ks):
+        index = FakeIndex(Latency(), Counter(), EMBEDDING_DIMENSION)
+        started = time.perf_counter()
+        chunks = []
+        for page_number, text in pages:
+            for i, chunk in enumerate(chunk_text(text, chunk_size, overlap)):
+                if chunk.strip():
+                    chunks.append({
+                        'id': f"p{page_number}_c{i}",
+                        'metadata': {'page_number': page_number, 'chunk_index': i, 'text': chunk},
+                    })
+        for start in range(0, len(chunks), INDEX_BATCH_SIZE):
+            batch = chunks[start:start + INDEX_BATCH_SIZE]
+            vectors = embed([item['metadata']['text'] for item in batch])
+            index.upsert([{**item, 'values': vector} for item, vector in zip(batch, vectors)])
+        ingest_seconds = time.perf_counter() - started
+
+        text_bytes = sum(len(item['metadata']['text'].encode('utf-8')) for item in chunks)
+        index_mb = (len(chunks) * EMBEDDING_DIMENSION * 4 + text_bytes) / (1024 * 1024)
+        label = lambda metadata: f"Book, PAGE {metadata.get('page_number', '?')}"  # noqa: E731
+
+        stats = {k: {'hits': 0, 'reciprocal': 0.0, 'tokens': [], 'latency': []} for k in top_ks}
+        for question, vector in zip(questions, query_vectors):
+            for k in top_ks:
+                searched = time.perf_counter()
+                matches = index.query(vector=vector, top_k=k, include_metadata=True)['matches']
+                _, _, tokens = format_context(matches, label, settings.RAG_CONTEXT_TOKEN_BUDGET)
+                stats[k]['latency'].append((time.perf_counter() - searched) * 1000)
+                stats[k]['tokens'].append(tokens)
+                for rank, match in enumerate(matches, start=1):
+                    if match['metadata']['page_number'] in question['pages']:
+                        stats[k]['hits'] += 1
+                        stats[k]['reciprocal'] += 1 / rank
+                        break
+
+        return [{
+            'chunk_size': chunk_size,
+            'chunk_overlap': overlap,
+            'top_k': k,
+            'recall': stats[k]['hits'] / len(questions),
+            'mrr': stats[k]['reciprocal'] / len(questions),
+            'vectors': len(chunks),
+            'index_mb': round(index_mb, 3),
+            'ingest_seconds': round(ingest_seconds, 3),
+            'context_tokens': statistics.fmean(stats[k]['tokens']),
+            'query_ms': statistics.median(stats[k]['latency']),
+        } for k in top_ks]
+
+    def _print(self, rows, page_count, question_count):
+        self.stdout.write(
+            f"{page_count} pages, {question_count} questions, context budget {settings.RAG_CONTEXT_TOKEN_BUDGET} tokens "
+            f"(current: chunk_size={settings.RAG_CHUNK_SIZE} overlap={settings.RAG_CHUNK_OVERLAP} top_k={settings.RAG_TOP_K})"
+        )
+        header = (
+            f"{'chunk':>6} {'overlap':>7} {'top_k':>5} {'recall':>7} {'MRR':>6} {'vectors':>8} {'index MB':>9} "
+            f"{'ingest s':>9} {'ctx tokens':>10} {'query ms':>9}"
+        )
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        best = max(rows, key=lambda row: (row['recall'], row['mrr'], -row['context_tokens'])) if rows else None
+        for row in rows:
+            line = (
+                f"{row['chunk_size']:>6} {row['chunk_overlap']:>7} {row['top_k']:>5} {row['recall']:>7.1%} "
+                f"{row['mrr']:>6.3f} {row['vectors']:>8} {row['index_mb']:>9.2f} {row['ingest_seconds']:>9.2f} "
+                f"{row['context_tokens']:>10.0f} {row['query_ms']:>9.2f}"
+            )
+            self.stdout.write(self.style.SUCCESS(line + '  <- best recall') if row is best else line)
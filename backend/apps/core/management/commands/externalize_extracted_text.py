@@ -0,0 +1,60 @@
+"""
+Move inline extracted text out of existing rows.
+
+    python manage.py externalize_extracted_text --dry-run
+
+Documents get a text artifact holding their full text and keep a preview
+inline. Book rows only ever stored a leading excerpt (the full text artifact
+is written at RAG ingestion), so they are truncated to the preview.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.core.services.supabase_service import SupabaseService
+from apps.core.services.text_artifacts import artifact_key, get_text_artifacts
+
+
+class Command(BaseCommand):
+    help = 'Store inline extracted_text as compressed artifacts and shrink rows to a preview.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tables', nargs='*', default=['documents', 'books'], choices=['documents', 'books'])
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+
+    def handle(self, *args, **options):
+        limit = settings.EXTRACTED_TEXT_PREVIEW_CHARS
+        for table in options['tables']:
+            rows_seen = rows_changed = chars_moved = 0
+            cursor = None
+            while True:
+                rows, has_more = SupabaseService.fetch_keyset_page(
+                    table,
+                    columns='id,created_at,content_hash,text_artifact_key,extracted_text',
+                    cursor=cursor,
+                    limit=options['batch_size']
+                )
+                for row in rows:
+                    rows_seen += 1
+                    text = row.get('extracted_text') or ''
+                    if len(text) <= limit:
+                        continue
+                    rows_changed += 1
+                    chars_moved += len(text) - limit
+                    if not options['dry_run']:
+                        self._externalize(table, row, text, limit)
+                if not has_more or not rows:
+                    break
+                cursor = (rows[-1]['created_at'], rows[-1]['id'])
+
+            verb = 'Would shrink' if options['dry_run'] else 'Shrank'
+            self.stdout.write(
+                f"{table}: {verb} {rows_changed} of {rows_seen} rows, moving {chars_moved} characters out of line"
+            )
+
+    def _externalize(self, table, row, text, limit):
+        updates = {'extracted_text': text[:limit]}
+        if table == 'documents' and not row.get('text_artifact_key'):
+            key = artifact_key(row.get('content_hash') or f"documents/{row['id']}")
+            get_text_artifacts().save(key, [(1, text)])
+            updates['text_artifact_key'] = key
+        SupabaseService.update_record(table, row['id'], updates)
@@ -0,0 +1,275 @@
+"""
+Replay recorded or synthetic request traces against the app, with OpenAI,
+Pinecone and Supabase replaced by the offline fakes in ``apps.core.fakes``.
+
+    python manage.py replay_traffic --pattern burst --users 40 --latency chat=0.8,embedding=0.1,pinecone=0.03
+    python manage.py replay_traffic --pattern ramp --users 200 --duration 60 --record trace.jsonl
+    python manage.py replay_traffic --trace trace.jsonl --concurrency 32
+
+A synthetic trace models classrooms: each student's session calls
+``initialize_session`` for their class's book, then sends ``--messages``
+chat messages with think time in between. Session starts follow the
+pattern: ``burst`` (everyone presses start within ``--spread`` seconds),
+``ramp`` (arrivals increasing linearly over ``--duration``) or ``steady``
+(Poisson arrivals over ``--duration``). ``--unindexed`` makes the first
+class's book need ingestion, as on the first lesson with a new book.
+
+Traces are JSON lines ``{"at", "session", "endpoint", "method", "path",
+"body"}``. Requests of one session run in order; ``"$conversation_id"`` in
+a body is replaced with the conversation the session's last chat returned.
+The seeded library's ids are deterministic, so a recorded synthetic trace
+replays against the same books. Latency is measured from when a request
+was due, so time spent waiting for a free worker counts against it.
+"""
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from apps.core.fakes import Latency, offline_services
+from ._workloads import sample_questions, seed_library, seed_unindexed_book
+
+PATTERNS = ('burst', 'ramp', 'steady')
+CONVERSATION_PLACEHOLDER = '$conversation_id'
+
+
+def _session_starts(pattern: str, count: int, duration: float, spread: float, rng: random.Random) -> List[float]:
+    if pattern == 'burst':
+        return sorted(rng.uniform(0, spread) for _ in range(count))
+    if pattern == 'ramp':
+        # Arrival rate grows linearly, so the i-th arrival is at duration * sqrt(i / count)
+        return [duration * math.sqrt((i + rng.random()) / count) for i in range(count)]
+    starts, at = [], 0.0
+    for _ in range(count):
+        at += rng.expovariate(count / duration)
+        starts.append(min(at, duration))
+    return starts
+
+
+def synthetic_trace(library: Dict, classes: List[Dict], options: Dict) -> List[Dict]:
+    """Classroom sessions: initialize a session, then chat with think time."""
+    rng = random.Random(options['seed'])
+    users = options['users']
+    starts = _session_starts(options['pattern'], users, options['duration'], options['spread'], rng)
+    questions = sample_questions(library, max(users * options['messages'], 1), seed=options['seed'])
+    trace = []
+    for n, start in enumerate(starts):
+        session = f"student-{n + 1}"
+        book = classes[n % len(classes)]
+        at = start
+        trace.append({
+            'at': round(at, 3),
+            'session': session,
+            'endpoint': 'initialize_session',
+            'method': 'POST',
+            'path': '/api/v1/books/initialize-session/',
+            'body': {'grade_id': book['grade_id'], 'subject_id': book['subject_id']},
+        })
+        for m in range(options['messages']):
+            at += rng.expovariate(1 / options['think']) if options['think'] > 0 else 0
+            trace.append({
+                'at': round(at, 3),
+                'session': session,
+                'endpoint': 'chat',
+                'method': 'POST',
+                'path': '/api/v1/chat/',
+                'body': {
+                    'message': questions[n * options['messages'] + m]['question'],
+                    'book_id': book['id'],
+                    'grade_id': book['grade_id'],
+                    'subject_id': book['subject_id'],
+                    **({'conversation_id': CONVERSATION_PLACEHOLDER} if m else {}),
+                },
+            })
+    return sorted(trace, key=lambda request: request['at'])
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted ``values``."""
+    if not values:
+        return 0.0
+    return values[max(math.ceil(len(values) * fraction) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = 'Replay classroom-style request traces against the app with offline upstream fakes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trace', metavar='PATH', help='Replay this JSON lines trace instead of a synthetic one')
+        parser.add_argument('--record', metavar='PATH', help='Write the trace that is replayed to PATH')
+        parser.add_argument('--pattern', choices=PATTERNS, default='burst', help='Synthetic session arrivals')
+        parser.add_argument('--users', type=int, default=40, help='Synthetic student sessions')
+        parser.add_argument('--classes', type=int, default=1, help='Classes the students are split into (one book each)')
+        parser.add_argument('--messages', type=int, default=3, help='Chat messages per session')
+        parser.add_argument('--think', type=float, default=5.0, help='Mean seconds between a session\'s messages')
+        parser.add_argument('--duration', type=float, default=60.0, help='Seconds over which ramp/steady sessions start')
+        parser.add_argument('--spread', type=float, default=3.0, help='Seconds over which a burst starts')
+        parser.add_argument('--unindexed', action='store_true', help='First class\'s book still needs ingestion')
+        parser.add_argument('--concurrency', type=int, default=0, help='Client threads (default: one per session)')
+        parser.add_argument('--latency', default='', help='Simulated upstream seconds, e.g. chat=0.8,embedding=0.1')
+        parser.add_argument('--jitter', type=float, default=0.2, help='Latency jitter as a fraction (seeded)')
+        parser.add_argument('--speed', type=float, default=1.0, help='Replay speed multiplier (2 = twice as fast)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic trace')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            latency = Latency.parse(options['latency'], jitter=options['jitter'], seed=options['seed'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['speed'] <= 0:
+            raise CommandError('--speed must be positive')
+
+        if options['verbosity'] < 2:
+            logging.disable(logging.INFO)
+        try:
+            with offline_services(latency) as services:
+                library = seed_library(services)
+                trace = self._load_trace(library, services, options)
+                if options['record']:
+                    with open(options['record'], 'w') as fh:
+                        for request in trace:
+                            fh.write(json.dumps(request) + '\n')
+                results, wall_seconds = self._replay(trace, options)
+                calls = dict(services.calls)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        report = self._summarize(results, wall_seconds)
+        report['upstream_calls'] = calls
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print(report)
+
+    def _load_trace(self, library, services, options) -> List[Dict]:
+        # Seeded first either way, so a recorded --unindexed trace finds its book
+        unindexed = seed_unindexed_book(services) if options['unindexed'] else None
+        if options['trace']:
+            try:
+                with open(options['trace']) as fh:
+                    trace = [json.loads(line) for line in fh if line.strip()]
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read trace {options['trace']}: {e}")
+            return sorted(trace, key=lambda request: request['at'])
+
+        books = library['books']
+        by_class = {}
+        for book in books:
+            by_class.setdefault((book['grade_id'], book['subject_id']), book)
+        classes = list(by_class.values())[:max(options['classes'], 1)]
+        if unindexed:
+            classes[0] = unindexed
+        return synthetic_trace(library, classes, options)
+
+    def _replay(self, trace: List[Dict], options):
+        sessions: Dict[str, List[Dict]] = defaultdict(list)
+        for request in trace:
+            sessions[request['session']].append(request)
+        workers = options['concurrency'] or len(sessions)
+        local = threading.local()
+        results = []
+        results_lock = threading.Lock()
+        speed = options['speed']
+
+        def run_session(requests: List[Dict]):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client(HTTP_HOST='localhost')
+            conversation_id = None
+            previous_done = 0.0
+            for request in requests:
+                due = max(started + request['at'] / speed, previous_done)
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                body = {
+                    key: (conversation_id if value == CONVERSATION_PLACEHOLDER else value)
+                    for key, value in (request.get('body') or {}).items()
+                }
+                body = {key: value for key, value in body.items() if value is not None}
+                status, error = 0, None
+                try:
+                    response = client.generic(
+                        request.get('method', 'POST'),
+                        request['path'],
+                        json.dumps(body),
+                        content_type='application/json',
+                    )
+                    status = response.status_code
+                    if status >= 400:
+                        error = f"HTTP {status}"
+                    elif response.get('Content-Type', '').startswith('application/json'):
+                        conversation_id = response.json().get('conversation_id') or conversation_id
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                previous_done = time.perf_counter()
+                with results_lock:
+                    results.append({
+                        'endpoint': request.get('endpoint') or request['path'],
+                        'latency_ms': (previous_done - due) * 1000,
+                        'status': status,
+                        'error': error,
+                    })
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='replay') as pool:
+            for future in [pool.submit(run_session, requests) for requests in sessions.values()]:
+                future.result()
+        return results, time.perf_counter() - started
+
+    @staticmethod
+    def _summarize(results: List[Dict], wall_seconds: float) -> Dict:
+        groups: Dict[str, List[Dict]] = defaultdict(list)
+        for result in results:
+            groups[result['endpoint']].append(result)
+        groups['all'] = results
+
+        endpoints = {}
+        for endpoint, items in groups.items():
+            latencies = sorted(item['latency_ms'] for item in items)
+            errors = [item['error'] for item in items if item['error']]
+            statuses = defaultdict(int)
+            for item in items:
+                statuses[str(item['status'])] += 1
+            endpoints[endpoint] = {
+                'requests': len(items),
+                'errors': len(errors),
+                'error_rate': len(errors) / len(items) if items else 0.0,
+                'throughput_rps': len(items) / wall_seconds if wall_seconds else 0.0,
+                'p50_ms': percentile(latencies, 0.50),
+                'p95_ms': percentile(latencies, 0.95),
+                'p99_ms': percentile(latencies, 0.99),
+                'max_ms': latencies[-1] if latencies else 0.0,
+                'statuses': dict(statuses),
+                'sample_errors': sorted(set(errors))[:3],
+            }
+        return {'wall_seconds': wall_seconds, 'endpoints': endpoints}
+
+    def _print(self, report: Dict):
+        header = (
+            f"{'endpoint':<22} {'requests':>8} {'errors':>7} {'err %':>6} {'req/s':>7} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+        )
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for endpoint, row in report['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<22} {row['requests']:>8} {row['errors']:>7} {row['error_rate']:>6.1%} "
+                f"{row['throughput_rps']:>7.2f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+                f"{row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}"
+            )
+            for error in row['sample_errors']:
+                self.stdout.write(self.style.ERROR(f"  {endpoint}: {error}"))
+        self.stdout.write(f"Replayed in {report['wall_seconds']:.1f}s")
+        self.stdout.write(
+            'Upstream calls: ' + ', '.join(f"{name}={count}" for name, count in sorted(report['upstream_calls'].items()))
+        )
@@ -0,0 +1,40 @@
+"""
+Delete Pinecone vectors whose book or uploaded document no longer exists.
+
+    python manage.py sweep_vectors --dry-run
+
+Book vectors are matched against ``books.id`` and uploaded-file vectors
+against ``documents.content_hash``. A dry run only reports the orphans.
+Schedule it once per deployment, e.g. daily from cron:
+
+    0 3 * * * cd /app/backend && python manage.py sweep_vectors
+"""
+import json
+
+from django.core.management.base import BaseCommand
+from apps.books.services.vector_gc import VectorCollector
+
+
+class Command(BaseCommand):
+    help = 'Reconcile Pinecone vectors against the books and documents tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report orphaned vectors without deleting them')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        report = VectorCollector().sweep(dry_run=options['dry_run'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for namespace, summary in report.items():
+            self.stdout.write(
+                f"{namespace}: {summary['vectors']} vectors from {summary['owners']} owners, "
+                f"{summary['orphan_vectors']} orphaned from {len(summary['orphans'])} owners, "
+                f"{summary['deleted']} deleted"
+            )
+            if summary['unrecognized']:
+                self.stdout.write(f"  {summary['unrecognized']} vectors with unrecognized ids left alone")
+            for owner, count in sorted(summary['orphans'].items()):
+                self.stdout.write(f"  {owner}: {count}")
@@ -0,0 +1,236 @@
+"""
+Prometheus metrics, exposed at ``/metrics``.
+
+Upstream latency and token usage are derived from tracing spans (see
+``apps.core.tracing``), so any ``@traced`` call is measured without extra
+code: OpenAI, Pinecone, PostgREST, Storage and GoTrue calls each get a
+latency histogram, and OpenAI spans feed the token counters, labelled with
+the Django endpoint (URL name) that made them.
+
+Multi-process servers: set ``PROMETHEUS_MULTIPROC_DIR`` to an empty,
+writable directory in the environment of every worker before it starts.
+Each process then writes its samples there and ``/metrics`` aggregates
+them. With gunicorn, also call ``mark_process_dead`` from the
+``child_exit`` server hook so gauges of exited workers are dropped.
+"""
+import os
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    REGISTRY,
+)
+
+from apps.core.tracing import Span, add_span_listener
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    'Time to produce a response, by endpoint.',
+    ['method', 'endpoint', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight',
+    'Requests being handled.',
+    multiprocess_mode='livesum',
+)
+UPSTREAM_SECONDS = Histogram(
+    'upstream_request_duration_seconds',
+    'Latency of calls to upstream services.',
+    ['upstream', 'operation', 'outcome'],
+    buckets=LATENCY_BUCKETS,
+)
+OPENAI_TOKENS = Counter(
+    'openai_tokens_total',
+    'OpenAI tokens consumed, by kind (prompt, completion, embedding) and endpoint.',
+    ['kind', 'endpoint'],
+)
+EMBEDDING_INPUTS = Counter(
+    'openai_embedding_inputs_total',
+    'Texts sent for embedding, by endpoint.',
+    ['endpoint'],
+)
+INGESTED_CHUNKS = Counter(
+    'rag_ingested_chunks_total',
+    'Chunks embedded and stored; rate() gives ingestion throughput.',
+    ['namespace'],
+)
+INGESTION_THROUGHPUT = Histogram(
+    'rag_ingestion_chunks_per_second',
+    'Throughput of each completed ingestion.',
+    ['namespace'],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'In-process cache lookups, by cache and result (hit, miss).',
+    ['cache', 'result'],
+)
+COALESCED_REQUESTS = Counter(
+    'singleflight_requests_total',
+    'Coalescible calls by role: leader (made the call), follower (shared one in this '
+    'process) or remote (shared one made by another process).',
+    ['operation', 'role'],
+)
+OPENAI_ADMISSIONS = Counter(
+    'openai_admissions_total',
+    'OpenAI calls by priority and outcome (admitted, shed_queue_full, shed_timeout).',
+    ['priority', 'outcome'],
+)
+OPENAI_QUEUE_SECONDS = Histogram(
+    'openai_queue_wait_seconds',
+    'Time OpenAI calls waited for budget before admission or shedding.',
+    ['priority'],
+    buckets=LATENCY_BUCKETS,
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    'circuit_breaker_state',
+    'Upstream circuit breaker state: 0 closed, 1 half-open, 2 open (worst worker).',
+    ['upstream'],
+    multiprocess_mode='livemax',
+)
+RESILIENCE_EVENTS = Counter(
+    'upstream_resilience_events_total',
+    'Retries, hedges (sent and won), missed deadlines, saturated pools and short-circuited calls, by upstream call.',
+    ['upstream', 'event'],
+)
+BACKGROUND_QUEUE_DEPTH = Gauge(
+    'background_tasks_pending',
+    'Background tasks queued or running.',
+    multiprocess_mode='livesum',
+)
+
+# Span name prefix → upstream label
+UPSTREAMS = {
+    'openai.': 'openai',
+    'pinecone.': 'pinecone',
+    'supabase.storage': 'storage',
+    'supabase.auth': 'gotrue',
+    'supabase.': 'postgrest',
+}
+
+_endpoint: ContextVar[str] = ContextVar('metrics_endpoint', default='background')
+
+
+def _upstream(span_name: str):
+    for prefix, upstream in UPSTREAMS.items():
+        if span_name.startswith(prefix):
+            return upstream
+    return None
+
+
+def observe_span(span: Span):
+    """Span listener: upstream latency for every upstream call, token counts for OpenAI."""
+    upstream = _upstream(span.name)
+    if upstream is None:
+        return
+    UPSTREAM_SECONDS.labels(
+        upstream=upstream,
+        operation=span.name.split('.', 1)[1],
+        outcome='error' if span.error else 'ok',
+    ).observe((span.duration_ms or 0.0) / 1000)
+
+    if upstream == 'openai':
+        endpoint = _endpoint.get()
+        attributes = span.attributes
+        if attributes.get('prompt_tokens'):
+            OPENAI_TOKENS.labels(kind='prompt', endpoint=endpoint).inc(attributes['prompt_tokens'])
+        if attributes.get('completion_tokens'):
+            OPENAI_TOKENS.labels(kind='completion', endpoint=endpoint).inc(attributes['completion_tokens'])
+        if span.name == 'openai.embedding':
+            if attributes.get('tokens'):
+                OPENAI_TOKENS.labels(kind='embedding', endpoint=endpoint).inc(attributes['tokens'])
+            if attributes.get('inputs'):
+                EMBEDDING_INPUTS.labels(endpoint=endpoint).inc(attributes['inputs'])
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result='hit' if hit else 'miss').inc()
+
+
+def record_coalesced(operation: str, role: str):
+    COALESCED_REQUESTS.labels(operation=operation, role=role).inc()
+
+
+def record_openai_admission(priority: str, outcome: str, waited: float):
+    OPENAI_ADMISSIONS.labels(priority=priority, outcome=outcome).inc()
+    OPENAI_QUEUE_SECONDS.labels(priority=priority).observe(waited)
+
+
+def record_resilience_event(upstream: str, event: str):
+    RESILIENCE_EVENTS.labels(upstream=upstream, event=event).inc()
+
+
+def set_circuit_state(upstream: str, state: str):
+    CIRCUIT_BREAKER_STATE.labels(upstream=upstream).set({'closed': 0, 'half_open': 1, 'open': 2}[state])
+
+
+def record_ingestion(namespace: str, chunks: int, seconds: float):
+    INGESTED_CHUNKS.labels(namespace=namespace).inc(chunks)
+    if chunks and seconds > 0:
+        INGESTION_THROUGHPUT.labels(namespace=namespace).observe(chunks / seconds)
+
+
+class MetricsMiddleware:
+    """Request latency by endpoint and in-flight requests; labels upstream calls with the endpoint."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        token = _endpoint.set('unmatched')
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            response = self.get_response(request)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+        endpoint = _endpoint.get()
+        _endpoint.reset(token)
+        HTTP_REQUEST_SECONDS.labels(
+            method=request.method,
+            endpoint=endpoint,
+            status=response.status_code,
+        ).observe(time.perf_counter() - started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # URL names keep label cardinality bounded (no ids in paths)
+        match = request.resolver_match
+        _endpoint.set(match.view_name if match and match.view_name else 'unnamed')
+        return None
+
+
+def metrics_view(request):
+    """Prometheus exposition of this process, or of all workers in multi-process mode."""
+    if settings.METRICS_AUTH_TOKEN:
+        if request.headers.get('Authorization') != f'Bearer {settings.METRICS_AUTH_TOKEN}':
+            return HttpResponse(status=401)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid: int):
+    """gunicorn ``child_exit`` hook helper: drop live gauges of an exited worker."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
+
+
+def install():
+    """Start deriving metrics from tracing spans."""
+    add_span_listener(observe_span)
@@ -0,0 +1,338 @@
+"""
+Admission control for outbound OpenAI calls.
+
+Every call takes one request and its estimated tokens from two token
+buckets, refilled at ``OPENAI_REQUESTS_PER_MINUTE`` and
+``OPENAI_TOKENS_PER_MINUTE`` and shared by the workers on this host
+through a small SQLite database (``OPENAI_SCHEDULER_PATH``). When the
+call returns, the estimate is corrected with the tokens actually used.
+
+Calls made while handling a request are ``interactive``, on behalf of the
+user the request authenticated as (anonymous requests share one budget);
+everything else
+(background tasks such as ingestion and summaries, management commands) is
+``batch``. Batch calls may not draw the buckets below
+``OPENAI_INTERACTIVE_RESERVE`` of their capacity, so a large re-index
+leaves headroom for live chats in every worker. Within a worker, waiting
+calls are admitted in priority order and, within a priority, to the user
+who has used the fewest tokens recently. A call is shed with
+``RateLimitExceeded`` when its priority's queue is full or the budgets
+cannot admit it within that priority's maximum wait.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.http import HttpRequest
+
+from apps.core.exceptions import RateLimitExceeded
+from apps.core.metrics import record_openai_admission
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+# Admission order
+PRIORITIES = (INTERACTIVE, BATCH)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    level REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Longest a queue head sleeps before re-checking the buckets and its place in line
+MAX_POLL_SECONDS = 0.25
+# Recent usage used for fairness halves every this many seconds
+USAGE_HALF_LIFE_SECONDS = 60
+
+# Priority and the user id, or the request whose authenticated user the calls are charged to
+_work: ContextVar[Tuple[str, Union[str, HttpRequest, None]]] = ContextVar('openai_work', default=(BATCH, None))
+
+
+@contextmanager
+def scheduling(priority: str, user: str = None) -> Iterator[None]:
+    """Schedule OpenAI calls made inside the block at ``priority`` on behalf of ``user``."""
+    token = _work.set((priority, user))
+    try:
+        yield
+    finally:
+        _work.reset(token)
+
+
+def current_work() -> Tuple[str, Optional[str]]:
+    """Priority and user that OpenAI calls made now are scheduled at."""
+    priority, user = _work.get()
+    if isinstance(user, HttpRequest):
+        # DRF sets the user on the underlying request once it has authenticated it
+        authenticated = getattr(user, 'user', None)
+        user = authenticated.get('id') if isinstance(authenticated, dict) else None
+    return priority, user
+
+
+class OpenAISchedulingMiddleware:
+    """
+    Marks OpenAI calls made while handling a request as interactive, on
+    behalf of the user the view authenticated (read when each call is made),
+    never a client-supplied id.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _work.set((INTERACTIVE, request))
+        try:
+            return self.get_response(request)
+        finally:
+            _work.reset(token)
+
+
+class _Waiter:
+    def __init__(self, priority: str, user: Optional[str], seq: int):
+        self.priority = priority
+        self.user = user
+        self.seq = seq
+
+
+class Slot:
+    """An admitted call; set ``used`` to the tokens it consumed to correct the estimate."""
+
+    def __init__(self, estimate: int):
+        self.estimate = estimate
+        self.used: Optional[int] = None
+
+
+class OpenAIScheduler:
+    """Token-bucket budgets with priority and per-user fair admission."""
+
+    _instance: Optional['OpenAIScheduler'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: str = '',
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        interactive_reserve: float = 0.2,
+        max_queue: Dict[str, int] = None,
+        max_wait: Dict[str, float] = None
+    ):
+        self.path = path
+        # Bucket name -> (capacity, refill per second); 0 means unlimited
+        self.limits = {
+            name: (float(per_minute), per_minute / 60)
+            for name, per_minute in (('requests', requests_per_minute), ('tokens', tokens_per_minute))
+            if per_minute > 0
+        }
+        self.interactive_reserve = interactive_reserve
+        self.max_queue = max_queue or {INTERACTIVE: 200, BATCH: 1000}
+        self.max_wait = max_wait or {INTERACTIVE: 15.0, BATCH: 600.0}
+        self._waiting: List[_Waiter] = []
+        self._seq = 0
+        self._usage: Dict[Optional[str], float] = {}
+        self._usage_decayed_at = time.monotonic()
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        # Buckets used when the shared database is unavailable
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._buckets_lock = threading.Lock()
+
+        if path and self.limits:
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._connection().executescript(SCHEMA)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"OpenAI budget store {path} unavailable, budgeting per process: {e}")
+                self.path = ''
+
+    @classmethod
+    def get(cls) -> 'OpenAIScheduler':
+        """The process-wide scheduler."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(
+                        settings.OPENAI_SCHEDULER_PATH,
+                        requests_per_minute=settings.OPENAI_REQUESTS_PER_MINUTE,
+                        tokens_per_minute=settings.OPENAI_TOKENS_PER_MINUTE,
+                        interactive_reserve=settings.OPENAI_INTERACTIVE_RESERVE,
+                        max_queue={
+                            INTERACTIVE: settings.OPENAI_QUEUE_MAX_INTERACTIVE,
+                            BATCH: settings.OPENAI_QUEUE_MAX_BATCH,
+                        },
+                        max_wait={
+                            INTERACTIVE: settings.OPENAI_MAX_WAIT_INTERACTIVE_SECONDS,
+                            BATCH: settings.OPENAI_MAX_WAIT_BATCH_SECONDS,
+                        },
+                    )
+        return cls._instance
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def slot(self, estimate: int) -> Iterator[Slot]:
+        """Admit one call of about ``estimate`` tokens, waiting for budget if needed."""
+        slot = Slot(estimate)
+        if not self.limits:
+            yield slot
+            return
+        self.acquire(estimate)
+        try:
+            yield slot
+        finally:
+            if slot.used is not None and slot.used != estimate:
+                self._refund(estimate - slot.used)
+
+    def acquire(self, estimate: int):
+        """
+        Block until the call is admitted.
+
+        Raises:
+            RateLimitExceeded: The queue is full or the wait would be too long
+        """
+        priority, user = current_work()
+        started = time.monotonic()
+        deadline = started + self.max_wait[priority]
+
+        with self._cond:
+            depth = sum(1 for waiter in self._waiting if waiter.priority == priority)
+            if depth >= self.max_queue[priority]:
+                record_openai_admission(priority, 'shed_queue_full', 0)
+                raise RateLimitExceeded(f"Too many {priority} OpenAI calls waiting ({depth}); try again shortly")
+            self._seq += 1
+            waiter = _Waiter(priority, user, self._seq)
+            self._waiting.append(waiter)
+
+        try:
+            while True:
+                with self._cond:
+                    while self._head() is not waiter:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._shed(priority, started, 'Timed out waiting for an OpenAI budget')
+                        self._cond.wait(remaining)
+
+                wait = self._take(estimate, priority)
+                if wait == 0:
+                    with self._cond:
+                        self._usage[user] = self._usage.get(user, 0) + estimate
+                    record_openai_admission(priority, 'admitted', time.monotonic() - started)
+                    return
+                if time.monotonic() + wait > deadline:
+                    self._shed(
+                        priority, started, f"OpenAI budget exhausted; the next {priority} slot is {wait:.0f}s away",
+                        retry_after=wait
+                    )
+                time.sleep(min(wait, MAX_POLL_SECONDS))
+        finally:
+            with self._cond:
+                self._waiting.remove(waiter)
+                self._cond.notify_all()
+
+    def _head(self) -> Optional[_Waiter]:
+        """The next waiter to admit: highest priority, then least recent usage, then arrival."""
+        now = time.monotonic()
+        if now - self._usage_decayed_at >= USAGE_HALF_LIFE_SECONDS:
+            self._usage = {user: used / 2 for user, used in self._usage.items() if used >= 2}
+            self._usage_decayed_at = now
+        if not self._waiting:
+            return None
+        return min(
+            self._waiting,
+            key=lambda waiter: (PRIORITIES.index(waiter.priority), self._usage.get(waiter.user, 0), waiter.seq)
+        )
+
+    @staticmethod
+    def _shed(priority: str, started: float, message: str, retry_after: float = None):
+        record_openai_admission(priority, 'shed_timeout', time.monotonic() - started)
+        raise RateLimitExceeded(message, retry_after=retry_after)
+
+    # --- Buckets ------------------------------------------------------------
+
+    def _take(self, estimate: int, priority: str) -> float:
+        """Take a request and ``estimate`` tokens, or return the seconds until they could be taken."""
+        reserve = 0.0 if priority == INTERACTIVE else self.interactive_reserve
+        if self.path:
+            try:
+                return self._take_shared(estimate, reserve)
+            except sqlite3.Error as e:
+                logger.warning(f"OpenAI budget store unavailable, budgeting per process: {e}")
+                self.path = ''
+        with self._buckets_lock:
+            return self._take_from(self._buckets, estimate, reserve, time.time())
+
+    def _take_shared(self, estimate: int, reserve: float) -> float:
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            state = {
+                row['name']: (row['level'], row['updated_at'])
+                for row in conn.execute('SELECT name, level, updated_at FROM buckets')
+            }
+            wait = self._take_from(state, estimate, reserve, time.time())
+            conn.executemany(
+                'INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)',
+                [(name, level, updated_at) for name, (level, updated_at) in state.items()]
+            )
+            conn.execute('COMMIT')
+            return wait
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _take_from(self, state: Dict[str, Tuple[float, float]], estimate: int, reserve: float, now: float) -> float:
+        costs = {'requests': 1, 'tokens': estimate}
+        levels = {}
+        wait = 0.0
+        for name, (capacity, rate) in self.limits.items():
+            level, updated_at = state.get(name, (capacity, now))
+            level = min(capacity, level + max(now - updated_at, 0) * rate)
+            levels[name] = level
+            # A call larger than the bucket is admitted from a full bucket and leaves it in debt
+            needed = min(costs[name] + reserve * capacity, capacity)
+            if level < needed:
+                wait = max(wait, (needed - level) / rate)
+        if wait == 0:
+            for name in levels:
+                levels[name] -= costs[name]
+        state.update({name: (level, now) for name, level in levels.items()})
+        return wait
+
+    def _refund(self, tokens: int):
+        """Return over-estimated tokens to the bucket (or charge an under-estimate)."""
+        if 'tokens' not in self.limits:
+            return
+        capacity, _ = self.limits['tokens']
+        if self.path:
+            try:
+                conn = self._connection()
+                conn.execute(
+                    'UPDATE buckets SET level = MIN(?, level + ?) WHERE name = ?', (capacity, tokens, 'tokens')
+                )
+                return
+            except sqlite3.Error as e:
+                logger.warning(f"Could not correct OpenAI token budget: {e}")
+                return
+        with self._buckets_lock:
+            if 'tokens' in self._buckets:
+                level, updated_at = self._buckets['tokens']
+                self._buckets['tokens'] = (min(capacity, level + tokens), updated_at)
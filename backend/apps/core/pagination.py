@@ -0,0 +1,53 @@
+"""
+Keyset (cursor) pagination helpers for Supabase-backed list endpoints.
+
+Cursors are opaque, URL-safe strings wrapping a ``(created_at, id)`` pair so
+clients can page in either direction without offsets.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: str, record_id: str) -> str:
+    """Encode a ``(created_at, id)`` pair as an opaque cursor."""
+    raw = json.dumps([created_at, record_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decode a cursor produced by ``encode_cursor``. Raises ValueError if
+    malformed, including when the pair is not a timestamp and a UUID.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        datetime.fromisoformat(created_at)
+        record_id = str(uuid.UUID(record_id))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return created_at, record_id
+
+
+def cursor_for(record: dict, sort_column: str = 'created_at') -> Optional[str]:
+    """Build the cursor pointing at a record, or None if the record is missing."""
+    if not record:
+        return None
+    return encode_cursor(str(record[sort_column]), str(record['id']))
+
+
+def parse_page_size(value, default: int = DEFAULT_PAGE_SIZE) -> int:
+    """Parse a ``limit`` query parameter, clamped to ``MAX_PAGE_SIZE``."""
+    try:
+        size = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if size < 1:
+        raise ValueError('limit must be positive')
+    return min(size, MAX_PAGE_SIZE)
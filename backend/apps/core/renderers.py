@@ -0,0 +1,37 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets views that stream Server-Sent Events pass content negotiation.
+
+    Such views return a StreamingHttpResponse, so nothing is rendered here.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class PDFRenderer(BaseRenderer):
+    """
+    Lets views that serve PDF bytes pass content negotiation for ``Accept: application/pdf``.
+
+    Such views return an HttpResponse with the PDF; only their error and
+    status payloads reach this renderer, and those are written as JSON.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or isinstance(data, bytes):
+            return data
+        return json.dumps(data).encode('utf-8')
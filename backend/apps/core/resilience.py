@@ -0,0 +1,335 @@
+"""
+Deadlines, retries, hedging and circuit breakers for upstream calls.
+
+An ``Upstream`` wraps one kind of call (e.g. Pinecone queries):
+
+- Deadline: the whole call, retries included, must finish within the
+  deadline or ``DeadlineExceeded`` is raised. The clock starts when the
+  first attempt starts running, so time spent queued for a worker does not
+  count; an attempt that cannot get a worker within the deadline is
+  cancelled and the call fails with ``UpstreamUnavailable`` instead. A
+  straggling attempt is abandoned to finish in the background.
+- Retries: transient failures (timeouts, connection errors, 408/429/5xx)
+  are retried with full-jitter exponential backoff while the deadline
+  allows. Only for idempotent calls.
+- Hedging: for reads, when an attempt outlasts the
+  ``RESILIENCE_HEDGE_PERCENTILE`` of the call's recent latencies a
+  duplicate is sent and the first success wins.
+- Circuit breaker: after ``RESILIENCE_BREAKER_FAILURES`` consecutive
+  transient failures the call fails fast with ``CircuitOpenError`` for
+  ``RESILIENCE_BREAKER_RESET_SECONDS``; then one probe is let through and
+  its outcome closes or re-opens the circuit. Throttling (429,
+  ``RateLimitExceeded``) is retried but not counted: the upstream is
+  healthy, and OpenAI budgets are paced by ``OpenAIScheduler``.
+
+Attempts run on a thread pool per upstream, of ``RESILIENCE_WORKERS``
+threads, so the deadline holds even for SDKs without per-request timeouts
+and stragglers of one upstream cannot starve the others. Hedges are only
+sent while the pool has idle workers, and abandoned attempts that have not
+started yet are cancelled. Breaker states are exported as the
+``circuit_breaker_state`` metric and at ``/health/upstreams``.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import openai
+import requests
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from apps.core.exceptions import CircuitOpenError, DeadlineExceeded, RateLimitExceeded, UpstreamUnavailable
+from apps.core.metrics import record_resilience_event, set_circuit_state
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+THROTTLED = 429
+RETRYABLE_STATUSES = {408, 425, THROTTLED, 500, 502, 503, 504}
+TRANSIENT_ERRORS = (
+    TimeoutError,
+    ConnectionError,
+    DeadlineExceeded,
+    httpx.TransportError,
+    requests.ConnectionError,
+    requests.Timeout,
+    openai.APIConnectionError,
+)
+# Recent successful latencies kept per upstream, and the fewest needed before hedging
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, 'status_code', None) or getattr(exc, 'status', None)
+    if status is None:
+        status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether a failure is worth retrying: timeouts, dropped connections, throttling and 5xx."""
+    if isinstance(exc, TRANSIENT_ERRORS):
+        return True
+    return _status(exc) in RETRYABLE_STATUSES
+
+
+def is_throttled(exc: BaseException) -> bool:
+    """Whether a failure is the caller being rate limited rather than the upstream failing."""
+    return isinstance(exc, RateLimitExceeded) or _status(exc) == THROTTLED
+
+
+class CircuitBreaker:
+    """Opens after consecutive transient failures and fails fast until a probe succeeds."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+        set_circuit_state(name, CLOSED)
+
+    def before_call(self):
+        """Raise ``CircuitOpenError`` unless a call may go through now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            reset_seconds = settings.RESILIENCE_BREAKER_RESET_SECONDS
+            remaining = self.opened_at + reset_seconds - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+        record_resilience_event(self.name, 'short_circuit')
+        raise CircuitOpenError(
+            f"{self.name} is failing; not calling it for now",
+            upstream=self.name,
+            retry_after=max(remaining, 1.0)
+        )
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.probing = False
+            if self.state != CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= settings.RESILIENCE_BREAKER_FAILURES:
+                if self.state != OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def record_ignored(self):
+        """A call that failed for a non-transient reason still ends a probe."""
+        with self._lock:
+            self.probing = False
+
+    def _set_state(self, state: str):
+        self.state = state
+        set_circuit_state(self.name, state)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(self.opened_at + settings.RESILIENCE_BREAKER_RESET_SECONDS - time.monotonic(), 0)
+            return {'state': self.state, 'consecutive_failures': self.failures, 'retry_in_seconds': retry_in}
+
+
+class _Started(threading.Event):
+    """Set when an attempt starts running on a worker, at ``at`` (monotonic)."""
+
+    at = 0.0
+
+    def mark(self):
+        self.at = time.monotonic()
+        self.set()
+
+
+class _Deadline:
+    """A call's deadline; the clock starts when its first attempt starts running."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.at: Optional[float] = None
+
+    def start(self, started_at: float):
+        if self.at is None:
+            self.at = started_at + self.seconds
+
+    def remaining(self, now: float = None) -> float:
+        if self.at is None:
+            return self.seconds
+        return self.at - (time.monotonic() if now is None else now)
+
+
+class Upstream:
+    """
+    Resilience policy for one upstream call. Deadline and retries are read
+    from the named settings on each call.
+    """
+
+    _registry: Dict[str, 'Upstream'] = {}
+
+    def __init__(self, name: str, deadline_setting: str, retries_setting: str = None, hedge: bool = False):
+        self.name = name
+        self.deadline_setting = deadline_setting
+        self.retries_setting = retries_setting
+        self.hedge = hedge
+        self.breaker = CircuitBreaker(name)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        Upstream._registry[name] = self
+
+    @classmethod
+    def all(cls) -> Dict[str, 'Upstream']:
+        return dict(cls._registry)
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` under this upstream's deadline, retries, hedging and breaker."""
+        if not settings.RESILIENCE_ENABLED:
+            return fn(*args, **kwargs)
+        deadline = _Deadline(getattr(settings, self.deadline_setting))
+        retries = getattr(settings, self.retries_setting) if self.retries_setting else 0
+
+        for attempt in range(retries + 1):
+            self.breaker.before_call()
+            try:
+                result = self._attempt(fn, args, kwargs, deadline)
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.record_ignored()
+                    raise
+                if is_throttled(e):
+                    self.breaker.record_ignored()
+                else:
+                    self.breaker.record_failure()
+                delay = random.uniform(0, settings.RESILIENCE_RETRY_BASE_SECONDS * (2 ** attempt))
+                if attempt == retries or deadline.remaining() <= delay:
+                    raise
+                record_resilience_event(self.name, 'retry')
+                logger.warning(f"{self.name} failed ({e}); retry {attempt + 1}/{retries} in {delay * 1000:.0f}ms")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _attempt(self, fn: Callable, args, kwargs, deadline: '_Deadline'):
+        primary = self._submit(fn, args, kwargs)
+        pending = {primary}
+        try:
+            if not primary.started.wait(deadline.remaining()):
+                # Every worker is busy (e.g. with stragglers); not the upstream's fault
+                record_resilience_event(self.name, 'saturated')
+                raise UpstreamUnavailable(
+                    f"{self.name} has no free worker within {deadline.seconds}s",
+                    upstream=self.name,
+                    retry_after=1.0
+                )
+            deadline.start(primary.started.at)
+            hedge_delay = self._hedge_delay()
+            hedge_at = primary.started.at + hedge_delay if hedge_delay is not None else None
+            error: Optional[BaseException] = None
+
+            while pending:
+                now = time.monotonic()
+                if deadline.remaining(now) <= 0:
+                    record_resilience_event(self.name, 'deadline')
+                    raise DeadlineExceeded(
+                        f"{self.name} did not respond within {deadline.seconds}s",
+                        upstream=self.name
+                    )
+                timeout = deadline.remaining(now)
+                if hedge_at is not None:
+                    timeout = max(min(timeout, hedge_at - now), 0)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future.exception() is None:
+                        result, elapsed = future.result()
+                        self._latencies.append(elapsed)
+                        if future is not primary:
+                            record_resilience_event(self.name, 'hedge_won')
+                        return result
+                    error = future.exception()
+
+                if pending and hedge_at is not None and time.monotonic() >= hedge_at:
+                    # One duplicate per attempt, once the first request is slower than usual,
+                    # and only if a worker is idle so hedges never queue behind stragglers
+                    hedge_at = None
+                    if self._in_flight < settings.RESILIENCE_WORKERS:
+                        record_resilience_event(self.name, 'hedge')
+                        pending.add(self._submit(fn, args, kwargs))
+
+            raise error
+        finally:
+            # Abandoned attempts that have not started yet never will
+            for future in pending:
+                future.cancel()
+
+    def _submit(self, fn: Callable, args, kwargs) -> Future:
+        # Each attempt runs in a copy of the caller's context (trace spans, scheduling priority)
+        context = contextvars.copy_context()
+        started = _Started()
+
+        def timed():
+            started.mark()
+            result = fn(*args, **kwargs)
+            return result, time.monotonic() - started.at
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.RESILIENCE_WORKERS,
+                    thread_name_prefix=f'upstream-{self.name}'
+                )
+            self._in_flight += 1
+            future = self._executor.submit(context.run, timed)
+        future.started = started
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: Future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge or self.breaker.state != CLOSED or len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        latencies: List[float] = sorted(self._latencies)
+        index = min(int(len(latencies) * settings.RESILIENCE_HEDGE_PERCENTILE), len(latencies) - 1)
+        return max(latencies[index], settings.RESILIENCE_HEDGE_MIN_SECONDS)
+
+
+def upstreams_view(request):
+    """Circuit breaker state of every upstream in this process."""
+    if settings.METRICS_AUTH_TOKEN:
+        if request.headers.get('Authorization') != f'Bearer {settings.METRICS_AUTH_TOKEN}':
+            return HttpResponse(status=401)
+    return JsonResponse({
+        'upstreams': {name: upstream.breaker.snapshot() for name, upstream in sorted(Upstream.all().items())}
+    })
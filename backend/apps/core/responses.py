@@ -0,0 +1,88 @@
+"""
+Conditional and ranged HTTP responses for immutable artifacts.
+
+Page artifacts are small, content-addressed and requested repeatedly on
+slow connections, so they are served with an ``ETag`` (answering
+``If-None-Match`` with 304), explicit ``Cache-Control``, and single-range
+``Range`` support so an interrupted download can resume.
+"""
+import re
+from typing import Optional, Tuple
+
+from django.http import HttpResponse
+from django.utils.http import parse_etags, quote_etag
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def cache_control(max_age: int, immutable: bool) -> str:
+    """Cache-Control for an artifact; mutable ones are revalidated with their ETag."""
+    if immutable:
+        return f'public, max-age={max_age}, immutable'
+    return 'no-cache'
+
+
+def not_modified(request, etag: str) -> bool:
+    """True if the client's ``If-None-Match`` already covers ``etag``."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = parse_etags(header)
+    return '*' in tags or quote_etag(etag) in tags
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single ``bytes=`` range against a body of ``size`` bytes.
+
+    Returns:
+        Inclusive (start, end), or None if the range cannot be satisfied.
+        Multi-range requests are treated as unsatisfiable.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def artifact_response(
+    request,
+    data: bytes,
+    content_type: str,
+    etag: str,
+    cache_control_header: str,
+    filename: str = None
+) -> HttpResponse:
+    """Serve ``data`` honoring ``If-None-Match`` and ``Range``."""
+    if not_modified(request, etag):
+        response = HttpResponse(status=304)
+    else:
+        range_header = request.META.get('HTTP_RANGE')
+        byte_range = parse_range(range_header, len(data)) if range_header else None
+        if range_header and byte_range is None:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{len(data)}'
+        elif byte_range:
+            start, end = byte_range
+            response = HttpResponse(data[start:end + 1], content_type=content_type, status=206)
+            response['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+        else:
+            response = HttpResponse(data, content_type=content_type)
+        if filename:
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+    response['ETag'] = quote_etag(etag)
+    response['Cache-Control'] = cache_control_header
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -1,10 +1,23 @@
 import openai
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from typing import List, Dict, Optional
 import logging
+from .embedding_batcher import EmbeddingBatcher
+from .token_counter import count_tokens, message_tokens
+from apps.core.openai_scheduler import OpenAIScheduler
+from apps.core.resilience import Upstream
+from apps.core.singleflight import SingleFlight
+from apps.core.tracing import set_attributes, traced
 
 logger = logging.getLogger(__name__)
 
+# Completions and embeddings have no side effects, so failed ones may be retried; never
+# hedged (cost). Each admission by OpenAIScheduler pays for one request, so retries
+# are off by default.
+OPENAI_CHAT = Upstream('openai.chat', 'OPENAI_CHAT_DEADLINE_SECONDS', 'OPENAI_CHAT_RETRIES')
+OPENAI_EMBEDDING = Upstream('openai.embedding', 'OPENAI_EMBEDDING_DEADLINE_SECONDS', 'OPENAI_EMBEDDING_RETRIES')
+
 
 class AIService:
     """Service for interacting with OpenAI API."""
@@ -13,38 +26,100 @@ class AIService:
         if not settings.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY must be set")
         self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+        # Calls are retried by their Upstream under its deadline, not by the SDK
+        self.api_client = self.client.with_options(max_retries=0)
         self.embedding_model = settings.OPENAI_EMBEDDING_MODEL
         self.chat_model = settings.OPENAI_CHAT_MODEL
+        self.history_token_budget = settings.CHAT_HISTORY_TOKEN_BUDGET
     
     def generate_response(
         self, 
         messages: List[Dict[str, str]], 
         temperature: float = 0.7,
-        max_tokens: int = 1000
+        max_tokens: int = 1000,
+        share: bool = False
     ) -> str:
-        """Generate AI response with chat history."""
+        """
+        Generate AI response with chat history.
+        
+        With ``share``, concurrent identical requests get one completion (see
+        ``SingleFlight``); only for prompts that carry no per-user history.
+        """
+        if share:
+            return SingleFlight.get().do(
+                'completion',
+                [self.chat_model, messages, temperature, max_tokens],
+                lambda: self._complete(messages, temperature, max_tokens)
+            )
+        return self._complete(messages, temperature, max_tokens)
+    
+    def _complete(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+        """Wait for an OpenAI budget (see ``OpenAIScheduler``), then request the completion with a deadline and retries."""
+        estimate = sum(message_tokens(msg) for msg in messages) + max_tokens
+        with OpenAIScheduler.get().slot(estimate) as slot:
+            return OPENAI_CHAT.call(self._create_completion, messages, temperature, max_tokens, slot)
+    
+    @traced('openai.chat')
+    def _create_completion(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int, slot) -> str:
         try:
-            response = self.client.chat.completions.create(
+            response = self.api_client.chat.completions.create(
                 model=self.chat_model,
                 messages=messages,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                timeout=settings.OPENAI_CHAT_DEADLINE_SECONDS
             )
+            if response.usage:
+                slot.used = response.usage.total_tokens
+                set_attributes(
+                    model=self.chat_model,
+                    prompt_tokens=response.usage.prompt_tokens,
+                    completion_tokens=response.usage.completion_tokens
+                )
             return response.choices[0].message.content or ""
         except Exception as e:
             logger.error(f"Error generating AI response: {e}")
             raise
     
     def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for text."""
+        """
+        Generate embedding for text.
+        
+        Concurrent identical requests share one call, and concurrent different
+        ones are sent together as one multi-input request (``EmbeddingBatcher``).
+        """
+        text = text[:8000]  # Limit to 8000 chars
+        return SingleFlight.get().do(
+            'embedding',
+            [self.embedding_model, text],
+            lambda: EmbeddingBatcher.get().embed(self.embedding_model, text, self.generate_embeddings)
+        )
+    
+    async def agenerate_embedding(self, text: str) -> List[float]:
+        """``generate_embedding`` for async callers; joins the same batches."""
+        return await sync_to_async(self.generate_embedding, thread_sensitive=False)(text)
+    
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for several texts in one request, once an OpenAI budget admits it, with a deadline."""
+        texts = [text[:8000] for text in texts]
+        estimate = sum(count_tokens(text, self.embedding_model) for text in texts)
+        with OpenAIScheduler.get().slot(estimate) as slot:
+            return OPENAI_EMBEDDING.call(self._create_embeddings, texts, slot)
+    
+    @traced('openai.embedding')
+    def _create_embeddings(self, texts: List[str], slot) -> List[List[float]]:
         try:
-            response = self.client.embeddings.create(
+            response = self.api_client.embeddings.create(
                 model=self.embedding_model,
-                input=text[:8000]  # Limit to 8000 chars
+                input=texts,
+                timeout=settings.OPENAI_EMBEDDING_DEADLINE_SECONDS
             )
-            return response.data[0].embedding
+            if response.usage:
+                slot.used = response.usage.total_tokens
+                set_attributes(inputs=len(texts), tokens=response.usage.total_tokens)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
         except Exception as e:
-            logger.error(f"Error generating embedding: {e}")
+            logger.error(f"Error generating embeddings: {e}")
             raise
     
     def build_system_prompt(
@@ -97,6 +172,63 @@ Remember: You are a patient, encouraging tutor helping Ethiopian students succee
 4. Support - Be helpful, patient, and encouraging
 5. Context - Consider the Ethiopian educational context"""
     
+    def build_history_messages(
+        self,
+        history: List[Dict] = None,
+        summary: str = None,
+        token_budget: int = None
+    ) -> List[Dict[str, str]]:
+        """
+        Pick the conversation summary plus as many recent turns as fit the token budget.
+        
+        Turns are taken newest-first and never split; stored ``token_count``
+        values are used when present so long messages are not re-tokenized.
+        """
+        budget = self.history_token_budget if token_budget is None else token_budget
+        selected = []
+        
+        if summary:
+            summary_message = {
+                "role": "system",
+                "content": f"Summary of the earlier part of this conversation:\n{summary}"
+            }
+            budget -= message_tokens(summary_message)
+        
+        for msg in reversed(history or []):
+            cost = message_tokens(msg)
+            if cost > budget:
+                break
+            budget -= cost
+            selected.append({
+                "role": msg.get('role', 'user'),
+                "content": msg.get('content', '')
+            })
+        selected.reverse()
+        
+        if summary:
+            selected.insert(0, summary_message)
+        return selected
+    
+    def summarize_conversation(self, messages: List[Dict], previous_summary: str = None, max_tokens: int = 400) -> str:
+        """Fold older conversation turns into a rolling summary."""
+        transcript = "\n".join(
+            f"{msg.get('role', 'user').upper()}: {msg.get('content', '')[:4000]}" for msg in messages
+        )
+        prompt = (
+            "Update the running summary of a tutoring conversation. Keep the topics covered, "
+            "facts and worked results the student was given, the student's level and misconceptions, "
+            "and any open questions. Be concise and write in the third person."
+        )
+        content = f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"
+        return self.generate_response(
+            [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": content},
+            ],
+            temperature=0.2,
+            max_tokens=max_tokens
+        )
+    
     def generate_chat_response(
         self,
         user_message: str,
@@ -104,7 +236,8 @@ Remember: You are a patient, encouraging tutor helping Ethiopian students succee
         history: List[Dict] = None,
         role: str = 'student',
         grade: str = None,
-        subject: str = None
+        subject: str = None,
+        summary: str = None
     ) -> str:
         """Generate chat response with context and history."""
         messages = []
@@ -120,29 +253,19 @@ Remember: You are a patient, encouraging tutor helping Ethiopian students succee
                 "content": f"Use the following reference materials when answering. IF THE ANSWER IS NOT IN THE CONTEXT, STATE THAT YOU DON'T KNOW BASED ON THE BOOK AND TRY TO HELP OTHERWISE. ALWAYS CITE THE BOOK AND PAGE NUMBER IF AVAILABLE IN THE CONTEXT.\n\n{context}"
             })
         
-        # Add chat history (last 10 messages)
-        if history:
-            for msg in history[-10:]:
-                messages.append({
-                    "role": msg.get('role', 'user'),
-                    "content": msg.get('content', '')
-                })
+        # Add conversation summary and the recent turns that fit the budget
+        history_messages = self.build_history_messages(history, summary)
+        messages.extend(history_messages)
         
         # Add current message
         messages.append({"role": "user", "content": user_message})
         
-        return self.generate_response(messages)
+        return self.generate_response(messages, share=settings.SINGLEFLIGHT_COMPLETIONS and not history_messages)
 
-    def chat(self, message, context=None, conversation_history=None, system_prompt=None):
+    def chat(self, message, context=None, conversation_history=None, system_prompt=None, summary=None):
         """Compatibility method for ChatView."""
-        # Map conversation_history to history
-        history = []
-        if conversation_history:
-            for msg in conversation_history:
-                history.append({
-                    'role': msg.get('role', 'user'),
-                    'content': msg.get('content', '')
-                })
+        # Map conversation_history to the summary plus budgeted recent turns
+        history = self.build_history_messages(conversation_history, summary)
         
         # Use existing logic
         messages = []
@@ -162,4 +285,5 @@ Remember: You are a patient, encouraging tutor helping Ethiopian students succee
             
         messages.append({"role": "user", "content": message})
         
-        return self.generate_response(messages)
+        # A first message has nothing user-specific, so identical ones may share a completion
+        return self.generate_response(messages, share=settings.SINGLEFLIGHT_COMPLETIONS and not history)
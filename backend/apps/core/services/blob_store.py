@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Optional, Tuple
+from django.conf import settings
+from .supabase_service import SupabaseService
+
+logger = logging.getLogger(__name__)
+
+BLOB_BUCKET = 'educational-content'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Blob statuses: reserved by the upload storing it, stored, or abandoned by that upload
+PENDING = 'pending'
+AVAILABLE = 'available'
+FAILED = 'failed'
+# Document upload statuses: waiting for the blob to be stored, stored, or given up
+UPLOAD_PENDING = 'pending'
+UPLOAD_STORED = 'stored'
+UPLOAD_FAILED = 'failed'
+
+
+class BlobStore:
+    """
+    Content-addressed layer over Supabase Storage.
+
+    Files are stored once under ``blobs/<sha256>`` and described by a row in
+    the ``blobs`` table; documents and books reference the blob by
+    ``content_hash`` instead of owning their own copy. New uploads reserve
+    the row as ``pending`` before storing the content, so concurrent
+    duplicates attach to it instead of storing it again.
+    """
+
+    @staticmethod
+    def new_hasher():
+        return hashlib.sha256()
+
+    @classmethod
+    def hash_stream(cls, stream: BinaryIO) -> str:
+        """Hash a file object in chunks, leaving it positioned at the start."""
+        hasher = cls.new_hasher()
+        stream.seek(0)
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+        stream.seek(0)
+        return hasher.hexdigest()
+
+    @staticmethod
+    def storage_path(content_hash: str, extension: str) -> str:
+        """Storage key for a blob; fanned out by hash prefix."""
+        return f"blobs/{content_hash[:2]}/{content_hash}.{extension}"
+
+    @staticmethod
+    def get(content_hash: str) -> Optional[Dict]:
+        """Fetch the blob record for a hash, if the content is already stored."""
+        results = SupabaseService.fetch_table('blobs', {'content_hash': content_hash}, limit=1)
+        return results[0] if results else None
+
+    @staticmethod
+    def status(blob: Dict) -> str:
+        return blob.get('status') or AVAILABLE
+
+    @staticmethod
+    def is_abandoned(blob: Dict) -> bool:
+        """A failed reservation, or a pending one whose upload stopped making progress long ago."""
+        status = BlobStore.status(blob)
+        if status == AVAILABLE or not blob.get('claim'):
+            return False
+        if status == FAILED or not blob.get('claimed_at'):
+            return True
+        claimed_at = datetime.fromisoformat(blob['claimed_at'])
+        return (datetime.now(timezone.utc) - claimed_at).total_seconds() > settings.BLOB_CLAIM_TIMEOUT_SECONDS
+
+    @staticmethod
+    def reserve(content_hash: str, storage_path: str, file_size: int, content_type: str,
+                previous: Dict = None) -> Tuple[Dict, bool]:
+        """
+        Reserve new content, or take over an abandoned reservation
+        (``previous``), for the calling upload to store.
+
+        Returns the blob row and whether the caller holds the reservation; a
+        caller that lost the race gets the winner's row.
+        """
+        claim = {
+            'status': PENDING,
+            'claim': uuid.uuid4().hex,
+            'claimed_at': datetime.now(timezone.utc).isoformat(),
+        }
+        if previous is None:
+            rows = SupabaseService.upsert_records('blobs', [{
+                'content_hash': content_hash,
+                'storage_path': storage_path,
+                'file_size': file_size,
+                'content_type': content_type,
+                **claim,
+            }], on_conflict='content_hash')
+        else:
+            # Compare-and-set on the old claim, so one of several uploads takes over
+            rows = SupabaseService.update_where(
+                'blobs', {'content_hash': content_hash, 'claim': previous['claim']}, claim
+            )
+        if rows:
+            return rows[0], True
+        return BlobStore.get(content_hash), False
+
+    @staticmethod
+    def finish(content_hash: str, claim: str, status: str, **data) -> bool:
+        """
+        Record the outcome of a reservation (``AVAILABLE`` or ``FAILED``).
+        False when another upload has since taken the reservation over.
+        """
+        return bool(SupabaseService.update_where(
+            'blobs', {'content_hash': content_hash, 'claim': claim}, {'status': status, **data}
+        ))
+
+    @staticmethod
+    def set_documents_status(content_hash: str, upload_status: str):
+        """
+        Record on the documents waiting for the content whether it reached
+        storage. Stored content also clears earlier failures, since those
+        documents point at the same blob path.
+        """
+        waiting = (UPLOAD_PENDING, UPLOAD_FAILED) if upload_status == UPLOAD_STORED else (UPLOAD_PENDING,)
+        for current in waiting:
+            SupabaseService.update_where(
+                'documents',
+                {'content_hash': content_hash, 'upload_status': current},
+                {'upload_status': upload_status}
+            )
+
+    @staticmethod
+    def register(content_hash: str, storage_path: str, file_size: int, content_type: str,
+                 page_count: int = None, text_artifact_key: str = None) -> Dict:
+        """
+        Record a stored blob. Concurrent registrations of the same content are
+        harmless: the first row wins and is returned.
+        """
+        SupabaseService.upsert_records('blobs', [{
+            'content_hash': content_hash,
+            'storage_path': storage_path,
+            'file_size': file_size,
+            'content_type': content_type,
+            'page_count': page_count,
+            'text_artifact_key': text_artifact_key,
+            'status': AVAILABLE,
+        }], on_conflict='content_hash')
+        return BlobStore.get(content_hash)
+
+    @staticmethod
+    def mark_indexed(content_hash: str):
+        """Flag a blob's text as chunked and embedded for retrieval."""
+        BlobStore._update(content_hash, {'rag_indexed': True})
+
+    @staticmethod
+    def mark_unindexed(content_hash: str):
+        """Flag a blob's text as needing to be embedded again, e.g. before its vectors are deleted."""
+        BlobStore._update(content_hash, {'rag_indexed': False})
+
+    @staticmethod
+    def set_text_artifact(content_hash: str, text_artifact_key: str, page_count: int = None):
+        """Point a blob at the stored artifact holding its extracted text."""
+        data = {'text_artifact_key': text_artifact_key}
+        if page_count is not None:
+            data['page_count'] = page_count
+        BlobStore._update(content_hash, data)
+
+    @staticmethod
+    def set_page_artifacts(content_hash: str, page_artifact_prefix: str):
+        """Point a blob at the storage prefix holding its single-page PDFs."""
+        BlobStore._update(content_hash, {'page_artifact_prefix': page_artifact_prefix})
+
+    @staticmethod
+    def _update(content_hash: str, data: Dict):
+        blob = BlobStore.get(content_hash)
+        if blob:
+            SupabaseService.update_record('blobs', blob['id'], data)
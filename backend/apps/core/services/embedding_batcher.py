@@ -0,0 +1,101 @@
+"""
+Micro-batching of concurrent single-text embedding requests.
+
+The first caller to arrive opens a batch and waits up to
+``EMBEDDING_BATCH_WINDOW_MS`` for others to join; the batch is sent as one
+multi-input request when the window closes or it reaches
+``EMBEDDING_BATCH_MAX_SIZE`` texts, and each caller receives its own
+vector (or the request's exception). Batches are kept per embedding model.
+"""
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EmbedMany = Callable[[List[str]], List[List[float]]]
+
+
+class _Batch:
+    def __init__(self, embed_many: EmbedMany):
+        self.embed_many = embed_many
+        self.items: List[Tuple[str, Future]] = []
+        self.full = threading.Event()
+
+
+class EmbeddingBatcher:
+    """Collects concurrent embedding requests into multi-input requests."""
+
+    _instance: Optional['EmbeddingBatcher'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, window_ms: float = 5, max_size: int = 64):
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self._open: Dict[str, _Batch] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> 'EmbeddingBatcher':
+        """The process-wide batcher."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(
+                        window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+                        max_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                    )
+        return cls._instance
+
+    def submit(self, model: str, text: str, embed_many: EmbedMany) -> Future:
+        """
+        Queue ``text`` for the next batch of ``model`` and return a future for its vector.
+
+        ``embed_many`` sends a batch; the one given by the caller who opened
+        the batch is used. That caller sends the batch, so ``submit`` blocks it
+        for up to the window.
+        """
+        future = Future()
+        if self.window <= 0 or self.max_size <= 1:
+            self._send(_Batch(embed_many), [(text, future)])
+            return future
+
+        with self._lock:
+            batch = self._open.get(model)
+            leader = batch is None
+            if leader:
+                batch = self._open[model] = _Batch(embed_many)
+            batch.items.append((text, future))
+            if len(batch.items) >= self.max_size:
+                # Later callers open a new batch; this one is sent now
+                del self._open[model]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(model) is batch:
+                    del self._open[model]
+                items = list(batch.items)
+            self._send(batch, items)
+        return future
+
+    def embed(self, model: str, text: str, embed_many: EmbedMany) -> List[float]:
+        """Embed ``text`` as part of a batch, blocking until its vector is ready."""
+        return self.submit(model, text, embed_many).result()
+
+    @staticmethod
+    def _send(batch: _Batch, items: List[Tuple[str, Future]]):
+        try:
+            vectors = batch.embed_many([text for text, _ in items])
+            if len(vectors) != len(items):
+                raise ValueError(f"Expected {len(items)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        for (_, future), vector in zip(items, vectors):
+            future.set_result(vector)
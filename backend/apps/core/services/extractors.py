@@ -0,0 +1,163 @@
+"""
+Pluggable text extraction backends.
+
+Each backend streams ``(page_number, text)`` records for one file type.
+Backends register themselves with ``register_backend``; the one used for a
+file type is chosen by ``settings.FILE_EXTRACTOR_BACKENDS`` (for example
+``{'pdf': 'pymupdf'}``) and defaults to the first registered.
+"""
+import logging
+import mmap
+import os
+from contextlib import contextmanager
+from io import BytesIO
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Type, Union
+
+import PyPDF2
+import docx2txt
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Files may be given as bytes, a path on disk, or an open binary file object
+FileSource = Union[bytes, str, os.PathLike, BinaryIO]
+PageRecord = Tuple[int, str]
+
+_REGISTRY: Dict[str, Dict[str, 'ExtractorBackend']] = {}
+
+
+@contextmanager
+def open_source(source: FileSource):
+    """Yield a seekable binary stream for any supported source without copying files."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as stream:
+            yield stream
+    else:
+        source.seek(0)
+        yield source
+
+
+class ExtractorBackend:
+    """Base class for extraction backends."""
+
+    name = ''
+    file_types: Tuple[str, ...] = ()
+
+    def iter_pages(self, source: FileSource) -> Iterator[PageRecord]:
+        raise NotImplementedError
+
+    def page_count(self, source: FileSource) -> int:
+        return sum(1 for _ in self.iter_pages(source))
+
+
+def register_backend(backend_cls: Type[ExtractorBackend]) -> Type[ExtractorBackend]:
+    """Class decorator registering a backend for each of its file types."""
+    backend = backend_cls()
+    for file_type in backend.file_types:
+        _REGISTRY.setdefault(file_type, {})[backend.name] = backend
+    return backend_cls
+
+
+def available_backends(file_type: str) -> List[str]:
+    """Names of the backends registered for a file type, in registration order."""
+    return list(_REGISTRY.get(file_type, {}))
+
+
+def get_backend(file_type: str, name: str = None) -> ExtractorBackend:
+    """Resolve the backend for a file type. Raises ValueError if none matches."""
+    backends = _REGISTRY.get(file_type)
+    if not backends:
+        raise ValueError(f"Unsupported file type: {file_type}")
+    name = name or settings.FILE_EXTRACTOR_BACKENDS.get(file_type)
+    if name:
+        if name not in backends:
+            raise ValueError(f"Unknown {file_type} extractor backend: {name}")
+        return backends[name]
+    return next(iter(backends.values()))
+
+
+@register_backend
+class PyPDF2Backend(ExtractorBackend):
+    """Pure-Python PDF extraction; always available."""
+
+    name = 'pypdf2'
+    file_types = ('pdf',)
+
+    def iter_pages(self, source):
+        with open_source(source) as stream:
+            # PdfReader seeks within the stream instead of reading it whole
+            reader = PyPDF2.PdfReader(stream)
+            for number, page in enumerate(reader.pages, start=1):
+                yield number, page.extract_text() or ''
+
+    def page_count(self, source):
+        with open_source(source) as stream:
+            return len(PyPDF2.PdfReader(stream).pages)
+
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+if fitz is not None:
+    @register_backend
+    class PyMuPDFBackend(ExtractorBackend):
+        """MuPDF-based PDF extraction; much faster on large textbooks when installed."""
+
+        name = 'pymupdf'
+        file_types = ('pdf',)
+
+        @staticmethod
+        def _open(source):
+            if isinstance(source, (str, os.PathLike)):
+                return fitz.open(source)
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                return fitz.open(stream=bytes(source), filetype='pdf')
+            source.seek(0)
+            return fitz.open(stream=source.read(), filetype='pdf')
+
+        def iter_pages(self, source):
+            with self._open(source) as document:
+                for number, page in enumerate(document, start=1):
+                    yield number, page.get_text()
+
+        def page_count(self, source):
+            with self._open(source) as document:
+                return document.page_count
+
+
+@register_backend
+class Docx2TxtBackend(ExtractorBackend):
+    name = 'docx2txt'
+    file_types = ('docx',)
+
+    def iter_pages(self, source):
+        with open_source(source) as stream:
+            yield 1, docx2txt.process(stream)
+
+    def page_count(self, source):
+        return 1
+
+
+@register_backend
+class PlainTextBackend(ExtractorBackend):
+    name = 'text'
+    file_types = ('txt',)
+
+    def iter_pages(self, source):
+        if isinstance(source, (str, os.PathLike)):
+            if os.path.getsize(source) == 0:
+                yield 1, ''
+                return
+            # Decode straight from the page cache rather than a bytes copy
+            with open(source, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield 1, str(mapped, 'utf-8')
+            return
+        with open_source(source) as stream:
+            yield 1, stream.read().decode('utf-8')
+
+    def page_count(self, source):
+        return 1
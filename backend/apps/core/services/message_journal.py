@@ -0,0 +1,363 @@
+"""
+Write-behind journal for Supabase writes on the chat hot path.
+
+Writes are appended to a local SQLite database in WAL mode and acknowledged
+immediately; a background thread flushes them to Supabase in batches with
+retries. Inserts carry client-generated primary keys, so a batch that is
+replayed after a crash or a timed-out request is deduplicated by the database.
+
+Entries sharing a scope (e.g. a conversation) reach Supabase in order: an
+entry waits while an earlier entry of its scope is backing off. When a batch
+is rejected outright it is split until the rows that fail on their own are
+found, and only those are retried and eventually given up on; an outage
+(timeouts, 5xx, open circuit) backs off the whole batch instead.
+"""
+import atexit
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from apps.core.exceptions import UpstreamUnavailable
+from apps.core.resilience import is_transient
+from .supabase_service import SupabaseService
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    table_name TEXT NOT NULL,
+    op TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    scope TEXT,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_journal_scope ON journal(table_name, scope);
+CREATE INDEX IF NOT EXISTS idx_journal_ready ON journal(dead, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_journal_scope_seq ON journal(scope, seq);
+"""
+
+# How long a flusher owns claimed rows before another worker may retry them
+CLAIM_LEASE_SECONDS = 30
+MAX_BACKOFF_SECONDS = 60
+
+
+def _is_outage(exc: BaseException) -> bool:
+    """Whether a failure says Supabase is unreachable rather than that the rows are bad."""
+    return is_transient(exc) or isinstance(exc, UpstreamUnavailable)
+
+
+def utc_now_iso() -> str:
+    """Current UTC time as an ISO-8601 string, as stored by PostgREST."""
+    return datetime.now(timezone.utc).isoformat()
+
+
+class MessageJournal:
+    """Durable local queue of pending Supabase inserts and updates."""
+
+    _instance: Optional['MessageJournal'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_attempts: int = 20
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    @classmethod
+    def get(cls) -> 'MessageJournal':
+        """Get the process-wide journal, starting its flusher on first use."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    journal = cls(
+                        settings.MESSAGE_JOURNAL_PATH,
+                        batch_size=settings.MESSAGE_JOURNAL_BATCH_SIZE,
+                        flush_interval=settings.MESSAGE_JOURNAL_FLUSH_INTERVAL,
+                        max_attempts=settings.MESSAGE_JOURNAL_MAX_ATTEMPTS,
+                    )
+                    journal.start()
+                    cls._instance = journal
+        return cls._instance
+
+    def _connection(self) -> sqlite3.Connection:
+        """SQLite connections are per-thread; WAL lets readers run beside the flusher."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------
+    # Producers
+    # ------------------------------------------------------------------
+
+    def insert(self, table: str, data: Dict, scope: str = None) -> Dict:
+        """
+        Queue an insert and return the record as it will be stored.
+
+        An ``id`` and ``created_at`` are assigned locally when missing so the
+        caller can reference the row before it reaches Supabase.
+        """
+        record = dict(data)
+        record.setdefault('id', str(uuid.uuid4()))
+        record.setdefault('created_at', utc_now_iso())
+        self._append(table, 'insert', record['id'], record, scope, key=f"{table}:{record['id']}")
+        return record
+
+    def update(self, table: str, record_id: str, data: Dict, scope: str = None) -> None:
+        """Queue an update of a single row by id."""
+        self._append(table, 'update', record_id, data, scope, key=str(uuid.uuid4()))
+
+    def _append(self, table, op, record_id, payload, scope, key):
+        self._connection().execute(
+            'INSERT OR IGNORE INTO journal (idempotency_key, table_name, op, record_id, scope, payload) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (key, table, op, str(record_id), scope, json.dumps(payload, default=str))
+        )
+        self._wakeup.set()
+
+    # ------------------------------------------------------------------
+    # Readers
+    # ------------------------------------------------------------------
+
+    def depth(self) -> int:
+        """Number of journal entries still waiting to be flushed."""
+        return self._connection().execute('SELECT COUNT(*) FROM journal WHERE dead = 0').fetchone()[0]
+
+    # ------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the background flusher thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='message-journal-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the flusher after a final best-effort flush."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                while self.flush() >= self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"Message journal flush failed: {e}")
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Final message journal flush failed: {e}")
+
+    def flush(self) -> int:
+        """Flush one batch of ready entries to Supabase. Returns the number of entries flushed."""
+        entries = self._claim_batch()
+        if not entries:
+            return 0
+
+        flushed = 0
+        failures: List[Tuple[sqlite3.Row, str]] = []
+        # Scopes with a failed entry; their later entries wait for it to go through
+        blocked = set()
+        for group in self._group(entries):
+            ready = [entry for entry in group if entry['scope'] is None or entry['scope'] not in blocked]
+            try:
+                if group[0]['op'] == 'insert':
+                    failed = self._insert_isolating(ready)
+                    failed_seqs = {entry['seq'] for entry, _ in failed}
+                    applied = [entry for entry in ready if entry['seq'] not in failed_seqs]
+                else:
+                    applied, failed = self._update_in_order(ready, blocked)
+            except Exception as e:
+                # Supabase is unreachable: back off this group, retry the rest of the batch later
+                failures.extend((entry, str(e)) for entry in ready)
+                logger.warning(f"Deferred {len(entries) - flushed} journal entries after error: {e}")
+                break
+            self._delete(applied)
+            flushed += len(applied)
+            failures.extend(failed)
+            blocked.update(entry['scope'] for entry, _ in failed if entry['scope'] is not None)
+
+        self._release(entries, failures)
+        return flushed
+
+    def _insert_isolating(self, group: List[sqlite3.Row]) -> List[Tuple[sqlite3.Row, str]]:
+        """
+        Insert ``group``, splitting it in halves when Supabase rejects it.
+
+        Returns the entries that failed on their own with their errors. An
+        outage is raised instead, since splitting would not help.
+        """
+        if not group:
+            return []
+        try:
+            self._apply(group)
+            return []
+        except Exception as e:
+            if _is_outage(e):
+                raise
+            if len(group) == 1:
+                logger.warning(f"Journal entry {group[0]['idempotency_key']} rejected: {e}")
+                return [(group[0], str(e))]
+        middle = len(group) // 2
+        return self._insert_isolating(group[:middle]) + self._insert_isolating(group[middle:])
+
+    def _update_in_order(self, group: List[sqlite3.Row], blocked: set):
+        """
+        Apply updates row by row; a rejected row holds back the later updates of its scope.
+
+        Returns the applied entries and the failed entries with their errors.
+        """
+        by_record: Dict[str, List[sqlite3.Row]] = {}
+        for entry in group:
+            by_record.setdefault(entry['record_id'], []).append(entry)
+
+        applied, failed = [], []
+        for record_entries in by_record.values():
+            scope = record_entries[0]['scope']
+            if scope is not None and scope in blocked:
+                continue
+            try:
+                self._apply(record_entries)
+            except Exception as e:
+                if _is_outage(e):
+                    raise
+                logger.warning(f"Journal update of {record_entries[0]['record_id']} rejected: {e}")
+                failed.extend((entry, str(e)) for entry in record_entries)
+                if scope is not None:
+                    blocked.add(scope)
+                continue
+            applied.extend(record_entries)
+        return applied, failed
+
+    def _claim_batch(self) -> List[sqlite3.Row]:
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # An entry is held back while an earlier entry of its scope is waiting or in flight
+            rows = conn.execute(
+                'SELECT * FROM journal AS entry WHERE dead = 0 AND next_attempt_at <= ? AND claimed_until <= ? '
+                'AND NOT EXISTS (SELECT 1 FROM journal AS earlier WHERE entry.scope IS NOT NULL '
+                'AND earlier.scope = entry.scope AND earlier.seq < entry.seq AND earlier.dead = 0 '
+                'AND (earlier.next_attempt_at > ? OR earlier.claimed_until > ?)) '
+                'ORDER BY seq LIMIT ?',
+                (now, now, now, now, self.batch_size)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    'UPDATE journal SET claimed_until = ? WHERE seq = ?',
+                    [(now + CLAIM_LEASE_SECONDS, row['seq']) for row in rows]
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return rows
+
+    @staticmethod
+    def _group(entries: List[sqlite3.Row]) -> List[List[sqlite3.Row]]:
+        """Split entries into consecutive runs with the same table and operation."""
+        groups = []
+        for entry in entries:
+            if groups and groups[-1][0]['table_name'] == entry['table_name'] and groups[-1][0]['op'] == entry['op']:
+                groups[-1].append(entry)
+            else:
+                groups.append([entry])
+        return groups
+
+    @staticmethod
+    def _apply(group: List[sqlite3.Row]):
+        table = group[0]['table_name']
+        if group[0]['op'] == 'insert':
+            SupabaseService.upsert_records(table, [json.loads(entry['payload']) for entry in group])
+            return
+
+        # Coalesce repeated updates of the same row; the latest value wins
+        merged: Dict[str, Dict] = {}
+        for entry in group:
+            merged.setdefault(entry['record_id'], {}).update(json.loads(entry['payload']))
+        for record_id, data in merged.items():
+            SupabaseService.update_record(table, record_id, data)
+
+    def _delete(self, entries: List[sqlite3.Row]):
+        self._connection().executemany(
+            'DELETE FROM journal WHERE seq = ?', [(entry['seq'],) for entry in entries]
+        )
+
+    def discard(self, scope: str) -> int:
+        """Drop the entries queued under ``scope``, e.g. for a deleted conversation. Returns how many."""
+        return self._connection().execute('DELETE FROM journal WHERE scope = ?', (scope,)).rowcount
+
+    def _release(self, entries: List[sqlite3.Row], failures: List[Tuple[sqlite3.Row, str]]):
+        """Back off the failed entries and hand the unflushed rest back to the queue."""
+        conn = self._connection()
+        now = time.time()
+        errors = {entry['seq']: error for entry, error in failures}
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for entry in entries:
+                error = errors.get(entry['seq'])
+                if error is None:
+                    # Flushed entries are already gone; the rest were not attempted
+                    conn.execute('UPDATE journal SET claimed_until = 0 WHERE seq = ?', (entry['seq'],))
+                    continue
+                attempts = entry['attempts'] + 1
+                backoff = min(MAX_BACKOFF_SECONDS, 2 ** attempts) * random.uniform(0.5, 1.0)
+                dead = 1 if attempts >= self.max_attempts else 0
+                if dead:
+                    logger.error(
+                        f"Giving up on journal entry {entry['idempotency_key']} after {attempts} attempts: {error}"
+                    )
+                conn.execute(
+                    'UPDATE journal SET attempts = ?, next_attempt_at = ?, claimed_until = 0, dead = ?, last_error = ? '
+                    'WHERE seq = ?',
+                    (attempts, now + backoff, dead, error[:1000], entry['seq'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
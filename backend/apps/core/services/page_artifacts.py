@@ -0,0 +1,138 @@
+"""
+Single-page PDF artifacts in Supabase Storage.
+
+Cited answers point at one page of a textbook; fetching the whole PDF to
+read it costs tens of megabytes. At ingestion each page is split into its
+own PDF under ``artifacts/pages/<name>/<n>.pdf`` so a page, or a short
+range merged from pages, can be served on its own. Page bytes are kept in a
+small in-process cache since the same cited pages are requested repeatedly.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Iterable, Iterator, Optional, Tuple
+
+import PyPDF2
+from django.conf import settings
+
+from apps.core.metrics import record_cache
+from .extractors import FileSource, open_source
+from .supabase_service import SupabaseService
+
+logger = logging.getLogger(__name__)
+
+PAGE_ARTIFACT_BUCKET = 'educational-content'
+PAGE_ARTIFACT_PREFIX = 'artifacts/pages'
+PDF_CONTENT_TYPE = 'application/pdf'
+
+
+def page_artifact_prefix(name: str) -> str:
+    """Storage prefix for the pages of ``name`` (a content hash, or ``<table>/<id>``)."""
+    return f"{PAGE_ARTIFACT_PREFIX}/{name}"
+
+
+def page_pdf_path(prefix: str, number: int) -> str:
+    return f"{prefix}/{number}.pdf"
+
+
+def split_pdf(source: FileSource) -> Iterator[Tuple[int, bytes]]:
+    """Yield ``(page_number, pdf_bytes)`` for each page as a standalone PDF."""
+    with open_source(source) as stream:
+        reader = PyPDF2.PdfReader(stream)
+        for number, page in enumerate(reader.pages, start=1):
+            writer = PyPDF2.PdfWriter()
+            writer.add_page(page)
+            out = BytesIO()
+            writer.write(out)
+            yield number, out.getvalue()
+
+
+def merge_pdfs(documents: Iterable[bytes]) -> bytes:
+    """Concatenate PDFs into one document."""
+    writer = PyPDF2.PdfWriter()
+    for data in documents:
+        for page in PyPDF2.PdfReader(BytesIO(data)).pages:
+            writer.add_page(page)
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+class PageArtifactStore:
+    """Writes and reads single-page PDFs, caching recently served pages."""
+
+    def __init__(self, max_cached_bytes: int = 32 * 1024 * 1024):
+        self.max_cached_bytes = max_cached_bytes
+        self._pages: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def save(self, prefix: str, source: FileSource) -> int:
+        """
+        Split a PDF into per-page artifacts under ``prefix``.
+
+        Returns:
+            Number of pages written
+        """
+        count = 0
+        for number, data in split_pdf(source):
+            SupabaseService.upload_stream(
+                PAGE_ARTIFACT_BUCKET,
+                page_pdf_path(prefix, number),
+                BytesIO(data),
+                len(data),
+                PDF_CONTENT_TYPE,
+                upsert=True
+            )
+            count += 1
+        logger.info(f"Stored {count} page artifacts under {prefix}")
+        return count
+
+    def page(self, prefix: str, number: int) -> bytes:
+        """One page as a PDF, downloading it on a cache miss."""
+        path = page_pdf_path(prefix, number)
+        with self._lock:
+            cached = self._pages.get(path)
+            if cached is not None:
+                self._pages.move_to_end(path)
+        record_cache('page_artifacts', cached is not None)
+        if cached is not None:
+            return cached
+        data = SupabaseService.download_file(PAGE_ARTIFACT_BUCKET, path)
+        self._remember(path, data)
+        return data
+
+    def pages(self, prefix: str, start: int, end: int) -> bytes:
+        """Pages ``start`` through ``end`` (inclusive) merged into one PDF."""
+        if start == end:
+            return self.page(prefix, start)
+        return merge_pdfs(self.page(prefix, number) for number in range(start, end + 1))
+
+    def _remember(self, path: str, data: bytes):
+        if len(data) > self.max_cached_bytes:
+            return
+        with self._lock:
+            if path in self._pages:
+                self._cached_bytes -= len(self._pages.pop(path))
+            self._pages[path] = data
+            self._cached_bytes += len(data)
+            while self._cached_bytes > self.max_cached_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._cached_bytes = 0
+
+
+_store: Optional[PageArtifactStore] = None
+
+
+def get_page_artifacts() -> PageArtifactStore:
+    """Get the process-wide page artifact store configured from settings."""
+    global _store
+    if _store is None:
+        _store = PageArtifactStore(max_cached_bytes=settings.PAGE_ARTIFACT_CACHE_BYTES)
+    return _store
@@ -1,10 +1,20 @@
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 from pinecone import Pinecone, ServerlessSpec
 from django.conf import settings
+from apps.core.resilience import Upstream
+from apps.core.tracing import set_attributes, traced
 
 logger = logging.getLogger(__name__)
 
+# Most ids Pinecone accepts in one delete request
+DELETE_BATCH_SIZE = 1000
+
+PINECONE_QUERY = Upstream('pinecone.query', 'PINECONE_QUERY_DEADLINE_SECONDS', 'PINECONE_QUERY_RETRIES', hedge=True)
+# Upserts by id are idempotent, so they are retried; never hedged
+PINECONE_WRITE = Upstream('pinecone.upsert', 'PINECONE_WRITE_DEADLINE_SECONDS', 'PINECONE_WRITE_RETRIES')
+
+
 class PineconeService:
     """Service for interacting with Pinecone Vector Database."""
     
@@ -43,7 +53,7 @@ class PineconeService:
 
     def upsert_vectors(self, vectors: List[Dict[str, Any]], namespace: str = "books"):
         """
-        Upsert vectors to Pinecone.
+        Upsert vectors to Pinecone, under PINECONE_WRITE's deadline, retries and circuit breaker.
         vectors format: [{"id": "chunk_1", "values": [...], "metadata": {...}}]
         """
         if not self.index:
@@ -51,12 +61,17 @@ class PineconeService:
             return False
             
         try:
-            self.index.upsert(vectors=vectors, namespace=namespace)
+            PINECONE_WRITE.call(self._upsert, vectors, namespace)
             return True
         except Exception as e:
             logger.error(f"Error upserting to Pinecone: {e}")
             return False
 
+    @traced('pinecone.upsert', capture=('namespace',))
+    def _upsert(self, vectors: List[Dict[str, Any]], namespace: str):
+        set_attributes(vectors=len(vectors))
+        self.index.upsert(vectors=vectors, namespace=namespace)
+
     def query_vectors(
         self, 
         vector: List[float], 
@@ -64,11 +79,25 @@ class PineconeService:
         filter: Optional[Dict[str, Any]] = None,
         namespace: str = "books"
     ) -> List[Dict[str, Any]]:
-        """Query Pinecone for similar vectors."""
+        """
+        Query Pinecone for similar vectors.
+        
+        Runs under PINECONE_QUERY's deadline, retries, hedging and circuit
+        breaker. Failures raise, so callers can tell them from no matches.
+        """
         if not self.index:
             logger.error("Pinecone index not initialized.")
             return []
-            
+        return PINECONE_QUERY.call(self._query, vector, top_k, filter, namespace)
+
+    @traced('pinecone.query', capture=('namespace', 'top_k'))
+    def _query(
+        self,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]],
+        namespace: str
+    ) -> List[Dict[str, Any]]:
         try:
             results = self.index.query(
                 vector=vector,
@@ -80,8 +109,9 @@ class PineconeService:
             return results.get("matches", [])
         except Exception as e:
             logger.error(f"Error querying Pinecone: {e}")
-            return []
+            raise
 
+    @traced('pinecone.delete', capture=('namespace',))
     def delete_vectors(self, ids: List[str], namespace: str = "books"):
         """Delete vectors from Pinecone."""
         if not self.index:
@@ -93,3 +123,40 @@ class PineconeService:
         except Exception as e:
             logger.error(f"Error deleting from Pinecone: {e}")
             return False
+
+    def delete_by_prefix(self, prefix: str, namespace: str = "books") -> int:
+        """
+        Delete every vector whose id starts with ``prefix``.
+
+        Returns:
+            Number of vectors deleted
+        """
+        # List everything first so deletions do not disturb the listing's pagination
+        ids = [vector_id for page in self.list_ids(prefix, namespace=namespace) for vector_id in page]
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            batch = ids[start:start + DELETE_BATCH_SIZE]
+            if not self.delete_vectors(batch, namespace=namespace):
+                raise RuntimeError(f"Failed to delete vectors with prefix {prefix} from {namespace}")
+        return len(ids)
+
+    def list_ids(self, prefix: str, namespace: str = "books") -> Iterator[List[str]]:
+        """Yield pages of vector ids starting with ``prefix``."""
+        if not self.index:
+            return
+        for page in self.index.list(prefix=prefix, namespace=namespace):
+            yield [item.id for item in page.vectors]
+
+    @traced('pinecone.fetch', capture=('namespace',))
+    def fetch_vectors(self, ids: List[str], namespace: str = "books") -> Dict[str, Dict[str, Any]]:
+        """Fetch vectors by id as {id: {"values": [...], "metadata": {...}}}."""
+        if not self.index or not ids:
+            return {}
+        try:
+            response = self.index.fetch(ids=ids, namespace=namespace)
+            return {
+                vector_id: {"values": vector.values, "metadata": vector.metadata or {}}
+                for vector_id, vector in response.vectors.items()
+            }
+        except Exception as e:
+            logger.error(f"Error fetching from Pinecone: {e}")
+            return {}
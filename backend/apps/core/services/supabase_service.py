@@ -1,10 +1,32 @@
 from supabase import create_client, Client
 from django.conf import settings
-from typing import Dict, List, Any, Optional
+from typing import BinaryIO, Dict, List, Any, Optional, Tuple
+from urllib.parse import urljoin
+import base64
 import logging
+import os
+import time
+import requests
+from apps.core.exceptions import UpstreamUnavailable
+from apps.core.resilience import Upstream
+from apps.core.tracing import traced
 
 logger = logging.getLogger(__name__)
 
+TUS_VERSION = '1.0.0'
+
+
+def postgrest_quote(value) -> str:
+    """Quote a value for a PostgREST filter so commas, dots and parentheses in it are not syntax."""
+    escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+SUPABASE_READ = Upstream('supabase.select', 'SUPABASE_READ_DEADLINE_SECONDS', 'SUPABASE_READ_RETRIES', hedge=True)
+# Background whole-table reads get their own deadline, pool and breaker so a slow
+# scan neither trips nor starves the reads serving requests
+SUPABASE_SCAN = Upstream('supabase.scan', 'SUPABASE_SCAN_DEADLINE_SECONDS', 'SUPABASE_SCAN_RETRIES')
+
 
 class SupabaseService:
     """Service for interacting with Supabase database and storage."""
@@ -30,12 +52,31 @@ class SupabaseService:
         filters: Dict = None, 
         limit: int = None,
         order_by: str = None,
-        ascending: bool = True
+        ascending: bool = True,
+        columns: str = '*'
+    ) -> List[Dict]:
+        """Fetch data from a Supabase table (with SUPABASE_READ's deadline, retries and hedging)."""
+        return SUPABASE_READ.call(cls._select, table, filters, limit, order_by, ascending, columns)
+
+    @classmethod
+    def scan_table(cls, table: str, filters: Dict = None, columns: str = '*') -> List[Dict]:
+        """Fetch every matching row, for background jobs (with SUPABASE_SCAN's deadline and retries)."""
+        return SUPABASE_SCAN.call(cls._select, table, filters, None, None, True, columns)
+    
+    @classmethod
+    @traced('supabase.select', capture=('table',))
+    def _select(
+        cls,
+        table: str,
+        filters: Optional[Dict],
+        limit: Optional[int],
+        order_by: Optional[str],
+        ascending: bool,
+        columns: str
     ) -> List[Dict]:
-        """Fetch data from a Supabase table."""
         try:
             client = cls.get_client()
-            query = client.table(table).select('*')
+            query = client.table(table).select(columns)
             
             if filters:
                 for key, value in filters.items():
@@ -54,12 +95,71 @@ class SupabaseService:
             raise
     
     @classmethod
-    def fetch_by_id(cls, table: str, record_id: str) -> Optional[Dict]:
-        """Fetch a single record by ID."""
-        results = cls.fetch_table(table, {'id': record_id}, limit=1)
+    def fetch_keyset_page(
+        cls,
+        table: str,
+        filters: Dict = None,
+        columns: str = '*',
+        cursor: Optional[Tuple[str, str]] = None,
+        direction: str = 'after',
+        limit: int = 50,
+        sort_column: str = 'created_at'
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Fetch one page of rows ordered by ``(sort_column, id)``.
+
+        ``direction='after'`` walks forward from ``cursor`` (or from the start),
+        ``direction='before'`` walks backward from ``cursor`` (or from the end).
+        Rows are always returned in ascending order.
+
+        Returns:
+            Tuple of (rows, has_more) where has_more tells whether further rows
+            exist beyond the page in the requested direction.
+        """
+        return SUPABASE_READ.call(cls._keyset_page, table, filters, columns, cursor, direction, limit, sort_column)
+
+    @classmethod
+    @traced('supabase.select', capture=('table',))
+    def _keyset_page(cls, table, filters, columns, cursor, direction, limit, sort_column) -> Tuple[List[Dict], bool]:
+        try:
+            client = cls.get_client()
+            query = client.table(table).select(columns)
+
+            if filters:
+                for key, value in filters.items():
+                    query = query.eq(key, value)
+
+            descending = direction == 'before'
+            if cursor:
+                sort_value, record_id = (postgrest_quote(value) for value in cursor)
+                op = 'lt' if descending else 'gt'
+                query = query.or_(
+                    f'{sort_column}.{op}.{sort_value},'
+                    f'and({sort_column}.eq.{sort_value},id.{op}.{record_id})'
+                )
+
+            query = query.order(sort_column, desc=descending).order('id', desc=descending)
+            # Fetch one extra row to learn whether another page exists
+            result = query.limit(limit + 1).execute()
+            rows = result.data or []
+
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if descending:
+                rows.reverse()
+            return rows, has_more
+        except Exception as e:
+            logger.error(f"Error fetching page from {table}: {e}")
+            raise
+
+    @classmethod
+    def fetch_by_id(cls, table: str, record_id: str, columns: str = '*') -> Optional[Dict]:
+        """Fetch a single record by ID, optionally only the given comma-separated columns."""
+        results = cls.fetch_table(table, {'id': record_id}, limit=1, columns=columns)
         return results[0] if results else None
     
     @classmethod
+    @traced('supabase.insert', capture=('table',))
     def insert_record(cls, table: str, data: Dict) -> Optional[Dict]:
         """Insert a record into Supabase table."""
         try:
@@ -71,6 +171,34 @@ class SupabaseService:
             raise
     
     @classmethod
+    @traced('supabase.upsert', capture=('table',))
+    def upsert_records(
+        cls,
+        table: str,
+        records: List[Dict],
+        on_conflict: str = 'id',
+        ignore_duplicates: bool = True
+    ) -> List[Dict]:
+        """
+        Insert several records in one request.
+
+        Rows whose ``on_conflict`` key already exists are skipped by default,
+        which makes replaying the same batch safe.
+        """
+        try:
+            client = cls.get_client()
+            result = client.table(table).upsert(
+                records,
+                on_conflict=on_conflict,
+                ignore_duplicates=ignore_duplicates
+            ).execute()
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error upserting into {table}: {e}")
+            raise
+
+    @classmethod
+    @traced('supabase.update', capture=('table',))
     def update_record(cls, table: str, record_id: str, data: Dict) -> Optional[Dict]:
         """Update a record in Supabase table."""
         try:
@@ -82,6 +210,28 @@ class SupabaseService:
             raise
     
     @classmethod
+    @traced('supabase.update', capture=('table',))
+    def update_where(cls, table: str, filters: Dict, data: Dict) -> List[Dict]:
+        """
+        Update the rows matching every ``filters`` equality and return them.
+
+        A ``None`` filter value matches NULL. An empty result means no row
+        matched, which makes this usable as a compare-and-set on the filtered
+        columns.
+        """
+        try:
+            client = cls.get_client()
+            query = client.table(table).update(data)
+            for key, value in filters.items():
+                query = query.is_(key, 'null') if value is None else query.eq(key, value)
+            result = query.execute()
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error updating {table}: {e}")
+            raise
+    
+    @classmethod
+    @traced('supabase.delete', capture=('table',))
     def delete_record(cls, table: str, record_id: str) -> bool:
         """Delete a record from Supabase table."""
         try:
@@ -93,14 +243,32 @@ class SupabaseService:
             raise
     
     @classmethod
-    def upload_file(cls, bucket: str, file_path: str, file_content: bytes) -> str:
+    @traced('supabase.rpc', capture=('function',))
+    def call_rpc(cls, function: str, params: Dict = None) -> Any:
+        """Call a Postgres function through PostgREST and return its result."""
+        try:
+            client = cls.get_client()
+            result = client.rpc(function, params or {}).execute()
+            return result.data
+        except Exception as e:
+            logger.error(f"Error calling {function}: {e}")
+            raise
+    
+    @classmethod
+    def upload_file(
+        cls,
+        bucket: str,
+        file_path: str,
+        file_content: bytes,
+        content_type: str = 'application/pdf'
+    ) -> str:
         """Upload a file to Supabase Storage."""
         try:
             client = cls.get_client()
             result = client.storage.from_(bucket).upload(
                 file_path,
                 file_content,
-                {'content-type': 'application/pdf'}
+                {'content-type': content_type}
             )
             
             # Get public URL
@@ -110,6 +278,176 @@ class SupabaseService:
             logger.error(f"Error uploading file to {bucket}: {e}")
             raise
     
+    @classmethod
+    @traced('supabase.storage_upload', capture=('bucket', 'size'))
+    def upload_stream(
+        cls,
+        bucket: str,
+        file_path: str,
+        fileobj: BinaryIO,
+        size: int,
+        content_type: str = 'application/octet-stream',
+        upsert: bool = False
+    ) -> str:
+        """
+        Upload a file object to Supabase Storage without loading it into memory.
+        
+        The body is streamed from ``fileobj`` in blocks by the HTTP client.
+        With ``upsert`` an existing object at the same path is overwritten.
+        """
+        try:
+            headers = cls._storage_headers(upsert, **{
+                'Content-Type': content_type,
+                'Content-Length': str(size),
+            })
+            response = requests.post(
+                f"{settings.SUPABASE_URL.rstrip('/')}/storage/v1/object/{bucket}/{file_path}",
+                data=fileobj,
+                headers=headers,
+                timeout=(10, 300)
+            )
+            response.raise_for_status()
+            return cls.get_storage_public_url(bucket, file_path)
+        except Exception as e:
+            logger.error(f"Error streaming file to {bucket}: {e}")
+            raise
+    
+    @classmethod
+    def upload_path(
+        cls,
+        bucket: str,
+        file_path: str,
+        local_path: str,
+        content_type: str = 'application/octet-stream',
+        upsert: bool = False
+    ) -> str:
+        """
+        Upload a file on disk, using resumable chunked transfer once it is
+        larger than ``STORAGE_RESUMABLE_THRESHOLD``.
+        """
+        size = os.path.getsize(local_path)
+        if size >= settings.STORAGE_RESUMABLE_THRESHOLD:
+            return cls.upload_resumable(bucket, file_path, local_path, content_type, upsert)
+        with open(local_path, 'rb') as fileobj:
+            return cls.upload_stream(bucket, file_path, fileobj, size, content_type, upsert)
+    
+    @classmethod
+    @traced('supabase.storage_upload', capture=('bucket',))
+    def upload_resumable(
+        cls,
+        bucket: str,
+        file_path: str,
+        local_path: str,
+        content_type: str = 'application/octet-stream',
+        upsert: bool = False
+    ) -> str:
+        """
+        Upload a file on disk through Supabase's TUS endpoint in fixed-size chunks.
+        
+        After a failed chunk the server is asked for the last offset it
+        acknowledged and the transfer continues from there, so an unreliable
+        link costs one chunk rather than the whole file.
+        """
+        endpoint = f"{settings.SUPABASE_URL.rstrip('/')}/storage/v1/upload/resumable"
+        size = os.path.getsize(local_path)
+        chunk_size = settings.STORAGE_RESUMABLE_CHUNK_SIZE
+        max_retries = settings.STORAGE_UPLOAD_MAX_RETRIES
+        metadata = {
+            'bucketName': bucket,
+            'objectName': file_path,
+            'contentType': content_type,
+            'cacheControl': '3600',
+        }
+        try:
+            response = requests.post(
+                endpoint,
+                headers=cls._storage_headers(upsert, **{
+                    'Tus-Resumable': TUS_VERSION,
+                    'Upload-Length': str(size),
+                    'Upload-Metadata': ','.join(
+                        f"{key} {base64.b64encode(value.encode('utf-8')).decode('ascii')}"
+                        for key, value in metadata.items()
+                    ),
+                }),
+                timeout=(10, 60)
+            )
+            response.raise_for_status()
+            upload_url = urljoin(endpoint, response.headers['Location'])
+            
+            offset = 0
+            failures = 0
+            with open(local_path, 'rb') as fileobj:
+                while offset < size:
+                    fileobj.seek(offset)
+                    chunk = fileobj.read(chunk_size)
+                    try:
+                        response = requests.patch(
+                            upload_url,
+                            data=chunk,
+                            headers=cls._storage_headers(**{
+                                'Tus-Resumable': TUS_VERSION,
+                                'Upload-Offset': str(offset),
+                                'Content-Type': 'application/offset+octet-stream',
+                            }),
+                            timeout=(10, 120)
+                        )
+                        response.raise_for_status()
+                        offset = int(response.headers.get('Upload-Offset', offset + len(chunk)))
+                        failures = 0
+                    except requests.exceptions.RequestException as e:
+                        failures += 1
+                        if failures > max_retries:
+                            raise
+                        delay = min(2 ** failures, 30)
+                        logger.warning(
+                            f"Chunk at {offset}/{size} of {file_path} failed ({e}); resuming in {delay}s"
+                        )
+                        time.sleep(delay)
+                        offset = cls._resumable_offset(upload_url, offset)
+            
+            logger.info(f"Uploaded {file_path} to {bucket} in resumable chunks ({size} bytes)")
+            return cls.get_storage_public_url(bucket, file_path)
+        except Exception as e:
+            logger.error(f"Error uploading {file_path} to {bucket} (resumable): {e}")
+            raise
+    
+    @classmethod
+    def _resumable_offset(cls, upload_url: str, fallback: int) -> int:
+        """Last byte offset the server acknowledged for a resumable upload."""
+        try:
+            response = requests.head(
+                upload_url,
+                headers=cls._storage_headers(**{'Tus-Resumable': TUS_VERSION}),
+                timeout=(10, 30)
+            )
+            response.raise_for_status()
+            return int(response.headers['Upload-Offset'])
+        except Exception as e:
+            logger.warning(f"Could not read upload offset, retrying from {fallback}: {e}")
+            return fallback
+    
+    @staticmethod
+    def _storage_headers(upsert: bool = False, **extra) -> Dict[str, str]:
+        headers = {
+            'Authorization': f"Bearer {settings.SUPABASE_SERVICE_KEY}",
+            'apikey': settings.SUPABASE_SERVICE_KEY,
+            **extra,
+        }
+        if upsert:
+            headers['x-upsert'] = 'true'
+        return headers
+    
+    @classmethod
+    @traced('supabase.storage_download', capture=('bucket',))
+    def download_file(cls, bucket: str, file_path: str) -> bytes:
+        """Download a file from Supabase Storage."""
+        try:
+            client = cls.get_client()
+            return client.storage.from_(bucket).download(file_path)
+        except Exception as e:
+            logger.error(f"Error downloading {file_path} from {bucket}: {e}")
+            raise
+    
     @classmethod
     def get_storage_public_url(cls, bucket: str, file_path: str) -> str:
         """Get public URL for a file in Supabase Storage."""
@@ -117,10 +455,16 @@ class SupabaseService:
         return client.storage.from_(bucket).get_public_url(file_path)
     
     @classmethod
+    @traced('supabase.auth')
     def get_user_by_token(cls, token: str) -> Optional[Dict[str, Any]]:
         """
         Validate a Supabase JWT token and return user info.
         Uses the GoTrue API to verify the token.
+
+        Returns None when GoTrue rejects the token (4xx). Raises
+        ``UpstreamUnavailable`` when it cannot say (connection errors,
+        timeouts, throttling, 5xx), so callers do not treat an outage as an
+        invalid token.
         """
         try:
             client = cls.get_client()
@@ -134,5 +478,9 @@ class SupabaseService:
                 }
             return None
         except Exception as e:
+            status = getattr(e, 'status', None)
+            if isinstance(status, int) and 400 <= status < 500 and status not in (408, 429):
+                logger.info(f"Token rejected by Supabase Auth: {e}")
+                return None
             logger.error(f"Error validating token: {e}")
-            return None
+            raise UpstreamUnavailable(f"Supabase Auth is unavailable: {e}", upstream='supabase.auth', retry_after=1.0)
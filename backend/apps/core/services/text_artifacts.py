@@ -0,0 +1,281 @@
+"""
+Extracted text stored as compressed artifacts in Supabase Storage.
+
+Full extracted text used to live inline in ``books.extracted_text`` and
+``documents.extracted_text``, so every ``select('*')`` carried it. Rows now
+keep a short preview plus a ``text_artifact_key``; the pages themselves are
+stored as compressed JSON lines (``{"page": n, "text": "..."}``) and loaded
+only by code paths that need them, through a small in-process cache of
+decompressed pages. Reads of a few pages decompress the artifact only up to
+them and cache just the pages around them, so serving one page of a long
+textbook neither decodes nor caches the whole book.
+
+Artifacts are gzip by default. Set ``TEXT_ARTIFACT_CODEC=zstd`` to write
+zstd when the ``zstandard`` package is installed; the codec is recorded in
+the key's suffix so both kinds can be read back.
+"""
+import gzip
+import io
+import json
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+
+from apps.core.metrics import record_cache
+from .extractors import PageRecord
+from .supabase_service import SupabaseService
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_BUCKET = 'educational-content'
+ARTIFACT_PREFIX = 'artifacts/text'
+# Pages cached on each side of a page range read, for readers moving through a book
+PAGE_WINDOW = 10
+
+
+def _codec() -> str:
+    if settings.TEXT_ARTIFACT_CODEC == 'zstd' and zstandard is not None:
+        return 'zst'
+    return 'gz'
+
+
+def artifact_key(name: str) -> str:
+    """Storage key for the text of ``name`` (a content hash, or ``<table>/<id>``)."""
+    return f"{ARTIFACT_PREFIX}/{name}.jsonl.{_codec()}"
+
+
+def encode_pages(pages: Iterable[PageRecord], key: str) -> bytes:
+    """Serialize pages as JSON lines compressed with the codec named by ``key``."""
+    raw = ''.join(
+        json.dumps({'page': number, 'text': text}, ensure_ascii=False) + '\n'
+        for number, text in pages
+    ).encode('utf-8')
+    if key.endswith('.zst'):
+        return zstandard.ZstdCompressor(level=6).compress(raw)
+    return gzip.compress(raw, compresslevel=6)
+
+
+def iter_decoded_pages(data: bytes, key: str) -> Iterator[PageRecord]:
+    """Pages of an artifact in order, decompressed only as far as they are read."""
+    if key.endswith('.zst'):
+        raw = zstandard.ZstdDecompressor().stream_reader(BytesIO(data))
+    else:
+        raw = gzip.GzipFile(fileobj=BytesIO(data))
+    with io.TextIOWrapper(raw, encoding='utf-8') as lines:
+        for line in lines:
+            if line.strip():
+                record = json.loads(line)
+                yield record['page'], record['text']
+
+
+def decode_pages(data: bytes, key: str) -> List[PageRecord]:
+    """Inverse of ``encode_pages``."""
+    return list(iter_decoded_pages(data, key))
+
+
+def preview_text(pages: Iterable[PageRecord], limit: int = None) -> str:
+    """Leading characters of the text, kept inline on rows for list views and legacy clients."""
+    limit = settings.EXTRACTED_TEXT_PREVIEW_CHARS if limit is None else limit
+    parts = []
+    collected = 0
+    for _, text in pages:
+        parts.append(text)
+        collected += len(text)
+        if collected >= limit:
+            break
+    return ''.join(parts)[:limit]
+
+
+class TextArtifactWriter:
+    """
+    Compresses pages as they are produced, so long documents are never held
+    as uncompressed text; ``close`` stores the artifact.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.page_count = 0
+        self._buffer = BytesIO()
+        if key.endswith('.zst'):
+            self._out = zstandard.ZstdCompressor(level=6).stream_writer(self._buffer, closefd=False)
+        else:
+            self._out = gzip.GzipFile(fileobj=self._buffer, mode='wb', compresslevel=6)
+
+    def add(self, number: int, text: str):
+        line = json.dumps({'page': number, 'text': text}, ensure_ascii=False) + '\n'
+        self._out.write(line.encode('utf-8'))
+        self.page_count += 1
+
+    def close(self) -> str:
+        """Finish compression and upload the artifact. Overwrites an existing one."""
+        self._out.close()
+        data = self._buffer.getvalue()
+        SupabaseService.upload_stream(
+            ARTIFACT_BUCKET,
+            self.key,
+            BytesIO(data),
+            len(data),
+            'application/octet-stream',
+            upsert=True
+        )
+        get_text_artifacts().forget(self.key)
+        logger.info(f"Stored text artifact {self.key} ({self.page_count} pages, {len(data)} bytes)")
+        return self.key
+
+
+class TextArtifactStore:
+    """
+    Reads and writes text artifacts, caching decompressed text.
+
+    The cache holds whole artifacts read through ``pages`` and single pages
+    read through ``page``/``page_range``, sharing one size budget.
+    """
+
+    def __init__(self, max_cached_chars: int = 8 * 1024 * 1024):
+        self.max_cached_chars = max_cached_chars
+        # Keyed by artifact key (all pages) or by (artifact key, page number)
+        self._cache: 'OrderedDict[object, object]' = OrderedDict()
+        self._sizes = {}
+        self._cached_chars = 0
+        self._lock = threading.Lock()
+
+    def save(self, key: str, pages: Iterable[PageRecord]) -> str:
+        """Compress and store pages under ``key``. Overwrites an existing artifact."""
+        pages = list(pages)
+        data = encode_pages(pages, key)
+        SupabaseService.upload_stream(
+            ARTIFACT_BUCKET,
+            key,
+            BytesIO(data),
+            len(data),
+            'application/octet-stream',
+            upsert=True
+        )
+        self.forget(key)
+        self._remember(key, pages, sum(len(text) for _, text in pages))
+        logger.info(f"Stored text artifact {key} ({len(pages)} pages, {len(data)} bytes)")
+        return key
+
+    @staticmethod
+    def writer(key: str) -> TextArtifactWriter:
+        """A writer that stores pages under ``key`` as they are added."""
+        return TextArtifactWriter(key)
+
+    def pages(self, key: str) -> List[PageRecord]:
+        """All pages of an artifact, downloading and decompressing it on a cache miss."""
+        cached = self._lookup(key)
+        record_cache('text_artifacts', cached is not None)
+        if cached is not None:
+            return cached
+        pages = decode_pages(SupabaseService.download_file(ARTIFACT_BUCKET, key), key)
+        self._remember(key, pages, sum(len(text) for _, text in pages))
+        return pages
+
+    def page(self, key: str, number: int) -> Optional[str]:
+        """Text of one page, or None if the artifact has no such page."""
+        pages = self.page_range(key, number, number)
+        return pages[0][1] if pages else None
+
+    def page_range(self, key: str, start: int, end: int) -> List[PageRecord]:
+        """
+        Pages ``start`` through ``end`` (inclusive) that exist in the artifact.
+
+        On a cache miss the artifact is decompressed up to ``end`` plus
+        ``PAGE_WINDOW`` and only the pages within the window are cached.
+        """
+        with self._lock:
+            whole = self._get_locked(key)
+            found: Dict[int, str] = {}
+            if whole is None:
+                for number in range(start, end + 1):
+                    text = self._get_locked((key, number))
+                    if text is None:
+                        break
+                    found[number] = text
+        hit = whole is not None or len(found) == end - start + 1
+        record_cache('text_artifacts', hit)
+        if whole is not None:
+            return [(number, text) for number, text in whole if start <= number <= end]
+        if hit:
+            return sorted(found.items())
+
+        first, last = start - PAGE_WINDOW, end + PAGE_WINDOW
+        window = {}
+        data = SupabaseService.download_file(ARTIFACT_BUCKET, key)
+        for number, text in iter_decoded_pages(data, key):
+            if number > last:
+                break
+            if number >= first:
+                window[number] = text
+
+        # Farthest first, so a tight budget evicts neighbours before the pages asked for
+        def distance(number):
+            return max(start - number, number - end, 0)
+
+        for number in sorted(window, key=distance, reverse=True):
+            self._remember((key, number), window[number], len(window[number]))
+        return [(number, text) for number, text in sorted(window.items()) if start <= number <= end]
+
+    def text(self, key: str, limit: int = None) -> str:
+        """Concatenated text, optionally truncated to ``limit`` characters."""
+        if limit is None:
+            return ''.join(text for _, text in self.pages(key))
+        return preview_text(self.pages(key), limit)
+
+    def forget(self, key: str):
+        """Drop everything cached for an artifact, e.g. after it was overwritten."""
+        with self._lock:
+            for entry in [entry for entry in self._cache if entry == key or entry[0] == key]:
+                self._drop_locked(entry)
+
+    def _lookup(self, entry):
+        with self._lock:
+            return self._get_locked(entry)
+
+    def _get_locked(self, entry):
+        value = self._cache.get(entry)
+        if value is not None:
+            self._cache.move_to_end(entry)
+        return value
+
+    def _remember(self, entry, value, size: int):
+        if size > self.max_cached_chars:
+            return
+        with self._lock:
+            if entry in self._cache:
+                self._drop_locked(entry)
+            self._cache[entry] = value
+            self._sizes[entry] = size
+            self._cached_chars += size
+            while self._cached_chars > self.max_cached_chars:
+                self._drop_locked(next(iter(self._cache)))
+
+    def _drop_locked(self, entry):
+        del self._cache[entry]
+        self._cached_chars -= self._sizes.pop(entry)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._sizes.clear()
+            self._cached_chars = 0
+
+
+_store: Optional[TextArtifactStore] = None
+
+
+def get_text_artifacts() -> TextArtifactStore:
+    """Get the process-wide artifact store configured from settings."""
+    global _store
+    if _store is None:
+        _store = TextArtifactStore(max_cached_chars=settings.TEXT_ARTIFACT_CACHE_CHARS)
+    return _store
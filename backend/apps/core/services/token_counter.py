@@ -0,0 +1,55 @@
+"""
+Token counting for prompt budgeting.
+
+Uses tiktoken when it is installed and its encoding can be loaded; otherwise
+falls back to a characters-per-token estimate that errs on the high side.
+"""
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Conservative estimate for English/Amharic mixed text without a tokenizer
+CHARS_PER_TOKEN = 3.5
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        logger.warning(f"Could not load tiktoken encoding for {model}, estimating tokens: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """Count (or estimate) the tokens in ``text`` for ``model``."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model or settings.OPENAI_CHAT_MODEL)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def message_tokens(message: Dict) -> int:
+    """Tokens used by one chat message, preferring a stored ``token_count``."""
+    stored = message.get('token_count')
+    content_tokens = stored if stored is not None else count_tokens(message.get('content', ''))
+    return content_tokens + MESSAGE_OVERHEAD_TOKENS
+
+
+def total_tokens(messages: Iterable[Dict]) -> int:
+    """Tokens used by a sequence of chat messages."""
+    return sum(message_tokens(msg) for msg in messages)
@@ -0,0 +1,297 @@
+"""
+Single-flight coalescing of identical upstream calls.
+
+Concurrent callers making the same call (same operation and normalized
+arguments) share one execution. Within a process the first caller leads:
+it runs the call while the others wait and receive its result, or its
+exception. That is all that happens by default.
+
+With ``SINGLEFLIGHT_PATH`` set, coalescing also spans the worker processes
+on the host: the leader claims the key in a small SQLite database, and a
+leader in another process that finds the claim registers as a waiter and
+polls for the result instead of calling upstream itself. The result is
+serialized and published only if someone registered; it stays readable
+for ``SINGLEFLIGHT_RESULT_SECONDS`` so they can collect it, and must be
+JSON-serializable.
+
+A claim whose owner process has died, or that is older than
+``SINGLEFLIGHT_WAIT_SECONDS``, is taken over. A failed call is not
+published: pollers in other processes then make the call themselves.
+Without a usable database coalescing stays within the process.
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from apps.core.metrics import record_coalesced
+from apps.core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flights (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    result TEXT,
+    waiters INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_flights_finished ON flights(finished_at);
+"""
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def flight_key(operation: str, args) -> str:
+    """Key for a call: the operation plus a hash of its arguments with whitespace collapsed."""
+    payload = json.dumps(_normalize(args), sort_keys=True, separators=(',', ':'), default=str)
+    return f"{operation}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Flight:
+    """A call in progress in this process."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Shares one execution of identical concurrent calls among their callers."""
+
+    _instance: Optional['SingleFlight'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: str = '',
+        result_seconds: float = 2.0,
+        wait_seconds: float = 60.0,
+        poll_seconds: float = 0.02
+    ):
+        self.path = path
+        self.result_seconds = result_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self.host = socket.gethostname()
+        self.owner = f"{self.host}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        if path:
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = self._connection()
+                conn.executescript(SCHEMA)
+                columns = {row['name'] for row in conn.execute('PRAGMA table_info(flights)')}
+                if 'waiters' not in columns:
+                    # Store created before waiters were tracked
+                    conn.execute('ALTER TABLE flights ADD COLUMN waiters INTEGER NOT NULL DEFAULT 0')
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Single-flight store {path} unavailable, coalescing in-process only: {e}")
+                self.path = ''
+
+    @classmethod
+    def get(cls) -> 'SingleFlight':
+        """The process-wide coordinator."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(
+                        settings.SINGLEFLIGHT_PATH,
+                        result_seconds=settings.SINGLEFLIGHT_RESULT_SECONDS,
+                        wait_seconds=settings.SINGLEFLIGHT_WAIT_SECONDS,
+                        poll_seconds=settings.SINGLEFLIGHT_POLL_SECONDS,
+                    )
+        return cls._instance
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connections; the rows are transient, so durability is not needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def do(self, operation: str, args, fn: Callable[[], Any]) -> Any:
+        """
+        Return ``fn()``, sharing the call with concurrent callers passing the
+        same ``operation`` and ``args``.
+        """
+        if not settings.SINGLEFLIGHT_ENABLED:
+            return fn()
+        key = flight_key(operation, args)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            record_coalesced(operation, 'follower')
+            with span('singleflight.wait', operation=operation):
+                flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._run(operation, key, fn)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    # --- Across processes ---------------------------------------------------
+
+    def _run(self, operation: str, key: str, fn: Callable[[], Any]) -> Any:
+        if not self.path:
+            record_coalesced(operation, 'leader')
+            return fn()
+
+        deadline = time.monotonic() + self.wait_seconds
+        registered = None
+        while True:
+            try:
+                claimed, row = self._claim(key)
+            except sqlite3.Error as e:
+                logger.warning(f"Single-flight store unavailable for {operation}, running the call: {e}")
+                record_coalesced(operation, 'leader')
+                return fn()
+
+            if claimed:
+                record_coalesced(operation, 'leader')
+                return self._lead(key, fn)
+            if row['finished_at'] is not None:
+                record_coalesced(operation, 'remote')
+                return json.loads(row['result'])
+            if time.monotonic() >= deadline:
+                logger.warning(f"Gave up waiting for {operation} in {row['owner']}; running the call")
+                record_coalesced(operation, 'leader')
+                return fn()
+            if registered != row['owner']:
+                self._register_waiter(key, row['owner'])
+                registered = row['owner']
+            time.sleep(self.poll_seconds)
+
+    def _claim(self, key: str) -> Tuple[bool, Optional[sqlite3.Row]]:
+        """Claim ``key`` unless a live claim or a fresh result exists, which is returned instead."""
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT * FROM flights WHERE key = ?', (key,)).fetchone()
+            if row is not None and not self._stale(row, now):
+                conn.execute('COMMIT')
+                return False, row
+            conn.execute(
+                'INSERT OR REPLACE INTO flights (key, owner, host, pid, started_at) VALUES (?, ?, ?, ?, ?)',
+                (key, self.owner, self.host, os.getpid(), now)
+            )
+            conn.execute('COMMIT')
+            return True, None
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _register_waiter(self, key: str, owner: str):
+        """Ask the leader in ``owner`` to publish its result."""
+        try:
+            self._connection().execute(
+                'UPDATE flights SET waiters = waiters + 1 WHERE key = ? AND owner = ?', (key, owner)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not register as single-flight waiter: {e}")
+
+    def _stale(self, row: sqlite3.Row, now: float) -> bool:
+        if row['finished_at'] is not None:
+            return row['finished_at'] + self.result_seconds < now
+        if row['started_at'] + self.wait_seconds < now:
+            return True
+        return row['host'] == self.host and not _process_alive(row['pid'])
+
+    def _lead(self, key: str, fn: Callable[[], Any]) -> Any:
+        try:
+            result = fn()
+        except BaseException:
+            self._forget(key)
+            raise
+        self._publish(key, result)
+        return result
+
+    def _publish(self, key: str, result: Any):
+        """Share the result with waiting processes; with none waiting just drop the claim."""
+        try:
+            row = self._connection().execute(
+                'SELECT waiters FROM flights WHERE key = ? AND owner = ?', (key, self.owner)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not publish single-flight result: {e}")
+            return
+        if row is None or not row['waiters']:
+            # A process registering from now on finds no claim and makes the call itself
+            self._forget(key)
+            return
+        try:
+            payload = json.dumps(result)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Result of {key.split(':', 1)[0]} cannot be shared across processes: {e}")
+            self._forget(key)
+            return
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                'UPDATE flights SET finished_at = ?, result = ? WHERE key = ? AND owner = ?',
+                (now, payload, key, self.owner)
+            )
+            conn.execute('DELETE FROM flights WHERE finished_at < ?', (now - self.result_seconds,))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not publish single-flight result: {e}")
+
+    def _forget(self, key: str):
+        try:
+            self._connection().execute('DELETE FROM flights WHERE key = ? AND owner = ?', (key, self.owner))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not drop single-flight claim: {e}")
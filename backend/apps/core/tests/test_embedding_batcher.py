@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from apps.core.services.ai_service import AIService
+from apps.core.services.embedding_batcher import EmbeddingBatcher
+
+
+def _embed_concurrently(texts, embed):
+    results, errors = {}, {}
+
+    def run(text):
+        try:
+            results[text] = embed(text)
+        except Exception as e:
+            errors[text] = e
+
+    threads = [threading.Thread(target=run, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+class Recorder:
+    """``embed_many`` that records its batches and embeds a text as [its length]."""
+
+    def __init__(self, error: Exception = None):
+        self.batches = []
+        self.error = error
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        if self.error:
+            raise self.error
+        return [[float(len(text))] for text in texts]
+
+
+def test_concurrent_texts_share_one_request():
+    batcher = EmbeddingBatcher(window_ms=5000, max_size=4)
+    embed_many = Recorder()
+    texts = ['a', 'bb', 'ccc', 'dddd']
+
+    results, errors = _embed_concurrently(texts, lambda text: batcher.embed('model', text, embed_many))
+
+    assert errors == {}
+    assert results == {text: [float(len(text))] for text in texts}
+    assert len(embed_many.batches) == 1
+    assert sorted(embed_many.batches[0]) == texts
+
+
+def test_full_batches_are_sent_without_waiting_for_the_window():
+    batcher = EmbeddingBatcher(window_ms=200, max_size=2)
+    embed_many = Recorder()
+    texts = [str(n) * n for n in range(1, 6)]
+
+    results, _ = _embed_concurrently(texts, lambda text: batcher.embed('m', text, embed_many))
+
+    assert len(results) == 5
+    assert all(len(batch) <= 2 for batch in embed_many.batches)
+    assert sum(len(batch) for batch in embed_many.batches) == 5
+
+
+def test_a_failed_request_fails_every_caller_in_it():
+    batcher = EmbeddingBatcher(window_ms=5000, max_size=3)
+    embed_many = Recorder(error=ConnectionError('reset'))
+
+    results, errors = _embed_concurrently(['a', 'b', 'c'], lambda text: batcher.embed('m', text, embed_many))
+
+    assert results == {}
+    assert all(isinstance(error, ConnectionError) for error in errors.values()) and len(errors) == 3
+
+
+def test_short_responses_are_errors():
+    batcher = EmbeddingBatcher(window_ms=0)
+
+    with pytest.raises(ValueError, match='Expected 1 embeddings'):
+        batcher.embed('m', 'a', lambda texts: [])
+
+
+def test_generate_embedding_batches_concurrent_questions(offline, settings):
+    settings.EMBEDDING_BATCH_WINDOW_MS = 5000
+    settings.EMBEDDING_BATCH_MAX_SIZE = 4
+    service = AIService()
+    questions = [f'What is question {n} about?' for n in range(4)]
+
+    results, errors = _embed_concurrently(questions, service.generate_embedding)
+
+    assert errors == {}
+    assert len({tuple(vector) for vector in results.values()}) == 4
+    assert offline.calls['openai.embedding'] == 1
@@ -0,0 +1,120 @@
+import pytest
+
+from apps.core.services import message_journal
+from apps.core.services.message_journal import MessageJournal
+from apps.core.services.supabase_service import SupabaseService
+
+
+class Rejected(Exception):
+    """A row the database refuses, e.g. a foreign key violation."""
+
+
+@pytest.fixture
+def journal(offline, tmp_path):
+    return MessageJournal(str(tmp_path / 'journal.sqlite3'), batch_size=100, max_attempts=2)
+
+
+@pytest.fixture
+def supabase(offline, monkeypatch):
+    """The fake Supabase, refusing any row of the ``deleted`` conversation."""
+    upsert_records = SupabaseService.upsert_records.__func__
+    update_record = SupabaseService.update_record.__func__
+
+    def upsert(cls, table, records, **kwargs):
+        if any(record.get('conversation_id') == 'deleted' for record in records):
+            raise Rejected('violates foreign key constraint')
+        return upsert_records(cls, table, records, **kwargs)
+
+    def update(cls, table, record_id, data):
+        if record_id == 'deleted':
+            raise Rejected('conversation is gone')
+        return update_record(cls, table, record_id, data)
+
+    monkeypatch.setattr(SupabaseService, 'upsert_records', classmethod(upsert))
+    monkeypatch.setattr(SupabaseService, 'update_record', classmethod(update))
+    monkeypatch.setattr(message_journal.random, 'uniform', lambda low, high: high)
+    return offline.supabase
+
+
+def _message(journal, conversation_id, content):
+    return journal.insert('messages', {'conversation_id': conversation_id, 'role': 'user', 'content': content},
+                          scope=conversation_id)
+
+
+def _stored(supabase):
+    return sorted(row['content'] for row in supabase.tables.get('messages', []))
+
+
+def _entries(journal):
+    return journal._connection().execute('SELECT scope, attempts, dead FROM journal ORDER BY seq').fetchall()
+
+
+def test_one_bad_row_does_not_hold_back_other_conversations(journal, supabase):
+    for index in range(6):
+        _message(journal, f'conversation-{index}', f'hello {index}')
+    _message(journal, 'deleted', 'lost')
+    _message(journal, 'conversation-9', 'after')
+
+    assert journal.flush() == 7
+
+    assert _stored(supabase) == ['after'] + [f'hello {index}' for index in range(6)]
+    assert [tuple(row) for row in _entries(journal)] == [('deleted', 1, 0)]
+
+
+def test_only_the_bad_row_is_given_up_on(journal, supabase, monkeypatch):
+    _message(journal, 'deleted', 'lost')
+    _message(journal, 'conversation-1', 'kept')
+    journal.flush()
+
+    monkeypatch.setattr(message_journal.time, 'time', lambda: 10 ** 10)
+    journal.flush()
+
+    assert _stored(supabase) == ['kept']
+    assert [tuple(row) for row in _entries(journal)] == [('deleted', 2, 1)]
+    assert journal.depth() == 0
+
+
+def test_later_writes_of_a_scope_wait_for_its_failed_entry(journal, supabase, monkeypatch):
+    conversation = supabase.seed('conversations', [{'title': 'Cells'}])[0]
+    journal.update('conversations', 'deleted', {'title': 'Gone'}, scope='shared')
+    journal.update('conversations', conversation['id'], {'title': 'Renamed'}, scope='shared')
+    _message(journal, 'conversation-1', 'unrelated')
+
+    assert journal.flush() == 1
+    assert supabase.tables['conversations'][0]['title'] == 'Cells'
+    # Still held back once released, while the failed entry backs off
+    assert journal.flush() == 0
+
+    # Once the failed entry is given up on, the scope moves on
+    monkeypatch.setattr(message_journal.time, 'time', lambda: 10 ** 10)
+    journal.flush()
+    assert journal.flush() == 1
+    assert supabase.tables['conversations'][0]['title'] == 'Renamed'
+
+
+def test_an_outage_backs_off_the_batch_without_splitting_it(journal, supabase, monkeypatch):
+    calls = []
+
+    def unreachable(cls, table, records, **kwargs):
+        calls.append(len(records))
+        raise ConnectionError('connection refused')
+
+    monkeypatch.setattr(SupabaseService, 'upsert_records', classmethod(unreachable))
+    for index in range(4):
+        _message(journal, f'conversation-{index}', f'hello {index}')
+
+    assert journal.flush() == 0
+
+    assert calls == [4]
+    assert {tuple(row)[1:] for row in _entries(journal)} == {(1, 0)}
+
+
+def test_discard_drops_a_conversations_queued_writes(journal, supabase):
+    _message(journal, 'deleted', 'lost')
+    journal.update('conversations', 'deleted', {'title': 'Gone'}, scope='deleted')
+    _message(journal, 'conversation-1', 'kept')
+
+    assert journal.discard('deleted') == 2
+
+    assert journal.flush() == 1
+    assert _stored(supabase) == ['kept']
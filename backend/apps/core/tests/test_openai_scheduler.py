@@ -0,0 +1,94 @@
+import jwt
+import pytest
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apps.auth.authentication import SupabaseAuthentication
+from apps.core.exceptions import RateLimitExceeded
+from apps.core.openai_scheduler import (
+    BATCH, INTERACTIVE, OpenAIScheduler, OpenAISchedulingMiddleware, _Waiter, current_work, scheduling
+)
+
+
+def _scheduler(**kwargs):
+    options = {
+        'tokens_per_minute': 1000,
+        'interactive_reserve': 0.2,
+        'max_wait': {INTERACTIVE: 0.05, BATCH: 0.05},
+    }
+    options.update(kwargs)
+    return OpenAIScheduler(**options)
+
+
+def test_batch_calls_leave_the_interactive_reserve():
+    scheduler = _scheduler()
+
+    with scheduling(BATCH):
+        scheduler.acquire(700)
+        with pytest.raises(RateLimitExceeded):
+            scheduler.acquire(200)
+    with scheduling(INTERACTIVE, 'student'):
+        scheduler.acquire(200)
+
+
+def test_full_queue_is_shed_immediately():
+    scheduler = _scheduler(max_queue={INTERACTIVE: 0, BATCH: 0})
+
+    with scheduling(INTERACTIVE, 'student'), pytest.raises(RateLimitExceeded):
+        scheduler.acquire(10)
+
+
+def test_unused_tokens_are_refunded():
+    scheduler = _scheduler()
+
+    with scheduling(INTERACTIVE, 'student'):
+        with scheduler.slot(900) as slot:
+            slot.used = 100
+        scheduler.acquire(800)
+
+
+def test_waiters_are_admitted_by_priority_then_least_usage():
+    scheduler = _scheduler()
+    scheduler._usage = {'heavy': 5000, 'light': 10}
+    scheduler._waiting = [
+        _Waiter(BATCH, 'idle', 1),
+        _Waiter(INTERACTIVE, 'heavy', 2),
+        _Waiter(INTERACTIVE, 'light', 3),
+    ]
+
+    assert scheduler._head().user == 'light'
+    scheduler._waiting.pop()
+    assert scheduler._head().user == 'heavy'
+
+
+def test_requests_are_charged_to_the_authenticated_user(offline, rf, settings):
+    # Without a JWT secret the token is checked with the (fake) GoTrue
+    settings.SUPABASE_JWT_SECRET = ''
+    token = jwt.encode({'sub': 'user-1'}, 'x' * 32, algorithm='HS256')
+    offline.supabase.add_user(token, user_id='user-1')
+    seen = []
+
+    class View(APIView):
+        authentication_classes = [SupabaseAuthentication]
+
+        def get(self, request):
+            seen.append(current_work())
+            return Response()
+
+    request = rf.get('/', HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_X_USER_ID='someone-else')
+    OpenAISchedulingMiddleware(View.as_view())(request)
+    OpenAISchedulingMiddleware(View.as_view())(rf.get('/'))
+
+    assert seen == [(INTERACTIVE, 'user-1'), (INTERACTIVE, None)]
+    assert current_work() == (BATCH, None)
+
+
+def test_authentication_does_not_change_scheduling(offline, rf, settings):
+    settings.SUPABASE_JWT_SECRET = ''
+    token = jwt.encode({'sub': 'user-1'}, 'x' * 32, algorithm='HS256')
+    offline.supabase.add_user(token, user_id='user-1')
+
+    user, _ = SupabaseAuthentication().authenticate(rf.get('/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+
+    assert user['id'] == 'user-1'
+    assert current_work() == (BATCH, None)
@@ -0,0 +1,50 @@
+import uuid
+
+import pytest
+
+from apps.core.pagination import cursor_for, decode_cursor, encode_cursor, parse_page_size
+from apps.core.services.supabase_service import postgrest_quote
+
+
+def test_cursors_round_trip():
+    record_id = str(uuid.uuid4())
+    cursor = cursor_for({'created_at': '2026-10-19T10:00:00.5+00:00', 'id': record_id})
+
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == ('2026-10-19T10:00:00.5+00:00', record_id)
+
+
+def test_cursor_ids_are_normalized():
+    record_id = uuid.uuid4()
+
+    assert decode_cursor(encode_cursor('2026-10-19', record_id.hex.upper()))[1] == str(record_id)
+
+
+@pytest.mark.parametrize('created_at, record_id', [
+    ('yesterday', str(uuid.uuid4())),
+    ('2026-10-19T10:00:00,id.gt.0', str(uuid.uuid4())),
+    ('2026-10-19', 'abc'),
+    (None, str(uuid.uuid4())),
+])
+def test_cursors_must_hold_a_timestamp_and_a_uuid(created_at, record_id):
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(created_at, record_id))
+
+
+def test_garbage_cursors_are_rejected():
+    for cursor in ('', '!!!', 'e30'):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+def test_postgrest_values_are_quoted_and_escaped():
+    assert postgrest_quote('2026-10-19T10:00:00+00:00') == '"2026-10-19T10:00:00+00:00"'
+    assert postgrest_quote('a"b\\c') == '"a\\"b\\\\c"'
+
+
+def test_page_sizes_are_validated_and_clamped():
+    assert parse_page_size(None) == 50
+    assert parse_page_size('500') == 200
+    for value in ('0', 'ten'):
+        with pytest.raises(ValueError):
+            parse_page_size(value)
@@ -0,0 +1,171 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+from apps.core.exceptions import CircuitOpenError, DeadlineExceeded, UpstreamUnavailable
+from apps.core.resilience import CLOSED, HALF_OPEN, OPEN, Upstream
+
+_names = itertools.count()
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+
+
+@pytest.fixture
+def upstream(settings):
+    settings.TEST_DEADLINE_SECONDS = 1.0
+    settings.TEST_RETRIES = 0
+    settings.RESILIENCE_WORKERS = 4
+    settings.RESILIENCE_RETRY_BASE_SECONDS = 0.001
+    settings.RESILIENCE_BREAKER_FAILURES = 3
+    settings.RESILIENCE_BREAKER_RESET_SECONDS = 0.1
+    return Upstream(f'test.{next(_names)}', 'TEST_DEADLINE_SECONDS', 'TEST_RETRIES')
+
+
+def _fail(exc):
+    def call():
+        raise exc
+    return call
+
+
+def test_transient_failures_are_retried(upstream, settings):
+    settings.TEST_RETRIES = 2
+    outcomes = iter([ConnectionError('reset'), StatusError(503), 'ok'])
+
+    def flaky():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert upstream.call(flaky) == 'ok'
+    assert upstream.breaker.state == CLOSED
+
+
+def test_breaker_opens_after_consecutive_failures_and_closes_after_a_probe(upstream):
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            upstream.call(_fail(ConnectionError('down')))
+    assert upstream.breaker.state == OPEN
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        upstream.call(lambda: calls.append(1))
+    assert calls == []
+
+    time.sleep(0.15)
+    assert upstream.call(lambda: 'probe') == 'probe'
+    assert upstream.breaker.state == CLOSED
+
+
+def test_failed_probe_reopens_the_breaker(upstream):
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            upstream.call(_fail(ConnectionError('down')))
+    time.sleep(0.15)
+
+    with pytest.raises(ConnectionError):
+        upstream.call(_fail(ConnectionError('still down')))
+    assert upstream.breaker.state == OPEN
+
+
+def test_throttling_and_client_errors_do_not_open_the_breaker(upstream):
+    for exc in [StatusError(429)] * 5 + [StatusError(400)] * 5:
+        with pytest.raises(StatusError):
+            upstream.call(_fail(exc))
+    assert upstream.breaker.state == CLOSED
+    assert upstream.breaker.failures == 0
+
+
+def test_deadline_abandons_a_slow_attempt(upstream, settings):
+    settings.TEST_DEADLINE_SECONDS = 0.1
+    release = threading.Event()
+    started = time.monotonic()
+
+    with pytest.raises(DeadlineExceeded):
+        upstream.call(release.wait, 5)
+    assert time.monotonic() - started < 1
+    release.set()
+
+
+def test_saturated_pool_fails_fast_without_opening_the_breaker(upstream, settings):
+    settings.TEST_DEADLINE_SECONDS = 0.1
+    settings.RESILIENCE_WORKERS = 1
+    release = threading.Event()
+    with pytest.raises(DeadlineExceeded):
+        upstream.call(release.wait, 5)
+
+    # The straggler still holds the only worker: time queued is not charged to the upstream
+    with pytest.raises(UpstreamUnavailable) as error:
+        upstream.call(lambda: 'queued')
+    assert not isinstance(error.value, DeadlineExceeded)
+    assert upstream.breaker.failures == 1
+
+    release.set()
+    assert upstream.call(lambda: 'ok') == 'ok'
+
+
+def test_half_open_lets_one_probe_through(upstream):
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            upstream.call(_fail(ConnectionError('down')))
+    time.sleep(0.15)
+    upstream.breaker.before_call()
+    assert upstream.breaker.state == HALF_OPEN
+
+    with pytest.raises(CircuitOpenError):
+        upstream.call(lambda: 'second probe')
+
+
+def test_hedged_read_returns_the_faster_duplicate(upstream, settings):
+    settings.RESILIENCE_HEDGE_MIN_SECONDS = 0.01
+    upstream.hedge = True
+    for _ in range(20):
+        upstream.call(lambda: None)
+    first = threading.Event()
+    release = threading.Event()
+
+    def read():
+        if not first.is_set():
+            first.set()
+            release.wait(5)
+            return 'slow'
+        return 'hedge'
+
+    assert upstream.call(read) == 'hedge'
+    release.set()
+
+
+def test_pinecone_upserts_are_retried(offline, upstream, settings, monkeypatch):
+    from apps.core.fakes import FakeIndex
+    from apps.core.services.pinecone_service import PineconeService
+
+    settings.PINECONE_WRITE_RETRIES = 2
+    upsert = FakeIndex.upsert
+    failures = iter([ConnectionError('reset')])
+
+    def flaky(self, *args, **kwargs):
+        for error in failures:
+            raise error
+        return upsert(self, *args, **kwargs)
+
+    monkeypatch.setattr(FakeIndex, 'upsert', flaky)
+    vectors = [{'id': 'chunk-1', 'values': [0.1] * 1536, 'metadata': {}}]
+
+    assert PineconeService().upsert_vectors(vectors) is True
+    assert offline.calls['pinecone.upsert'] == 1
+
+
+def test_embeddings_are_abandoned_at_their_deadline(offline, upstream, settings):
+    from apps.core.services.ai_service import AIService
+
+    settings.OPENAI_EMBEDDING_DEADLINE_SECONDS = 0.05
+    offline.latency.seconds['embedding'] = 0.5
+
+    with pytest.raises(DeadlineExceeded):
+        AIService().generate_embeddings(['photosynthesis'])
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+import pytest
+
+from apps.core import singleflight
+from apps.core.singleflight import SingleFlight, flight_key
+
+
+def _run_concurrently(count, target):
+    results, errors = [None] * count, [None] * count
+
+    def run(index):
+        try:
+            results[index] = target()
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def call():
+        calls.append(1)
+        release.wait(5)
+        return {'answer': 42}
+
+    threading.Timer(0.1, release.set).start()
+    results, errors = _run_concurrently(8, lambda: flights.do('completion', ['same  prompt'], call))
+
+    assert len(calls) == 1
+    assert results == [{'answer': 42}] * 8
+    assert errors == [None] * 8
+
+
+def test_keys_ignore_whitespace_but_not_content():
+    assert flight_key('completion', ['a  b\n']) == flight_key('completion', ['a b'])
+    assert flight_key('completion', ['a b']) != flight_key('completion', ['a c'])
+
+
+def test_failure_reaches_every_caller_and_is_not_kept():
+    flights = SingleFlight()
+    release = threading.Event()
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        release.wait(5)
+        raise ValueError('upstream failed')
+
+    threading.Timer(0.1, release.set).start()
+    _, errors = _run_concurrently(4, lambda: flights.do('embedding', ['text'], failing))
+
+    assert len(attempts) == 1
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flights.do('embedding', ['text'], lambda: 'fresh') == 'fresh'
+
+
+def test_other_process_collects_the_published_result(tmp_path):
+    path = str(tmp_path / 'flights.sqlite3')
+    leader, poller = SingleFlight(path), SingleFlight(path, poll_seconds=0.01)
+    claimed, release = threading.Event(), threading.Event()
+    polled = []
+
+    def lead():
+        claimed.set()
+        release.wait(5)
+        return ['shared']
+
+    thread = threading.Thread(target=leader.do, args=('completion', ['prompt'], lead))
+    thread.start()
+    claimed.wait(5)
+    threading.Timer(0.1, release.set).start()
+    result = poller.do('completion', ['prompt'], lambda: polled.append(1) or ['own'])
+    thread.join(5)
+
+    assert result == ['shared']
+    assert polled == []
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs a pid that is known to be dead')
+def test_claim_of_a_dead_process_is_taken_over(tmp_path):
+    path = str(tmp_path / 'flights.sqlite3')
+    flights = SingleFlight(path, wait_seconds=60)
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    flights._connection().execute(
+        'INSERT INTO flights (key, owner, host, pid, started_at) VALUES (?, ?, ?, ?, ?)',
+        (flight_key('completion', ['prompt']), 'gone', flights.host, pid, time.time())
+    )
+
+    assert flights.do('completion', ['prompt'], lambda: 'ran') == 'ran'
+
+
+def test_results_are_published_only_for_waiting_processes(tmp_path, monkeypatch):
+    flights = SingleFlight(str(tmp_path / 'flights.sqlite3'))
+    vector = [0.1] * 1536
+    dumps = singleflight.json.dumps
+    serialized = []
+    monkeypatch.setattr(singleflight.json, 'dumps', lambda value, **kwargs: serialized.append(value) or dumps(value, **kwargs))
+
+    assert flights.do('embedding', ['text'], lambda: vector) == vector
+
+    assert vector not in serialized
+
+    assert flights._connection().execute('SELECT COUNT(*) FROM flights').fetchone()[0] == 0
+
+
+def test_the_shared_store_is_off_by_default(settings):
+    SingleFlight._instance = None
+    try:
+        assert SingleFlight.get().path == ''
+    finally:
+        SingleFlight._instance = None
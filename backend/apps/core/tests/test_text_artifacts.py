@@ -0,0 +1,96 @@
+import pytest
+
+from apps.core.services import text_artifacts
+from apps.core.services.supabase_service import SupabaseService
+from apps.core.services.text_artifacts import PAGE_WINDOW, TextArtifactStore, decode_pages, encode_pages
+
+PAGES = [(number, f'page {number} ' * 20) for number in range(1, 101)]
+
+
+@pytest.fixture
+def store(offline):
+    return TextArtifactStore()
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """Keys of artifacts downloaded from storage."""
+    keys = []
+    download_file = SupabaseService.download_file.__func__
+
+    def download(cls, bucket, path):
+        keys.append(path)
+        return download_file(cls, bucket, path)
+
+    monkeypatch.setattr(SupabaseService, 'download_file', classmethod(download))
+    return keys
+
+
+def _stored(store, key, pages=PAGES):
+    """An artifact in storage that this store has not read yet."""
+    TextArtifactStore().save(key, pages)
+    return key
+
+
+@pytest.mark.parametrize('key', ['books/a.jsonl.gz', 'books/a.jsonl.zst'])
+def test_pages_round_trip_through_both_codecs(key):
+    if key.endswith('.zst') and text_artifacts.zstandard is None:
+        pytest.skip('zstandard is not installed')
+    assert decode_pages(encode_pages(PAGES, key), key) == PAGES
+
+
+def test_a_page_is_read_without_caching_the_whole_book(store, downloads):
+    key = _stored(store, 'books/a.jsonl.gz')
+
+    assert store.page(key, 50) == PAGES[49][1]
+
+    assert downloads == [key]
+    cached = {entry[1] for entry in store._cache}
+    assert cached == set(range(50 - PAGE_WINDOW, 50 + PAGE_WINDOW + 1))
+
+
+def test_neighbouring_pages_are_served_from_the_cache(store, downloads):
+    key = _stored(store, 'books/a.jsonl.gz')
+    store.page(key, 50)
+
+    assert store.page_range(key, 45, 55) == PAGES[44:55]
+    assert downloads == [key]
+
+    store.page(key, 90)
+    assert downloads == [key, key]
+
+
+def test_missing_pages_are_none(store, downloads):
+    key = _stored(store, 'books/a.jsonl.gz')
+
+    assert store.page(key, 500) is None
+    assert store.page_range(key, 99, 120) == PAGES[98:]
+
+
+def test_whole_artifacts_also_serve_single_pages(store, downloads):
+    key = _stored(store, 'books/a.jsonl.gz')
+
+    assert store.pages(key) == PAGES
+    assert store.page(key, 3) == PAGES[2][1]
+    assert downloads == [key]
+
+
+def test_saving_replaces_cached_pages(store):
+    key = store.save('books/a.jsonl.gz', PAGES)
+    store.clear()
+    store.page(key, 1)
+
+    store.save(key, [(1, 'revised')])
+
+    assert store.page(key, 1) == 'revised'
+    assert store.page(key, 2) is None
+
+
+def test_the_cache_stays_within_its_budget(offline, downloads):
+    store = TextArtifactStore(max_cached_chars=len(PAGES[0][1]) * 5)
+    key = _stored(store, 'books/a.jsonl.gz')
+
+    store.page(key, 50)
+
+    assert store._cached_chars <= store.max_cached_chars
+    assert (key, 50) in store._cache
@@ -0,0 +1,37 @@
+import logging
+
+import pytest
+from django.http import HttpResponse
+
+from apps.core.tracing import TracingMiddleware
+
+
+@pytest.fixture
+def middleware(settings):
+    settings.TRACING_ENABLED = True
+    settings.TRACE_LOG_MIN_MS = 0
+    return TracingMiddleware(lambda request: HttpResponse('ok'))
+
+
+def test_plain_request_ids_are_kept(middleware, rf):
+    response = middleware(rf.get('/', HTTP_X_REQUEST_ID='req-42.a_b'))
+
+    assert response['X-Request-ID'] == 'req-42.a_b'
+    assert 'total;dur=' in response['Server-Timing']
+
+
+@pytest.mark.parametrize('incoming', ['', 'a' * 129, 'id with spaces', 'id"\\n{}'])
+def test_other_request_ids_are_replaced(middleware, rf, incoming):
+    response = middleware(rf.get('/', HTTP_X_REQUEST_ID=incoming))
+
+    assert response['X-Request-ID'] != incoming
+    assert len(response['X-Request-ID']) == 32
+
+
+def test_fast_requests_are_not_logged(middleware, rf, settings, caplog):
+    settings.TRACE_LOG_MIN_MS = 500
+
+    with caplog.at_level(logging.INFO, logger='apps.core.tracing'):
+        middleware(rf.get('/'))
+
+    assert caplog.records == []
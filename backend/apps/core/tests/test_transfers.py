@@ -0,0 +1,116 @@
+import hashlib
+
+import pytest
+import requests
+
+from apps.core.fakes import FakeStorage
+from apps.core.services import downloads, supabase_service
+from apps.core.services.downloads import download_to_file
+from apps.core.services.supabase_service import SupabaseService
+
+BODY = bytes(range(256)) * 1024
+
+
+@pytest.fixture
+def transfers(offline, settings, tmp_path, monkeypatch):
+    """Storage requests as (method, headers); transfers do not sleep between attempts."""
+    settings.UPLOAD_SPOOL_DIR = str(tmp_path / 'spool')
+    settings.STORAGE_RESUMABLE_THRESHOLD = 1024
+    settings.STORAGE_RESUMABLE_CHUNK_SIZE = 64 * 1024
+    monkeypatch.setattr(downloads.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(supabase_service.time, 'sleep', lambda seconds: None)
+    requests_seen = []
+    http = FakeStorage.http
+
+    def recording(self, method, url, data=None, headers=None, **kwargs):
+        requests_seen.append((method, dict(headers or {})))
+        return http(self, method, url, data=data, headers=headers, **kwargs)
+
+    monkeypatch.setattr(FakeStorage, 'http', recording)
+    return requests_seen
+
+
+def _drop_first_get_after(monkeypatch, received: int, honour_range=True):
+    """The first GET breaks after ``received`` bytes; with ``honour_range`` off, Range is ignored."""
+    http = FakeStorage.http
+    dropped = []
+
+    def flaky(self, method, url, data=None, headers=None, **kwargs):
+        if not honour_range:
+            headers = {key: value for key, value in (headers or {}).items() if key != 'Range'}
+        response = http(self, method, url, data=data, headers=headers, **kwargs)
+        if method != 'GET' or dropped:
+            return response
+        dropped.append(1)
+        chunks = response.iter_content
+
+        def broken(chunk_size=65536):
+            sent = 0
+            for chunk in chunks(chunk_size):
+                if sent >= received:
+                    raise requests.exceptions.ChunkedEncodingError('connection reset')
+                sent += len(chunk)
+                yield chunk
+
+        response.iter_content = broken
+        return response
+
+    monkeypatch.setattr(FakeStorage, 'http', flaky)
+
+
+def test_download_resumes_from_the_last_byte(offline, transfers, monkeypatch):
+    offline.supabase.storage.put('books', 'algebra.pdf', BODY)
+    _drop_first_get_after(monkeypatch, 128 * 1024)
+
+    download = download_to_file(offline.supabase.storage.public_url('books', 'algebra.pdf'))
+
+    assert [headers.get('Range') for method, headers in transfers] == [None, f'bytes={128 * 1024}-']
+    with open(download.path, 'rb') as fh:
+        assert fh.read() == BODY
+    assert download.content_hash == hashlib.sha256(BODY).hexdigest()
+    download.remove()
+
+
+def test_download_restarts_when_range_is_ignored(offline, transfers, monkeypatch):
+    offline.supabase.storage.put('books', 'algebra.pdf', BODY)
+    _drop_first_get_after(monkeypatch, 128 * 1024, honour_range=False)
+
+    download = download_to_file(offline.supabase.storage.public_url('books', 'algebra.pdf'))
+
+    assert download.size == len(BODY)
+    assert download.content_hash == hashlib.sha256(BODY).hexdigest()
+    download.remove()
+
+
+def test_resumable_upload_continues_from_the_acknowledged_offset(offline, transfers, tmp_path, monkeypatch):
+    path = tmp_path / 'algebra.pdf'
+    path.write_bytes(BODY)
+    http = FakeStorage.http
+    failed = []
+
+    def flaky(self, method, url, data=None, headers=None, **kwargs):
+        if method == 'PATCH' and headers['Upload-Offset'] == str(64 * 1024) and not failed:
+            # The server kept half of the chunk before the connection dropped
+            failed.append(1)
+            http(self, method, url, data=data[:32 * 1024], headers=headers, **kwargs)
+            raise requests.exceptions.ConnectionError('connection reset')
+        return http(self, method, url, data=data, headers=headers, **kwargs)
+
+    monkeypatch.setattr(FakeStorage, 'http', flaky)
+
+    SupabaseService.upload_path('books', 'algebra.pdf', str(path), 'application/pdf')
+
+    patches = [headers['Upload-Offset'] for method, headers in transfers if method == 'PATCH']
+    assert patches == ['0', str(64 * 1024), str(96 * 1024), str(160 * 1024), str(224 * 1024)]
+    assert 'HEAD' in [method for method, _ in transfers]
+    assert offline.supabase.storage.objects[('books', 'algebra.pdf')] == BODY
+
+
+def test_small_files_are_uploaded_in_one_request(offline, transfers, tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_bytes(b'short')
+
+    SupabaseService.upload_path('documents', 'notes.txt', str(path), 'text/plain')
+
+    assert [method for method, _ in transfers] == ['POST']
+    assert offline.supabase.storage.objects[('documents', 'notes.txt')] == b'short'
@@ -0,0 +1,263 @@
+"""
+Per-request tracing of service calls.
+
+``TracingMiddleware`` opens a trace for each request; service methods
+decorated with ``traced`` record nested spans with their duration, selected
+arguments, result sizes and any attributes added with ``set_attributes``
+(token counts, payload bytes). When the response is ready the spans are
+summed per service into a ``Server-Timing`` header and logged as one JSON
+line on the ``apps.core.tracing`` logger.
+
+Spans are tracked with context variables, so concurrent requests do not
+mix. Work handed to other threads is not part of the request's trace.
+
+Set ``OTEL_EXPORTER_OTLP_ENDPOINT`` (e.g. ``http://localhost:4318``) to also
+export spans to an OpenTelemetry collector over OTLP/HTTP; this needs the
+``opentelemetry-sdk`` and ``opentelemetry-exporter-otlp-proto-http``
+packages.
+"""
+import functools
+import inspect
+import json
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from django.conf import settings
+
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+# Incoming X-Request-ID values are echoed in headers and logs, so only plain ids are kept
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._-]{1,128}')
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+_tracer = None
+# Called with every finished span, traced request or not (see apps.core.metrics)
+_listeners: List[Callable[['Span'], None]] = []
+
+
+class Span:
+    """One timed operation; children are the operations it called."""
+
+    __slots__ = ('name', 'attributes', 'children', 'started', 'duration_ms', 'error')
+
+    def __init__(self, name: str, attributes: Dict[str, Any] = None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.children: List['Span'] = []
+        self.started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+
+    def walk(self):
+        """This span and all descendants, depth first."""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self) -> Dict:
+        record = {'name': self.name, 'ms': round(self.duration_ms or 0.0, 2)}
+        if self.attributes:
+            record['attributes'] = self.attributes
+        if self.error:
+            record['error'] = self.error
+        if self.children:
+            record['children'] = [child.to_dict() for child in self.children]
+        return record
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time the enclosed block as a child of the current span.
+
+    Outside a traced request the span is measured but not recorded, except
+    by OpenTelemetry when it is configured.
+    """
+    parent = _current_span.get()
+    current = Span(name, attributes)
+    if parent is not None:
+        parent.children.append(current)
+    token = _current_span.set(current)
+    otel_span = otel_scope = None
+    if _tracer is not None:
+        # Made current so spans opened inside nest under it in the collector too
+        otel_span = _tracer.start_span(name)
+        otel_scope = otel_trace.use_span(otel_span, end_on_exit=False)
+        otel_scope.__enter__()
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        if otel_span is not None:
+            otel_span.record_exception(e)
+            otel_span.set_status(Status(StatusCode.ERROR, str(e)))
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+        for listener in _listeners:
+            try:
+                listener(current)
+            except Exception as e:
+                logger.warning(f"Span listener {listener.__qualname__} failed: {e}")
+        if otel_span is not None:
+            otel_scope.__exit__(None, None, None)
+            for key, value in current.attributes.items():
+                if isinstance(value, (str, bool, int, float)):
+                    otel_span.set_attribute(key, value)
+            otel_span.end()
+
+
+def add_span_listener(listener: Callable[['Span'], None]):
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def set_attributes(**attributes):
+    """Add attributes (token counts, payload sizes...) to the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def _result_size(result) -> Dict[str, int]:
+    if isinstance(result, (bytes, bytearray)):
+        return {'bytes': len(result)}
+    if isinstance(result, (list, tuple, dict)):
+        return {'items': len(result)}
+    return {}
+
+
+def traced(name: str, capture: Sequence[str] = ()):
+    """
+    Record each call of the decorated function as a span named ``name``.
+
+    ``capture`` names arguments to record as attributes (e.g. ``'table'``);
+    the size of list, dict and bytes results is recorded too. Apply below
+    ``@classmethod``/``@staticmethod``.
+    """
+    def decorator(fn: Callable):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            attributes = {}
+            if capture:
+                try:
+                    bound = signature.bind_partial(*args, **kwargs)
+                except TypeError:
+                    bound = None
+                if bound is not None:
+                    for argument in capture:
+                        value = bound.arguments.get(argument)
+                        if value is not None:
+                            attributes[argument] = value if isinstance(value, (str, int, float, bool)) else str(value)
+            with span(name, **attributes) as current:
+                result = fn(*args, **kwargs)
+                current.attributes.update(_result_size(result))
+                return result
+
+        return wrapper
+    return decorator
+
+
+def server_timing(root: Span) -> str:
+    """
+    ``Server-Timing`` value summing spans per service (the name's first segment).
+
+    Only the outermost span of each service is counted, so nested calls
+    within one service are not double counted.
+    """
+    totals: Dict[str, List[float]] = {}
+
+    def visit(node: Span, open_services: frozenset):
+        service = node.name.split('.', 1)[0]
+        if node is not root and service not in open_services:
+            entry = totals.setdefault(service, [0.0, 0])
+            entry[0] += node.duration_ms or 0.0
+            entry[1] += 1
+            open_services = open_services | {service}
+        for child in node.children:
+            visit(child, open_services)
+
+    visit(root, frozenset())
+    parts = [
+        f'{service};dur={duration:.1f};desc="{count} call{"s" if count != 1 else ""}"'
+        for service, (duration, count) in sorted(totals.items(), key=lambda item: -item[1][0])
+    ]
+    parts.append(f'total;dur={root.duration_ms or 0.0:.1f}')
+    return ', '.join(parts)
+
+
+def request_id(request) -> str:
+    """The caller's ``X-Request-ID`` when it is a plain id, otherwise a new one."""
+    incoming = request.headers.get('X-Request-ID', '')
+    return incoming if REQUEST_ID_PATTERN.fullmatch(incoming) else uuid.uuid4().hex
+
+
+class TracingMiddleware:
+    """Trace each request, add ``Server-Timing`` and log the span tree as JSON."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.TRACING_ENABLED:
+            return self.get_response(request)
+
+        trace_id = request_id(request)
+        with span('http.request', method=request.method, path=request.path) as root:
+            response = self.get_response(request)
+            root.attributes['status'] = response.status_code
+            match = getattr(request, 'resolver_match', None)
+            if match is not None and match.route:
+                root.attributes['route'] = match.route
+
+        response['Server-Timing'] = server_timing(root)
+        response['X-Request-ID'] = trace_id
+        if root.duration_ms >= settings.TRACE_LOG_MIN_MS:
+            logger.info(json.dumps({'trace_id': trace_id, **root.to_dict()}, default=str))
+        return response
+
+
+def configure_opentelemetry():
+    """Export spans to ``OTEL_EXPORTER_OTLP_ENDPOINT`` when set and the SDK is installed."""
+    global _tracer
+    endpoint = settings.OTEL_EXPORTER_OTLP_ENDPOINT
+    if not endpoint or _tracer is not None:
+        return
+    if otel_trace is None:
+        logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry is not installed")
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        logger.warning(f"OpenTelemetry export disabled: {e}")
+        return
+
+    provider = TracerProvider(resource=Resource.create({'service.name': settings.OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=f"{endpoint.rstrip('/')}/v1/traces")))
+    otel_trace.set_tracer_provider(provider)
+    _tracer = otel_trace.get_tracer('apps.core.tracing')
+    logger.info(f"Exporting traces to {endpoint}")
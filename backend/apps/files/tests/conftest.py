@@ -0,0 +1,34 @@
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.test import APIClient
+
+CONTENT = ('Photosynthesis turns light into chemical energy. ' * 40).encode('utf-8')
+
+
+@pytest.fixture
+def content():
+    return CONTENT
+
+
+@pytest.fixture
+def conversation(offline, inline_background, settings, tmp_path):
+    settings.UPLOAD_SPOOL_DIR = str(tmp_path / 'spool')
+    settings.UPLOAD_STORE_RETRY_SECONDS = 0
+    return offline.supabase.seed('conversations', [{'title': 'Biology'}])[0]
+
+
+@pytest.fixture
+def upload(conversation):
+    """POST a text file to the conversation, as the frontend does."""
+    def post(content=CONTENT, name='notes.txt', content_type='text/plain'):
+        return APIClient().post('/api/v1/documents/', {
+            'file': SimpleUploadedFile(name, content, content_type=content_type),
+            'conversation_id': conversation['id'],
+        }, format='multipart')
+    return post
+
+
+@pytest.fixture
+def stored_document(offline):
+    """The document row as currently stored."""
+    return lambda document_id: next(row for row in offline.supabase.tables['documents'] if row['id'] == document_id)
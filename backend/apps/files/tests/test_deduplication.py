@@ -0,0 +1,34 @@
+from apps.core.services.blob_store import AVAILABLE, UPLOAD_PENDING, UPLOAD_STORED, BlobStore
+
+
+def test_duplicate_uploads_reuse_the_stored_and_indexed_content(offline, upload):
+    first = upload()
+    calls = dict(offline.calls)
+
+    second = upload(name='copy.txt')
+
+    assert second.status_code == 201
+    assert second.data['content_hash'] == first.data['content_hash']
+    assert second.data['storage_path'] == first.data['storage_path']
+    assert second.data['upload_status'] == UPLOAD_STORED
+    assert offline.calls['supabase.storage_upload'] == calls['supabase.storage_upload']
+    assert offline.calls['openai.embedding'] == calls.get('openai.embedding', 0)
+    assert len(offline.supabase.tables['blobs']) == 1
+
+
+def test_duplicates_attach_to_a_pending_reservation(offline, upload, stored_document, content):
+    hasher = BlobStore.new_hasher()
+    hasher.update(content)
+    content_hash = hasher.hexdigest()
+    blob, owner = BlobStore.reserve(content_hash, BlobStore.storage_path(content_hash, 'txt'), len(content), 'text/plain')
+    assert owner
+
+    response = upload()
+
+    assert response.status_code == 201
+    assert stored_document(response.data['id'])['upload_status'] == UPLOAD_PENDING
+    assert offline.calls['supabase.storage_upload'] == 0
+    # The upload holding the reservation settles the documents that attached to it
+    BlobStore.finish(content_hash, blob['claim'], AVAILABLE)
+    BlobStore.set_documents_status(content_hash, UPLOAD_STORED)
+    assert stored_document(response.data['id'])['upload_status'] == UPLOAD_STORED
@@ -0,0 +1,48 @@
+from apps.core.services.blob_store import AVAILABLE, FAILED, UPLOAD_FAILED, UPLOAD_STORED, BlobStore
+from apps.core.services.supabase_service import SupabaseService
+from apps.core.services.text_artifacts import get_text_artifacts
+
+
+def test_new_content_is_stored_extracted_and_indexed(offline, upload, stored_document, content):
+    response = upload()
+
+    assert response.status_code == 201
+    assert response.data['extracted_text'].startswith('Photosynthesis')
+    document = stored_document(response.data['id'])
+    assert document['upload_status'] == UPLOAD_STORED
+    blob = BlobStore.get(document['content_hash'])
+    assert (blob['status'], blob['rag_indexed']) == (AVAILABLE, True)
+    assert offline.supabase.storage.objects[('educational-content', blob['storage_path'])] == content
+    assert ''.join(text for _, text in get_text_artifacts().pages(blob['text_artifact_key'])).strip()
+
+
+def test_failed_storage_marks_the_document_and_frees_the_reservation(upload, stored_document, settings, monkeypatch):
+    settings.UPLOAD_STORE_ATTEMPTS = 2
+    upload_path = SupabaseService.upload_path.__func__
+    attempts = []
+
+    def unavailable(cls, *args, **kwargs):
+        attempts.append(args)
+        raise ConnectionError('storage is down')
+
+    monkeypatch.setattr(SupabaseService, 'upload_path', classmethod(unavailable))
+    failed = upload()
+
+    assert len(attempts) == 2
+    assert stored_document(failed.data['id'])['upload_status'] == UPLOAD_FAILED
+    assert BlobStore.get(failed.data['content_hash'])['status'] == FAILED
+
+    # The next upload of the content takes the abandoned reservation over
+    monkeypatch.setattr(SupabaseService, 'upload_path', classmethod(upload_path))
+    retried = upload()
+    assert BlobStore.get(retried.data['content_hash'])['status'] == AVAILABLE
+    assert stored_document(failed.data['id'])['upload_status'] == UPLOAD_STORED
+
+
+def test_oversized_and_unsupported_uploads_are_refused(offline, upload, settings):
+    settings.DOCUMENT_UPLOAD_MAX_SIZE = 100
+    assert upload().status_code == 413
+
+    settings.DOCUMENT_UPLOAD_MAX_SIZE = 10 ** 6
+    assert upload(b'MZ', name='run.exe', content_type='application/octet-stream').status_code == 400
+    assert not offline.supabase.tables.get('documents')
@@ -0,0 +1,131 @@
+"""
+Upload handling for document uploads: size limits and content hashes
+computed while the body streams in, and spooling to disk so extraction and
+storage uploads never need the whole file in memory.
+"""
+import logging
+import os
+import time
+import uuid
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from apps.core.services.blob_store import BlobStore
+from apps.core.services.supabase_service import SupabaseService
+
+logger = logging.getLogger(__name__)
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """
+    Rejects files larger than ``DOCUMENT_UPLOAD_MAX_SIZE`` as soon as the limit
+    is crossed, instead of after the whole body has been written to disk.
+
+    Must be listed first in ``FILE_UPLOAD_HANDLERS`` so it sees every chunk.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.DOCUMENT_UPLOAD_MAX_SIZE:
+            self.request.upload_too_large = True
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+class ContentHashUploadHandler(FileUploadHandler):
+    """
+    Computes the SHA-256 of each uploaded file as its chunks stream past, so
+    deduplication needs no second read. Digests are stored on
+    ``request.upload_hashes`` keyed by form field name.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = BlobStore.new_hasher()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_hashes'):
+            self.request.upload_hashes = {}
+        self.request.upload_hashes[self.field_name] = self.hasher.hexdigest()
+        return None
+
+
+def upload_hash(request, field_name: str, file_obj) -> str:
+    """Digest recorded while the upload streamed in, or computed now as a fallback."""
+    digest = getattr(request, 'upload_hashes', {}).get(field_name)
+    if digest:
+        return digest
+    return BlobStore.hash_stream(file_obj)
+
+
+def extraction_source(file_obj):
+    """Path of a disk-spooled upload, or the in-memory file object for small ones."""
+    if hasattr(file_obj, 'temporary_file_path'):
+        return file_obj.temporary_file_path()
+    file_obj.seek(0)
+    return file_obj.file
+
+
+def spool_upload(file_obj) -> str:
+    """
+    Keep a copy of an upload that outlives the request.
+
+    Disk-spooled uploads are hard-linked into ``UPLOAD_SPOOL_DIR`` when it is on
+    the same filesystem, so no bytes are copied.
+    """
+    os.makedirs(settings.UPLOAD_SPOOL_DIR, exist_ok=True)
+    spool_path = os.path.join(settings.UPLOAD_SPOOL_DIR, uuid.uuid4().hex)
+
+    if hasattr(file_obj, 'temporary_file_path'):
+        try:
+            os.link(file_obj.temporary_file_path(), spool_path)
+            return spool_path
+        except OSError:
+            pass
+
+    file_obj.seek(0)
+    with open(spool_path, 'wb') as out:
+        for chunk in file_obj.chunks():
+            out.write(chunk)
+    return spool_path
+
+
+def upload_spooled_file(bucket: str, storage_path: str, spool_path: str, content_type: str,
+                        upsert: bool = False):
+    """
+    Send a spooled file to Supabase Storage (resumably when large), retrying
+    up to ``UPLOAD_STORE_ATTEMPTS`` times with exponential backoff. The
+    spooled copy is left in place; raises the last error when every attempt
+    failed.
+    """
+    attempts = max(settings.UPLOAD_STORE_ATTEMPTS, 1)
+    for attempt in range(1, attempts + 1):
+        try:
+            SupabaseService.upload_path(bucket, storage_path, spool_path, content_type, upsert=upsert)
+            logger.info(f"Uploaded {storage_path} to {bucket}")
+            return
+        except Exception as e:
+            if attempt == attempts:
+                logger.error(f"Giving up storing {storage_path} after {attempts} attempts: {e}")
+                raise
+            delay = settings.UPLOAD_STORE_RETRY_SECONDS * (2 ** (attempt - 1))
+            logger.warning(f"Storing {storage_path} failed ({e}); attempt {attempt + 1}/{attempts} in {delay:.0f}s")
+            time.sleep(delay)
+
+
+def remove_spooled_file(spool_path: str):
+    """Delete a spooled copy once nothing needs it."""
+    try:
+        os.remove(spool_path)
+    except OSError:
+        pass
@@ -1,12 +1,137 @@
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.decorators import action
 from apps.core.services.supabase_service import SupabaseService
 from apps.core.services.file_processor import FileProcessor
+from apps.core.background import run_in_background
+from apps.core.services.blob_store import (
+    AVAILABLE, BLOB_BUCKET, FAILED, PENDING, UPLOAD_FAILED, UPLOAD_PENDING, UPLOAD_STORED, BlobStore
+)
+from apps.core.services.text_artifacts import artifact_key, get_text_artifacts, preview_text
+from apps.files.uploads import (
+    extraction_source, remove_spooled_file, spool_upload, upload_hash, upload_spooled_file
+)
+from apps.books.services.rag_service import RAGService
+from apps.books.services.vector_gc import release_documents_in_background
+from django.conf import settings
+from contextlib import closing
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Columns returned by list views; full text is fetched separately through the text action
+DOCUMENT_LIST_COLUMNS = (
+    'id,conversation_id,file_name,file_type,file_size,storage_path,download_url,'
+    'document_type,grade_id,subject_id,chapter,topics,is_processed,rag_indexed,'
+    'content_hash,text_artifact_key,upload_status,created_at'
+)
+
+
+def index_document(document, pages):
+    """Embed an uploaded file's pages once per distinct content hash."""
+    return RAGService().ingest_document(
+        document['content_hash'],
+        pages,
+        {'file_name': document.get('file_name')}
+    )
+
+
+def store_blob(storage_path, spool_path, content_type):
+    """Stream new content to its blob path."""
+    upload_spooled_file(BLOB_BUCKET, storage_path, spool_path, content_type, upsert=True)
+
+
+def finish_upload(document, file_type, content_type, spool_path, claim=None, save_text=False, index=False):
+    """
+    Background half of an upload: store new content, then extract pages from
+    the spooled file one at a time, compressing them into the text artifact
+    and embedding them as they are produced.
+    
+    With ``claim`` this upload holds the blob's reservation: it stores the
+    content (with retries) and marks the blob available, or failed so another
+    upload can take it over, along with the documents waiting for it.
+    """
+    content_hash = document['content_hash']
+    text_artifact_key = document['text_artifact_key']
+    try:
+        if claim:
+            try:
+                store_blob(document['storage_path'], spool_path, content_type)
+            except Exception:
+                BlobStore.set_documents_status(content_hash, UPLOAD_FAILED)
+                raise
+            BlobStore.set_documents_status(content_hash, UPLOAD_STORED)
+        
+        writer = get_text_artifacts().writer(text_artifact_key) if save_text else None
+        page_count = None
+        if save_text or index:
+            page_count = 0
+            
+            def pages():
+                nonlocal page_count
+                for number, text in FileProcessor().iter_pages(spool_path, file_type):
+                    page_count += 1
+                    if writer:
+                        writer.add(number, text)
+                    yield number, text
+            
+            stream = pages()
+            # Also for duplicates of this content that attached from a conversation
+            index = index or (bool(claim) and referenced_by_conversation(content_hash))
+            if index:
+                index_document(document, stream)
+            if writer:
+                # Pages indexing did not consume (all of them, or the rest after a failure)
+                for _ in stream:
+                    pass
+                writer.close()
+        
+        if claim:
+            outcome = {'text_artifact_key': text_artifact_key, 'page_count': page_count} if writer else {}
+            BlobStore.finish(content_hash, claim, AVAILABLE, **outcome)
+            # Documents that attached while the content was being extracted
+            BlobStore.set_documents_status(content_hash, UPLOAD_STORED)
+            if not index and referenced_by_conversation(content_hash):
+                index_document(document, FileProcessor().iter_pages(spool_path, file_type))
+        elif writer:
+            BlobStore.set_text_artifact(content_hash, text_artifact_key, page_count)
+    except Exception:
+        if claim:
+            BlobStore.finish(content_hash, claim, FAILED)
+        raise
+    finally:
+        remove_spooled_file(spool_path)
+
+
+def index_stored_document(document, text_artifact_key):
+    """Embed a document whose content was extracted by an earlier upload."""
+    index_document(document, get_text_artifacts().pages(text_artifact_key))
+
+
+def referenced_by_conversation(content_hash) -> bool:
+    """Whether any document with this content belongs to a conversation, so needs retrieval."""
+    documents = SupabaseService.fetch_table('documents', {'content_hash': content_hash}, columns='conversation_id')
+    return any(document.get('conversation_id') for document in documents)
+
+
+def settle_attached(document, blob):
+    """
+    Bring a document that attached to a pending blob up to date if the
+    reservation finished while the document was being saved. Documents saved
+    before it finished are settled by the upload holding the reservation.
+    """
+    status = BlobStore.status(blob)
+    if status == PENDING:
+        return
+    SupabaseService.update_record(
+        'documents', document['id'], {'upload_status': UPLOAD_STORED if status == AVAILABLE else UPLOAD_FAILED}
+    )
+    if status == AVAILABLE and document.get('conversation_id') and not blob.get('rag_indexed') \
+            and blob.get('text_artifact_key'):
+        run_in_background(index_stored_document, document, blob['text_artifact_key'])
+
 
 class DocumentViewSet(ViewSet):
     """ViewSet for Document operations."""
@@ -18,11 +143,13 @@ class DocumentViewSet(ViewSet):
         if conversation_id:
             filters['conversation_id'] = conversation_id
         
-        documents = SupabaseService.fetch_table('documents', filters, order_by='created_at')
+        documents = SupabaseService.fetch_table(
+            'documents', filters, order_by='created_at', columns=DOCUMENT_LIST_COLUMNS
+        )
         return Response(documents)
     
     def retrieve(self, request, pk=None):
-        document = SupabaseService.fetch_by_id('documents', pk)
+        document = SupabaseService.fetch_by_id('documents', pk, columns=DOCUMENT_LIST_COLUMNS)
         if document:
             return Response(document)
         return Response(
@@ -30,6 +157,52 @@ class DocumentViewSet(ViewSet):
             status=status.HTTP_404_NOT_FOUND
         )
     
+    @action(detail=True, methods=['get'], url_path='text')
+    def text(self, request, pk=None):
+        """
+        Full extracted text of a document, loaded from its text artifact.
+        
+        Query params:
+            - page: Return only this page (optional)
+        """
+        rows = SupabaseService.fetch_table(
+            'documents', {'id': pk}, limit=1, columns='id,text_artifact_key,extracted_text'
+        )
+        if not rows:
+            return Response(
+                {'error': 'Document not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        document = rows[0]
+        
+        # Documents uploaded before text artifacts existed keep their text inline
+        if not document.get('text_artifact_key'):
+            return Response({'id': pk, 'pages': [{'page': 1, 'text': document.get('extracted_text') or ''}]})
+        
+        key = document['text_artifact_key']
+        page = request.query_params.get('page')
+        if page is None:
+            pages = get_text_artifacts().pages(key)
+        else:
+            try:
+                page = int(page)
+            except ValueError:
+                return Response(
+                    {'error': 'page must be an integer'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            pages = get_text_artifacts().page_range(key, page, page)
+            if not pages:
+                return Response(
+                    {'error': 'Page not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        
+        return Response({
+            'id': pk,
+            'pages': [{'page': number, 'text': text} for number, text in pages]
+        })
+    
     def create(self, request):
         """
         Upload and process a document.
@@ -41,13 +214,20 @@ class DocumentViewSet(ViewSet):
             - chapter: Chapter number (optional)
             - topics: List of topics (optional)
         """
-        if 'file' not in request.FILES:
+        # Files are spooled to disk by the upload handlers; oversized ones are dropped mid-stream
+        if 'file' not in request.FILES and not getattr(request, 'upload_too_large', False):
             return Response(
                 {'error': 'File is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        file_obj = request.FILES['file']
+        file_obj = request.FILES.get('file')
+        if getattr(request, 'upload_too_large', False) or file_obj.size > settings.DOCUMENT_UPLOAD_MAX_SIZE:
+            return Response(
+                {'error': f'File exceeds the {settings.DOCUMENT_UPLOAD_MAX_SIZE // (1024 * 1024)} MB upload limit'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        
         processor = FileProcessor()
         
         if not processor.is_supported(file_obj.content_type):
@@ -56,40 +236,95 @@ class DocumentViewSet(ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        claim = None
         try:
-            # Read file content
-            file_content = file_obj.read()
-            
-            # Extract text
             file_type = processor.get_file_type(file_obj.content_type)
-            extracted_text, page_count = processor.process_file(file_content, file_type)
+            conversation_id = request.data.get('conversation_id')
+            
+            # Identical content is stored, extracted and embedded only once: new content
+            # is reserved before the response, and concurrent duplicates attach to it
+            content_hash = upload_hash(request, 'file', file_obj)
+            blob = BlobStore.get(content_hash)
+            if blob is None or BlobStore.is_abandoned(blob):
+                blob, owner = BlobStore.reserve(
+                    content_hash,
+                    blob['storage_path'] if blob else BlobStore.storage_path(content_hash, file_type),
+                    file_obj.size,
+                    file_obj.content_type,
+                    previous=blob
+                )
+                claim = blob['claim'] if owner else None
+            
+            available = BlobStore.status(blob) == AVAILABLE
+            needs_text = bool(claim) or (available and not blob.get('text_artifact_key'))
+            needs_index = bool(conversation_id) and (bool(claim) or (available and not blob.get('rag_indexed')))
+            # Another upload is storing this content; it settles this document when done
+            attached = not claim and BlobStore.status(blob) == PENDING
+            
+            if blob.get('text_artifact_key'):
+                text_artifact_key = blob['text_artifact_key']
+                extracted_text = get_text_artifacts().text(
+                    text_artifact_key, settings.EXTRACTED_TEXT_PREVIEW_CHARS
+                )
+            else:
+                # Only the leading pages are parsed here; the rest are extracted in the background
+                text_artifact_key = artifact_key(content_hash)
+                with closing(processor.iter_pages(extraction_source(file_obj), file_type)) as pages:
+                    extracted_text = preview_text(pages)
+            
+            storage_path = blob['storage_path']
             
             # Prepare data for Supabase
             data = {
                 'file_name': file_obj.name,
                 'file_type': file_obj.content_type,
                 'file_size': file_obj.size,
-                'storage_path': f"documents/{file_obj.name}",
+                'storage_path': storage_path,
+                'content_hash': content_hash,
+                'text_artifact_key': text_artifact_key,
                 'extracted_text': extracted_text,
                 'document_type': request.data.get('document_type', 'textbook'),
                 'chapter': request.data.get('chapter'),
                 'topics': request.data.get('topics', []),
                 'is_processed': True,
-                'conversation_id': request.data.get('conversation_id'),
+                'conversation_id': conversation_id,
+                'upload_status': UPLOAD_STORED if BlobStore.status(blob) == AVAILABLE else UPLOAD_PENDING,
             }
             
-            # Upload to storage
-            if 'conversation_id' in data:
-                public_url = SupabaseService.upload_file('educational-content', data['storage_path'], file_content)
-                data['download_url'] = public_url
+            # The public URL is known up front; new content is streamed to storage,
+            # and text extracted, from a spooled copy after the response is sent.
+            # upload_status tells clients when the URL is usable, or that storing failed.
+            data['download_url'] = SupabaseService.get_storage_public_url(BLOB_BUCKET, storage_path)
+            spool_path = spool_upload(file_obj) if (claim or needs_text or needs_index) else None
             
             # Save to database
             document = SupabaseService.insert_record('documents', data)
             
+            if document and spool_path:
+                run_in_background(
+                    finish_upload,
+                    document,
+                    file_type,
+                    file_obj.content_type,
+                    spool_path,
+                    claim=claim,
+                    save_text=needs_text,
+                    index=needs_index
+                )
+                claim = None
+            elif spool_path:
+                remove_spooled_file(spool_path)
+            if document and attached:
+                # Re-read after saving: either this sees the finished blob, or its uploader sees this document
+                settle_attached(document, BlobStore.get(content_hash))
+            
             return Response(document, status=status.HTTP_201_CREATED)
             
         except Exception as e:
             logger.error(f"Error uploading document: {e}")
+            if claim:
+                # Let the next upload of this content take the reservation over
+                BlobStore.finish(content_hash, claim, FAILED)
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -105,7 +340,11 @@ class DocumentViewSet(ViewSet):
         )
     
     def destroy(self, request, pk=None):
+        document = SupabaseService.fetch_table('documents', {'id': pk}, limit=1, columns='id,content_hash')
         if SupabaseService.delete_record('documents', pk):
+            # Vectors are shared by identical uploads; they go once nothing references them
+            if document:
+                release_documents_in_background([document[0].get('content_hash')])
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'error': 'Failed to delete document'},
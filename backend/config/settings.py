@@ -3,6 +3,7 @@ Django settings for Insight Navigator backend.
 Connects to Supabase PostgreSQL database.
 """
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -32,6 +33,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so Server-Timing's total covers the rest of the stack
+    'apps.core.tracing.TracingMiddleware',
+    'apps.core.metrics.MetricsMiddleware',
+    'apps.core.openai_scheduler.OpenAISchedulingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,15 +85,162 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 OPENAI_EMBEDDING_MODEL = os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-ada-002')
 OPENAI_CHAT_MODEL = os.getenv('OPENAI_CHAT_MODEL', 'gpt-4')
 
+# Query embeddings requested concurrently are sent together: a batch waits up to the
+# window (0 disables batching) or until it holds EMBEDDING_BATCH_MAX_SIZE texts
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv('EMBEDDING_BATCH_WINDOW_MS', '5'))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', '64'))
+
+# OpenAI admission control: each call takes a request and its estimated tokens from
+# budgets shared by this host's workers through a local SQLite file (0 = no limit).
+# Batch work (background tasks, commands) leaves the last OPENAI_INTERACTIVE_RESERVE
+# of each budget to request-driven calls. Calls are shed with HTTP 429 when their
+# queue is full or admission would take longer than the priority's maximum wait.
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv('OPENAI_REQUESTS_PER_MINUTE', '500'))
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv('OPENAI_TOKENS_PER_MINUTE', '150000'))
+OPENAI_INTERACTIVE_RESERVE = float(os.getenv('OPENAI_INTERACTIVE_RESERVE', '0.2'))
+OPENAI_QUEUE_MAX_INTERACTIVE = int(os.getenv('OPENAI_QUEUE_MAX_INTERACTIVE', '200'))
+OPENAI_QUEUE_MAX_BATCH = int(os.getenv('OPENAI_QUEUE_MAX_BATCH', '1000'))
+OPENAI_MAX_WAIT_INTERACTIVE_SECONDS = float(os.getenv('OPENAI_MAX_WAIT_INTERACTIVE_SECONDS', '15'))
+OPENAI_MAX_WAIT_BATCH_SECONDS = float(os.getenv('OPENAI_MAX_WAIT_BATCH_SECONDS', '600'))
+OPENAI_SCHEDULER_PATH = os.getenv('OPENAI_SCHEDULER_PATH', str(BASE_DIR / 'var' / 'openai_scheduler.sqlite3'))
+
+# Conversation history budgeting and rolling summaries
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '2000'))
+CHAT_SUMMARY_KEEP_RECENT_TOKENS = int(os.getenv('CHAT_SUMMARY_KEEP_RECENT_TOKENS', '1000'))
+CHAT_SUMMARY_MAX_INPUT_TOKENS = int(os.getenv('CHAT_SUMMARY_MAX_INPUT_TOKENS', '6000'))
+
+# Token budgets for retrieved book passages and uploaded-document passages in the prompt
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv('RAG_CONTEXT_TOKEN_BUDGET', '1500'))
+RAG_DOCUMENT_TOKEN_BUDGET = int(os.getenv('RAG_DOCUMENT_TOKEN_BUDGET', '800'))
+
+# Chunking (characters) and passages retrieved per query; compare settings with
+# `manage.py evaluate_retrieval`. Changed chunking applies to newly indexed content.
+RAG_CHUNK_SIZE = int(os.getenv('RAG_CHUNK_SIZE', '1000'))
+RAG_CHUNK_OVERLAP = int(os.getenv('RAG_CHUNK_OVERLAP', '200'))
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', '5'))
+
+# Extracted text: rows keep a short preview, full pages live in compressed storage artifacts
+EXTRACTED_TEXT_PREVIEW_CHARS = int(os.getenv('EXTRACTED_TEXT_PREVIEW_CHARS', '2000'))
+TEXT_ARTIFACT_CODEC = os.getenv('TEXT_ARTIFACT_CODEC', 'gzip')
+TEXT_ARTIFACT_CACHE_CHARS = int(os.getenv('TEXT_ARTIFACT_CACHE_CHARS', str(8 * 1024 * 1024)))
+
+# Page artifacts: single-page PDFs served for citations instead of whole textbooks
+PAGE_ARTIFACT_CACHE_BYTES = int(os.getenv('PAGE_ARTIFACT_CACHE_BYTES', str(32 * 1024 * 1024)))
+PAGE_RANGE_MAX_PAGES = int(os.getenv('PAGE_RANGE_MAX_PAGES', '20'))
+# Backoff after failed page PDF generation; the whole book is served meanwhile
+PAGE_GENERATION_RETRY_BASE_SECONDS = float(os.getenv('PAGE_GENERATION_RETRY_BASE_SECONDS', '60'))
+PAGE_GENERATION_RETRY_MAX_SECONDS = float(os.getenv('PAGE_GENERATION_RETRY_MAX_SECONDS', '21600'))
+# Page artifacts are content-addressed, so clients and CDNs may keep them for long
+PAGE_ARTIFACT_MAX_AGE = int(os.getenv('PAGE_ARTIFACT_MAX_AGE', str(30 * 24 * 3600)))
+
 # Pinecone Configuration
 PINECONE_API_KEY = os.getenv('PINECONE_API_KEY', '')
 PINECONE_ENVIRONMENT = os.getenv('PINECONE_ENVIRONMENT', '')
 PINECONE_INDEX_NAME = os.getenv('PINECONE_INDEX_NAME', 'insight-navigator')
 
+# Write-behind message journal (local SQLite WAL, flushed to Supabase in batches)
+MESSAGE_JOURNAL_PATH = os.getenv('MESSAGE_JOURNAL_PATH', str(BASE_DIR / 'var' / 'message_journal.sqlite3'))
+MESSAGE_JOURNAL_BATCH_SIZE = int(os.getenv('MESSAGE_JOURNAL_BATCH_SIZE', '100'))
+MESSAGE_JOURNAL_FLUSH_INTERVAL = float(os.getenv('MESSAGE_JOURNAL_FLUSH_INTERVAL', '0.5'))
+MESSAGE_JOURNAL_MAX_ATTEMPTS = int(os.getenv('MESSAGE_JOURNAL_MAX_ATTEMPTS', '20'))
+
+# Single-flight: concurrent identical embedding and retrieval calls share one upstream
+# call within a process. Setting SINGLEFLIGHT_PATH to a local SQLite file shares them
+# across the host's workers too, at the cost of a write lock per call. History-less
+# completions are shared too when SINGLEFLIGHT_COMPLETIONS is on. Results stay
+# readable by waiting workers for SINGLEFLIGHT_RESULT_SECONDS.
+SINGLEFLIGHT_ENABLED = os.getenv('SINGLEFLIGHT_ENABLED', 'True') == 'True'
+SINGLEFLIGHT_COMPLETIONS = os.getenv('SINGLEFLIGHT_COMPLETIONS', 'False') == 'True'
+SINGLEFLIGHT_PATH = os.getenv('SINGLEFLIGHT_PATH', '')
+SINGLEFLIGHT_RESULT_SECONDS = float(os.getenv('SINGLEFLIGHT_RESULT_SECONDS', '2'))
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv('SINGLEFLIGHT_WAIT_SECONDS', '60'))
+SINGLEFLIGHT_POLL_SECONDS = float(os.getenv('SINGLEFLIGHT_POLL_SECONDS', '0.02'))
+
+# Uploads: small files stay in memory, larger ones are spooled to disk while they stream in
+FILE_UPLOAD_HANDLERS = [
+    'apps.files.uploads.MaxSizeUploadHandler',
+    'apps.files.uploads.ContentHashUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', str(1024 * 1024)))
+DOCUMENT_UPLOAD_MAX_SIZE = int(os.getenv('DOCUMENT_UPLOAD_MAX_SIZE', str(50 * 1024 * 1024)))
+# Spooled copies awaiting upload to storage; keep on the same filesystem as the temp dir
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'insight-navigator-uploads'))
+
+# New content is reserved as a pending blob while its first upload stores and indexes
+# it; duplicates attach to the reservation. A claim older than the timeout is taken over.
+BLOB_CLAIM_TIMEOUT_SECONDS = int(os.getenv('BLOB_CLAIM_TIMEOUT_SECONDS', '1800'))
+
+# Storage transfers: files at or above the threshold use resumable (TUS) uploads.
+# Supabase requires 6 MB chunks for resumable uploads.
+STORAGE_RESUMABLE_THRESHOLD = int(os.getenv('STORAGE_RESUMABLE_THRESHOLD', str(6 * 1024 * 1024)))
+STORAGE_RESUMABLE_CHUNK_SIZE = int(os.getenv('STORAGE_RESUMABLE_CHUNK_SIZE', str(6 * 1024 * 1024)))
+STORAGE_UPLOAD_MAX_RETRIES = int(os.getenv('STORAGE_UPLOAD_MAX_RETRIES', '8'))
+# Whole-file attempts for storing a spooled upload after the response, with
+# exponential backoff; the spooled copy is kept until storing succeeds or gives up
+UPLOAD_STORE_ATTEMPTS = int(os.getenv('UPLOAD_STORE_ATTEMPTS', '5'))
+UPLOAD_STORE_RETRY_SECONDS = float(os.getenv('UPLOAD_STORE_RETRY_SECONDS', '2'))
+# Interrupted source downloads are resumed with HTTP Range requests this many times
+DOWNLOAD_MAX_RESUMES = int(os.getenv('DOWNLOAD_MAX_RESUMES', '5'))
+
+# Text extraction backend per file type, e.g. "pdf=pymupdf,docx=docx2txt"
+FILE_EXTRACTOR_BACKENDS = dict(
+    item.split('=', 1) for item in os.getenv('FILE_EXTRACTOR_BACKENDS', '').split(',') if '=' in item
+)
+
+# Background thread pool for deferred work (summaries, indexing)
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', '4'))
+
+# Book routing: per-book and per-section centroids pick where to search when a
+# chat is not pinned to a book
+BOOK_ROUTER_ENABLED = os.getenv('BOOK_ROUTER_ENABLED', 'True') == 'True'
+BOOK_ROUTER_SECTION_PAGES = int(os.getenv('BOOK_ROUTER_SECTION_PAGES', '20'))
+BOOK_ROUTER_TOP_BOOKS = int(os.getenv('BOOK_ROUTER_TOP_BOOKS', '5'))
+BOOK_ROUTER_TOP_SECTIONS = int(os.getenv('BOOK_ROUTER_TOP_SECTIONS', '8'))
+BOOK_ROUTER_REFRESH_SECONDS = int(os.getenv('BOOK_ROUTER_REFRESH_SECONDS', '300'))
+
+# Book ingestion is single-flight across workers: the lease holder renews it every
+# heartbeat and it expires after the TTL if the worker dies. Failed ingestions are
+# retried after INGESTION_RETRY_SECONDS. initialize_session may wait for the result
+# up to INGESTION_WAIT_MAX_SECONDS when the client asks to.
+INGESTION_LEASE_TTL_SECONDS = int(os.getenv('INGESTION_LEASE_TTL_SECONDS', '120'))
+INGESTION_LEASE_HEARTBEAT_SECONDS = int(os.getenv('INGESTION_LEASE_HEARTBEAT_SECONDS', '30'))
+INGESTION_RETRY_SECONDS = int(os.getenv('INGESTION_RETRY_SECONDS', '300'))
+INGESTION_WAIT_MAX_SECONDS = float(os.getenv('INGESTION_WAIT_MAX_SECONDS', '30'))
+INGESTION_POLL_SECONDS = float(os.getenv('INGESTION_POLL_SECONDS', '1'))
+
+# Catalog search index: warmed at startup, reconciled with Supabase periodically,
+# optionally including full page text from text artifacts
+CATALOG_INDEX_WARM_ON_STARTUP = os.getenv('CATALOG_INDEX_WARM_ON_STARTUP', 'True') == 'True'
+CATALOG_INDEX_SYNC_SECONDS = int(os.getenv('CATALOG_INDEX_SYNC_SECONDS', '60'))
+CATALOG_INDEX_PAGE_TEXT = os.getenv('CATALOG_INDEX_PAGE_TEXT', 'True') == 'True'
+CATALOG_INDEX_READY_TIMEOUT = float(os.getenv('CATALOG_INDEX_READY_TIMEOUT', '10'))
+
+# Bulk book imports: concurrent books per batch, downloads per source host,
+# PDF parsing processes, retry policy for transient failures, batches run at
+# once per process, and the heartbeat after which a silent batch counts as lost
+BULK_IMPORT_WORKERS = int(os.getenv('BULK_IMPORT_WORKERS', '8'))
+BULK_IMPORT_PER_HOST_LIMIT = int(os.getenv('BULK_IMPORT_PER_HOST_LIMIT', '2'))
+BULK_IMPORT_PARSE_PROCESSES = int(os.getenv('BULK_IMPORT_PARSE_PROCESSES', '2'))
+BULK_IMPORT_MAX_ATTEMPTS = int(os.getenv('BULK_IMPORT_MAX_ATTEMPTS', '4'))
+BULK_IMPORT_RETRY_BASE_SECONDS = float(os.getenv('BULK_IMPORT_RETRY_BASE_SECONDS', '2'))
+BULK_IMPORT_CONCURRENT_BATCHES = int(os.getenv('BULK_IMPORT_CONCURRENT_BATCHES', '2'))
+BULK_IMPORT_HEARTBEAT_SECONDS = float(os.getenv('BULK_IMPORT_HEARTBEAT_SECONDS', '30'))
+BULK_IMPORT_STALE_SECONDS = float(os.getenv('BULK_IMPORT_STALE_SECONDS', '300'))
+
 # JWT Configuration (Supabase Auth)
-JWT_SECRET = os.getenv('SUPABASE_JWT_SECRET', '')
+SUPABASE_JWT_SECRET = os.getenv('SUPABASE_JWT_SECRET', '')
+SUPABASE_JWT_AUDIENCE = os.getenv('SUPABASE_JWT_AUDIENCE', 'authenticated')
+JWT_SECRET = SUPABASE_JWT_SECRET
 JWT_ALGORITHM = 'HS256'
 
+# Validated-token cache (entries live until the token's exp) and JWKS refresh
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000'))
+AUTH_CACHE_DEFAULT_TTL = int(os.getenv('AUTH_CACHE_DEFAULT_TTL', '300'))
+AUTH_NEGATIVE_CACHE_SECONDS = int(os.getenv('AUTH_NEGATIVE_CACHE_SECONDS', '30'))
+AUTH_JWKS_REFRESH_SECONDS = int(os.getenv('AUTH_JWKS_REFRESH_SECONDS', '600'))
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -111,6 +263,48 @@ REST_FRAMEWORK = {
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'http://localhost:5173,http://localhost:3000').split(',')
 
+CORS_EXPOSE_HEADERS = ['Server-Timing', 'X-Request-ID']
+
+# Tracing: per-request spans in Server-Timing headers and JSON logs; only
+# requests slower than TRACE_LOG_MIN_MS are logged (0 logs every request). Spans are also exported to an
+# OpenTelemetry collector when OTEL_EXPORTER_OTLP_ENDPOINT is set.
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'True') == 'True'
+TRACE_LOG_MIN_MS = float(os.getenv('TRACE_LOG_MIN_MS', '500'))
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', '')
+OTEL_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'insight-navigator-backend')
+
+# Metrics: Prometheus exposition at /metrics, optionally behind a bearer token.
+# Multi-process servers also need PROMETHEUS_MULTIPROC_DIR in the environment.
+METRICS_AUTH_TOKEN = os.getenv('METRICS_AUTH_TOKEN', '')
+
+# Upstream resilience: per-call deadlines in seconds (retries included), retries of
+# transient failures with jittered exponential backoff, hedged duplicate reads once
+# an attempt outlasts RESILIENCE_HEDGE_PERCENTILE of recent latencies, and circuit
+# breakers that fail fast for RESILIENCE_BREAKER_RESET_SECONDS after
+# RESILIENCE_BREAKER_FAILURES consecutive failures (state at /health/upstreams).
+# Each upstream runs its attempts on its own pool of RESILIENCE_WORKERS threads.
+RESILIENCE_ENABLED = os.getenv('RESILIENCE_ENABLED', 'True') == 'True'
+RESILIENCE_WORKERS = int(os.getenv('RESILIENCE_WORKERS', '16'))
+RESILIENCE_RETRY_BASE_SECONDS = float(os.getenv('RESILIENCE_RETRY_BASE_SECONDS', '0.1'))
+RESILIENCE_HEDGE_PERCENTILE = float(os.getenv('RESILIENCE_HEDGE_PERCENTILE', '0.95'))
+RESILIENCE_HEDGE_MIN_SECONDS = float(os.getenv('RESILIENCE_HEDGE_MIN_SECONDS', '0.02'))
+RESILIENCE_BREAKER_FAILURES = int(os.getenv('RESILIENCE_BREAKER_FAILURES', '5'))
+RESILIENCE_BREAKER_RESET_SECONDS = float(os.getenv('RESILIENCE_BREAKER_RESET_SECONDS', '30'))
+OPENAI_CHAT_DEADLINE_SECONDS = float(os.getenv('OPENAI_CHAT_DEADLINE_SECONDS', '60'))
+# OpenAI retries are off by default: an OpenAIScheduler admission pays for one request
+OPENAI_CHAT_RETRIES = int(os.getenv('OPENAI_CHAT_RETRIES', '0'))
+OPENAI_EMBEDDING_DEADLINE_SECONDS = float(os.getenv('OPENAI_EMBEDDING_DEADLINE_SECONDS', '30'))
+OPENAI_EMBEDDING_RETRIES = int(os.getenv('OPENAI_EMBEDDING_RETRIES', '0'))
+PINECONE_QUERY_DEADLINE_SECONDS = float(os.getenv('PINECONE_QUERY_DEADLINE_SECONDS', '3'))
+PINECONE_QUERY_RETRIES = int(os.getenv('PINECONE_QUERY_RETRIES', '2'))
+PINECONE_WRITE_DEADLINE_SECONDS = float(os.getenv('PINECONE_WRITE_DEADLINE_SECONDS', '30'))
+PINECONE_WRITE_RETRIES = int(os.getenv('PINECONE_WRITE_RETRIES', '2'))
+SUPABASE_READ_DEADLINE_SECONDS = float(os.getenv('SUPABASE_READ_DEADLINE_SECONDS', '5'))
+SUPABASE_READ_RETRIES = int(os.getenv('SUPABASE_READ_RETRIES', '2'))
+# Whole-table reads by background jobs (router and catalog loads): never hedged
+SUPABASE_SCAN_DEADLINE_SECONDS = float(os.getenv('SUPABASE_SCAN_DEADLINE_SECONDS', '60'))
+SUPABASE_SCAN_RETRIES = int(os.getenv('SUPABASE_SCAN_RETRIES', '2'))
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -129,12 +323,21 @@ LOGGING = {
             'format': '{levelname} {asctime} {module} {message}',
             'style': '{',
         },
+        # Trace records are already JSON
+        'message': {
+            'format': '{message}',
+            'style': '{',
+        },
     },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
         },
+        'traces': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -146,5 +349,10 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        'apps.core.tracing': {
+            'handlers': ['traces'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
@@ -2,12 +2,16 @@
 URL configuration for Insight Navigator backend.
 """
 from django.urls import path, include
+from rest_framework.renderers import JSONRenderer
 from rest_framework.routers import DefaultRouter
+from apps.core.renderers import EventStreamRenderer, PDFRenderer
 from apps.courses.views import GradeViewSet, SubjectViewSet, CourseViewSet
 from apps.books.views import BookViewSet
 from apps.files.views import DocumentViewSet
 from apps.chat.views import ChatView, ConversationViewSet
 from apps.auth.views import SupabaseAuthView
+from apps.core.metrics import metrics_view
+from apps.core.resilience import upstreams_view
 
 # Create router for viewsets
 router = DefaultRouter()
@@ -19,6 +23,37 @@ router.register(r'documents', DocumentViewSet, basename='documents')
 router.register(r'conversations', ConversationViewSet, basename='conversations')
 
 urlpatterns = [
+    # Book routes are listed before the router, whose books/<pk>/ pattern would shadow them
+    
+    # Book download endpoint
+    path('api/v1/books/<str:book_id>/download/', BookViewSet.as_view({'get': 'download'}), name='book-download'),
+    
+    # Page artifacts: text and single-page PDFs of one page or a page range
+    path('api/v1/books/<str:book_id>/pages/<int:start>/', BookViewSet.as_view({'get': 'page_text'}), name='book-page-text'),
+    path('api/v1/books/<str:book_id>/pages/<int:start>-<int:end>/', BookViewSet.as_view({'get': 'page_text'}), name='book-page-range-text'),
+    path(
+        'api/v1/books/<str:book_id>/pages/<int:start>/pdf/',
+        BookViewSet.as_view({'get': 'page_pdf'}, renderer_classes=[JSONRenderer, PDFRenderer]),
+        name='book-page-pdf'
+    ),
+    path(
+        'api/v1/books/<str:book_id>/pages/<int:start>-<int:end>/pdf/',
+        BookViewSet.as_view({'get': 'page_pdf'}, renderer_classes=[JSONRenderer, PDFRenderer]),
+        name='book-page-range-pdf'
+    ),
+    
+    # Book pipeline endpoints: Download → Upload → Register
+    path('api/v1/books/download-register/', BookViewSet.as_view({'post': 'download_and_register'}), name='book-download-register'),
+    path('api/v1/books/bulk-download-register/', BookViewSet.as_view({'post': 'bulk_download_and_register'}), name='book-bulk-download-register'),
+    
+    # Bulk import progress: polling and Server-Sent Events
+    path('api/v1/books/imports/<str:batch_id>/', BookViewSet.as_view({'get': 'import_status'}), name='book-import-status'),
+    path(
+        'api/v1/books/imports/<str:batch_id>/events/',
+        BookViewSet.as_view({'get': 'import_events'}, renderer_classes=[EventStreamRenderer, JSONRenderer]),
+        name='book-import-events'
+    ),
+    
     # API v1 endpoints
     path('api/v1/', include(router.urls)),
     
@@ -31,10 +66,9 @@ urlpatterns = [
     # File upload endpoint
     path('api/v1/upload/', DocumentViewSet.as_view({'post': 'create'}), name='file-upload'),
     
-    # Book download endpoint
-    path('api/v1/books/<str:book_id>/download/', BookViewSet.as_view({'get': 'download'}), name='book-download'),
+    # Prometheus metrics
+    path('metrics', metrics_view, name='metrics'),
     
-    # Book pipeline endpoints: Download → Upload → Register
-    path('api/v1/books/download-register/', BookViewSet.as_view({'post': 'download_and_register'}), name='book-download-register'),
-    path('api/v1/books/bulk-download-register/', BookViewSet.as_view({'post': 'bulk_download_and_register'}), name='book-bulk-download-register'),
+    # Circuit breaker state of upstream calls
+    path('health/upstreams', upstreams_view, name='upstream-health'),
 ]
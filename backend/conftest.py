@@ -0,0 +1,31 @@
+from concurrent.futures import Future
+
+import pytest
+
+from apps.core import background
+from apps.core.fakes import offline_services
+
+
+@pytest.fixture
+def offline():
+    """OpenAI, Pinecone and Supabase replaced by in-memory fakes (see ``apps.core.fakes``)."""
+    with offline_services() as services:
+        yield services
+
+
+class InlineExecutor:
+    """Runs submitted work on the calling thread, so tests see its effects right away."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@pytest.fixture
+def inline_background(monkeypatch):
+    """Run ``run_in_background`` work before the scheduling call returns."""
+    monkeypatch.setattr(background, 'get_executor', InlineExecutor)
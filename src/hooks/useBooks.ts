@@ -35,6 +35,15 @@ export interface BookContext {
   }>;
 }
 
+export interface BookSearchResult {
+  total: number;
+  results: Array<Pick<Book, 'id' | 'title' | 'author' | 'description' | 'grade_id' | 'subject_id' | 'download_url' | 'page_count'> & { score: number }>;
+  facets: {
+    grade_id: Record<string, number>;
+    subject_id: Record<string, number>;
+  };
+}
+
 export function useBooks() {
   const [books, setBooks] = useState<Book[]>([]);
   const [isLoading, setIsLoading] = useState(false);
@@ -182,20 +191,35 @@ export function useBooks() {
         throw new Error(errorData.error || 'Failed to bulk download and register books');
       }
 
-      const data = await response.json();
+      // The import runs in the background; poll the batch until it finishes
+      let batch = await response.json();
+      while (batch.status !== 'completed' && batch.status !== 'failed') {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        const progress = await fetch(
+          `${DJANGO_API_URL}/books/imports/${batch.id}/`,
+          { headers: getAuthHeaders() }
+        );
+        if (!progress.ok) {
+          throw new Error('Failed to fetch bulk import progress');
+        }
+        batch = await progress.json();
+      }
+
+      const imported = batch.imported + batch.existing;
+      const errors = batch.failed;
 
       toast({
         title: 'Import Complete',
-        description: `Successfully imported ${data.total_imported} books, ${data.total_errors} errors`,
-        variant: data.total_errors > 0 ? 'default' : 'default',
+        description: `Successfully imported ${imported} books, ${errors} errors`,
+        variant: errors > 0 ? 'default' : 'default',
       });
 
       // Refresh books list
       await fetchBooks();
 
       return {
-        imported: data.total_imported,
-        errors: data.total_errors,
+        imported,
+        errors,
       };
     } catch (error) {
       console.error('Error bulk downloading and registering books:', error);
@@ -261,6 +285,63 @@ export function useBooks() {
     }
   }, []);
 
+  // Full-text search over the catalog (title, author, description and page text)
+  const searchBooks = useCallback(async (
+    query: string,
+    filters?: { gradeId?: number; subjectId?: number; limit?: number; offset?: number }
+  ): Promise<BookSearchResult | null> => {
+    try {
+      const params = new URLSearchParams({ q: query });
+      if (filters?.gradeId) params.append('grade_id', filters.gradeId.toString());
+      if (filters?.subjectId) params.append('subject_id', filters.subjectId.toString());
+      if (filters?.limit) params.append('limit', filters.limit.toString());
+      if (filters?.offset) params.append('offset', filters.offset.toString());
+
+      const response = await fetch(
+        `${DJANGO_API_URL}/books/search/?${params.toString()}`
+      );
+
+      if (!response.ok) {
+        throw new Error('Failed to search books');
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error('Error searching books:', error);
+      return null;
+    }
+  }, []);
+
+  // URL of a single page (or page range) as a standalone PDF, for citation links
+  const getBookPagePdfUrl = useCallback((bookId: string, startPage: number, endPage?: number): string => {
+    const pages = endPage && endPage !== startPage ? `${startPage}-${endPage}` : `${startPage}`;
+    return `${DJANGO_API_URL}/books/${bookId}/pages/${pages}/pdf/`;
+  }, []);
+
+  // Extracted text of a page (or page range)
+  const getBookPageText = useCallback(async (
+    bookId: string,
+    startPage: number,
+    endPage?: number
+  ): Promise<Array<{ page: number; text: string }> | null> => {
+    try {
+      const pages = endPage && endPage !== startPage ? `${startPage}-${endPage}` : `${startPage}`;
+      const response = await fetch(
+        `${DJANGO_API_URL}/books/${bookId}/pages/${pages}/`
+      );
+
+      if (!response.ok) {
+        throw new Error('Failed to fetch page text');
+      }
+
+      const data = await response.json();
+      return data.pages;
+    } catch (error) {
+      console.error('Error fetching page text:', error);
+      return null;
+    }
+  }, []);
+
   // Get download URL for a book
   const getBookDownloadUrl = useCallback(async (bookId: string): Promise<string | null> => {
     try {
@@ -290,5 +371,8 @@ export function useBooks() {
     deleteBook,
     getBook,
     getBookDownloadUrl,
+    searchBooks,
+    getBookPagePdfUrl,
+    getBookPageText,
   };
 }
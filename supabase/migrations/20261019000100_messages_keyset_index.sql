@@ -0,0 +1,3 @@
+-- Composite index backing (created_at, id) cursor pagination of messages
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_created_id
+  ON public.messages(conversation_id, created_at, id);
@@ -0,0 +1,9 @@
+-- Token accounting per message and rolling conversation summaries
+ALTER TABLE public.messages
+  ADD COLUMN IF NOT EXISTS token_count INTEGER;
+
+ALTER TABLE public.conversations
+  ADD COLUMN IF NOT EXISTS summary TEXT,
+  ADD COLUMN IF NOT EXISTS summary_token_count INTEGER,
+  ADD COLUMN IF NOT EXISTS summary_until_at TIMESTAMPTZ,
+  ADD COLUMN IF NOT EXISTS summary_until_id UUID;
@@ -0,0 +1,3 @@
+-- Track whether an uploaded document has been chunked and embedded for retrieval
+ALTER TABLE public.documents
+  ADD COLUMN IF NOT EXISTS rag_indexed BOOLEAN NOT NULL DEFAULT false;
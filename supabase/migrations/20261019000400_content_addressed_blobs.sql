@@ -0,0 +1,28 @@
+-- Content-addressed storage: each distinct file is stored, extracted and embedded once
+CREATE TABLE IF NOT EXISTS public.blobs (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  content_hash TEXT NOT NULL UNIQUE,
+  storage_path TEXT NOT NULL,
+  file_size BIGINT NOT NULL,
+  content_type TEXT NOT NULL,
+  page_count INTEGER,
+  rag_indexed BOOLEAN NOT NULL DEFAULT false,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Only the backend (service role) reads or writes blobs
+ALTER TABLE public.blobs ENABLE ROW LEVEL SECURITY;
+
+ALTER TABLE public.documents
+  ADD COLUMN IF NOT EXISTS content_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_documents_content_hash
+  ON public.documents (content_hash);
+CREATE INDEX IF NOT EXISTS idx_documents_conversation_id
+  ON public.documents (conversation_id);
+
+ALTER TABLE public.books
+  ADD COLUMN IF NOT EXISTS content_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_books_content_hash
+  ON public.books (content_hash);
+CREATE INDEX IF NOT EXISTS idx_books_source_url
+  ON public.books (source_url);
@@ -0,0 +1,13 @@
+-- Extracted text moves to compressed storage artifacts; rows keep a short preview
+ALTER TABLE public.blobs
+  ADD COLUMN IF NOT EXISTS text_artifact_key TEXT;
+
+ALTER TABLE public.documents
+  ADD COLUMN IF NOT EXISTS text_artifact_key TEXT,
+  -- Written by the upload API; declared here so explicit column lists resolve
+  ADD COLUMN IF NOT EXISTS download_url TEXT,
+  ADD COLUMN IF NOT EXISTS is_processed BOOLEAN DEFAULT false;
+
+ALTER TABLE public.books
+  ADD COLUMN IF NOT EXISTS text_artifact_key TEXT,
+  ADD COLUMN IF NOT EXISTS is_official BOOLEAN DEFAULT false;
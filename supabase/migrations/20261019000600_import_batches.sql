@@ -0,0 +1,21 @@
+-- Bulk book import batches and their per-item progress
+CREATE TABLE IF NOT EXISTS public.import_batches (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  status TEXT NOT NULL DEFAULT 'queued'
+    CHECK (status IN ('queued', 'running', 'completed', 'failed')),
+  total INTEGER NOT NULL DEFAULT 0,
+  succeeded INTEGER NOT NULL DEFAULT 0,
+  failed INTEGER NOT NULL DEFAULT 0,
+  -- [{index, source_url, title, status, attempts, book_id, error}, ...]
+  items JSONB NOT NULL DEFAULT '[]'::jsonb,
+  created_by UUID,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_import_batches_created_at
+  ON public.import_batches (created_at DESC);
+
+-- Only the backend (service role) reads or writes import batches
+ALTER TABLE public.import_batches ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,6 @@
+-- Per-page PDF artifacts: prefix under which a book's single-page PDFs are stored
+ALTER TABLE public.blobs
+  ADD COLUMN IF NOT EXISTS page_artifact_prefix TEXT;
+
+ALTER TABLE public.books
+  ADD COLUMN IF NOT EXISTS page_artifact_prefix TEXT;
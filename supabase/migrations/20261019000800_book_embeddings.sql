@@ -0,0 +1,18 @@
+-- Centroid embeddings used to route chat queries to books and page sections.
+-- page_start = 0 holds the whole-book centroid; embeddings are base64 float16.
+CREATE TABLE IF NOT EXISTS public.book_embeddings (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  book_id UUID NOT NULL REFERENCES public.books(id) ON DELETE CASCADE,
+  page_start INTEGER NOT NULL,
+  page_end INTEGER NOT NULL,
+  chunk_count INTEGER NOT NULL DEFAULT 0,
+  embedding TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  UNIQUE (book_id, page_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_book_embeddings_created_at
+  ON public.book_embeddings (created_at, id);
+
+-- Only the backend (service role) reads or writes routing centroids
+ALTER TABLE public.book_embeddings ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,74 @@
+-- One row per book that is being, or was last, ingested into the RAG index.
+-- The worker holding the lease renews expires_at while it ingests; a running
+-- lease past expires_at belonged to a crashed worker and may be taken over.
+-- A failed lease keeps expires_at in the future until a retry is allowed.
+CREATE TABLE IF NOT EXISTS public.ingestion_leases (
+  book_id UUID PRIMARY KEY REFERENCES public.books(id) ON DELETE CASCADE,
+  holder TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'running'
+    CHECK (status IN ('running', 'succeeded', 'failed')),
+  attempts INTEGER NOT NULL DEFAULT 1,
+  error TEXT,
+  acquired_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  expires_at TIMESTAMPTZ NOT NULL,
+  finished_at TIMESTAMPTZ
+);
+
+-- Only the backend (service role) reads or writes ingestion leases
+ALTER TABLE public.ingestion_leases ENABLE ROW LEVEL SECURITY;
+
+-- Take the lease for p_holder unless another worker holds a live one, and
+-- return the lease row; the caller got it when holder = p_holder.
+-- The upsert is atomic, so exactly one of several concurrent callers wins.
+CREATE OR REPLACE FUNCTION public.acquire_ingestion_lease(p_book_id UUID, p_holder TEXT, p_ttl_seconds INTEGER)
+RETURNS SETOF public.ingestion_leases AS $$
+BEGIN
+  INSERT INTO public.ingestion_leases AS lease (book_id, holder, expires_at)
+  VALUES (p_book_id, p_holder, now() + make_interval(secs => p_ttl_seconds))
+  ON CONFLICT (book_id) DO UPDATE
+    SET holder = EXCLUDED.holder,
+        status = 'running',
+        attempts = lease.attempts + 1,
+        error = NULL,
+        acquired_at = now(),
+        heartbeat_at = now(),
+        expires_at = EXCLUDED.expires_at,
+        finished_at = NULL
+    WHERE lease.status = 'succeeded' OR lease.expires_at < now();
+
+  RETURN QUERY SELECT * FROM public.ingestion_leases WHERE book_id = p_book_id;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Extend a running lease; false when p_holder no longer holds it
+CREATE OR REPLACE FUNCTION public.renew_ingestion_lease(p_book_id UUID, p_holder TEXT, p_ttl_seconds INTEGER)
+RETURNS BOOLEAN AS $$
+BEGIN
+  UPDATE public.ingestion_leases
+  SET heartbeat_at = now(),
+      expires_at = now() + make_interval(secs => p_ttl_seconds)
+  WHERE book_id = p_book_id AND holder = p_holder AND status = 'running';
+  RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Record the outcome. A failed lease blocks new attempts for p_retry_seconds.
+CREATE OR REPLACE FUNCTION public.release_ingestion_lease(
+  p_book_id UUID,
+  p_holder TEXT,
+  p_status TEXT,
+  p_error TEXT DEFAULT NULL,
+  p_retry_seconds INTEGER DEFAULT 0
+)
+RETURNS BOOLEAN AS $$
+BEGIN
+  UPDATE public.ingestion_leases
+  SET status = p_status,
+      error = p_error,
+      finished_at = now(),
+      expires_at = now() + make_interval(secs => p_retry_seconds)
+  WHERE book_id = p_book_id AND holder = p_holder AND status = 'running';
+  RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
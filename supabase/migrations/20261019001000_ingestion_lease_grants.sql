@@ -0,0 +1,15 @@
+-- The ingestion lease functions run as their owner and bypass RLS, so only
+-- the backend (service role) may call them. Functions are executable by
+-- PUBLIC by default, which PostgREST exposes to anon and authenticated.
+REVOKE EXECUTE ON FUNCTION public.acquire_ingestion_lease(UUID, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.renew_ingestion_lease(UUID, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.release_ingestion_lease(UUID, TEXT, TEXT, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+
+GRANT EXECUTE ON FUNCTION public.acquire_ingestion_lease(UUID, TEXT, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION public.renew_ingestion_lease(UUID, TEXT, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION public.release_ingestion_lease(UUID, TEXT, TEXT, TEXT, INTEGER) TO service_role;
+
+-- Pin the search path so the definer functions cannot be redirected to other schemas
+ALTER FUNCTION public.acquire_ingestion_lease(UUID, TEXT, INTEGER) SET search_path = public;
+ALTER FUNCTION public.renew_ingestion_lease(UUID, TEXT, INTEGER) SET search_path = public;
+ALTER FUNCTION public.release_ingestion_lease(UUID, TEXT, TEXT, TEXT, INTEGER) SET search_path = public;
@@ -0,0 +1,10 @@
+-- Blobs are reserved before their content is stored, so concurrent uploads of
+-- the same file find the reservation instead of storing, extracting and
+-- embedding it again. A pending blob whose claim is older than the backend's
+-- BLOB_CLAIM_TIMEOUT_SECONDS, or a failed one, is taken over by the next upload;
+-- claim is a token that changes with every takeover so only one uploader wins.
+ALTER TABLE public.blobs
+  ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'available'
+    CHECK (status IN ('pending', 'available', 'failed')),
+  ADD COLUMN IF NOT EXISTS claim TEXT,
+  ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ;
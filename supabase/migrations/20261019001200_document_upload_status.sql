@@ -0,0 +1,6 @@
+-- Whether a document's content has reached storage. Uploads are stored after the
+-- response, so a document starts 'pending' until its blob is stored, and becomes
+-- 'failed' if storing gave up; download_url is only usable once it is 'stored'.
+ALTER TABLE public.documents
+  ADD COLUMN IF NOT EXISTS upload_status TEXT NOT NULL DEFAULT 'stored'
+    CHECK (upload_status IN ('pending', 'stored', 'failed'));
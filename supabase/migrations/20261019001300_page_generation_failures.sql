@@ -0,0 +1,6 @@
+-- Failed page PDF generation: consecutive failures, the last error, and when the
+-- next attempt may run (exponential backoff). Cleared once page artifacts exist.
+ALTER TABLE public.books
+  ADD COLUMN IF NOT EXISTS page_generation_attempts INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS page_generation_retry_at TIMESTAMPTZ,
+  ADD COLUMN IF NOT EXISTS page_generation_error TEXT;
@@ -0,0 +1,5 @@
+-- Finished import batches tell full success ('completed'), partial success
+-- ('partial') and total failure ('failed') apart
+ALTER TABLE public.import_batches DROP CONSTRAINT IF EXISTS import_batches_status_check;
+ALTER TABLE public.import_batches ADD CONSTRAINT import_batches_status_check
+  CHECK (status IN ('queued', 'running', 'completed', 'partial', 'failed'));